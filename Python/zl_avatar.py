@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_avatar.py
+-----------------------------------
+Dịch vụ avatar cho GUI (không chặn Tk thread):
+    Tải avatar song song bằng pool thread, gộp các yêu cầu trùng URL đang tải
+
+    Cache nội dung trên đĩa (tên file = SHA256 của URL), giới hạn dung lượng, loại bỏ theo LRU
+
+    Cache PhotoImage trong bộ nhớ (giải mã + resize trong thread, tạo PhotoImage trên Tk thread)
+
+    Tải trước (prefetch) avatar của các dòng đang hiển thị
+
+    Chế độ offline: chỉ đọc từ cache, không truy cập mạng
+-----------------------------------
+Yêu cầu:
+ pip install requests pillow
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import BytesIO
+from pathlib import Path
+
+import requests
+
+AVATAR_CACHE_DIR = Path.home() / ".zl_extract" / "avatars"
+AVATAR_CACHE_MAX_BYTES = 200 * 1024 * 1024   # 200 MB
+AVATAR_WORKERS = 8
+AVATAR_TIMEOUT = 10
+PHOTO_CACHE_ITEMS = 512
+
+
+class AvatarDiskCache:
+    """
+    Cache avatar trên đĩa, địa chỉ theo nội dung URL (sha256(url)).
+    Thứ tự LRU giữ trong OrderedDict (khởi tạo theo mtime), lần dùng gần nhất ghi lại bằng os.utime
+    để thứ tự còn đúng giữa các phiên. Vượt max_bytes thì xóa file ít dùng nhất.
+    """
+
+    def __init__(self, cache_dir: Path = AVATAR_CACHE_DIR, max_bytes: int = AVATAR_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # tên file -> kích thước
+        self.total_bytes = 0
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if e.is_file() and not e.name.endswith(".tmp"):
+                    st = e.stat()
+                    files.append((st.st_mtime, e.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get(self, url: str):
+        """Trả về bytes nếu có trong cache (và đánh dấu vừa dùng), ngược lại None"""
+        name = self.key_for(url)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.cache_dir / name
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(name, 0)
+            return None
+
+    def put(self, url: str, data: bytes):
+        """Ghi nguyên tử (file tạm + os.replace) rồi loại bỏ LRU nếu vượt giới hạn"""
+        name = self.key_for(url)
+        path = self.cache_dir / name
+        tmp = path.with_name(f"{name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                (self.cache_dir / name).unlink()
+            except OSError:
+                pass
+
+    def __contains__(self, url):
+        with self._lock:
+            return self.key_for(url) in self._entries
+
+
+class AvatarService:
+    """
+    Lấy avatar theo URL: cache đĩa -> tải mạng (pool thread), các yêu cầu trùng URL đang
+    chạy dùng chung 1 Future. offline=True: chỉ đọc cache, thiếu thì trả None.
+    fetch(url) trả về Future[bytes | None].
+    """
+
+    def __init__(self, cache: AvatarDiskCache = None, workers: int = AVATAR_WORKERS,
+                 timeout: float = AVATAR_TIMEOUT, offline: bool = False):
+        self.cache = cache or AvatarDiskCache()
+        self.timeout = timeout
+        self.offline = offline
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zl_avatar")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session không chia sẻ giữa các thread -> mỗi worker 1 session (giữ kết nối keep-alive)
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def _load(self, url):
+        data = self.cache.get(url)
+        if data is not None or self.offline:
+            return data
+        resp = self._session().get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        self.cache.put(url, resp.content)
+        return resp.content
+
+    def fetch(self, url: str) -> Future:
+        if not url:
+            fut = Future()
+            fut.set_result(None)
+            return fut
+        with self._lock:
+            fut = self._inflight.get(url)
+            if fut is not None:
+                return fut
+            fut = self._pool.submit(self._load, url)
+            self._inflight[url] = fut
+        # đăng ký ngoài lock: Future đã xong (cache / offline) thì callback chạy ngay trong thread này
+        fut.add_done_callback(lambda f: self._done(url, f))
+        return fut
+
+    def _done(self, url, fut):
+        with self._lock:
+            # chỉ bỏ đúng Future này (URL có thể đã được fetch lại sau khi Future cũ xong)
+            if self._inflight.get(url) is fut:
+                del self._inflight[url]
+
+    def prefetch(self, urls):
+        """Đưa các URL chưa có trong cache vào hàng đợi tải (bỏ qua khi offline)"""
+        if self.offline:
+            return
+        for url in urls:
+            if url and url not in self.cache:
+                self.fetch(url)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AvatarPhotoCache:
+    """
+    Cache PhotoImage trong bộ nhớ theo (url, size), LRU tối đa max_items.
+    Giải mã + resize ảnh chạy trong thread của AvatarService; PhotoImage chỉ được tạo trên
+    Tk thread (qua widget.after). on_ready(photo | None) luôn được gọi trên Tk thread.
+    """
+
+    def __init__(self, widget, service: AvatarService, max_items: int = PHOTO_CACHE_ITEMS):
+        self.widget = widget
+        self.service = service
+        self.max_items = max_items
+        self._photos = OrderedDict()
+
+    def get(self, url: str, size, on_ready):
+        """Trả về PhotoImage ngay nếu đã có trong bộ nhớ; nếu chưa, tải bất đồng bộ rồi gọi on_ready"""
+        key = (url, tuple(size))
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+            on_ready(photo)
+            return photo
+
+        def decoded(fut):
+            try:
+                data = fut.result()
+                img = _decode(data, size) if data else None
+            except Exception:
+                img = None
+            self.widget.after(0, lambda: on_ready(self._store(key, img)))
+
+        self.service.fetch(url).add_done_callback(decoded)
+        return None
+
+    def _store(self, key, img):
+        if img is None:
+            return None
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(img)
+        self._photos[key] = photo
+        while len(self._photos) > self.max_items:
+            self._photos.popitem(last=False)
+        return photo
+
+
+def _decode(data: bytes, size):
+    from PIL import Image
+    img = Image.open(BytesIO(data))
+    img.load()
+    return img.resize(tuple(size))
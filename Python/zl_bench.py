@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+zl_bench.py
+
+Benchmark các đường xử lý chính trên dữ liệu ZaloData giả lập (zl_synth) ở nhiều quy mô:
+scan tài khoản, snapshot, mở DB + đọc schema, preview 100 dòng, đếm dòng, tìm kiếm,
+tìm danh bạ, build bảng tra tên, xuất CSV (và giải mã nếu dùng --key).
+
+    python zl_bench.py --rows 10000 1000000 10000000
+    python zl_bench.py --rows 10000 --ops scan open count --key secret
+
+Mỗi phép đo được ghi thêm 1 dòng JSON vào --results (mặc định bench_results.jsonl, kèm git
+revision + thông tin máy) để theo dõi qua thời gian; cuối mỗi lần chạy in chênh lệch so với
+lần chạy trước cùng quy mô. Dữ liệu sinh ra được giữ trong --work và dùng lại ở lần sau.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from zl_contacts import ContactStore, ContactIndex
+from zl_engine import discover_accounts, find_storage_db, find_message_dbs, snapshot_db, connect_ro, list_tables
+from zl_export import build_search_query, count_query, count_rows, export_query_streaming
+from zl_resolve import build_names_db, build_resolved_query
+from zl_sqlcipher import KEY_CACHE
+from zl_synth import generate_zalodata
+
+# "names" trước "preview": preview đo cả phần LEFT JOIN bảng tra tên
+OPS = ("scan", "snapshot", "open", "names", "preview", "count", "search", "contacts", "export", "decrypt")
+SEARCH_TEXT = "hợp đồng"
+CONTACT_QUERIES = ("nguyen", "thu", "linh", "đức an", "ang")
+PREVIEW_ROWS = 100
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+
+def dataset(work: Path, rows: int, message_dbs: int, key: str, seed: int):
+    """Sinh (hoặc dùng lại) cây ZaloData cho quy mô rows; trả về dict mô tả của zl_synth"""
+    name = f"synth_{rows}_{message_dbs}_{seed}" + ("_enc" if key else "")
+    root = work / name
+    info_file = root / "synth_info.json"
+    if info_file.exists():
+        return json.loads(info_file.read_text(encoding="utf-8"))
+    shutil.rmtree(root, ignore_errors=True)
+    print(f"[+] Generating {rows} messages in {root} ...")
+    info = generate_zalodata(root, messages=rows, message_dbs=message_dbs, contacts=max(1000, min(rows // 20, 200_000)),
+                             wal=not key, key=key, seed=seed)
+    info_file.write_text(json.dumps(info, indent=2), encoding="utf-8")
+    return info
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    n = fn()
+    return n, time.perf_counter() - t0
+
+
+class Bench:
+    """Chạy các phép đo trên 1 dataset; snapshot / bảng tra tên được dùng lại giữa các phép đo"""
+
+    def __init__(self, info, tmp: Path, key: str = None):
+        self.info = info
+        self.tmp = tmp
+        self.key = key
+        self.zalodata = Path(info["zalodata"])
+        self.uid = info["uids"][0]
+        self.message_dbs = find_message_dbs(self.zalodata, self.uid)
+        self.snapshots = []
+        self.names_db = None
+
+    def _snapshots(self):
+        if not self.snapshots:
+            self.op_snapshot()
+        return self.snapshots
+
+    def _names_db(self):
+        if self.names_db is None and not self.key:
+            self.op_names()
+        return self.names_db
+
+    def _connect(self, path):
+        if not self.key:
+            return connect_ro(path)
+        from zl_sqlcipher import open_sqlcipher_connection
+        return open_sqlcipher_connection(path, self.key)
+
+    def op_scan(self):
+        return sum(a["db_count"] for a in discover_accounts(self.zalodata))
+
+    def op_snapshot(self):
+        snap_dir = self.tmp / "snapshots"
+        shutil.rmtree(snap_dir, ignore_errors=True)
+        snap_dir.mkdir()
+        self.snapshots = [snapshot_db(p, snap_dir, f"{i}_{p.name}") for i, p in enumerate(self.message_dbs)]
+        return len(self.snapshots)
+
+    def op_open(self):
+        # connect + đọc schema (giống bước mở DB của GUI)
+        n = 0
+        for snap in self._snapshots():
+            conn = self._connect(snap)
+            try:
+                for t in list_tables(snap) if not self.key else [r[0] for r in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type='table'")]:
+                    conn.execute(f'PRAGMA table_info("{t}")').fetchall()
+                    n += 1
+            finally:
+                conn.close()
+        return n
+
+    def op_preview(self):
+        conn = self._connect(self._snapshots()[0])
+        try:
+            sql, params = build_resolved_query(conn, "message", self._names_db(), plaintext_key=bool(self.key))
+            return len(conn.execute(f"SELECT * FROM ({sql}) LIMIT {PREVIEW_ROWS}", params).fetchall())
+        finally:
+            conn.close()
+
+    def op_count(self):
+        total = 0
+        for snap in self._snapshots():
+            conn = self._connect(snap)
+            try:
+                total += count_rows(conn, "message")
+            finally:
+                conn.close()
+        return total
+
+    def op_search(self):
+        total = 0
+        for snap in self._snapshots():
+            conn = self._connect(snap)
+            try:
+                sql, params = build_search_query(conn, "message", SEARCH_TEXT)
+                total += count_query(conn, sql, params)
+            finally:
+                conn.close()
+        return total
+
+    def op_contacts(self):
+        if self.key:
+            return None
+        store = ContactStore(snapshot_db(find_storage_db(self.zalodata), self.tmp, "Storage.db")).load()
+        index = ContactIndex(store)
+        for q in CONTACT_QUERIES:
+            index.search(q, limit=200)
+        return len(store)
+
+    def op_names(self):
+        if self.key:
+            return None
+        storage = snapshot_db(find_storage_db(self.zalodata), self.tmp, "Storage_names.db")
+        self.names_db = build_names_db(storage, force=True)
+        with sqlite3.connect(str(self.names_db)) as conn:
+            return conn.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+
+    def op_export(self):
+        conn = self._connect(self._snapshots()[0])
+        try:
+            result = export_query_streaming(conn, 'SELECT * FROM "message"', (), self.tmp / "export.csv",
+                                            fmt="csv", chunk_size=2000)
+            return result["rows"]
+        finally:
+            conn.close()
+
+    def op_decrypt(self):
+        if not self.key:
+            return None
+        from zl_decrypt import decrypt_database
+        pages = 0
+        for i, snap in enumerate(self._snapshots()):
+            pages += decrypt_database(snap, self.tmp / f"plain_{i}.db", self.key)["pages"]
+        return pages
+
+
+def previous_results(results_path: Path, rows: int, encrypted: bool):
+    """Kết quả gần nhất (trước lần chạy này) theo op cho quy mô rows (cùng loại dataset mã hóa / không)"""
+    last = {}
+    if results_path.exists():
+        with open(results_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                if r.get("scale") == rows and bool(r.get("encrypted")) == encrypted:
+                    last[r["op"]] = r
+    return last
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark scan/open/preview/search/count/export on synthetic ZaloData.")
+    p.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000], help="Messages per dataset (scales).")
+    p.add_argument("--message-dbs", type=int, default=4, help="Message DBs per dataset.")
+    p.add_argument("--ops", nargs="+", choices=OPS, default=list(OPS), help="Operations to time.")
+    p.add_argument("--key", default=None, help="Benchmark SQLCipher-encrypted datasets with this passphrase.")
+    p.add_argument("--seed", type=int, default=0, help="Generator seed.")
+    p.add_argument("--work", default=str(Path.home() / ".zl_extract" / "bench"), help="Where datasets are cached.")
+    p.add_argument("--results", default="bench_results.jsonl", help="JSONL file results are appended to.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    work = Path(args.work)
+    work.mkdir(parents=True, exist_ok=True)
+    results_path = Path(args.results)
+    run = {"run_id": uuid.uuid4().hex[:12], "git_rev": git_revision(), "python": platform.python_version(),
+           "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "cpus": os.cpu_count(),
+           "encrypted": bool(args.key)}
+
+    print(f"{'rows':>10} {'op':>10} {'seconds':>10} {'items':>12} {'prev':>10} {'delta':>8}")
+    for rows in args.rows:
+        info = dataset(work, rows, args.message_dbs, args.key, args.seed)
+        prev = previous_results(results_path, rows, bool(args.key))
+        with tempfile.TemporaryDirectory(prefix="zl_bench_") as tmp:
+            bench = Bench(info, Path(tmp), key=args.key)
+            for op in OPS:
+                if op not in args.ops:
+                    continue
+                # dataset() / op trước đã chạy PBKDF2 trong process này -> mỗi op đo từ cache khóa trống
+                KEY_CACHE.clear()
+                n, sec = timed(getattr(bench, f"op_{op}"))
+                if n is None:
+                    continue   # không áp dụng cho dataset này (vd. decrypt khi không mã hóa)
+                record = {**run, "ts": datetime.now().isoformat(timespec="seconds"), "scale": rows, "op": op,
+                          "seconds": round(sec, 4), "items": n}
+                with open(results_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+                old = prev.get(op)
+                prev_s = f"{old['seconds']:.3f}" if old else "-"
+                delta = f"{(sec / old['seconds'] - 1) * 100:+.0f}%" if old and old["seconds"] else "-"
+                print(f"{rows:>10} {op:>10} {sec:>10.3f} {n:>12} {prev_s:>10} {delta:>8}")
+
+
+if __name__ == "__main__":
+    main()
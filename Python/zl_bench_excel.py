@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+zl_bench_excel.py
+
+Benchmark xuất Excel: so sánh cách cũ (pd.ExcelWriter mode="a" mở lại workbook
+cho mỗi chunk, mỗi chunk 1 sheet part_N) với XlsxStreamWriter (ghi streaming 1 sheet).
+
+    python zl_bench_excel.py --rows 2000 10000 40000 --chunk-size 2000
+
+Cách cũ có độ phức tạp bậc hai nên mặc định chỉ chạy tới --legacy-max-rows.
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from zl_export import export_query_streaming, XLSXWRITER_AVAILABLE
+import zl_export
+
+
+def make_db(path: Path, rows: int):
+    """DB mẫu giống bảng tin nhắn: id, uid, thời gian (ms), nội dung"""
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE message (msgId INTEGER, fromUid TEXT, toUid TEXT, sendDttm INTEGER, content TEXT)")
+    conn.executemany(
+        "INSERT INTO message VALUES (?, ?, ?, ?, ?)",
+        ((i, f"10000000{i % 97:05d}", f"20000000{i % 31:05d}", 1_700_000_000_000 + i * 1000,
+          f"Tin nhắn số {i} - xin chào") for i in range(rows)),
+    )
+    conn.commit()
+    return conn
+
+
+def legacy_export_excel(conn, sql, out_path: Path, chunk_size: int):
+    """Đường xuất Excel cũ của export_table_streaming (giữ lại để so sánh)"""
+    cur = conn.cursor()
+    cur.execute(sql)
+    cols = [d[0] for d in cur.description]
+    exported = 0
+    first_write = True
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        df_chunk = pd.DataFrame(rows, columns=cols)
+        if first_write:
+            df_chunk.to_excel(out_path, index=False, engine="openpyxl")
+            first_write = False
+        else:
+            with pd.ExcelWriter(out_path, engine="openpyxl", mode="a", if_sheet_exists="overlay") as writer:
+                df_chunk.to_excel(writer, index=False, sheet_name=f"part_{exported // chunk_size}")
+        exported += len(rows)
+    return exported
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    n = fn()
+    return n, time.perf_counter() - t0
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark Excel export: legacy append-mode vs streaming writer.")
+    p.add_argument("--rows", type=int, nargs="+", default=[2000, 10000, 40000], help="Table sizes to benchmark.")
+    p.add_argument("--chunk-size", type=int, default=2000, help="fetchmany chunk size (same as the GUIs).")
+    p.add_argument("--legacy-max-rows", type=int, default=40000, help="Skip the quadratic legacy path above this size.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    engines = ["openpyxl"] + (["xlsxwriter"] if XLSXWRITER_AVAILABLE else [])
+    print(f"{'rows':>10} {'path':>20} {'seconds':>10} {'rows/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for rows in args.rows:
+            conn = make_db(tmp / f"bench_{rows}.db", rows)
+            sql = "SELECT * FROM message"
+            results = []
+            if rows <= args.legacy_max_rows:
+                results.append(("legacy (mode=a)", timed(lambda: legacy_export_excel(
+                    conn, sql, tmp / "legacy.xlsx", args.chunk_size))))
+            for engine in engines:
+                # ép backend của XlsxStreamWriter để so sánh từng engine
+                zl_export.XLSXWRITER_AVAILABLE = engine == "xlsxwriter"
+                results.append((f"stream ({engine})", timed(lambda: export_query_streaming(
+                    conn, sql, (), tmp / f"stream_{engine}.xlsx", fmt="excel", chunk_size=args.chunk_size)["rows"])))
+            zl_export.XLSXWRITER_AVAILABLE = XLSXWRITER_AVAILABLE
+            conn.close()
+            for label, (n, sec) in results:
+                print(f"{rows:>10} {label:>20} {sec:>10.2f} {n / sec if sec else 0:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
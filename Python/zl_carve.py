@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_carve.py
+-----------------------------------
+Khôi phục bản ghi đã xóa (carving) trực tiếp từ file SQLite, không qua SQLite:
+    mmap file DB (snapshot), đọc header: page size, reserved bytes, trang trunk đầu của freelist, encoding
+
+    Phân loại trang: duyệt cây b-tree của từng bảng (chỉ đọc trang interior) -> trang lá thuộc bảng nào;
+    chuỗi freelist trunk -> trang trunk / trang lá freelist; trang nằm sau page count của header
+
+    Vùng được quét:
+        trang lá freelist (cả trang), phần còn lại của trang trunk (sau danh sách số trang),
+        freeblock + vùng chưa cấp phát (giữa mảng con trỏ cell và vùng nội dung) của trang lá còn sống,
+        trang thừa cuối file
+
+    Trong mỗi vùng: tìm header record (varint header size + serial type từng cột) khớp schema của bảng
+    đã biết bằng regex dựng từ affinity của từng cột (quét ở tốc độ C), rồi giải mã body trong Python.
+    Nếu ngay trước record còn (payload length, rowid) nguyên vẹn -> lấy được rowid và đọc tiếp overflow.
+    Bản ghi có rowid được so với bảng đang sống: trùng hệt thì bỏ (bản sao cũ sau khi cân bằng cây),
+    khác nội dung -> "modified" (phiên bản cũ), rowid không còn -> "deleted", không rõ rowid -> "unknown"
+
+    Các khoảng PAGES_PER_TASK trang chạy song song trên ProcessPoolExecutor, mỗi process tự mmap file
+
+    Kết quả ghi vào file SQLite sidecar: bảng recovered_records (JSON) + view "recovered" (có offset trong file),
+    và bảng recovered_<bảng> cùng cột với bảng gốc + _status, _source, _page, _offset, _rowid
+    (mở được bằng cửa sổ xem bảng như bảng thường)
+-----------------------------------
+Lưu ý:
+    Chỉ đọc file chính, bỏ qua -wal: header, freelist và schema lấy từ cùng 1 trạng thái (immutable=1).
+    DB SQLCipher phải giải mã trang-theo-trang trước (zl_decrypt.decrypt_database giữ nguyên trang trống,
+    sqlcipher_export thì không) - CLI làm sẵn khi có --key.
+    Không quét trang overflow / trang mồ côi; record trong freeblock bị ghi đè mất header thì bỏ qua.
+    Bảng WITHOUT ROWID và bảng ít hơn MIN_COLUMNS cột không được carving (quá nhiều dương tính giả).
+-----------------------------------
+Ví dụ:
+    stats = carve_database(prepare_db_copy(db_file), carve_path_for(db_file))
+    python zl_carve.py Message0.db --out Message0.carved.sqlite --tables message
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from zl_timeline_index import INDEX_DIR
+from zl_trace import span
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+PAGES_PER_TASK = 2048
+MIN_COLUMNS = 3
+MAX_OVERFLOW_PAGES = 4096
+LOOKBACK = 18                 # payload length (<= 9 byte) + rowid (<= 9 byte) đứng trước record
+LIVE_BATCH = 500
+
+PAGE_TABLE_INTERIOR = 0x05
+PAGE_TABLE_LEAF = 0x0D
+ENCODINGS = {1: "utf-8", 2: "utf-16-le", 3: "utf-16-be"}
+
+# Nhóm serial type được chấp nhận theo affinity của cột
+NULL, INT, FLOAT, TEXT, BLOB = "null", "int", "float", "text", "blob"
+AFFINITY_KINDS = {
+    "INTEGER": frozenset((NULL, INT, FLOAT)),
+    "REAL": frozenset((NULL, INT, FLOAT)),
+    "NUMERIC": frozenset((NULL, INT, FLOAT, TEXT)),
+    "TEXT": frozenset((NULL, TEXT, BLOB)),
+    "BLOB": frozenset((NULL, INT, FLOAT, TEXT, BLOB)),
+}
+_KIND_BYTES = {NULL: b"\x00", INT: bytes((1, 2, 3, 4, 5, 6, 8, 9)), FLOAT: b"\x07"}
+_INT_SIZES = (0, 1, 2, 3, 4, 6, 8, 8, 0, 0)
+_SIZES = _INT_SIZES + (0, 0) + tuple((t - 12) >> 1 for t in range(12, 128))
+
+OUT_SCHEMA = """
+CREATE TABLE recovered_records (
+    id          INTEGER PRIMARY KEY,
+    table_name  TEXT,
+    status      TEXT,       -- deleted | modified | unknown
+    source      TEXT,       -- freelist | freelist_trunk | freeblock | unallocated | trailing
+    page        INTEGER,
+    offset      INTEGER,    -- vị trí header record trong file DB
+    rowid_hint  INTEGER,
+    record_json TEXT
+);
+CREATE INDEX recovered_table ON recovered_records(table_name, status);
+CREATE TABLE carve_info (key TEXT PRIMARY KEY, value TEXT);
+CREATE VIEW recovered AS
+    SELECT table_name, status, source, page, offset, printf('0x%X', offset) AS offset_hex,
+           rowid_hint AS rowid, record_json
+    FROM recovered_records ORDER BY table_name, page, offset;
+"""
+
+
+def carve_path_for(db_path: Path) -> Path:
+    """Đường dẫn file kết quả carving của một DB (theo tên + đường dẫn, tránh trùng giữa các tài khoản)"""
+    INDEX_DIR.mkdir(exist_ok=True)
+    digest = hashlib.sha1(str(Path(db_path).resolve()).encode("utf-8")).hexdigest()[:8]
+    return INDEX_DIR / f"carved_{Path(db_path).stem}_{digest}.sqlite"
+
+
+# -----------------------------
+# Header / schema
+# -----------------------------
+def read_header(db_path: Path):
+    """Header 100 byte của file SQLite -> dict page_size, usable, pages, freelist_trunk, freelist_count, encoding"""
+    size = Path(db_path).stat().st_size
+    with open(db_path, "rb") as f:
+        head = f.read(100)
+    if len(head) < 100 or not head.startswith(SQLITE_MAGIC):
+        raise ValueError(f"{Path(db_path).name} không phải SQLite thường "
+                         "(DB SQLCipher: giải mã trước bằng zl_decrypt.decrypt_database)")
+    page_size = struct.unpack(">H", head[16:18])[0]
+    page_size = 65536 if page_size == 1 else page_size
+    header_pages = struct.unpack(">I", head[28:32])[0]
+    # page count trong header chỉ đúng khi "version-valid-for" khớp change counter
+    if not header_pages or head[92:96] != head[24:28]:
+        header_pages = size // page_size
+    return {"page_size": page_size, "usable": page_size - head[20], "pages": size // page_size,
+            "header_pages": header_pages,
+            "freelist_trunk": struct.unpack(">I", head[32:36])[0],
+            "freelist_count": struct.unpack(">I", head[36:40])[0],
+            "encoding": ENCODINGS.get(struct.unpack(">I", head[56:60])[0], "utf-8")}
+
+
+def column_affinity(decl: str) -> str:
+    """Affinity của cột theo kiểu khai báo (quy tắc của SQLite)"""
+    t = (decl or "").upper()
+    if "INT" in t:
+        return "INTEGER"
+    if "CHAR" in t or "CLOB" in t or "TEXT" in t:
+        return "TEXT"
+    if "BLOB" in t or not t:
+        return "BLOB"
+    if "REAL" in t or "FLOA" in t or "DOUB" in t:
+        return "REAL"
+    return "NUMERIC"
+
+
+def _column_pattern(kinds, ipk):
+    """Regex cho serial type của 1 cột (cột INTEGER PRIMARY KEY luôn lưu NULL)"""
+    if ipk:
+        return b"\x00"
+    single = b"".join(_KIND_BYTES[k] for k in (NULL, INT, FLOAT) if k in kinds)
+    if TEXT in kinds or BLOB in kinds:
+        single += bytes(range(12, 128))
+    cls = b"[" + b"".join(re.escape(bytes((c,))) for c in sorted(set(single))) + b"]"
+    if TEXT in kinds or BLOB in kinds:
+        return b"(?:" + cls + b"|[\x81-\xff][\x80-\xff]{0,2}[\x00-\x7f])"
+    return cls
+
+
+def read_schemas(db_path: Path, tables=None):
+    """
+    Schema các bảng rowid trong sqlite_master: list dict name, rootpage, columns, types,
+    kinds (nhóm serial type hợp lệ từng cột), ipk (chỉ số cột INTEGER PRIMARY KEY hoặc None), pattern (regex header).
+    tables: chỉ lấy các bảng này (None = tất cả).
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro&immutable=1", uri=True)
+    try:
+        rows = conn.execute("SELECT name, rootpage, sql FROM sqlite_master WHERE type = 'table' "
+                            "AND name NOT LIKE 'sqlite_%' AND rootpage > 0").fetchall()
+        schemas = []
+        for name, rootpage, sql in rows:
+            if tables and name not in tables:
+                continue
+            if sql and "WITHOUT ROWID" in sql.upper():
+                continue
+            info = conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+            if len(info) < MIN_COLUMNS:
+                continue
+            pks = [c for c in info if c[5]]
+            ipk = pks[0][0] if len(pks) == 1 and (pks[0][2] or "").upper() == "INTEGER" else None
+            affinities = [column_affinity(c[2]) for c in info]
+            kinds = [AFFINITY_KINDS[a] for a in affinities]
+            n = len(info)
+            hdr = (b"(?:[\x81-\xff][\x00-\x7f]|[" + re.escape(bytes((n + 1,))) + b"-\x7f])"
+                   if n + 1 < 128 else b"[\x81-\xff][\x00-\x7f]")
+            pattern = b"(?=" + hdr + b"".join(_column_pattern(k, i == ipk) for i, k in enumerate(kinds)) + b")"
+            schemas.append({"name": name, "rootpage": rootpage, "columns": [c[1] for c in info],
+                            "types": [c[2] or "" for c in info], "kinds": kinds, "ipk": ipk,
+                            "real": [i for i, a in enumerate(affinities) if a == "REAL"], "pattern": pattern,
+                            # cột chỉ nhận text hoặc chỉ nhận blob: regex không phân biệt được chẵn / lẻ
+                            "parity": [(i, TEXT if TEXT in k else BLOB) for i, k in enumerate(kinds)
+                                       if (TEXT in k) != (BLOB in k) and i != ipk]})
+        return schemas
+    finally:
+        conn.close()
+
+
+# -----------------------------
+# Phân loại trang
+# -----------------------------
+def _page_header_offset(pgno):
+    return 100 if pgno == 1 else 0
+
+
+def walk_table_leaves(mm, header, schemas):
+    """Duyệt cây b-tree của từng bảng (chỉ trang interior) -> {số trang lá: tên bảng}"""
+    page_size, pages = header["page_size"], header["pages"]
+    owner = {}
+    for schema in schemas:
+        stack, seen = [schema["rootpage"]], set()
+        while stack:
+            pgno = stack.pop()
+            if pgno < 1 or pgno > pages or pgno in seen:
+                continue
+            seen.add(pgno)
+            base = (pgno - 1) * page_size
+            hdr = base + _page_header_offset(pgno)
+            kind = mm[hdr]
+            if kind == PAGE_TABLE_LEAF:
+                owner[pgno] = schema["name"]
+            elif kind == PAGE_TABLE_INTERIOR:
+                ncells = struct.unpack_from(">H", mm, hdr + 3)[0]
+                stack.append(struct.unpack_from(">I", mm, hdr + 8)[0])
+                for i in range(ncells):
+                    ptr = struct.unpack_from(">H", mm, hdr + 12 + 2 * i)[0]
+                    if ptr + 4 <= page_size:
+                        stack.append(struct.unpack_from(">I", mm, base + ptr)[0])
+    return owner
+
+
+def walk_freelist(mm, header):
+    """Chuỗi freelist trunk -> (danh sách trang trunk, danh sách trang lá)"""
+    page_size, pages = header["page_size"], header["pages"]
+    max_leaves = (header["usable"] - 8) // 4
+    trunks, leaves, seen = [], [], set()
+    trunk = header["freelist_trunk"]
+    while 1 <= trunk <= pages and trunk not in seen:
+        seen.add(trunk)
+        trunks.append(trunk)
+        base = (trunk - 1) * page_size
+        nxt, count = struct.unpack_from(">II", mm, base)
+        count = min(count, max_leaves)
+        leaves.extend(p for p in struct.unpack_from(f">{count}I", mm, base + 8) if 1 <= p <= pages)
+        trunk = nxt
+    return trunks, leaves
+
+
+# -----------------------------
+# Giải mã record
+# -----------------------------
+def _varint(buf, i, end):
+    """Varint SQLite tại buf[i] (không vượt end) -> (giá trị, vị trí kế tiếp) hoặc (None, i)"""
+    v = 0
+    for k in range(8):
+        if i + k >= end:
+            return None, i
+        b = buf[i + k]
+        v = (v << 7) | (b & 0x7F)
+        if b < 0x80:
+            return v, i + k + 1
+    if i + 8 >= end:
+        return None, i
+    return (v << 8) | buf[i + 8], i + 9
+
+
+def _parse_header(buf, r, hi, schema):
+    """
+    Header record tại buf[r] -> (danh sách serial type, header size, body size) hoặc None.
+    Regex của schema đã kiểm nhóm serial type từng cột; ở đây chỉ còn độ dài header và text / blob.
+    """
+    h, i = buf[r], r + 1
+    if h >= 0x80:
+        h, i = _varint(buf, r, hi)
+        if h is None:
+            return None
+    end = r + h
+    if h < 2 or end > hi:
+        return None
+    n = len(schema["kinds"])
+    raw = buf[i:end]
+    if not raw or raw[-1] >= 0x80:
+        return None
+    types, t = [], 0
+    for b in raw:                 # varint serial type (không cần nhánh 9 byte: kích thước < 2^56)
+        t = (t << 7) | (b & 0x7F)
+        if b < 0x80:
+            types.append(t)
+            t = 0
+    if len(types) != n:
+        return None
+    for c, kind in schema["parity"]:
+        t = types[c]
+        if t >= 12 and (TEXT if t & 1 else BLOB) != kind:
+            return None
+    return types, h, sum(_SIZES[t] if t < 128 else (t - 12) >> 1 for t in types)
+
+
+def _local_size(payload, usable):
+    """Số byte payload nằm ngay trong cell của trang lá bảng (phần còn lại ở overflow)"""
+    x = usable - 35
+    if payload <= x:
+        return payload
+    m = ((usable - 12) * 32 // 255) - 23
+    k = m + (payload - m) % (usable - 4)
+    return k if k <= x else m
+
+
+def _find_cell(buf, r, lo, length):
+    """Tìm (payload length, rowid) đứng ngay trước record -> (vị trí cell, rowid) hoặc None"""
+    for s in range(r - 2, max(lo, r - LOOKBACK) - 1, -1):
+        payload, j = _varint(buf, s, r)
+        if payload != length:
+            continue
+        rowid, k = _varint(buf, j, r)
+        if rowid is not None and k == r:
+            return s, rowid
+    return None
+
+
+def _read_overflow(read_page, first, need, usable):
+    """Đọc need byte từ chuỗi trang overflow bắt đầu ở trang first; read_page(pgno) -> bytes trang hoặc None"""
+    chunks, got, pgno, hops = [], 0, first, 0
+    while got < need:
+        page = read_page(pgno) if hops < MAX_OVERFLOW_PAGES else None
+        if page is None:
+            return None
+        chunk = page[4:min(usable, 4 + need - got)]
+        chunks.append(chunk)
+        got += len(chunk)
+        pgno = struct.unpack_from(">I", page, 0)[0]
+        hops += 1
+    return b"".join(chunks)
+
+
+def _decode_values(payload, h, types, encoding, strict=True):
+    """Body record -> list giá trị Python (None nếu text không giải mã được / có byte NUL khi strict)"""
+    values, i = [], h
+    for t in types:
+        if t == 0:
+            values.append(None)
+        elif t < 7:
+            n = _INT_SIZES[t]
+            values.append(int.from_bytes(payload[i:i + n], "big", signed=True))
+            i += n
+        elif t == 7:
+            values.append(struct.unpack_from(">d", payload, i)[0])
+            i += 8
+        elif t in (8, 9):
+            values.append(t - 8)
+        else:
+            n = (t - 12) >> 1
+            raw = bytes(payload[i:i + n])
+            if t & 1:
+                try:
+                    text = raw.decode(encoding)
+                except UnicodeDecodeError:
+                    return None
+                if strict and "\x00" in text:      # byte rác từ cell bị ghi đè chồng lên
+                    return None
+                values.append(text)
+            else:
+                values.append(raw)
+            i += n
+    return values
+
+
+def decode_record(payload, encoding="utf-8"):
+    """Payload đầy đủ của 1 record (header + body) -> list giá trị, None nếu record hỏng"""
+    h, i = _varint(payload, 0, len(payload))
+    if h is None or h < 1 or h > len(payload):
+        return None
+    types = []
+    while i < h:
+        t, i = _varint(payload, i, h)
+        if t is None or t in (10, 11):
+            return None
+        types.append(t)
+    if h + sum(_SIZES[t] if t < 128 else (t - 12) >> 1 for t in types) > len(payload):
+        return None
+    return _decode_values(payload, h, types, encoding, strict=False)
+
+
+def read_leaf_cells(buf, hdr, usable, encoding="utf-8", read_page=None):
+    """
+    Các cell của 1 trang lá bảng (buf = cả trang, hdr = 100 với trang 1) -> {rowid: list giá trị}.
+    read_page(pgno) -> bytes trang để đọc phần payload tràn sang overflow; không có thì giá trị là None.
+    """
+    cells = {}
+    ncells = struct.unpack_from(">H", buf, hdr + 3)[0]
+    for i in range(ncells):
+        ptr = struct.unpack_from(">H", buf, hdr + 8 + 2 * i)[0]
+        payload, j = _varint(buf, ptr, usable)
+        if payload is None:
+            continue
+        rowid, k = _varint(buf, j, usable)
+        if rowid is None:
+            continue
+        local = _local_size(payload, usable)
+        data = bytes(buf[k:k + local])
+        if local < payload:
+            rest = None
+            if read_page and k + local + 4 <= usable:
+                rest = _read_overflow(read_page, struct.unpack_from(">I", buf, k + local)[0], payload - local, usable)
+            data = data + rest if rest is not None else None
+        cells[rowid] = decode_record(data, encoding) if data is not None else None
+    return cells
+
+
+def _carve_region(mm, buf, base, lo, hi, schemas, source, ctx, found):
+    """Quét buf[lo:hi] (1 trang, offset trong trang) tìm record của các bảng trong schemas"""
+    page_size, usable, pages, encoding = ctx
+    read_page = lambda p: mm[(p - 1) * page_size:p * page_size] if 1 <= p <= pages else None
+    region = buf[:hi]
+    candidates = []
+    for schema in schemas:
+        for m in re.finditer(schema["pattern"], region[lo:]):
+            r = lo + m.start()
+            parsed = _parse_header(buf, r, hi, schema)
+            if parsed is None:
+                continue
+            types, h, body = parsed
+            length = h + body
+            # payload length = header + body -> biết phần cục bộ / số trang overflow mà không cần prefix của cell
+            local = _local_size(length, usable)
+            if r + local + (4 if local < length else 0) > hi:
+                continue
+            if local < length:
+                first = struct.unpack_from(">I", buf, r + local)[0]
+                rest = _read_overflow(read_page, first, length - local, usable)
+                if rest is None:
+                    continue
+                payload = bytes(buf[r:r + local]) + rest
+            else:
+                payload = buf[r:r + length]
+            cell = _find_cell(buf, r, lo, length)
+            rowid = cell[1] if cell is not None else None
+            values = _decode_values(payload, h, types, encoding)
+            if values is None:
+                continue
+            if all(v is None for v in values):
+                continue
+            if schema["ipk"] is not None:
+                values[schema["ipk"]] = rowid
+            for i in schema["real"]:
+                if isinstance(values[i], int):
+                    values[i] = float(values[i])
+            candidates.append((r, r + min(local, hi - r), schema["name"], rowid, values))
+    # record chồng lấn (header giả nằm trong body record khác): giữ record bắt đầu sớm hơn
+    candidates.sort(key=lambda c: (c[0], -c[1]))
+    end = lo
+    for r, stop, name, rowid, values in candidates:
+        if r < end:
+            continue
+        end = stop
+        found.append((name, base // page_size + 1, base + r, source, rowid, values))
+
+
+def _carve_range(db_path: str, jobs, header, schemas):
+    """
+    Chạy trong process con: carving các trang trong jobs [(số trang, loại, tên bảng hoặc None)].
+    Trả về (số trang, list (bảng, trang, offset, nguồn, rowid, values)).
+    """
+    page_size, usable, pages = header["page_size"], header["usable"], header["pages"]
+    ctx = (page_size, usable, pages, header["encoding"])
+    by_name = {s["name"]: s for s in schemas}
+    found = []
+    with open(db_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for pgno, kind, table in jobs:
+                base = (pgno - 1) * page_size
+                buf = mm[base:base + usable]
+                if kind == "leaf":
+                    hdr = _page_header_offset(pgno)
+                    own = [by_name[table]]
+                    first_fb, ncells, content = struct.unpack_from(">HHH", buf, hdr + 1)
+                    content = content or 65536
+                    gap_lo = hdr + 8 + 2 * ncells
+                    if gap_lo < min(content, usable):
+                        _carve_region(mm, buf, base, gap_lo, min(content, usable), own, "unallocated", ctx, found)
+                    fb, seen = first_fb, set()
+                    while fb and fb + 4 <= usable and fb not in seen:
+                        seen.add(fb)
+                        nxt, size = struct.unpack_from(">HH", buf, fb)
+                        if size >= 4:
+                            _carve_region(mm, buf, base, fb + 4, min(fb + size, usable), own, "freeblock", ctx, found)
+                        fb = nxt
+                elif kind == "freelist_trunk":
+                    count = min(struct.unpack_from(">I", buf, 4)[0], (usable - 8) // 4)
+                    _carve_region(mm, buf, base, 8 + 4 * count, usable, schemas, kind, ctx, found)
+                else:
+                    _carve_region(mm, buf, base, 0, usable, schemas, kind, ctx, found)
+        finally:
+            mm.close()
+    return len(jobs), found
+
+
+# -----------------------------
+# Đối chiếu với bảng đang sống
+# -----------------------------
+def _classify(conn, schema, records):
+    """Gắn status cho record của 1 bảng; bỏ record trùng hệt dòng đang sống. records: [(…, rowid, values)]"""
+    live = {}
+    rowids = sorted({r[4] for r in records if r[4] is not None})
+    for i in range(0, len(rowids), LIVE_BATCH):
+        batch = rowids[i:i + LIVE_BATCH]
+        sql = f'SELECT rowid, * FROM "{schema["name"]}" WHERE rowid IN ({",".join("?" * len(batch))})'
+        for row in conn.execute(sql, batch):
+            live[row[0]] = list(row[1:])
+    out = []
+    for rec in records:
+        rowid, values = rec[4], rec[5]
+        if rowid is None:
+            status = "unknown"
+        elif rowid not in live:
+            status = "deleted"
+        elif live[rowid] == values:
+            continue
+        else:
+            status = "modified"
+        out.append((*rec, status))
+    return out
+
+
+def _json_default(v):
+    return v.hex() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+def _write_output(out_path: Path, schemas, records, info):
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    for p in (out_path, Path(str(out_path) + "-journal")):
+        p.unlink(missing_ok=True)
+    out = sqlite3.connect(str(out_path))
+    try:
+        out.executescript(OUT_SCHEMA)
+        out.executemany("INSERT INTO carve_info VALUES (?, ?)", [(k, json.dumps(v)) for k, v in info.items()])
+        by_name = {s["name"]: s for s in schemas}
+        out.executemany(
+            "INSERT INTO recovered_records (table_name, status, source, page, offset, rowid_hint, record_json) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((name, status, source, page, offset, rowid,
+              json.dumps(dict(zip(by_name[name]["columns"], values)), ensure_ascii=False, default=_json_default))
+             for name, page, offset, source, rowid, values, status in records))
+        for schema in schemas:
+            rows = [r for r in records if r[0] == schema["name"]]
+            if not rows:
+                continue
+            cols = ", ".join(f'"{c}" {t}'.rstrip() for c, t in zip(schema["columns"], schema["types"]))
+            out.execute(f'CREATE TABLE "recovered_{schema["name"]}" (_status TEXT, _source TEXT, _page INTEGER, '
+                        f'_offset INTEGER, _rowid INTEGER, {cols})')
+            marks = ", ".join("?" * (len(schema["columns"]) + 5))
+            out.executemany(f'INSERT INTO "recovered_{schema["name"]}" VALUES ({marks})',
+                            ((status, source, page, offset, rowid, *values)
+                             for _, page, offset, source, rowid, values, status in rows))
+        out.commit()
+    finally:
+        out.close()
+
+
+# -----------------------------
+# Carving cả DB
+# -----------------------------
+def carve_database(db_path: Path, out_path: Path, tables=None, workers: int = None, progress_callback=None):
+    """
+    Carving file SQLite db_path (nên là snapshot), ghi kết quả vào out_path (ghi đè).
+    tables: chỉ khôi phục các bảng này (None = mọi bảng rowid có >= MIN_COLUMNS cột).
+    progress_callback(done_pages, total_pages) để cập nhật UI.
+    Trả về dict: pages, scanned_pages, freelist_pages, leaf_pages, tables, recovered, by_table, by_status, seconds.
+    """
+    t0 = time.perf_counter()
+    db_path, out_path = Path(db_path), Path(out_path)
+    with span("carve", file=db_path.name) as sp:
+        header = read_header(db_path)
+        schemas = read_schemas(db_path, tables)
+        if not schemas:
+            raise ValueError("Không có bảng nào để khôi phục (bảng rowid, >= %d cột)" % MIN_COLUMNS)
+        with open(db_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                owner = walk_table_leaves(mm, header, schemas)
+                trunks, leaves = walk_freelist(mm, header)
+            finally:
+                mm.close()
+        jobs = [(p, "freelist", None) for p in leaves]
+        jobs += [(p, "freelist_trunk", None) for p in trunks]
+        jobs += [(p, "leaf", name) for p, name in owner.items()]
+        jobs += [(p, "trailing", None) for p in range(header["header_pages"] + 1, header["pages"] + 1)]
+        jobs.sort()
+        total = len(jobs)
+        chunks = [jobs[i:i + PAGES_PER_TASK] for i in range(0, total, PAGES_PER_TASK)]
+
+        found, done = [], 0
+        if chunks:
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(chunks))) as pool:
+                futures = [pool.submit(_carve_range, str(db_path), chunk, header, schemas) for chunk in chunks]
+                for fut in futures:
+                    n, part = fut.result()
+                    found.extend(part)
+                    done += n
+                    if progress_callback:
+                        progress_callback(done, total)
+
+        # bỏ bản trùng (cùng bảng, rowid, nội dung), giữ vị trí đầu tiên
+        unique, seen = [], set()
+        for rec in sorted(found, key=lambda r: (r[1], r[2])):
+            key = (rec[0], rec[4], repr(rec[5]))
+            if key not in seen:
+                seen.add(key)
+                unique.append(rec)
+
+        records = []
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro&immutable=1", uri=True)
+        try:
+            for schema in schemas:
+                records.extend(_classify(conn, schema, [r for r in unique if r[0] == schema["name"]]))
+        finally:
+            conn.close()
+
+        by_table, by_status = {}, {}
+        for rec in records:
+            by_table[rec[0]] = by_table.get(rec[0], 0) + 1
+            by_status[rec[6]] = by_status.get(rec[6], 0) + 1
+        stats = {"source": str(db_path), "pages": header["pages"], "page_size": header["page_size"],
+                 "scanned_pages": total, "freelist_pages": len(trunks) + len(leaves), "leaf_pages": len(owner),
+                 "tables": [s["name"] for s in schemas], "recovered": len(records),
+                 "by_table": by_table, "by_status": by_status}
+        _write_output(out_path, schemas, records, stats)
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        sp.set(pages=total, recovered=len(records))
+    return stats
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Recover deleted records from freelist pages, free blocks and "
+                                            "unallocated space of a SQLite DB.")
+    p.add_argument("db", help="SQLite DB (a copy; the -wal file is ignored).")
+    p.add_argument("--out", default=None, help="Output SQLite file (default: zl_index/carved_<name>_<hash>.sqlite).")
+    p.add_argument("--tables", nargs="*", default=None, help="Only recover these tables.")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    p.add_argument("--key", default=None, help="SQLCipher key: decrypt page-for-page to a temp file first.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    db = Path(args.db)
+    out = Path(args.out) if args.out else carve_path_for(db)
+    progress = lambda d, t: print(f"[+] {d}/{t} pages")
+    if args.key:
+        from zl_decrypt import decrypt_database
+        from zl_sqlcipher import secure_delete
+        with tempfile.TemporaryDirectory() as tmp:
+            plain = Path(tmp) / db.name
+            try:
+                decrypt_database(db, plain, args.key, workers=args.workers, strict=False)
+                stats = carve_database(plain, out, args.tables, args.workers, progress)
+            finally:
+                # bản giải mã tạm: ghi đè trước khi TemporaryDirectory xóa
+                secure_delete(plain)
+    else:
+        stats = carve_database(db, out, args.tables, args.workers, progress)
+    stats["out"] = str(out)
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
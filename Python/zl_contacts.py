@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_contacts.py
+-----------------------------------
+Danh bạ từ bảng `info-cache` của Storage.db (dùng chung cho GUI và các bước xử lý):
+    Bản ghi gọn (__slots__): chỉ giữ key, tên, avatar URL - không giữ JSON raw
+
+    Tên/avatar được lấy bằng json_extract ngay trong SQLite (không json.loads từng dòng trong Python)
+
+    JSON raw và các trường khác đọc theo key khi cần (on demand), parse lười
+
+    Đọc theo lô fetchmany, chạy được trong thread nền
+
+    Chỉ mục tìm kiếm: bỏ dấu + không phân biệt hoa thường (kể cả đ -> d), tìm theo tiền tố
+    (bisect trên danh sách token đã sắp xếp) và chuỗi con (trigram), kết quả có xếp hạng
+-----------------------------------
+Lưu ý:
+ - Luôn đọc trên **bản copy** (snapshot) của Storage.db.
+"""
+import json
+import sqlite3
+import unicodedata
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from zl_trace import traced
+
+INFO_CACHE_TABLE = "info-cache"
+LOAD_BATCH = 5000
+
+# Tên + avatar lấy trực tiếp bằng JSON1 của SQLite; dòng có JSON hỏng trả về chuỗi rỗng
+_SQL_JSON1 = (
+    "SELECT key,"
+    " CASE WHEN json_valid(val) THEN coalesce(json_extract(val, '$.zName'), '') ELSE '' END,"
+    " CASE WHEN json_valid(val) THEN coalesce(json_extract(val, '$.avatar'), '') ELSE '' END"
+    f' FROM "{INFO_CACHE_TABLE}"'
+)
+_SQL_RAW = f'SELECT key, val FROM "{INFO_CACHE_TABLE}"'
+
+
+class Contact:
+    """1 liên hệ trong info-cache (chỉ các trường hiển thị)"""
+    __slots__ = ("key", "name", "avatar")
+
+    def __init__(self, key, name, avatar):
+        self.key = key
+        self.name = name
+        self.avatar = avatar
+
+    def __repr__(self):
+        return f"Contact({self.key!r}, {self.name!r})"
+
+
+def _parse_fields(val):
+    # Fallback khi SQLite không có JSON1
+    try:
+        data = json.loads(val)
+        return str(data.get("zName", "") or ""), str(data.get("avatar", "") or "")
+    except Exception:
+        return "", ""
+
+
+class ContactStore:
+    """
+    Danh bạ đọc từ snapshot Storage.db.
+    - load(): đọc key/tên/avatar theo lô (gọi trong thread nền)
+    - raw(key) / field(key, name): đọc JSON raw theo key khi người dùng chọn 1 liên hệ
+    - export_sql(): câu SELECT đầy đủ (kèm JSON raw) để xuất streaming bằng zl_export
+    """
+
+    def __init__(self, snapshot_path: Path):
+        self.snapshot_path = Path(snapshot_path)
+        self.contacts = []
+        self.by_key = {}
+
+    def _connect(self):
+        return sqlite3.connect(f"file:{self.snapshot_path}?mode=ro", uri=True)
+
+    @traced("contacts.load")
+    def load(self, batch_size=LOAD_BATCH, progress_callback=None):
+        """Đọc toàn bộ danh bạ; progress_callback(loaded) sau mỗi lô. Trả về self."""
+        contacts, by_key = [], {}
+        conn = self._connect()
+        try:
+            try:
+                cur = conn.execute(_SQL_JSON1)
+                parse = None
+            except sqlite3.OperationalError:
+                cur = conn.execute(_SQL_RAW)
+                parse = _parse_fields
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for key, a, b in (((k, *parse(v)) for k, v in rows) if parse else rows):
+                    c = Contact(str(key), a or "", b or "")
+                    contacts.append(c)
+                    by_key[c.key] = c
+                if progress_callback:
+                    progress_callback(len(contacts))
+        finally:
+            conn.close()
+        self.contacts, self.by_key = contacts, by_key
+        return self
+
+    def __len__(self):
+        return len(self.contacts)
+
+    def __iter__(self):
+        return iter(self.contacts)
+
+    def get(self, key):
+        return self.by_key.get(str(key))
+
+    def raw(self, key):
+        """JSON raw của 1 liên hệ (đọc lại từ snapshot theo key)"""
+        conn = self._connect()
+        try:
+            row = conn.execute(f'SELECT val FROM "{INFO_CACHE_TABLE}" WHERE key = ?', (str(key),)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def field(self, key, name, default=None):
+        """Đọc 1 trường bất kỳ trong JSON của liên hệ (parse lười, chỉ khi gọi)"""
+        raw = self.raw(key)
+        if not raw:
+            return default
+        try:
+            return json.loads(raw).get(name, default)
+        except Exception:
+            return default
+
+    @staticmethod
+    def export_sql():
+        """SELECT cho xuất danh bạ: key, tên, avatar, JSON raw"""
+        return (
+            'SELECT key AS "Key",'
+            ' CASE WHEN json_valid(val) THEN json_extract(val, \'$.zName\') END AS "Tên (zName)",'
+            ' CASE WHEN json_valid(val) THEN json_extract(val, \'$.avatar\') END AS "Avatar URL",'
+            ' val AS "JSON Raw"'
+            f' FROM "{INFO_CACHE_TABLE}"'
+        )
+
+
+# -----------------------
+# Tìm kiếm danh bạ
+# -----------------------
+_FOLD_EXTRA = str.maketrans({"đ": "d", "Đ": "d", "ð": "d"})
+
+
+def fold_text(text: str) -> str:
+    """Chuẩn hóa để so khớp: bỏ dấu tiếng Việt, đ -> d, casefold ("Nguyễn Đức" -> "nguyen duc")"""
+    text = unicodedata.normalize("NFD", str(text).translate(_FOLD_EXTRA))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def _trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ContactIndex:
+    """
+    Chỉ mục tìm kiếm trên ContactStore (tên + key/UID, đã fold_text).
+    - Tiền tố: danh sách (token, vị trí) đã sắp xếp, tra bằng bisect
+    - Chuỗi con (>= 3 ký tự): posting list theo trigram, giao các list rồi kiểm tra lại
+    - Xếp hạng: trùng khớp tên > tên bắt đầu bằng chuỗi tìm > mọi từ khớp tiền tố > chuỗi con;
+      cùng hạng thì tên ngắn hơn, rồi theo thứ tự chữ cái
+    search() trả về danh sách Contact.
+    """
+
+    @traced("contacts.index")
+    def __init__(self, store: ContactStore):
+        self.contacts = list(store.contacts)
+        self.folded = [fold_text(c.name) for c in self.contacts]
+        tokens = []
+        grams = {}
+        for i, (c, name) in enumerate(zip(self.contacts, self.folded)):
+            text = f"{name} {c.key.casefold()}"
+            for tok in set(text.split()):
+                tokens.append((tok, i))
+            for g in _trigrams(text):
+                posting = grams.get(g)
+                if posting is None:
+                    posting = grams[g] = array("I")
+                posting.append(i)
+        tokens.sort()
+        self._tokens = tokens
+        self._grams = grams
+
+    def _prefix_hits(self, q):
+        hits = set()
+        pos = bisect_left(self._tokens, (q, -1))
+        tokens = self._tokens
+        while pos < len(tokens) and tokens[pos][0].startswith(q):
+            hits.add(tokens[pos][1])
+            pos += 1
+        return hits
+
+    def _substring_hits(self, q):
+        postings = sorted((self._grams.get(g, ()) for g in _trigrams(q)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        hits = set(postings[0])
+        for p in postings[1:]:
+            hits.intersection_update(p)
+            if not hits:
+                return hits
+        return {i for i in hits if q in self.folded[i] or q in self.contacts[i].key.casefold()}
+
+    def search(self, query: str, limit: int = None):
+        """Tìm theo tên/UID; query rỗng -> toàn bộ danh bạ theo thứ tự gốc"""
+        q = fold_text(query).strip()
+        if not q:
+            return self.contacts[:limit] if limit else list(self.contacts)
+        hits = prefix_all = None
+        for w in sorted(q.split(), key=len, reverse=True):
+            prefix = self._prefix_hits(w)
+            found = prefix | self._substring_hits(w) if len(w) >= 3 else prefix
+            hits = found if hits is None else hits & found
+            prefix_all = prefix if prefix_all is None else prefix_all & prefix
+            if not hits:
+                return []
+
+        folded = self.folded
+
+        def rank(i):
+            name = folded[i]
+            if name == q:
+                tier = 0
+            elif name.startswith(q):
+                tier = 1
+            elif i in prefix_all:
+                tier = 2
+            else:
+                tier = 3
+            return tier, len(name), name
+
+        ordered = sorted(hits, key=rank)
+        if limit:
+            ordered = ordered[:limit]
+        return [self.contacts[i] for i in ordered]
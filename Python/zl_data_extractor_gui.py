@@ -14,38 +14,68 @@ Công cụ GUI cho phép:
 
     Tìm kiếm, lọc dữ liệu theo từ khóa trong bảng
 
+    Giải mã cột khi xem / xuất: thời gian epoch -> ISO, nội dung JSON -> chữ / đính kèm, BLOB -> hex
+
     Xuất dữ liệu ra file CSV hoặc Excel
 
+    Xuất toàn bộ DB / tất cả DB thành bundle (mỗi bảng 1 file, chạy song song)
+
     Xem danh bạ (info-cache) gồm bạn bè, nhóm, user
 
+    Timeline hội thoại (số tin nhắn theo ngày) từ chỉ mục sidecar
+
+    Kiểm kê media (ảnh, file, voice): SHA256, kiểu thật theo magic bytes, liên kết với tin nhắn
+    -> xem media theo hội thoại từ chỉ mục sidecar
+
     Chuyển đổi giao diện sáng/tối (Light/Dark mode)
 
+    Đo thời gian các bước (nút "Trace" hoặc ZL_TRACE=1): snapshot, connect, truy vấn,
+    render Treeview, xuất file -> Chrome trace JSON trong ~/.zl_extract/traces
+
     Đọc DB an toàn (read-only), hỗ trợ thread tránh treo ứng dụng
 -----------------------------------
 Yêu cầu:
- pip install ttkbootstrap pandas pillow sqlite3
+ pip install ttkbootstrap pandas pillow requests sqlite3
+ (tùy chọn, nén CSV zstd) pip install zstandard
 
 Lưu ý:
  - Công cụ chỉ dùng khi bạn **có quyền hợp pháp** (dữ liệu của bạn hoặc giấy phép được phép truy cập).
  - Luôn làm việc trên **bản copy** của file gốc.
 """
 import os
-import shutil
-import sqlite3
+from datetime import datetime
 from pathlib import Path
 import pandas as pd
-import threading
 import json
-import re
-import requests
-from io import BytesIO
-from PIL import Image, ImageTk
 
 import ttkbootstrap as tb
 import tkinter as tk
 from ttkbootstrap.constants import *
 from tkinter import filedialog, messagebox
 
+from zl_engine import (
+    snapshot_db, connect_ro, discover_accounts, find_storage_db, find_message_dbs, run_extraction, export_db_bundle,
+    list_tables as list_snapshot_tables, sha256_of_file, append_evidence_log, EVIDENCE_LOG_NAME,
+)
+from zl_export import export_table_streaming, export_query_streaming, EXPORT_FORMATS, COMPRESSIONS
+from zl_contacts import ContactStore, ContactIndex
+from zl_resolve import build_names_db, build_resolved_query
+from zl_avatar import AvatarService, AvatarPhotoCache
+from zl_trace import TRACER, span
+from zl_decode import DecodePlan
+from zl_memory import plan_load, paged_sql, measure, format_bytes, format_report
+from zl_tasks import TaskScheduler, TaskPanel
+from zl_media import (
+    build_media_index, media_index_path_for, account_media_scope, media_conversations, conversation_media,
+    export_media_csv,
+)
+from zl_carve import carve_database, carve_path_for
+from zl_wal import WalReader, wal_path_for, format_page_diff
+from zl_timeline_index import (
+    build_timeline_index, index_path_for, timeline_summary, timeline_daily,
+    export_timeline_csv, format_ts,
+)
+
 # Thư mục tạm để copy file SQLite (tránh khóa file khi Zalo đang chạy)
 TEMP_DIR = Path("temp_zalo_db")
 
@@ -58,54 +88,12 @@ def prepare_db_copy(db_file: Path) -> Path:
     Copy file DB và các file liên quan (-wal, -shm) sang thư mục tạm để mở chế độ read-only
     Tránh tình trạng SQLite bị khóa khi Zalo đang sử dụng.
     """
-    TEMP_DIR.mkdir(exist_ok=True)
-    dst_db = TEMP_DIR / db_file.name
-    shutil.copy2(db_file, dst_db)
-    for ext in ["-wal", "-shm"]:
-        f = Path(str(db_file) + ext)
-        if f.exists():
-            shutil.copy2(f, TEMP_DIR / f.name)
-    return dst_db
+    return snapshot_db(db_file, TEMP_DIR)
 
 
 def list_tables(db_file: Path):
     """Liệt kê danh sách bảng trong file SQLite DB"""
-    db_copy = prepare_db_copy(db_file)
-    conn = sqlite3.connect(f'file:{db_copy}?mode=ro', uri=True)
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return tables
-
-
-def extract_first_id(obj):
-    """
-    Trích xuất UID đầu tiên (chuỗi số >= 10 ký tự) từ JSON config
-    Duyệt đệ quy trong dict, list, string
-    """
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            if k.isdigit() and len(k) >= 10:
-                return k
-            res = extract_first_id(v)
-            if res:
-                return res
-    elif isinstance(obj, list):
-        for item in obj:
-            res = extract_first_id(item)
-            if res:
-                return res
-    elif isinstance(obj, str):
-        match = re.search(r"\b\d{10,}\b", obj)
-        if match:
-            return match.group(0)
-        try:
-            nested = json.loads(obj)
-            return extract_first_id(nested)
-        except Exception:
-            pass
-    return None
+    return list_snapshot_tables(prepare_db_copy(db_file))
 
 
 # -----------------------------
@@ -120,10 +108,27 @@ class ZaloExtractorApp:
 
         # Biến lưu trữ
         self.selected_dir = None       # thư mục ZaloData
-        self.uid = None                # UID tài khoản
+        self.uid = None                # UID tài khoản đang xem
+        self.accounts = []             # mọi tài khoản tìm thấy (discover_accounts)
         self.avatar_img = None         # ảnh avatar chính
-        self.avatar_cache = {}         # cache avatar của bạn bè
+        self.contacts = None           # danh bạ info-cache (ContactStore)
+        self.contact_index = None      # chỉ mục tìm kiếm danh bạ (ContactIndex)
+        self._pending_index = None
+        self._contacts_inserted = False
+        self._tree_keys = []           # mọi key đã chèn vào cache_tree (kể cả đang detach)
+        self.names_db = None           # DB tra UID -> tên (gắn tên vào preview / xuất)
         self.message_arr = {}          # lưu trữ danh sách file Message DB đã quét
+        self.source_hashes = {}        # cache SHA256 snapshot nguồn cho nhật ký xuất
+        # Avatar: tải song song + cache đĩa (LRU) + cache PhotoImage, không chặn Tk thread
+        self.avatar_service = AvatarService()
+        self.avatar_photos = AvatarPhotoCache(master, self.avatar_service)
+        self._prefetch_job = None
+        # Tác vụ nền: pool giới hạn + 1 hàng đợi UI poll định kỳ, hủy được, có bảng tác vụ
+        self.tasks = TaskScheduler()
+        self.tasks.attach(master)
+        self.task_panel = None
+        self._contacts_task = None
+        self.preview_windows = {}      # (file DB, bảng) -> cửa sổ preview đang mở
 
         self.style = tb.Style()
 
@@ -154,10 +159,34 @@ class ZaloExtractorApp:
                                   bootstyle="success", command=self.scan_dir)
         self.btn_scan.pack(side=LEFT, padx=5)
 
+        # Nút chọn tài khoản (máy có nhiều tài khoản Zalo đăng nhập)
+        self.btn_account = tb.Button(top_frame, text="👤 Chọn tài khoản",
+                                     bootstyle="info-outline", command=self.pick_account)
+        self.btn_account.pack(side=LEFT, padx=5)
+
+        # Nút trích xuất toàn bộ (engine headless, nhiều process)
+        self.btn_extract = tb.Button(top_frame, text="⚙ Trích xuất toàn bộ",
+                                     bootstyle="secondary", command=self.extract_all)
+        self.btn_extract.pack(side=LEFT, padx=5)
+
         # Nút đổi theme sáng/tối
         tb.Button(top_frame, text="🌞 / 🌙 Đổi theme",
                   bootstyle="warning", command=self.toggle_theme).pack(side=RIGHT, padx=10)
 
+        # Offline: chỉ hiển thị avatar đã có trong cache, không truy cập mạng
+        self.offline_var = tb.BooleanVar(value=False)
+        tb.Checkbutton(top_frame, text="Offline (avatar từ cache)", variable=self.offline_var,
+                       bootstyle="round-toggle", command=self.toggle_offline).pack(side=RIGHT, padx=10)
+
+        # Trace: ghi thời gian từng bước, tắt thì lưu file Chrome trace
+        self.trace_var = tb.BooleanVar(value=TRACER.enabled)
+        tb.Checkbutton(top_frame, text="⏱ Trace", variable=self.trace_var,
+                       bootstyle="round-toggle", command=self.toggle_trace).pack(side=RIGHT, padx=10)
+
+        # Bảng tác vụ nền (tiến trình + hủy)
+        tb.Button(top_frame, text="🧵 Tác vụ", bootstyle="secondary-outline",
+                  command=self.show_tasks).pack(side=RIGHT, padx=5)
+
         # Khung hiển thị UID + info
         uid_frame = tb.LabelFrame(self.main_tab, text="UID / Info", padding=10, bootstyle="secondary")
         uid_frame.pack(fill=X, padx=10, pady=5)
@@ -195,6 +224,12 @@ class ZaloExtractorApp:
                 command=lambda: self.export_message_list("csv")).pack(side=LEFT, padx=5)
         tb.Button(export_frame, text="💾 Xuất danh sách Excel", bootstyle="info",
                 command=lambda: self.export_message_list("excel")).pack(side=LEFT, padx=5)
+        tb.Button(export_frame, text="📊 Timeline hội thoại", bootstyle="warning",
+                command=self.open_timeline).pack(side=LEFT, padx=5)
+        tb.Button(export_frame, text="🖼 Media đính kèm", bootstyle="warning-outline",
+                command=self.open_media).pack(side=LEFT, padx=5)
+        tb.Button(export_frame, text="📦 Bundle tất cả DB", bootstyle="secondary",
+                command=lambda: self.export_bundle(self.all_db_files())).pack(side=LEFT, padx=5)
 
 
         sb = tb.Scrollbar(msg_frame, orient="vertical", command=self.tree.yview, bootstyle="round")
@@ -224,13 +259,12 @@ class ZaloExtractorApp:
         search_entry2 = tb.Entry(search_frame2, textvariable=self.search_var2, bootstyle="info")
         search_entry2.pack(side=LEFT, fill=X, expand=True, padx=5)
 
-        # Hàm lọc danh sách khi gõ
+        # Hàm lọc danh sách khi gõ (tìm trên chỉ mục, bỏ dấu: "nguyen" khớp "Nguyễn")
         def filter_cache(*args):
-            q = self.search_var2.get().lower()
-            self.cache_tree.delete(*self.cache_tree.get_children())
-            for key, (zname, avatar, val) in self.avatar_cache.items():
-                if q in zname.lower():
-                    self.cache_tree.insert("", "end", values=(key, zname, avatar, val))
+            if self.contact_index is None:
+                return
+            results = self.contact_index.search(self.search_var2.get())
+            self.sync_cache_tree([c.key for c in results])
 
         # Gắn sự kiện realtime (khi gõ)
         try:
@@ -240,7 +274,8 @@ class ZaloExtractorApp:
 
 
         sb2 = tb.Scrollbar(left, orient="vertical", command=self.cache_tree.yview, bootstyle="round")
-        self.cache_tree.configure(yscroll=sb2.set)
+        # Mỗi lần cuộn -> tải trước avatar của các dòng đang hiển thị
+        self.cache_tree.configure(yscroll=lambda *a: (sb2.set(*a), self.schedule_avatar_prefetch()))
         sb2.pack(side=RIGHT, fill=Y)
 
         self.cache_tree.bind("<<TreeviewSelect>>", self.on_select_cache)
@@ -295,49 +330,125 @@ class ZaloExtractorApp:
             messagebox.showwarning("Chưa chọn", "⚠ Hãy chọn thư mục ZaloPC trước.")
             return
 
+        # Tìm mọi tài khoản (thư mục UID + database-config.json)
+        try:
+            self.accounts = discover_accounts(self.selected_dir)
+        except Exception as e:
+            self.accounts = []
+            messagebox.showerror("Lỗi", f"Không đọc được danh sách tài khoản: {e}")
+
+        if not self.accounts:
+            messagebox.showwarning("UID", "❌ Không tìm thấy UID trong database-config.json")
+            return
+
+        if len(self.accounts) == 1:
+            self.load_account(self.accounts[0]["uid"])
+        else:
+            self.pick_account()
+
+    # Hộp thoại chọn tài khoản (kèm thống kê từng tài khoản)
+    def pick_account(self):
+        if not self.accounts:
+            messagebox.showwarning("Chưa quét", "⚠ Hãy quét thư mục ZaloPC trước.")
+            return
+        dlg = tb.Toplevel(self.master)
+        dlg.title("👤 Chọn tài khoản")
+        dlg.geometry("720x300")
+        cols = ("uid", "config", "dbs", "msg", "size", "modified")
+        tree = tb.Treeview(dlg, columns=cols, show="headings", bootstyle="info", height=8)
+        for c, text, w in zip(cols, ("UID", "Trong config", "Số DB", "Message DB", "Dung lượng", "Sửa gần nhất"),
+                              (170, 90, 60, 90, 100, 160)):
+            tree.heading(c, text=text)
+            tree.column(c, width=w)
+        for a in self.accounts:
+            tree.insert("", "end", iid=a["uid"], values=(
+                a["uid"], "✔" if a["in_config"] else "", a["db_count"], a["message_dbs"],
+                f"{a['total_bytes'] / 1048576:.1f} MB", a["last_modified"] or "-"))
+        tree.pack(fill=BOTH, expand=True, padx=10, pady=10)
+        tree.selection_set(self.uid if self.uid in tree.get_children() else self.accounts[0]["uid"])
+
+        def choose(event=None):
+            sel = tree.selection()
+            if sel:
+                dlg.destroy()
+                self.load_account(sel[0])
+
+        tree.bind("<Double-1>", choose)
+        tb.Button(dlg, text="Mở tài khoản", bootstyle="success", command=choose).pack(pady=5)
+
+    # Nạp dữ liệu của 1 tài khoản (info-cache, danh bạ, Message DB)
+    def load_account(self, uid):
         # Reset UI
         self.tree.delete(*self.tree.get_children())
-        self.uid_var.set("")
+        self.message_arr.clear()
         self.zname_var.set("")
         self.avatar_label.config(image="", text="(Avatar sẽ hiển thị ở đây)")
-        self.uid = None
-
-        # Đọc file database-config.json để tìm UID
-        cfg_file = self.selected_dir / "database-config.json"
-        if cfg_file.exists():
-            try:
-                data = json.loads(cfg_file.read_text(encoding="utf-8"))
-                self.uid = extract_first_id(data)
-                if self.uid:
-                    self.uid_var.set(self.uid)
-            except Exception as e:
-                messagebox.showerror("Lỗi", f"Không đọc được database-config.json: {e}")
-
-        if not self.uid:
-            messagebox.showwarning("UID", "❌ Không tìm thấy UID trong database-config.json")
-            return
+        self.uid = uid
+        self.uid_var.set(uid)
 
         # Kiểm tra Storage.db để lấy info-cache (tên, avatar)
-        storage_db = self.selected_dir / "Database" / "_production" / "Storage.db"
-        if storage_db.exists():
+        storage_db = find_storage_db(self.selected_dir)
+        if storage_db:
             self.load_info_cache(storage_db, self.uid)
             self.load_all_info_cache(storage_db)
 
-        # Tìm thư mục chứa message DB
-        msg_dir = self.selected_dir / "Database" / "_production" / self.uid / "Core" / "Message"
-        if msg_dir.exists():
-            self.message_arr.clear()
-            for f in msg_dir.glob("*.db"):
+        # Tìm các message DB
+        msg_files = find_message_dbs(self.selected_dir, self.uid)
+        if msg_files:
+            for f in msg_files:
                 self.tree.insert("", "end", values=(f.name,f))
                 self.message_arr[f.name] = (f.name,f)
         else:
             messagebox.showinfo("Kết quả", "❌ Không có thư mục Message DB.")
 
+    # Trích xuất toàn bộ tài khoản bằng engine (snapshot + xuất mọi bảng song song)
+    def extract_all(self):
+        if not self.selected_dir:
+            messagebox.showwarning("Chưa chọn", "⚠ Hãy chọn thư mục ZaloPC trước.")
+            return
+        out = filedialog.askdirectory(title="Chọn thư mục lưu kết quả trích xuất")
+        if not out:
+            return
+
+        win = tb.Toplevel(self.master)
+        win.title("⚙ Trích xuất toàn bộ")
+        win.geometry("500x150")
+        label_status = tb.Label(win, text="⏳ Đang snapshot DB...")
+        label_status.pack(pady=10)
+        pb = tb.Progressbar(win, mode="determinate", bootstyle="info-striped")
+        pb.pack(fill=X, padx=20, pady=5)
+        self.btn_extract.configure(state=DISABLED)
+
+        # Tiến trình: gọi trên UI thread, đã gộp (chỉ giá trị mới nhất mỗi lần poll)
+        def progress(done, total, table):
+            pb.configure(maximum=total, value=done)
+            label_status.config(text=f"⏳ {done}/{total} bảng - {table}")
+
+        def done(report):
+            msg = (f"✅ {len(report['sources'])} DB, {report['total_tables']} bảng, "
+                   f"{report['total_rows']} dòng trong {report['seconds']}s\n"
+                   f"Báo cáo: {Path(out) / 'job_report.json'}")
+            if report["failed_tables"]:
+                msg += f"\n⚠ {report['failed_tables']} bảng lỗi (xem job_report.json)"
+            win.destroy()
+            messagebox.showinfo("Hoàn tất", msg)
+
+        def failed(err):
+            win.destroy()
+            messagebox.showerror("Lỗi", f"Trích xuất thất bại: {err}")
+
+        task = self.tasks.submit("Trích xuất toàn bộ",
+                                 lambda task: run_extraction(self.selected_dir, Path(out), uid=self.uid,
+                                                             progress_callback=task.report),
+                                 on_done=done, on_error=failed, on_progress=progress, on_cancel=win.destroy,
+                                 on_finally=lambda: self.btn_extract.configure(state=NORMAL))
+        tb.Button(win, text="Hủy", bootstyle="danger-outline", command=task.cancel).pack(pady=5)
+
     # Load info-cache của chính tài khoản (tên, avatar)
     def load_info_cache(self, storage_db: Path, uid: str):
         try:
             db_copy = prepare_db_copy(storage_db)
-            conn = sqlite3.connect(f'file:{db_copy}?mode=ro', uri=True)
+            conn = connect_ro(db_copy)
             cur = conn.cursor()
             cur.execute("SELECT val FROM 'info-cache' WHERE key=?", (f"0_{uid}",))
             row = cur.fetchone()
@@ -352,13 +463,10 @@ class ZaloExtractorApp:
 
             self.zname_var.set(zname)
 
-            # Nếu có avatar thì tải về
+            # Nếu có avatar thì tải bất đồng bộ (cache đĩa / mạng)
             if avatar_url:
-                resp = requests.get(avatar_url, timeout=10)
-                img = Image.open(BytesIO(resp.content))
-                img = img.resize((120, 120))
-                self.avatar_img = ImageTk.PhotoImage(img)
-                self.avatar_label.config(image=self.avatar_img, text="")
+                self.avatar_label.config(image="", text="⏳ Đang tải avatar...")
+                self.avatar_photos.get(avatar_url, (120, 120), self.show_main_avatar)
             else:
                 self.avatar_label.config(text="(No avatar)")
 
@@ -369,71 +477,187 @@ class ZaloExtractorApp:
         except Exception as e:
             messagebox.showerror("Lỗi", f"Load info-cache thất bại: {e}")
 
-    # Load toàn bộ info-cache (danh bạ bạn bè)
-    def load_all_info_cache(self, storage_db: Path):
-        try:
-            db_copy = prepare_db_copy(storage_db)
-            conn = sqlite3.connect(f'file:{db_copy}?mode=ro', uri=True)
-            cur = conn.cursor()
-            cur.execute("SELECT key, val FROM 'info-cache'")
-            rows = cur.fetchall()
-            conn.close()
+    def show_main_avatar(self, photo):
+        """Callback (Tk thread) khi avatar tài khoản đã sẵn sàng"""
+        if photo is None:
+            self.avatar_label.config(image="", text="(Avatar lỗi / không có trong cache)")
+            return
+        self.avatar_img = photo
+        self.avatar_label.config(image=photo, text="")
 
-            self.cache_tree.delete(*self.cache_tree.get_children())
-            self.avatar_cache.clear()
-
-            for key, val in rows:
-                try:
-                    data = json.loads(val)
-                    zname = data.get("zName", "")
-                    avatar = data.get("avatar", "")
-                except:
-                    zname, avatar = "", ""
-                self.cache_tree.insert("", "end", values=(key, zname, avatar, val))
-                self.avatar_cache[key] = (zname, avatar, val)
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Không load được info-cache: {e}")
+    def toggle_offline(self):
+        self.avatar_service.offline = self.offline_var.get()
+
+    def toggle_trace(self):
+        """Bật: bắt đầu ghi span. Tắt: ghi Chrome trace (+ .prof nếu ZL_TRACE_PROFILE) và báo đường dẫn."""
+        if self.trace_var.get():
+            TRACER.clear()
+            TRACER.enable(profile=bool(os.environ.get("ZL_TRACE_PROFILE")))
+            return
+        TRACER.disable()
+        if not TRACER.events:
+            return
+        path, prof = TRACER.dump()
+        TRACER.clear()
+        messagebox.showinfo("Trace", f"Đã lưu trace: {path}" + (f"\nProfile: {prof}" if prof else "")
+                            + "\n\nMở bằng chrome://tracing hoặc https://ui.perfetto.dev")
+
+    def show_tasks(self):
+        """Mở (hoặc đưa lên trước) bảng tác vụ nền"""
+        if self.task_panel is not None and self.task_panel.exists():
+            self.task_panel.lift()
+            return
+        self.task_panel = TaskPanel(self.master, self.tasks)
+
+    # Tải trước avatar của các dòng đang hiển thị trong danh bạ
+    def schedule_avatar_prefetch(self):
+        # gộp các sự kiện cuộn liên tiếp thành 1 lần prefetch
+        if self._prefetch_job is not None:
+            self.master.after_cancel(self._prefetch_job)
+        self._prefetch_job = self.master.after(150, self.prefetch_visible_avatars)
+
+    def prefetch_visible_avatars(self):
+        self._prefetch_job = None
+        tree = self.cache_tree
+        children = tree.get_children()
+        if not children:
+            return
+        first, last = tree.yview()
+        start = int(first * len(children))
+        end = min(len(children), int(last * len(children)) + 1)
+        if self.contacts is None:
+            return
+        urls = []
+        for iid in children[start:end]:
+            c = self.contacts.get(iid)
+            if c is not None and c.avatar:
+                urls.append(c.avatar)
+        self.avatar_service.prefetch(urls)
+
+    # Load toàn bộ info-cache (danh bạ bạn bè) trong thread nền
+    def load_all_info_cache(self, storage_db: Path):
+        self.clear_cache_tree()
+        self.contacts = None
+        self.contact_index = None
+        self._pending_index = None
+        self.names_db = None
+
+        def work(task):
+            store = ContactStore(prepare_db_copy(storage_db)).load()
+            self.tasks.call_ui(self.show_contacts, store)
+            task.check()
+            names_db = build_names_db(store.snapshot_path, source=storage_db)
+            self.tasks.call_ui(lambda: setattr(self, "names_db", names_db) if self.contacts is store else None)
+            task.check()
+            # chỉ mục tìm kiếm build sau khi danh sách đã hiển thị
+            return store, ContactIndex(store)
+
+        # quét lại: bỏ lần tải danh bạ trước (nếu chưa xong)
+        if self._contacts_task is not None:
+            self._contacts_task.cancel()
+        self._contacts_task = self.tasks.submit(
+            "Danh bạ info-cache", work, on_done=lambda result: self.set_contact_index(*result),
+            on_error=lambda err: messagebox.showerror("Lỗi", f"Không load được info-cache: {err}"))
+
+    def show_contacts(self, store, start=0, batch=2000):
+        """Chèn danh bạ vào Treeview theo từng lô (after) để UI không bị đứng khi có hàng chục nghìn liên hệ"""
+        if start == 0:
+            self.clear_cache_tree()
+            self.contacts = store
+            self._contacts_inserted = False
+        elif self.contacts is not store:
+            return  # đã quét lại thư mục khác
+        with span("render.contacts", start=start, rows=min(batch, len(store) - start)):
+            for c in store.contacts[start:start + batch]:
+                self.cache_tree.insert("", "end", iid=c.key, values=(c.key, c.name))
+                self._tree_keys.append(c.key)
+        if start + batch < len(store):
+            self.master.after(1, lambda: self.show_contacts(store, start + batch, batch))
+        else:
+            self._contacts_inserted = True
+            self.schedule_avatar_prefetch()
+            self.activate_contact_index()
+
+    def clear_cache_tree(self):
+        # xóa cả các dòng đang bị detach (ẩn do tìm kiếm), không chỉ các dòng đang hiển thị
+        if self._tree_keys:
+            self.cache_tree.delete(*self._tree_keys)
+        self._tree_keys = []
+
+    def set_contact_index(self, store, index):
+        if self.contacts is store:
+            self._pending_index = index
+            self.activate_contact_index()
+
+    def activate_contact_index(self):
+        """Dùng chỉ mục khi đã build xong VÀ mọi dòng đã được chèn vào Treeview"""
+        if self._pending_index is None or not self._contacts_inserted:
+            return
+        self.contact_index, self._pending_index = self._pending_index, None
+        if self.search_var2.get():
+            self.search_var2.set(self.search_var2.get())  # áp dụng lại chuỗi đã gõ trong lúc tải
+
+    def sync_cache_tree(self, keys):
+        """
+        Cập nhật Treeview danh bạ theo danh sách key mới bằng cách diff, không xóa/chèn lại:
+        set_children gắn lại (reattach) các dòng cần hiện đúng thứ tự, dòng không khớp chỉ bị detach.
+        """
+        if self.cache_tree.get_children() == tuple(keys):
+            return
+        self.cache_tree.set_children("", *keys)
+        self.cache_tree.yview_moveto(0)
+        self.schedule_avatar_prefetch()
 
     # Xử lý khi chọn 1 người trong info-cache
     def on_select_cache(self, event):
         sel = self.cache_tree.selection()
-        if not sel:
+        if not sel or self.contacts is None:
             return
 
-        item = self.cache_tree.item(sel[0])
-        vals = item.get("values", [])
-        if len(vals) < 4:
+        contact = self.contacts.get(sel[0])
+        if contact is None:
             return
-
-        uid, zname, avatar, raw = vals
+        uid, zname, avatar = contact.key, contact.name, contact.avatar
 
         # cập nhật entry
         self.key_var2.set(str(uid))
         self.zname_var2.set(zname)
 
-        # cập nhật JSON preview
+        # cập nhật JSON preview (JSON raw đọc lại từ snapshot theo key)
         self.json_text.delete("1.0", "end")
+        try:
+            raw = self.contacts.raw(uid) or ""
+        except Exception as e:
+            raw = f"(Không đọc được JSON: {e})"
         self.json_text.insert("1.0", raw)
 
-        # cập nhật avatar
+        # cập nhật avatar (bất đồng bộ; bỏ qua kết quả nếu người dùng đã chọn dòng khác)
         self.avatar_canvas.delete("all")
         if avatar:
-            try:
-                resp = requests.get(avatar, timeout=10)
-                img = Image.open(BytesIO(resp.content)).resize((100, 100))
-                self.avatar_img2 = ImageTk.PhotoImage(img)
-                self.avatar_canvas.create_image(
-                    60, 60, image=self.avatar_img2, anchor="center"
-                )
-            except Exception as e:
-                print("Lỗi load avatar:", e)
-                self.avatar_canvas.create_text(60, 60, text="(Avatar lỗi)")
+            def show(photo, selected=sel[0]):
+                if self.cache_tree.selection()[:1] != (selected,):
+                    return
+                self.avatar_canvas.delete("all")
+                if photo is None:
+                    self.avatar_canvas.create_text(60, 60, text="(Avatar lỗi)")
+                    return
+                self.avatar_img2 = photo
+                self.avatar_canvas.create_image(60, 60, image=photo, anchor="center")
+
+            if self.avatar_photos.get(avatar, (100, 100), show) is None:
+                self.avatar_canvas.create_text(60, 60, text="⏳")
         else:
             self.avatar_canvas.create_text(60, 60, text="(Không có avatar)")
 
     # -----------------------------
     # Preview bảng SQLite
     # -----------------------------
+    # Storage.db + toàn bộ Message DB đã quét
+    def all_db_files(self):
+        files = [Path(path) for _, path in self.message_arr.values()]
+        storage_db = find_storage_db(self.selected_dir) if self.selected_dir else None
+        return ([storage_db] if storage_db else []) + files
+
     # -----------------------------
     # 🗂 Hàm mở DB tin nhắn được chọn trong TreeView
     def open_message_db(self, event):
@@ -497,12 +721,175 @@ class ZaloExtractorApp:
         table_list.bind("<Double-1>", open_selected_table)
         # Nút xem bảng
         tb.Button(win, text="Xem bảng", bootstyle="success", command=open_selected_table).pack(pady=5)
+        # Nút xuất toàn bộ DB (mọi bảng, mỗi bảng 1 file)
+        tb.Button(win, text="📦 Xuất toàn bộ DB", bootstyle="secondary",
+                  command=lambda: self.export_bundle([db_file])).pack(pady=5)
+        # Nút khôi phục bản ghi đã xóa (freelist, freeblock, vùng trống của trang)
+        tb.Button(win, text="🧹 Khôi phục bản ghi đã xóa", bootstyle="warning",
+                  command=lambda: self.carve_db(db_file)).pack(pady=5)
+        # Nút xem lịch sử -wal (chỉ khi DB có file -wal chưa checkpoint)
+        wal_file = wal_path_for(db_file)
+        if wal_file.exists() and wal_file.stat().st_size:
+            tb.Button(win, text="🕘 Lịch sử WAL", bootstyle="info",
+                      command=lambda: self.open_wal_history(db_file)).pack(pady=5)
+
+    # -----------------------------
+    def carve_db(self, db_file: Path):
+        """Carving bản ghi đã xóa của db_file (trên snapshot) trong tác vụ nền rồi mở view "recovered" """
+        out_path = carve_path_for(db_file)
+
+        def run(task):
+            snap = prepare_db_copy(db_file)
+            return carve_database(snap, out_path, progress_callback=lambda done, total: task.report(
+                done, total, f"Carving {db_file.name}: {done}/{total} trang"))
+
+        def show(stats):
+            if not stats["recovered"]:
+                messagebox.showinfo("Khôi phục", f"Không tìm thấy bản ghi đã xóa trong {db_file.name} "
+                                                 f"({stats['scanned_pages']} trang đã quét).")
+                return
+            detail = ", ".join(f"{k}: {v}" for k, v in stats["by_status"].items())
+            messagebox.showinfo("Khôi phục", f"🧹 {db_file.name}: khôi phục {stats['recovered']} bản ghi ({detail}) "
+                                             f"trong {stats['seconds']}s\n{out_path}")
+            # danh sách bảng recovered_<bảng> + view tổng hợp có offset
+            self.preview_message_db(out_path)
+            self.preview_table_by_name(out_path, "recovered")
+
+        self.tasks.submit(f"Khôi phục {db_file.name}", run, key=("carve", str(db_file)), on_done=show,
+                          on_error=lambda err: messagebox.showerror("Lỗi", f"Không khôi phục được: {err}"))
+
+    # -----------------------------
+    def open_wal_history(self, db_file: Path):
+        """Snapshot DB + -wal vào thư mục riêng, dựng chỉ mục frame trong tác vụ nền rồi mở cửa sổ lịch sử"""
+        # mỗi cửa sổ 1 thư mục: reader giữ mmap, không để lần snapshot sau ghi đè lên file đang map
+        dest = TEMP_DIR / "wal" / f"{db_file.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+
+        def build(task):
+            task.report(0, 0, f"Snapshot {db_file.name}")
+            snap = snapshot_db(db_file, dest)
+            task.report(0, 0, f"Đọc frame {wal_path_for(snap).name}")
+            return WalReader(snap)
+
+        self.tasks.submit(f"Lịch sử WAL {db_file.name}", build, key=("wal", str(db_file)),
+                          on_done=lambda wal: self.show_wal_history(db_file, wal),
+                          on_error=lambda err: messagebox.showerror("Lỗi", f"Không đọc được -wal: {err}"))
+
+    def show_wal_history(self, db_file: Path, wal: WalReader):
+        """Commit trong -wal -> trang đổi trong commit -> diff với phiên bản trước; dựng DB tại 1 commit"""
+        summary = wal.summary()
+        win = tb.Toplevel(self.master)
+        win.title(f"🕘 Lịch sử WAL - {db_file.name}")
+        win.geometry("1200x700")
+
+        def close():
+            wal.close()
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", close)
+        tb.Label(win, text=f"{summary['frames']} frame, {summary['commits']} commit | đã commit {summary['committed']}, "
+                           f"chưa commit {summary['uncommitted']}, checksum hỏng {summary['invalid']}, "
+                           f"thế hệ cũ {summary['stale']} | {summary['pages']} trang, đọc trong {summary['seconds']}s",
+                 bootstyle="primary").pack(pady=5)
+
+        body = tb.PanedWindow(win, orient=HORIZONTAL)
+        body.pack(fill=BOTH, expand=True, padx=5, pady=5)
+
+        # Cột trái: commit (0 = DB chính) + nhóm frame chưa commit / thế hệ cũ
+        left = tb.Frame(body)
+        body.add(left, weight=2)
+        commit_cols = ("commit", "frames", "pages", "db_pages")
+        commit_tree = tb.Treeview(left, columns=commit_cols, show="headings", bootstyle="info")
+        for c, text, w in zip(commit_cols, ("Commit", "Frame", "Trang đổi", "Số trang DB"), (110, 70, 80, 90)):
+            commit_tree.heading(c, text=text)
+            commit_tree.column(c, width=w, anchor="w")
+        commit_tree.pack(fill=BOTH, expand=True, side=LEFT)
+        sb = tb.Scrollbar(left, orient="vertical", command=commit_tree.yview, bootstyle="round")
+        commit_tree.configure(yscroll=sb.set)
+        sb.pack(side=RIGHT, fill=Y)
+
+        groups = {"0": []}
+        commit_tree.insert("", "end", iid="0", values=("0 (DB chính)", 0, 0, wal.db_pages(0)))
+        for c in wal.commits:
+            groups[str(c["commit"])] = [wal.frame_at(p, c["commit"]) for p in c["pages"]]
+            commit_tree.insert("", "end", iid=str(c["commit"]),
+                               values=(c["commit"], c["frames"], len(c["pages"]), c["db_pages"]))
+        for status, label in (("uncommitted", "chưa commit"), ("invalid", "checksum hỏng"), ("stale", "thế hệ cũ")):
+            # mỗi trang lấy frame cuối cùng của nhóm
+            latest = {f["pgno"]: f["index"] for f in wal.frames if f["status"] == status}
+            if latest:
+                groups[status] = [latest[p] for p in sorted(latest)]
+                commit_tree.insert("", "end", iid=status, values=(f"({label})", len(latest), len(latest), ""))
+
+        # Cột phải: trang đổi + diff
+        right = tb.Frame(body)
+        body.add(right, weight=3)
+        page_cols = ("pgno", "type", "frame", "offset")
+        page_tree = tb.Treeview(right, columns=page_cols, show="headings", height=10, bootstyle="primary")
+        for c, text, w in zip(page_cols, ("Trang", "Loại", "Frame", "Offset trong -wal"), (70, 110, 70, 120)):
+            page_tree.heading(c, text=text)
+            page_tree.column(c, width=w, anchor="w")
+        page_tree.pack(fill=X)
+        diff_text = tb.Text(right, wrap="none", height=20)
+        diff_text.pack(fill=BOTH, expand=True, pady=5)
+
+        def show_pages(event=None):
+            sel = commit_tree.selection()
+            if not sel:
+                return
+            page_tree.delete(*page_tree.get_children())
+            diff_text.delete("1.0", "end")
+            for frame in groups[sel[0]]:
+                f = wal.frames[frame]
+                page_tree.insert("", "end", iid=str(frame), values=(
+                    f["pgno"], wal.page_type(wal.frame_data(frame), f["pgno"]), frame, f["offset"]))
+
+        def show_diff(event=None):
+            sel = page_tree.selection()
+            if not sel:
+                return
+            frame = int(sel[0])
+            pgno = wal.frames[frame]["pgno"]
+            # phiên bản ngay trước frame này (frame nhỏ hơn gần nhất, không có thì DB chính)
+            versions = [v["frame"] for v in wal.page_versions(pgno)]
+            before = [v for v in versions if v is None or v < frame]
+            previous = before[-1] if before else None
+            text = format_page_diff(wal.diff_page(pgno, previous, frame))
+            diff_text.delete("1.0", "end")
+            diff_text.insert("end", f"So với {'DB chính' if previous is None else f'frame {previous}'}\n{text}")
+
+        commit_tree.bind("<<TreeviewSelect>>", show_pages)
+        page_tree.bind("<<TreeviewSelect>>", show_diff)
+
+        def open_at_commit():
+            sel = commit_tree.selection()
+            if not sel or not sel[0].isdigit():
+                messagebox.showwarning("Chọn commit", "⚠ Hãy chọn 1 commit (0 = DB chính).")
+                return
+            commit = int(sel[0])
+            out_path = wal.db_path.with_name(f"{db_file.stem}@{commit}.db")
+
+            def build(task):
+                task.report(0, 0, f"Dựng {out_path.name}")
+                return wal.materialize(out_path, commit)
+
+            self.tasks.submit(f"Dựng DB tại commit {commit}", build, key=("wal_db", str(out_path)),
+                              on_done=lambda stats: self.preview_message_db(out_path),
+                              on_error=lambda err: messagebox.showerror("Lỗi", f"Không dựng được DB: {err}"))
+
+        tb.Button(win, text="📂 Mở DB tại commit đã chọn", bootstyle="success", command=open_at_commit).pack(pady=5)
 
     # -----------------------------
     def preview_table_by_name(self, db_file: Path, table: str):
-        """Hiển thị preview dữ liệu trong bảng SQLite"""
+        """Hiển thị preview dữ liệu trong bảng SQLite (bảng đã mở thì chỉ đưa cửa sổ lên trước)"""
+        key = (str(db_file), table)
+        existing = self.preview_windows.get(key)
+        if existing is not None and existing.winfo_exists():
+            existing.lift()
+            return
+
         # Tạo cửa sổ xem dữ liệu
         preview_win = tb.Toplevel(self.master)
+        self.preview_windows[key] = preview_win
         preview_win.title(f"👀 Preview {db_file.name}:{table}")
         preview_win.geometry("1000x700")
 
@@ -519,68 +906,182 @@ class ZaloExtractorApp:
         frame_data = tb.Frame(preview_win)
         frame_data.pack(fill=BOTH, expand=True)
 
-        # Thread tải dữ liệu (tránh treo giao diện)
-        def load_data():
-            try:
-                # Sao chép DB sang bản tạm (tránh lock)
-                db_copy = prepare_db_copy(db_file)
-
-                # Mở DB ở chế độ chỉ đọc
-                conn = sqlite3.connect(f'file:{db_copy}?mode=ro', uri=True)
-
-                # Đọc toàn bộ bảng vào DataFrame Pandas
-                df = pd.read_sql_query(f'SELECT * FROM "{table}"', conn)
-                conn.close()
-
-                # Hàm hiển thị dữ liệu sau khi tải xong
-                def show_data():
-                    label_status.destroy()
-                    pb.stop()
-                    pb.destroy()
-
-                    # 🔍 Thanh tìm kiếm
-                    search_frame = tb.Frame(preview_win)
-                    search_frame.pack(fill=X, padx=5, pady=5)
-                    tb.Label(search_frame, text="🔎 Tìm kiếm:").pack(side=LEFT)
-                    search_var = tb.StringVar()
-                    tb.Entry(search_frame, textvariable=search_var, bootstyle="info").pack(side=LEFT, fill=X, expand=True, padx=5)
-
-                    # Tạo TreeView hiển thị dữ liệu
-                    cols = list(df.columns)
-                    tree = tb.Treeview(frame_data, columns=cols, show="headings", bootstyle="primary")
-
-                    # Cấu hình các cột
+        # Tác vụ nền tải dữ liệu (tránh treo giao diện)
+        def load_data(task):
+            # Sao chép DB sang bản tạm (tránh lock)
+            db_copy = prepare_db_copy(db_file)
+
+            # Mở DB ở chế độ chỉ đọc
+            conn = connect_ro(db_copy)
+
+            # Đọc bảng vào DataFrame Pandas (kèm cột <cột>_name nếu đã có bảng tra tên).
+            # Ước lượng bộ nhớ trước: vượt ngân sách thì chỉ đọc từng trang (LIMIT/OFFSET)
+            names_db = self.names_db
+            sql, params = build_resolved_query(conn, table, names_db)
+            plan = plan_load(conn, table, sql, params)
+            paged = plan["mode"] == "paged"
+            page_rows = plan["page_rows"]
+            task.check()
+            with measure("preview.load", table=table, mode=plan["mode"]) as mem:
+                with span("query", table=table) as sp:
+                    if paged:
+                        df = pd.read_sql_query(paged_sql(sql), conn, params=(*params, page_rows, 0))
+                    else:
+                        df = pd.read_sql_query(sql, conn, params=params)
+                    sp.set(rows=len(df))
+                task.check()
+                # Giải mã cột (timestamp, nội dung JSON, BLOB) ngay trong tác vụ nền; bảng gốc giữ nguyên để bật/tắt
+                with span("decode", table=table) as sp:
+                    decoder = DecodePlan.from_frame(df)
+                    decoded = decoder.apply_frame(df) if decoder else None
+                    sp.set(decoders=decoder.describe())
+            conn.close()
+            task.check()
+            state = {"df": df, "decoded": decoded, "page": 0, "query": "", "report": mem.report}
+
+            # Hàm hiển thị dữ liệu sau khi tải xong
+            def show_data():
+                if not preview_win.winfo_exists():
+                    return
+                label_status.destroy()
+                pb.stop()
+                pb.destroy()
+
+                # 🔍 Thanh tìm kiếm
+                search_frame = tb.Frame(preview_win)
+                search_frame.pack(fill=X, padx=5, pady=5)
+                tb.Label(search_frame, text="🔎 Tìm kiếm:").pack(side=LEFT)
+                search_var = tb.StringVar()
+                search_entry = tb.Entry(search_frame, textvariable=search_var, bootstyle="info")
+                search_entry.pack(side=LEFT, fill=X, expand=True, padx=5)
+                if paged:
+                    tb.Label(search_frame, text="(Enter để lọc)").pack(side=LEFT)
+                # Bật/tắt cột giải mã (chỉ hiện khi nhận dạng được cột cần giải mã)
+                decode_var = tb.BooleanVar(value=bool(decoder))
+                if decoder:
+                    tb.Checkbutton(search_frame, text=f"🧩 Giải mã ({decoder.describe()})", variable=decode_var,
+                                   bootstyle="round-toggle", command=lambda: refresh()).pack(side=LEFT, padx=5)
+
+                def current():
+                    # DataFrame đang hiển thị: bản giải mã hoặc bản gốc
+                    if decode_var.get() and state["decoded"] is not None:
+                        return state["decoded"]
+                    return state["df"]
+
+                # Tạo TreeView hiển thị dữ liệu
+                tree = tb.Treeview(frame_data, show="headings", bootstyle="primary")
+                tree.pack(fill=BOTH, expand=True)
+
+                def set_columns(cols):
+                    # Cấu hình các cột (đổi khi bật/tắt giải mã)
+                    if tuple(tree["columns"]) == tuple(cols):
+                        return
+                    tree.configure(columns=cols)
                     for c in cols:
                         tree.heading(c, text=c)
                         tree.column(c, width=160, anchor="w", stretch=True)
-                    tree.pack(fill=BOTH, expand=True)
 
-                    # Thêm scrollbar
-                    sb = tb.Scrollbar(frame_data, orient="vertical", command=tree.yview, bootstyle="round")
-                    tree.configure(yscroll=sb.set)
-                    sb.pack(side=RIGHT, fill=Y)
+                # Thêm scrollbar
+                sb = tb.Scrollbar(frame_data, orient="vertical", command=tree.yview, bootstyle="round")
+                tree.configure(yscroll=sb.set)
+                sb.pack(side=RIGHT, fill=Y)
 
-                    # Hàm cập nhật TreeView từ DataFrame
-                    def update_tree(dataframe):
+                # Hàm cập nhật TreeView từ DataFrame
+                def update_tree(dataframe):
+                    with span("render.preview", table=table, rows=len(dataframe)):
+                        set_columns([str(c) for c in dataframe.columns])
                         tree.delete(*tree.get_children())
                         for _, row in dataframe.iterrows():
                             # Thay giá trị NaN bằng chuỗi rỗng
                             vals = [("" if pd.isna(x) else x) for x in row.tolist()]
                             tree.insert("", "end", values=vals)
 
-                    # Hiển thị dữ liệu ban đầu
-                    update_tree(df)
-
-                    # Hàm tìm kiếm (lọc DataFrame theo chuỗi nhập)
-                    def do_search(*args):
-                        q = search_var.get().lower()
-                        if q:
-                            # Lọc các dòng có chứa chuỗi tìm kiếm trong bất kỳ cột nào
-                            filtered = df[df.apply(lambda r: r.astype(str).str.lower().str.contains(q).any(), axis=1)]
-                        else:
-                            filtered = df
-                        update_tree(filtered)
-
+                # Hiển thị dữ liệu ban đầu
+                update_tree(current())
+
+                # Thanh trạng thái bộ nhớ / phân trang
+                frame_pager = tb.Frame(preview_win)
+                frame_pager.pack(fill=X, padx=5)
+                label_page = tb.Label(frame_pager, text="")
+                label_page.pack(side=LEFT)
+
+                def update_page_label():
+                    text = format_report(state["report"])
+                    if paged:
+                        first = state["page"] * page_rows
+                        text = (f"Trang {state['page'] + 1} · dòng {first + 1 if len(state['df']) else 0}"
+                                f"–{first + len(state['df'])} / ~{plan['rows']:,} "
+                                f"(ước tính {format_bytes(plan['bytes'])} > ngân sách "
+                                f"{format_bytes(plan['budget'])} → đọc theo trang) · {text}")
+                    label_page.config(text=text)
+
+                def load_page(page, query):
+                    # Đọc 1 trang trong tác vụ nền; tìm kiếm chạy trong SQLite (cả bảng, không chỉ trang đang xem)
+                    def work(task):
+                        page_conn = connect_ro(db_copy)
+                        try:
+                            page_sql, page_params = build_resolved_query(page_conn, table, names_db, query)
+                            with measure("preview.page", table=table, page=page) as m:
+                                with span("query", table=table, page=page) as sp:
+                                    page_df = pd.read_sql_query(paged_sql(page_sql), page_conn,
+                                                                params=(*page_params, page_rows, page * page_rows))
+                                    sp.set(rows=len(page_df))
+                                page_decoded = decoder.apply_frame(page_df) if decoder else None
+                        finally:
+                            page_conn.close()
+                        return page_df, page_decoded, m.report
+
+                    def done(result):
+                        page_df, page_decoded, report = result
+                        if not preview_win.winfo_exists():
+                            return
+                        state.update(df=page_df, decoded=page_decoded, page=page, query=query, report=report)
+                        update_tree(current())
+                        update_page_label()
+
+                    # bấm trang liên tục: trang đang tải chưa xong thì lần bấm mới không tạo thêm tác vụ
+                    if self.tasks.find(("preview-page",) + key) is None:
+                        label_page.config(text="⏳ Đang tải trang...")
+                    self.tasks.submit(f"Preview {table} trang {page + 1}", work, key=("preview-page",) + key,
+                                      on_done=done, on_error=lambda err: messagebox.showerror("Lỗi", err))
+
+                def next_page():
+                    if len(state["df"]) == page_rows:   # trang chưa đầy = trang cuối
+                        load_page(state["page"] + 1, state["query"])
+
+                def prev_page():
+                    if state["page"] > 0:
+                        load_page(state["page"] - 1, state["query"])
+
+                if paged:
+                    tb.Button(frame_pager, text="▶ Trang sau", bootstyle="secondary-outline",
+                              command=next_page).pack(side=RIGHT, padx=2)
+                    tb.Button(frame_pager, text="◀ Trang trước", bootstyle="secondary-outline",
+                              command=prev_page).pack(side=RIGHT, padx=2)
+                update_page_label()
+
+                # Hàm tìm kiếm (lọc DataFrame theo chuỗi nhập)
+                def do_search(*args):
+                    q = search_var.get().lower()
+                    shown = current()
+                    if q:
+                        # Lọc các dòng có chứa chuỗi tìm kiếm trong bất kỳ cột nào
+                        filtered = shown[shown.apply(lambda r: r.astype(str).str.lower().str.contains(q).any(), axis=1)]
+                    else:
+                        filtered = shown
+                    update_tree(filtered)
+
+                def refresh():
+                    # Bật/tắt giải mã: trang đã lọc bằng SQL thì chỉ đổi cột, bảng trong bộ nhớ thì lọc lại
+                    if paged:
+                        update_tree(current())
+                    else:
+                        do_search()
+
+                if paged:
+                    # Đọc theo trang: lọc bằng SQL khi nhấn Enter (mỗi lần lọc quét cả bảng)
+                    search_entry.bind("<Return>", lambda e: load_page(0, search_var.get().strip().lower()))
+                else:
                     # Theo dõi thay đổi trên ô tìm kiếm
                     try:
                         search_var.trace_add("write", do_search)
@@ -588,50 +1089,441 @@ class ZaloExtractorApp:
                         # Fallback cho các phiên bản Tkinter cũ
                         search_var.trace("w", lambda *a: do_search())
 
-                    # 📤 Khung nút xuất file CSV/Excel
-                    frame_export = tb.Frame(preview_win)
-                    frame_export.pack(pady=5)
-                    tb.Button(frame_export, text="💾 Xuất CSV", bootstyle="success",
-                            command=lambda: self.export_df(df, "csv", db_file.name, table)).pack(side=LEFT, padx=5)
-                    tb.Button(frame_export, text="💾 Xuất Excel", bootstyle="info",
-                            command=lambda: self.export_df(df, "excel", db_file.name, table)).pack(side=LEFT, padx=5)
-
-                # Hiển thị dữ liệu trên giao diện (UI thread)
-                self.master.after(0, show_data)
+                # 📤 Khung nút xuất file CSV/Excel
+                frame_export = tb.Frame(preview_win)
+                frame_export.pack(pady=5)
+                # Xuất lại trực tiếp từ snapshot (streaming), áp dụng chuỗi tìm kiếm đang lọc
+                # Nén CSV khi ghi (gzip / zstd), "none" = không nén
+                compress_var = tb.StringVar(value="none")
+                tb.Combobox(frame_export, textvariable=compress_var, values=["none", *COMPRESSIONS],
+                            state="readonly", width=6).pack(side=LEFT, padx=5)
+                tb.Button(frame_export, text="💾 Xuất CSV", bootstyle="success",
+                        command=lambda: self.export_table_query(db_copy, db_file.name, table, search_var.get(), "csv",
+                                                                compress_var.get(), names_db,
+                                                                decode_var.get())).pack(side=LEFT, padx=5)
+                tb.Button(frame_export, text="💾 Xuất Excel", bootstyle="info",
+                        command=lambda: self.export_table_query(db_copy, db_file.name, table, search_var.get(), "excel",
+                                                                names_db=names_db, decode=decode_var.get())).pack(side=LEFT, padx=5)
+                tb.Button(frame_export, text="💾 Xuất Parquet", bootstyle="secondary",
+                        command=lambda: self.export_table_query(db_copy, db_file.name, table, search_var.get(), "parquet",
+                                                                names_db=names_db, decode=decode_var.get())).pack(side=LEFT, padx=5)
+                tb.Button(frame_export, text="💾 Xuất Arrow", bootstyle="secondary",
+                        command=lambda: self.export_table_query(db_copy, db_file.name, table, search_var.get(), "arrow",
+                                                                names_db=names_db, decode=decode_var.get())).pack(side=LEFT, padx=5)
+
+            # Hiển thị dữ liệu trên giao diện (UI thread)
+            task.check()
+            self.tasks.call_ui(show_data)
+
+        def stop_progress():
+            # Dừng progress bar nếu có lỗi (cửa sổ có thể đã đóng)
+            try:
+                pb.stop()
+            except Exception:
+                pass
 
-            except Exception as e:
-                # Báo lỗi nếu không đọc được bảng
-                self.master.after(0, lambda: messagebox.showerror("Lỗi", str(e)))
-            finally:
-                # Dừng progress bar nếu có lỗi
-                try:
-                    self.master.after(0, pb.stop)
-                except Exception:
-                    pass
+        # Chạy tải dữ liệu trong pool tác vụ; đóng cửa sổ khi đang tải thì hủy luôn
+        task = self.tasks.submit(f"Preview {db_file.name}:{table}", load_data, key=("preview",) + key,
+                                 on_error=lambda err: messagebox.showerror("Lỗi", err), on_finally=stop_progress)
 
-        # Chạy tải dữ liệu trong luồng riêng
-        threading.Thread(target=load_data, daemon=True).start()
+        def close_preview():
+            task.cancel()
+            self.preview_windows.pop(key, None)
+            preview_win.destroy()
+        preview_win.protocol("WM_DELETE_WINDOW", close_preview)
 
     # -----------------------------
-    def export_df(self, df, fmt, fname, table):
-        """Xuất dữ liệu DataFrame ra CSV hoặc Excel"""
+    def export_table_query(self, db_copy: Path, fname, table, query, fmt, compression="none", names_db=None,
+                           decode=False):
+        """
+        Xuất bảng ra CSV / Excel / Parquet / Arrow bằng cách chạy lại truy vấn trên snapshot
+        và ghi streaming (fetchmany) - không dùng DataFrame đang hiển thị.
+        CSV có thể nén gzip/zstd khi ghi; SHA256 file kết quả + SHA256 DB nguồn được ghi
+        vào export_evidence_log.jsonl cạnh file xuất. names_db: thêm cột tên giống preview,
+        decode: thêm cột giải mã giống preview (zl_decode).
+        """
+        compression = None if compression in (None, "", "none") else compression
+        ext = EXPORT_FORMATS[fmt][0] + (COMPRESSIONS[compression] if compression else "")
         # Hộp thoại chọn nơi lưu file
         file = filedialog.asksaveasfilename(
-            defaultextension=".csv" if fmt == "csv" else ".xlsx",
-            filetypes=[("CSV", "*.csv")] if fmt == "csv" else [("Excel", "*.xlsx")],
+            defaultextension=ext,
+            filetypes=[(EXPORT_FORMATS[fmt][1], "*" + ext)],
             initialfile=f"{fname}__{table}"
         )
         if not file:
             return
 
+        # Cửa sổ tiến trình
+        win = tb.Toplevel(self.master)
+        win.title(f"💾 Xuất {table}")
+        win.geometry("420x150")
+        label_status = tb.Label(win, text="⏳ Đang đếm số dòng...")
+        label_status.pack(pady=10)
+        pb = tb.Progressbar(win, mode="determinate", maximum=100, bootstyle="success-striped")
+        pb.pack(fill=X, padx=20, pady=5)
+
+        def progress(exported, total, _text):
+            perc = min(100, int(exported * 100 / total)) if total else 0
+            pb.configure(value=perc)
+            label_status.config(text=f"⏳ {exported}/{total} dòng ({perc}%)")
+
+        def work(task):
+            # hash snapshot trước khi đọc: file ghi vào nhật ký đúng là file được xuất
+            source_sha256 = self.source_hash(db_copy)
+            # Mỗi lần xuất dùng connection read-only riêng
+            conn = connect_ro(db_copy)
+            try:
+                result = export_table_streaming(conn, table, Path(file), fmt=fmt, chunk_size=2000,
+                                                progress_callback=task.report, query=query, compression=compression,
+                                                names_db=names_db, decode=decode)
+            finally:
+                conn.close()
+            append_evidence_log(Path(file).parent / EVIDENCE_LOG_NAME, {
+                "source": str(db_copy), "source_sha256": source_sha256, "table": table,
+                "query": query, "output": str(file), "output_sha256": result["sha256"],
+                "rows": result["rows"], "bytes": result["bytes"], "compression": compression,
+            })
+            return result
+
+        def done(result):
+            win.destroy()
+            messagebox.showinfo("Xuất thành công", f"✅ Đã lưu {result['rows']} dòng vào {file}\nSHA256: {result['sha256']}")
+
+        def failed(err):
+            win.destroy()
+            messagebox.showerror("Lỗi", err)
+
+        def cancelled():
+            # file xuất dở không còn giá trị chứng cứ
+            Path(file).unlink(missing_ok=True)
+            win.destroy()
+
+        task = self.tasks.submit(f"Xuất {table} ({fmt})", work, on_done=done, on_error=failed,
+                                 on_progress=progress, on_cancel=cancelled)
+        tb.Button(win, text="Hủy", bootstyle="danger-outline", command=task.cancel).pack(pady=5)
+
+    # -----------------------------
+    # 📦 Xuất toàn bộ DB thành bundle (mỗi bảng 1 file, song song nhiều process)
+    # -----------------------------
+    def source_hash(self, db_copy: Path):
+        """
+        SHA256 của snapshot nguồn (dùng cho nhật ký xuất).
+        Snapshot trong TEMP_DIR bị ghi đè mỗi lần mở lại DB nên cache theo (path, size, mtime),
+        không theo riêng path.
+        """
+        st = Path(db_copy).stat()
+        key = (str(db_copy), st.st_size, st.st_mtime_ns)
+        if key not in self.source_hashes:
+            self.source_hashes[key] = sha256_of_file(Path(db_copy))
+        return self.source_hashes[key]
+
+    def ask_bundle_options(self):
+        """Hộp thoại chọn định dạng, nén CSV + nén zip cho bundle. Trả về (fmt, compression, zip) hoặc None nếu hủy."""
+        dlg = tb.Toplevel(self.master)
+        dlg.title("📦 Tùy chọn bundle")
+        dlg.geometry("320x220")
+        fmt_var = tb.StringVar(value="csv")
+        compress_var = tb.StringVar(value="none")
+        zip_var = tb.BooleanVar(value=False)
+        result = {}
+        tb.Label(dlg, text="Định dạng:").pack(anchor=W, padx=10, pady=(10, 0))
+        tb.Combobox(dlg, textvariable=fmt_var, values=list(EXPORT_FORMATS), state="readonly").pack(fill=X, padx=10)
+        tb.Label(dlg, text="Nén từng file CSV:").pack(anchor=W, padx=10, pady=(8, 0))
+        tb.Combobox(dlg, textvariable=compress_var, values=["none", *COMPRESSIONS], state="readonly").pack(fill=X, padx=10)
+        tb.Checkbutton(dlg, text="Nén thành file .zip", variable=zip_var).pack(anchor=W, padx=10, pady=8)
+
+        def ok():
+            compression = None if compress_var.get() == "none" or fmt_var.get() != "csv" else compress_var.get()
+            result["value"] = (fmt_var.get(), compression, zip_var.get())
+            dlg.destroy()
+
+        tb.Button(dlg, text="Xuất", bootstyle="success", command=ok).pack(pady=5)
+        dlg.grab_set()
+        self.master.wait_window(dlg)
+        return result.get("value")
+
+    def export_bundle(self, db_files):
+        """Snapshot các DB rồi xuất mọi bảng vào 1 thư mục bundle (kèm bundle_manifest.json)"""
+        if not db_files:
+            messagebox.showwarning("Không có dữ liệu", "⚠ Chưa quét hoặc không có file DB nào.")
+            return
+        out = filedialog.askdirectory(title="Chọn thư mục lưu bundle")
+        if not out:
+            return
+        options = self.ask_bundle_options()
+        if not options:
+            return
+        fmt, compression, zip_bundle = options
+        name = db_files[0].stem if len(db_files) == 1 else f"all_{self.uid or 'db'}"
+        bundle_dir = Path(out) / f"bundle_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        win = tb.Toplevel(self.master)
+        win.title("📦 Xuất bundle")
+        win.geometry("500x150")
+        label_status = tb.Label(win, text="⏳ Đang snapshot DB...")
+        label_status.pack(pady=10)
+        pb = tb.Progressbar(win, mode="determinate", bootstyle="info-striped")
+        pb.pack(fill=X, padx=20, pady=5)
+
+        def progress(done, total, table):
+            pb.configure(maximum=total, value=done)
+            label_status.config(text=f"⏳ {done}/{total} bảng - {table}")
+
+        def work(task):
+            databases = []
+            for f in db_files:
+                task.check()
+                databases.append((Path(f).stem, prepare_db_copy(Path(f))))
+            return export_db_bundle(databases, bundle_dir, fmt=fmt, zip_bundle=zip_bundle,
+                                    progress_callback=task.report, compression=compression,
+                                    names_db=self.names_db)
+
+        def done(manifest):
+            msg = (f"✅ {manifest['total_tables']} bảng, {manifest['total_rows']} dòng\n"
+                   f"Bundle: {manifest.get('archive', bundle_dir)}")
+            if manifest["failed_tables"]:
+                msg += f"\n⚠ {manifest['failed_tables']} bảng lỗi (xem bundle_manifest.json)"
+            win.destroy()
+            messagebox.showinfo("Hoàn tất", msg)
+
+        def failed(err):
+            win.destroy()
+            messagebox.showerror("Lỗi", f"Xuất bundle thất bại: {err}")
+
+        task = self.tasks.submit(f"Bundle {name}", work, on_done=done, on_error=failed, on_progress=progress,
+                                 on_cancel=win.destroy)
+        tb.Button(win, text="Hủy", bootstyle="danger-outline", command=task.cancel).pack(pady=5)
+
+    # -----------------------------
+    # 📊 Timeline hội thoại (đọc từ chỉ mục sidecar)
+    # -----------------------------
+    def open_timeline(self):
+        """Build/cập nhật chỉ mục timeline trong thread rồi mở cửa sổ timeline"""
+        if not self.uid or not self.message_arr:
+            messagebox.showwarning("Không có dữ liệu", "⚠ Hãy quét thư mục ZaloPC trước.")
+            return
+
+        index_path = index_path_for(self.uid)
+        db_files = [Path(path) for _, path in self.message_arr.values()]
+
+        win = tb.Toplevel(self.master)
+        win.title(f"📊 Timeline hội thoại - {self.uid}")
+        win.geometry("900x600")
+        label_status = tb.Label(win, text="⏳ Đang xây dựng chỉ mục timeline...")
+        label_status.pack(pady=10)
+        pb = tb.Progressbar(win, mode="determinate", maximum=len(db_files), bootstyle="info-striped")
+        pb.pack(fill=X, padx=20, pady=5)
+
+        def progress(done, total, name):
+            pb.configure(value=done)
+            label_status.config(text=f"⏳ Index {name} ({done}/{total})")
+
+        def build(task):
+            stats = build_timeline_index(index_path, db_files, snapshot=prepare_db_copy,
+                                         progress_callback=task.report)
+            return stats, timeline_summary(index_path)
+
+        def show(result):
+            stats, summary = result
+            if not win.winfo_exists():
+                return
+            label_status.config(text=f"✅ Chỉ mục: {len(summary)} hội thoại "
+                                     f"(index {stats['indexed']} DB, bỏ qua {stats['skipped']} DB không đổi)")
+            pb.destroy()
+            self.show_timeline(win, index_path, summary)
+
+        # 1 chỉ mục / tài khoản: mở timeline nhiều lần không build song song cùng 1 file chỉ mục
+        self.tasks.submit("Chỉ mục timeline", build, key=("timeline", str(index_path)), on_done=show,
+                          on_progress=progress,
+                          on_error=lambda err: messagebox.showerror("Lỗi", f"Không build được chỉ mục timeline: {err}"))
+
+    def show_timeline(self, win, index_path: Path, summary):
+        """Hiển thị danh sách hội thoại + histogram theo ngày của hội thoại được chọn"""
+        body = tb.PanedWindow(win, orient=HORIZONTAL)
+        body.pack(fill=BOTH, expand=True, padx=5, pady=5)
+
+        # Cột trái: tổng hợp theo hội thoại
+        left = tb.Frame(body)
+        body.add(left, weight=3)
+        conv_cols = ("conv", "count", "first", "last", "days")
+        conv_tree = tb.Treeview(left, columns=conv_cols, show="headings", bootstyle="info")
+        for c, text, w in zip(conv_cols, ("Hội thoại", "Số tin", "Tin đầu", "Tin cuối", "Số ngày"),
+                              (160, 70, 140, 140, 60)):
+            conv_tree.heading(c, text=text)
+            conv_tree.column(c, width=w, anchor="w")
+        conv_tree.pack(fill=BOTH, expand=True, side=LEFT)
+        sb = tb.Scrollbar(left, orient="vertical", command=conv_tree.yview, bootstyle="round")
+        conv_tree.configure(yscroll=sb.set)
+        sb.pack(side=RIGHT, fill=Y)
+        for conv_id, n, first, last, days in summary:
+            conv_tree.insert("", "end", values=(conv_id, n, format_ts(first), format_ts(last), days))
+
+        # Cột phải: histogram theo ngày
+        right = tb.Frame(body)
+        body.add(right, weight=2)
+        day_tree = tb.Treeview(right, columns=("day", "count", "bar"), show="headings", bootstyle="primary")
+        day_tree.heading("day", text="Ngày (UTC)")
+        day_tree.heading("count", text="Số tin")
+        day_tree.heading("bar", text="")
+        day_tree.column("day", width=90)
+        day_tree.column("count", width=60)
+        day_tree.column("bar", width=200)
+        day_tree.pack(fill=BOTH, expand=True, side=LEFT)
+        sb2 = tb.Scrollbar(right, orient="vertical", command=day_tree.yview, bootstyle="round")
+        day_tree.configure(yscroll=sb2.set)
+        sb2.pack(side=RIGHT, fill=Y)
+
+        def show_days(conv_id=None):
+            days = timeline_daily(index_path, conv_id)
+            peak = max((n for _, n in days), default=0) or 1
+            day_tree.delete(*day_tree.get_children())
+            for day, n in days:
+                day_tree.insert("", "end", values=(day, n, "█" * max(1, n * 30 // peak)))
+
+        def on_select(event=None):
+            sel = conv_tree.selection()
+            if sel:
+                show_days(str(conv_tree.item(sel[0], "values")[0]))
+
+        conv_tree.bind("<<TreeviewSelect>>", on_select)
+        show_days()
+
+        # Nút xuất CSV (chỉ đọc từ chỉ mục)
+        frame_export = tb.Frame(win)
+        frame_export.pack(pady=5)
+        tb.Button(frame_export, text="💾 CSV theo hội thoại", bootstyle="success",
+                  command=lambda: self.export_timeline(index_path, daily=False)).pack(side=LEFT, padx=5)
+        tb.Button(frame_export, text="💾 CSV theo ngày", bootstyle="info",
+                  command=lambda: self.export_timeline(index_path, daily=True)).pack(side=LEFT, padx=5)
+
+    def export_timeline(self, index_path: Path, daily=False):
+        """Xuất chỉ mục timeline ra CSV"""
+        file = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv")],
+            initialfile=f"Timeline_{self.uid}_{'daily' if daily else 'conversations'}"
+        )
+        if not file:
+            return
         try:
-            # Ghi file theo định dạng
-            if fmt == "csv":
-                df.to_csv(file, index=False, encoding="utf-8-sig")
-            else:
-                df.to_excel(file, index=False)
+            n = export_timeline_csv(index_path, Path(file), daily=daily)
+            messagebox.showinfo("Xuất thành công", f"✅ Đã lưu {n} dòng vào {file}")
+        except Exception as e:
+            messagebox.showerror("Lỗi", str(e))
 
-            messagebox.showinfo("Xuất thành công", f"✅ Đã lưu {file}")
+    # -----------------------------
+    # 🖼 Media đính kèm (kiểm kê + liên kết tin nhắn, đọc từ chỉ mục sidecar)
+    # -----------------------------
+    def open_media(self):
+        """Build/cập nhật chỉ mục media trong tác vụ nền rồi mở cửa sổ media theo hội thoại"""
+        if not self.uid or not self.message_arr or not self.selected_dir:
+            messagebox.showwarning("Không có dữ liệu", "⚠ Hãy quét thư mục ZaloPC trước.")
+            return
+
+        index_path = media_index_path_for(self.uid)
+        db_files = [Path(path) for _, path in self.message_arr.values()]
+        roots, skip = account_media_scope(self.selected_dir, self.uid)
+
+        win = tb.Toplevel(self.master)
+        win.title(f"🖼 Media đính kèm - {self.uid}")
+        win.geometry("1100x600")
+        label_status = tb.Label(win, text="⏳ Đang kiểm kê media...")
+        label_status.pack(pady=10)
+        pb = tb.Progressbar(win, mode="determinate", maximum=100, bootstyle="info-striped")
+        pb.pack(fill=X, padx=20, pady=5)
+
+        def progress(done, total, text):
+            pb.configure(value=done * 100 // total if total else 0)
+            label_status.config(text=f"⏳ {text}")
+
+        def build(task):
+            stats = build_media_index(index_path, roots, db_files, snapshot=prepare_db_copy,
+                                      progress_callback=task.report, skip_dirs=skip)
+            return stats, media_conversations(index_path)
+
+        def show(result):
+            stats, convs = result
+            if not win.winfo_exists():
+                return
+            label_status.config(text=f"✅ {stats['files']} file (băm {stats['hashed']}, giữ {stats['reused']}), "
+                                     f"{stats['linked_files']} file liên kết với tin nhắn, {len(convs)} hội thoại")
+            pb.destroy()
+            self.show_media(win, index_path, convs)
+
+        # 1 chỉ mục / tài khoản: mở nhiều lần không build song song cùng 1 file chỉ mục
+        self.tasks.submit("Chỉ mục media", build, key=("media", str(index_path)), on_done=show,
+                          on_progress=progress,
+                          on_error=lambda err: messagebox.showerror("Lỗi", f"Không build được chỉ mục media: {err}"))
+
+    def show_media(self, win, index_path: Path, convs):
+        """Danh sách hội thoại có media + media của hội thoại được chọn (kèm mục media không liên kết)"""
+        body = tb.PanedWindow(win, orient=HORIZONTAL)
+        body.pack(fill=BOTH, expand=True, padx=5, pady=5)
+
+        # Cột trái: hội thoại
+        left = tb.Frame(body)
+        body.add(left, weight=2)
+        conv_cols = ("conv", "files", "size", "first", "last")
+        conv_tree = tb.Treeview(left, columns=conv_cols, show="headings", bootstyle="info")
+        for c, text, w in zip(conv_cols, ("Hội thoại", "Số file", "Dung lượng", "Đầu tiên", "Gần nhất"),
+                              (160, 60, 80, 130, 130)):
+            conv_tree.heading(c, text=text)
+            conv_tree.column(c, width=w, anchor="w")
+        conv_tree.pack(fill=BOTH, expand=True, side=LEFT)
+        sb = tb.Scrollbar(left, orient="vertical", command=conv_tree.yview, bootstyle="round")
+        conv_tree.configure(yscroll=sb.set)
+        sb.pack(side=RIGHT, fill=Y)
+        conv_tree.insert("", "end", iid="__unlinked__", values=("(không liên kết)", "", "", "", ""))
+        for conv_id, n, size, first, last in convs:
+            conv_tree.insert("", "end", values=(conv_id, n, format_bytes(size), format_ts(first), format_ts(last)))
+
+        # Cột phải: media của hội thoại
+        right = tb.Frame(body)
+        body.add(right, weight=3)
+        media_cols = ("time", "msg", "name", "kind", "size", "match", "sha256")
+        media_tree = tb.Treeview(right, columns=media_cols, show="headings", bootstyle="primary")
+        for c, text, w in zip(media_cols, ("Thời gian (UTC)", "Tin nhắn", "Tên file", "Loại", "Dung lượng",
+                                           "Khớp theo", "SHA256"), (130, 80, 180, 90, 80, 100, 200)):
+            media_tree.heading(c, text=text)
+            media_tree.column(c, width=w, anchor="w")
+        media_tree.pack(fill=BOTH, expand=True, side=LEFT)
+        sb2 = tb.Scrollbar(right, orient="vertical", command=media_tree.yview, bootstyle="round")
+        media_tree.configure(yscroll=sb2.set)
+        sb2.pack(side=RIGHT, fill=Y)
+
+        def show_files(conv_id=None):
+            media_tree.delete(*media_tree.get_children())
+            for ts, msg_id, name, kind, mime, size, sha, match, mismatch, path in conversation_media(index_path, conv_id):
+                # đuôi file không khớp kiểu thật (vd. ảnh đổi đuôi) -> đánh dấu ⚠
+                kind_text = f"{kind} ⚠ {mime}" if mismatch else (mime or kind)
+                media_tree.insert("", "end", values=(format_ts(ts), msg_id or "", name, kind_text,
+                                                     format_bytes(size), match or "", sha or ""))
+
+        def on_select(event=None):
+            sel = conv_tree.selection()
+            if not sel:
+                return
+            show_files(None if sel[0] == "__unlinked__" else str(conv_tree.item(sel[0], "values")[0]))
+
+        conv_tree.bind("<<TreeviewSelect>>", on_select)
+
+        frame_export = tb.Frame(win)
+        frame_export.pack(pady=5)
+        tb.Button(frame_export, text="💾 CSV kiểm kê media", bootstyle="success",
+                  command=lambda: self.export_media(index_path)).pack(side=LEFT, padx=5)
+
+    def export_media(self, index_path: Path):
+        """Xuất kiểm kê media (kèm liên kết tin nhắn) ra CSV"""
+        file = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv")],
+            initialfile=f"Media_{self.uid}"
+        )
+        if not file:
+            return
+        try:
+            n = export_media_csv(index_path, Path(file))
+            messagebox.showinfo("Xuất thành công", f"✅ Đã lưu {n} dòng vào {file}")
         except Exception as e:
             messagebox.showerror("Lỗi", str(e))
 
@@ -666,23 +1558,11 @@ class ZaloExtractorApp:
             messagebox.showerror("Lỗi khi xuất", str(e))
 
     def export_info_cache(self, fmt="csv"):
-        """Xuất toàn bộ danh bạ info-cache ra CSV hoặc Excel"""
-        if not self.avatar_cache:
+        """Xuất toàn bộ danh bạ info-cache ra CSV hoặc Excel (streaming từ snapshot Storage.db)"""
+        if not self.contacts:
             messagebox.showwarning("Không có dữ liệu", "⚠ Chưa có dữ liệu danh bạ để xuất.")
             return
 
-        # Chuẩn bị DataFrame
-        records = []
-        for key, (zname, avatar, raw) in self.avatar_cache.items():
-            records.append({
-                "Key": key,
-                "Tên (zName)": zname,
-                "Avatar URL": avatar,
-                "JSON Raw": raw
-            })
-
-        df = pd.DataFrame(records)
-
         # Hộp thoại chọn nơi lưu file
         file = filedialog.asksaveasfilename(
             defaultextension=".csv" if fmt == "csv" else ".xlsx",
@@ -692,15 +1572,22 @@ class ZaloExtractorApp:
         if not file:
             return
 
-        try:
-            # Ghi file
-            if fmt == "csv":
-                df.to_csv(file, index=False, encoding="utf-8-sig")
-            else:
-                df.to_excel(file, index=False)
-            messagebox.showinfo("Xuất thành công", f"✅ Đã lưu {file}")
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Không thể xuất dữ liệu: {e}")
+        store = self.contacts
+
+        def work(task):
+            conn = connect_ro(store.snapshot_path)
+            try:
+                return export_query_streaming(conn, store.export_sql(), (), Path(file), fmt=fmt, chunk_size=2000,
+                                              progress_callback=task.report, total=len(store),
+                                              sheet_name="info-cache")
+            finally:
+                conn.close()
+
+        self.tasks.submit("Xuất danh bạ", work,
+                          on_done=lambda result: messagebox.showinfo("Xuất thành công",
+                                                                     f"✅ Đã lưu {result['rows']} liên hệ vào {file}"),
+                          on_error=lambda err: messagebox.showerror("Lỗi", f"Không thể xuất dữ liệu: {err}"),
+                          on_cancel=lambda: Path(file).unlink(missing_ok=True))
 
     def load_last_startup(self):
         """Đọc dòng cuối cùng từ startup.log"""
@@ -5,14 +5,28 @@ zl_data_extractor_keypass_gui.py
 -----------------------------------
 Công cụ GUI cho phép:
  - Chọn file .db (hoặc auto detect)
- - Nhập khóa (key/passphrase) cho SQLCipher
+ - Nhập khóa (key/passphrase, hoặc raw key x'<hex>') cho SQLCipher; khóa dẫn xuất được giữ trong
+   bộ nhớ nên các lần mở lại / worker xuất bundle không chạy lại PBKDF2
+ - Không cài được pysqlcipher3: giải mã bằng Python thuần (zl_decrypt, cần `cryptography`)
+ - Tự dò cấu hình SQLCipher (cipher_compat / page size / kdf_iter) cho key, nhớ theo fingerprint DB
  - Mở DB mã hóa (nếu key hợp lệ)
+ - Giải mã 1 lần ra bản làm việc SQLite thường (sqlcipher_export) trong thư mục tạm riêng,
+   preview / xuất chạy trên bản này; bản giải mã được ghi đè + xóa khi đóng ứng dụng
  - Liệt kê bảng, preview 100 dòng, tìm kiếm/filter
- - Xuất toàn bộ bảng hoặc dữ liệu đã lọc ra CSV / Excel (streaming, progressbar)
+ - Giải mã cột khi xem / xuất (zl_decode): thời gian epoch -> ISO, nội dung JSON -> chữ / đính kèm, BLOB -> hex
+ - Xuất toàn bộ bảng hoặc dữ liệu đã lọc ra CSV / Excel / Parquet / Arrow (streaming, progressbar)
+ - Xuất mọi bảng của DB thành bundle (mỗi bảng 1 file, song song nhiều process, manifest SHA256)
+ - Nén CSV gzip/zstd ngay khi ghi; SHA256 file kết quả ghi cạnh SHA256 DB gốc (export_evidence_log.jsonl)
  - Ghi log cơ bản và SHA256 file để bảo toàn chứng cứ
+ - Tác vụ nền chạy trong pool giới hạn (zl_tasks), xem / hủy trong bảng "Tác vụ"
+ - ZL_TRACE=1: ghi thời gian từng bước (copy, mở DB, giải mã, đếm dòng, preview, render, xuất) ra Chrome trace JSON
 -----------------------------------
 Yêu cầu:
  pip install ttkbootstrap pandas openpyxl pysqlcipher3
+ (không có pysqlcipher3, giải mã bằng Python thuần) pip install cryptography
+ (tùy chọn, xuất Excel nhanh hơn) pip install xlsxwriter
+ (tùy chọn, xuất Parquet / Arrow) pip install pyarrow
+ (tùy chọn, nén zstd) pip install zstandard
 
 Lưu ý:
  - Nếu bạn không thể cài pysqlcipher3 dễ dàng trên Windows, xem hướng dẫn cài sqlcipher & pysqlcipher3 phù hợp hệ thống.
@@ -21,12 +35,7 @@ Lưu ý:
 """
 
 import os
-import shutil
-import sqlite3
-import hashlib
 import tempfile
-import threading
-import csv
 from pathlib import Path
 from datetime import datetime
 
@@ -38,13 +47,14 @@ from tkinter import filedialog, messagebox
 # Data handling
 import pandas as pd
 
-# SQLCipher library (pysqlcipher3). Nếu không import được, tool sẽ hiển thị lỗi và hướng dẫn.
-try:
-    from pysqlcipher3 import dbapi2 as sqlcipher
-    SQLCIPHER_AVAILABLE = True
-except Exception as e:
-    SQLCIPHER_AVAILABLE = False
-    _sqlcipher_import_error = str(e)
+from zl_engine import sha256_of_file, snapshot_db, export_db_bundle, append_evidence_log, EVIDENCE_LOG_NAME
+from zl_export import list_tables_from_conn, count_rows, export_table_streaming, EXPORT_FORMATS, COMPRESSIONS
+from zl_sqlcipher import SQLCIPHER_AVAILABLE, _sqlcipher_import_error, open_sqlcipher_connection, auto_configure
+from zl_sqlcipher import PlaintextCache, connect_plaintext, KEY_CACHE, is_raw_key
+from zl_decrypt import CRYPTOGRAPHY_AVAILABLE
+from zl_decode import DecodePlan
+from zl_trace import span
+from zl_tasks import TaskScheduler, TaskPanel
 
 # -----------------------
 # Helper functions
@@ -53,131 +63,25 @@ except Exception as e:
 TEMP_DIR = Path(tempfile.gettempdir()) / "zalo_sqlcipher_tmp"
 TEMP_DIR.mkdir(exist_ok=True)
 
-def sha256_of_file(path: Path):
-    """Tính SHA256 của file (để ghi nhận trước khi thao tác)."""
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
-
 def safe_copy_db_with_wal_shm(db_path: Path) -> Path:
     """
     Copy file .db và các file .db-wal / .db-shm nếu có vào thư mục tạm,
     trả về path tới file copy.
     """
-    TEMP_DIR.mkdir(exist_ok=True)
-    dst = TEMP_DIR / (db_path.name + f".copy_{int(datetime.now().timestamp())}")
-    shutil.copy2(db_path, dst)
-    # copy wal/shm nếu tồn tại cùng thư mục gốc
-    for ext in (".db-wal", ".db-shm"):
-        # for files like name.db-wal or name.sqlite-wal
-        candidate = db_path.with_name(db_path.name + ext)
-        if candidate.exists():
-            try:
-                shutil.copy2(candidate, TEMP_DIR / candidate.name)
-            except Exception:
-                pass
-    return dst
+    return snapshot_db(db_path, TEMP_DIR, db_path.name + f".copy_{int(datetime.now().timestamp())}")
 
-def open_sqlcipher_connection(db_path: Path, key: str, kdf_iter: int = None, cipher_compat: int = None, page_size: int=None):
-    """
-    Mở connection SQLCipher với key và optional pragmas.
-    Trả về connection nếu thành công, hoặc raise Exception nếu lỗi.
-    """
-    if not SQLCIPHER_AVAILABLE:
-        raise RuntimeError(f"pysqlcipher3 không có sẵn: {_sqlcipher_import_error}")
-    conn = sqlcipher.connect(str(db_path))
-    cur = conn.cursor()
-
-    # optional pragmas (nếu DB dùng cấu hình khác)
-    if cipher_compat is not None:
-        cur.execute(f"PRAGMA cipher_compatibility = {int(cipher_compat)};")
-    if kdf_iter is not None:
-        cur.execute(f"PRAGMA kdf_iter = {int(kdf_iter)};")
-    if page_size is not None:
-        cur.execute(f"PRAGMA page_size = {int(page_size)};")
-
-    # set key
-    cur.execute("PRAGMA key = ?;", (key,))
-    # test query
+def fetch_preview_df(conn, table, limit=100, decode=False):
+    """Đọc preview (limit rows) vào pandas DataFrame để phục vụ hiển thị & lọc nhanh (decode: thêm cột giải mã)."""
     try:
-        cur.execute("SELECT count(*) FROM sqlite_master;")
-        _ = cur.fetchone()
-        return conn
-    except Exception as e:
-        conn.close()
-        raise e
-
-def list_tables_from_conn(conn):
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-    return [r[0] for r in cur.fetchall()]
-
-def fetch_preview_df(conn, table, limit=100):
-    """Đọc preview (limit rows) vào pandas DataFrame để phục vụ hiển thị & lọc nhanh."""
-    try:
-        df = pd.read_sql_query(f'SELECT * FROM "{table}" LIMIT {limit}', conn)
+        with span("query", table=table, limit=limit):
+            df = pd.read_sql_query(f'SELECT * FROM "{table}" LIMIT {limit}', conn)
+        if decode:
+            with span("decode", table=table):
+                df = DecodePlan.from_frame(df).apply_frame(df)
         return df
     except Exception as e:
         raise
 
-def count_rows(conn, table):
-    cur = conn.cursor()
-    cur.execute(f'SELECT COUNT(*) FROM "{table}";')
-    r = cur.fetchone()
-    return r[0] if r else 0
-
-def export_table_streaming(conn, table, out_path: Path, fmt="csv", chunk_size=1000, progress_callback=None):
-    """
-    Xuất toàn bộ bảng ra CSV/Excel dạng streaming (tránh load toàn bộ vào RAM).
-    - progress_callback(received_rows, total_rows) để cập nhật progressbar.
-    """
-    total = count_rows(conn, table)
-    if fmt == "csv":
-        cur = conn.cursor()
-        cur.execute(f'SELECT * FROM "{table}";')
-        cols = [d[0] for d in cur.description]
-        with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow(cols)
-            exported = 0
-            while True:
-                rows = cur.fetchmany(chunk_size)
-                if not rows:
-                    break
-                writer.writerows(rows)
-                exported += len(rows)
-                if progress_callback:
-                    progress_callback(exported, total)
-    else:
-        # Excel export using pandas in chunks: we'll accumulate chunk files then concat (but to reduce memory, write via pandas using openpyxl in append mode)
-        # Simpler approach: read in chunks and write via DataFrame to_excel with mode append - openpyxl supports append? We'll do batched DataFrame writes.
-        # Note: openpyxl doesn't have efficient append for header/rows; for moderate sizes it's acceptable.
-        cur = conn.cursor()
-        cur.execute(f'SELECT * FROM "{table}";')
-        cols = [d[0] for d in cur.description]
-        exported = 0
-        # building Excel by accumulating chunks into DataFrame and writing in append mode
-        first_write = True
-        while True:
-            rows = cur.fetchmany(chunk_size)
-            if not rows:
-                break
-            df_chunk = pd.DataFrame(rows, columns=cols)
-            if first_write:
-                df_chunk.to_excel(out_path, index=False, engine="openpyxl")
-                first_write = False
-            else:
-                # append: load existing then append -> slower but keeps memory low per chunk
-                with pd.ExcelWriter(out_path, engine="openpyxl", mode="a", if_sheet_exists="overlay") as writer:
-                    # write at next row manually by reading existing? To keep code simpler we will append by creating a new sheet named _part_i
-                    sheet_name = f"part_{exported//chunk_size}"
-                    df_chunk.to_excel(writer, index=False, sheet_name=sheet_name)
-            exported += len(rows)
-            if progress_callback:
-                progress_callback(exported, total)
-
 # -----------------------
 # GUI Application
 # -----------------------
@@ -216,15 +120,47 @@ class App:
         self.cipher_compat_var = tb.StringVar()
         tb.Entry(frm_top, textvariable=self.cipher_compat_var, width=6).grid(row=2, column=2, sticky="w")
 
+        tb.Label(frm_top, text="Page size (opt):").grid(row=2, column=3, sticky="e", padx=4)
+        self.page_size_var = tb.StringVar()
+        tb.Entry(frm_top, textvariable=self.page_size_var, width=8).grid(row=2, column=4, sticky="w")
+
+        # Compression options (CSV export)
+        tb.Label(frm_top, text="Nén CSV:").grid(row=3, column=0, sticky="w", padx=4, pady=6)
+        compress_fr = tb.Frame(frm_top)
+        compress_fr.grid(row=3, column=1, sticky="w", padx=4)
+        self.compress_var = tb.StringVar(value="none")
+        tb.Combobox(compress_fr, textvariable=self.compress_var, values=["none", *COMPRESSIONS], state="readonly", width=6).pack(side=LEFT)
+        tb.Label(compress_fr, text="Level (opt):").pack(side=LEFT, padx=(10, 2))
+        self.level_var = tb.StringVar()
+        tb.Entry(compress_fr, textvariable=self.level_var, width=4).pack(side=LEFT)
+        tb.Label(compress_fr, text="Threads zstd (opt):").pack(side=LEFT, padx=(10, 2))
+        self.threads_var = tb.StringVar()
+        tb.Entry(compress_fr, textvariable=self.threads_var, width=4).pack(side=LEFT)
+
         # Open button + auto detect on Windows
         btn_frame = tb.Frame(root)
         btn_frame.pack(fill=X, padx=10)
         self.btn_open = tb.Button(btn_frame, text="🔓 Mở DB với key", bootstyle="success", command=self.open_db)
         self.btn_open.pack(side=LEFT, padx=6, pady=6)
 
+        self.btn_auto = tb.Button(btn_frame, text="🧪 Tự dò cấu hình", bootstyle="warning", command=self.auto_configure_db)
+        self.btn_auto.pack(side=LEFT, padx=6, pady=6)
+
+        self.materialize_var = tb.BooleanVar(value=True)
+        tb.Checkbutton(btn_frame, text="Giải mã 1 lần ra bản làm việc", variable=self.materialize_var).pack(side=LEFT, padx=6, pady=6)
+
+        # Giải mã cột khi preview / xuất: thời gian -> ISO, nội dung JSON -> chữ / đính kèm, BLOB -> hex
+        self.decode_var = tb.BooleanVar(value=True)
+        tb.Checkbutton(btn_frame, text="🧩 Giải mã cột", variable=self.decode_var).pack(side=LEFT, padx=6, pady=6)
+
         self.btn_hash = tb.Button(btn_frame, text="Hash SHA256 file", bootstyle="info", command=self.show_hash)
         self.btn_hash.pack(side=LEFT, padx=6, pady=6)
 
+        self.btn_bundle = tb.Button(btn_frame, text="📦 Xuất toàn bộ DB (bundle)", bootstyle="secondary", command=self.export_bundle)
+        self.btn_bundle.pack(side=LEFT, padx=6, pady=6)
+
+        tb.Button(btn_frame, text="🧵 Tác vụ", bootstyle="secondary-outline", command=self.show_tasks).pack(side=LEFT, padx=6, pady=6)
+
         # If running on Windows, attempt auto-detect ZaloData default path
         if os.name == "nt":
             try:
@@ -285,6 +221,10 @@ class App:
         self.btn_export_all_csv.pack(side=LEFT, padx=4)
         self.btn_export_all_excel = tb.Button(export_frame, text="Xuất toàn bộ bảng → Excel", bootstyle="secondary", command=lambda: self.export_all("excel"))
         self.btn_export_all_excel.pack(side=LEFT, padx=4)
+        self.btn_export_all_parquet = tb.Button(export_frame, text="Xuất toàn bộ bảng → Parquet", bootstyle="secondary", command=lambda: self.export_all("parquet"))
+        self.btn_export_all_parquet.pack(side=LEFT, padx=4)
+        self.btn_export_all_arrow = tb.Button(export_frame, text="Xuất toàn bộ bảng → Arrow", bootstyle="secondary", command=lambda: self.export_all("arrow"))
+        self.btn_export_all_arrow.pack(side=LEFT, padx=4)
 
         # Progressbar
         self.progress = tb.Progressbar(root, mode="determinate", bootstyle="info")
@@ -298,12 +238,26 @@ class App:
         # internal state
         self.conn = None
         self.current_db_copy = None
+        self.current_db_path = None   # file gốc ứng với snapshot đang mở
+        self.plain_db = None      # bản giải mã (None nếu đang truy vấn thẳng DB mã hóa)
+        self.plain_cache = PlaintextCache()
         self.current_table = None
         self.current_preview_df = pd.DataFrame()
+        self.source_hashes = {}   # cache SHA256 snapshot nguồn cho nhật ký xuất
+        # tác vụ nền: pool giới hạn, callback về UI qua 1 hàng đợi poll định kỳ, hủy được
+        self.tasks = TaskScheduler()
+        self.tasks.attach(root)
+        self.task_panel = None
 
     # -----------------------
     # UI helpers
     # -----------------------
+    def show_tasks(self):
+        if self.task_panel is not None and self.task_panel.exists():
+            self.task_panel.lift()
+            return
+        self.task_panel = TaskPanel(self.root, self.tasks)
+
     def log_status(self, text):
         ts = datetime.now().isoformat(sep=" ", timespec="seconds")
         self.status_var.set(f"{ts} — {text}")
@@ -334,8 +288,9 @@ class App:
         """
         Hàm mở DB bằng key. Thực thi trong thread để tránh treo UI.
         """
-        if not SQLCIPHER_AVAILABLE:
-            messagebox.showerror("Thiếu thư viện", f"pysqlcipher3 chưa cài được.\nLỗi: {_sqlcipher_import_error}\nHãy cài bằng: pip install pysqlcipher3")
+        if not SQLCIPHER_AVAILABLE and not CRYPTOGRAPHY_AVAILABLE:
+            messagebox.showerror("Thiếu thư viện", f"pysqlcipher3 chưa cài được.\nLỗi: {_sqlcipher_import_error}\n"
+                                 "Hãy cài bằng: pip install pysqlcipher3 (hoặc pip install cryptography)")
             return
 
         db_path = self.db_path_var.get().strip()
@@ -353,7 +308,7 @@ class App:
             if not dbp.exists():
                 messagebox.showerror("File không tồn tại", str(dbp))
                 return
-            self.current_db_copy = safe_copy_db_with_wal_shm(dbp)
+            db_copy = safe_copy_db_with_wal_shm(dbp)
         except Exception as e:
             messagebox.showerror("Lỗi copy", str(e))
             return
@@ -362,47 +317,126 @@ class App:
         self.btn_open.configure(state=DISABLED)
         self.log_status("Đang mở DB...")
 
-        def worker():
+        params = self.cipher_params()
+        materialize = self.materialize_var.get()
+
+        def work(task):
+            plain_db = None
+            if not SQLCIPHER_AVAILABLE:
+                # giải mã bằng Python thuần (kiểm tra HMAC từng trang) rồi mở bằng sqlite3
+                self.tasks.call_ui(self.log_status, "Đang giải mã (Python thuần)...")
+                plain_db = self.plain_cache.materialize(db_copy, key, params)
+                conn = connect_plaintext(plain_db)
+            else:
+                conn = open_sqlcipher_connection(db_copy, key, **params)
             try:
-                kdf = int(self.kdf_var.get()) if self.kdf_var.get().strip() else None
-                cipher_compat = int(self.cipher_compat_var.get()) if self.cipher_compat_var.get().strip() else None
-                conn = open_sqlcipher_connection(self.current_db_copy, key, kdf_iter=kdf, cipher_compat=cipher_compat)
-                self.conn = conn
+                if plain_db is None and materialize:
+                    self.tasks.call_ui(self.log_status, "Đang giải mã ra bản làm việc...")
+                    conn.execute("SELECT count(*) FROM sqlite_master").fetchone()   # kiểm tra key trước khi export
+                    conn.close()
+                    plain_db = self.plain_cache.materialize(db_copy, key, params)
+                    conn = connect_plaintext(plain_db)
                 tables = list_tables_from_conn(conn)
                 # get rows count for each table (may take time for big DBs)
                 table_info = []
-                for t in tables:
+                for i, t in enumerate(tables):
+                    task.report(i, len(tables), t)
                     try:
                         cnt = count_rows(conn, t)
                     except Exception:
                         cnt = -1
                     table_info.append((t, cnt))
-                def update_ui():
-                    self.tbl_tree.delete(*self.tbl_tree.get_children())
-                    for t, cnt in table_info:
-                        self.tbl_tree.insert("", "end", values=(t, cnt))
-                    self.log_status(f"Mở DB thành công: {Path(db_path).name} (tìm thấy {len(table_info)} bảng)")
-                    messagebox.showinfo("Mở thành công", f"Đã mở DB thành công.\nTìm thấy {len(table_info)} bảng.")
-                self.root.after(0, update_ui)
-            except Exception as e:
-                err_msg = str(e).lower()
-                def err_ui():
-                    if "file is not a database" in err_msg or "not a database" in err_msg:
-                        messagebox.showerror(
-                            "Sai key hoặc cipher",
-                            f"Không mở được DB.\n\nNguyên nhân có thể:\n"
-                            f" • Sai key (thường là số điện thoại, chuỗi hex, ...)\n"
-                            f" • Sai cipher_compat (thử đổi giữa 3 hoặc 4)\n\n"
-                            f"Chi tiết lỗi: {e}"
-                        )
-                    else:
-                        messagebox.showerror("Mở DB thất bại", f"Không mở được DB: {e}")
-                    self.log_status("Mở DB thất bại")
-                self.root.after(0, err_ui)
-            finally:
-                self.root.after(0, lambda: self.btn_open.configure(state=NORMAL))
-
-        threading.Thread(target=worker, daemon=True).start()
+            except BaseException:
+                conn.close()
+                raise
+            return conn, plain_db, table_info
+
+        def update_ui(result):
+            conn, plain_db, table_info = result
+            if self.conn is not None:
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+            self.conn = conn
+            self.current_db_copy = db_copy   # snapshot ứng với connection đang mở
+            self.current_db_path = dbp
+            self.plain_db = plain_db
+            self.tbl_tree.delete(*self.tbl_tree.get_children())
+            for t, cnt in table_info:
+                self.tbl_tree.insert("", "end", values=(t, cnt))
+            mode = " - bản giải mã" if plain_db else ""
+            self.log_status(f"Mở DB thành công: {Path(db_path).name} (tìm thấy {len(table_info)} bảng){mode}")
+            messagebox.showinfo("Mở thành công", f"Đã mở DB thành công.\nTìm thấy {len(table_info)} bảng.")
+
+        def err_ui(err):
+            err_msg = err.lower()
+            if "not a database" in err_msg or "hmac" in err_msg:
+                messagebox.showerror(
+                    "Sai key hoặc cipher",
+                    f"Không mở được DB.\n\nNguyên nhân có thể:\n"
+                    f" • Sai key (thường là số điện thoại, chuỗi hex, ...)\n"
+                    f" • Sai cipher_compat / page size / kdf_iter (bấm \"Tự dò cấu hình\")\n\n"
+                    f"Chi tiết lỗi: {err}"
+                )
+            else:
+                messagebox.showerror("Mở DB thất bại", f"Không mở được DB: {err}")
+            self.log_status("Mở DB thất bại")
+
+        self.tasks.submit(f"Mở {Path(db_path).name}", work, key=("open_db",), on_done=update_ui, on_error=err_ui,
+                          on_progress=lambda done, total, t: self.status_var.set(f"Đếm dòng: {done}/{total} bảng - {t}"),
+                          on_cancel=lambda: self.log_status("Đã hủy mở DB"),
+                          on_finally=lambda: self.btn_open.configure(state=NORMAL))
+
+    def cipher_params(self):
+        """kdf_iter / cipher_compat / page_size từ các ô nhập (None nếu để trống)"""
+        def opt_int(var):
+            return int(var.get()) if var.get().strip() else None
+        return {"kdf_iter": opt_int(self.kdf_var), "cipher_compat": opt_int(self.cipher_compat_var),
+                "page_size": opt_int(self.page_size_var)}
+
+    def auto_configure_db(self):
+        """
+        Thử key với ma trận cấu hình SQLCipher (song song nhiều process, chỉ đọc trang đầu),
+        điền cấu hình tìm được vào các ô rồi mở DB.
+        """
+        if not SQLCIPHER_AVAILABLE:
+            messagebox.showerror("Thiếu thư viện", f"pysqlcipher3 chưa cài được.\nLỗi: {_sqlcipher_import_error}")
+            return
+        db_path = self.db_path_var.get().strip()
+        key = self.key_var.get()
+        if not db_path or not Path(db_path).is_file():
+            messagebox.showwarning("Chưa chọn file", "Vui lòng chọn file .db trước")
+            return
+        if not key:
+            messagebox.showwarning("Chưa nhập key", "Vui lòng nhập key trước khi dò cấu hình")
+            return
+        self.btn_auto.configure(state=DISABLED)
+        self.progress.configure(mode="determinate", value=0, maximum=100)
+        self.log_status("Đang dò cấu hình SQLCipher...")
+
+        def progress(done, total, _text):
+            perc = min(100, int(done * 100 / total)) if total else 0
+            self.progress.configure(value=perc)
+            self.status_var.set(f"Dò cấu hình: {done}/{total} tổ hợp")
+
+        def done_ui(profile):
+            self.cipher_compat_var.set(str(profile["cipher_compat"]))
+            self.page_size_var.set(str(profile["page_size"]))
+            self.kdf_var.set(str(profile["kdf_iter"]))
+            src = "đã nhớ" if profile["cached"] else "vừa dò"
+            self.log_status(f"Cấu hình ({src}): compat={profile['cipher_compat']}, "
+                            f"page_size={profile['page_size']}, kdf_iter={profile['kdf_iter']}")
+            self.open_db()
+
+        def failed(err):
+            messagebox.showerror("Dò cấu hình thất bại", err)
+            self.log_status("Dò cấu hình thất bại")
+
+        self.tasks.submit("Dò cấu hình SQLCipher",
+                          lambda task: auto_configure(Path(db_path), key, progress_callback=task.report),
+                          key=("auto_configure",), on_done=done_ui, on_error=failed, on_progress=progress,
+                          on_finally=lambda: (self.btn_auto.configure(state=NORMAL), self.progress.configure(value=0)))
 
     # -----------------------
     # Table preview handling
@@ -429,30 +463,34 @@ class App:
         self.progress.configure(mode="indeterminate")
         self.progress.start()
 
-        def worker():
-            try:
-                df = fetch_preview_df(self.conn, table_name, limit=100)
-                self.current_preview_df = df.copy()
-                # prepare columns for treeview
-                cols = list(df.columns)
-                def show():
-                    # clear previous columns
-                    self.preview_tree.delete(*self.preview_tree.get_children())
-                    self.preview_tree["columns"] = cols
-                    for c in cols:
-                        self.preview_tree.heading(c, text=c)
-                        self.preview_tree.column(c, width=120, anchor="w")
-                    # insert rows
-                    for _, row in df.iterrows():
-                        vals = [("" if pd.isna(v) else str(v)) for v in row.tolist()]
-                        self.preview_tree.insert("", "end", values=vals)
-                    self.log_status(f"Preview {table_name} hiển thị ({len(df)} dòng)")
-                self.root.after(0, show)
-            except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Lỗi load preview", str(e)))
-            finally:
-                self.root.after(0, lambda: (self.progress.stop(), self.progress.configure(mode="determinate")))
-        threading.Thread(target=worker, daemon=True).start()
+        conn = self.conn
+        decode = self.decode_var.get()
+
+        def show(df):
+            # người dùng đã chọn bảng khác trong lúc tải: bỏ kết quả cũ
+            if self.current_table != table_name:
+                return
+            self.current_preview_df = df.copy()
+            # prepare columns for treeview
+            cols = list(df.columns)
+            # clear previous columns
+            self.preview_tree.delete(*self.preview_tree.get_children())
+            self.preview_tree["columns"] = cols
+            for c in cols:
+                self.preview_tree.heading(c, text=c)
+                self.preview_tree.column(c, width=120, anchor="w")
+            # insert rows
+            with span("render.preview", table=table_name, rows=len(df)):
+                for _, row in df.iterrows():
+                    vals = [("" if pd.isna(v) else str(v)) for v in row.tolist()]
+                    self.preview_tree.insert("", "end", values=vals)
+            self.log_status(f"Preview {table_name} hiển thị ({len(df)} dòng)")
+
+        # double-click cùng 1 bảng nhiều lần: chỉ 1 lần tải
+        self.tasks.submit(f"Preview {table_name}", lambda task: fetch_preview_df(conn, table_name, limit=100, decode=decode),
+                          key=("preview", table_name, decode), on_done=show,
+                          on_error=lambda err: messagebox.showerror("Lỗi load preview", err),
+                          on_finally=lambda: (self.progress.stop(), self.progress.configure(mode="determinate")))
 
     def apply_filter_preview(self, *args):
         """Lọc dữ liệu trong preview_df dựa trên search_var."""
@@ -506,52 +544,196 @@ class App:
         except Exception as e:
             messagebox.showerror("Lỗi xuất", str(e))
 
+    def compression_options(self, fmt):
+        """Đọc tùy chọn nén từ UI -> (compression, level, threads); chỉ áp dụng cho CSV"""
+        compression = self.compress_var.get()
+        if fmt != "csv" or compression == "none":
+            return None, None, 0
+        level = int(self.level_var.get()) if self.level_var.get().strip() else None
+        threads = int(self.threads_var.get()) if self.threads_var.get().strip() else 0
+        return compression, level, threads
+
+    def source_hash(self, path: Path):
+        """SHA256 của snapshot đã mở (cache theo path, size, mtime)"""
+        st = Path(path).stat()
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        if key not in self.source_hashes:
+            self.source_hashes[key] = sha256_of_file(path)
+        return self.source_hashes[key]
+
     def export_all(self, fmt="csv"):
-        """Export toàn bộ bảng (streaming) với progressbar."""
+        """Export toàn bộ bảng (streaming) với progressbar; nén + SHA256 tính ngay khi ghi."""
         if self.conn is None:
             messagebox.showwarning("Chưa mở DB", "Vui lòng mở DB bằng key trước.")
             return
         if not self.current_table:
             messagebox.showwarning("Chưa chọn bảng", "Vui lòng double-click một bảng để chọn trước khi xuất toàn bộ.")
             return
-        out = filedialog.asksaveasfilename(defaultextension=".csv" if fmt=="csv" else ".xlsx",
-                                           filetypes=[("CSV", "*.csv")] if fmt=="csv" else [("Excel", "*.xlsx")],
+        try:
+            compression, level, threads = self.compression_options(fmt)
+        except ValueError:
+            messagebox.showerror("Giá trị không hợp lệ", "Level / Threads phải là số nguyên.")
+            return
+        ext, label = EXPORT_FORMATS[fmt]
+        ext += COMPRESSIONS[compression] if compression else ""
+        out = filedialog.asksaveasfilename(defaultextension=ext,
+                                           filetypes=[(label, "*" + ext)],
                                            initialfile=f"{Path(self.db_path_var.get()).stem}__{self.current_table}")
         if not out:
             return
         out_path = Path(out)
         self.progress.configure(mode="determinate", value=0, maximum=100)
         self.log_status(f"Đang xuất toàn bộ bảng {self.current_table} ...")
-        self.btn_export_all_csv.configure(state=DISABLED)
-        self.btn_export_all_excel.configure(state=DISABLED)
+        export_buttons = (self.btn_export_all_csv, self.btn_export_all_excel, self.btn_export_all_parquet, self.btn_export_all_arrow)
+        for b in export_buttons:
+            b.configure(state=DISABLED)
+
+        conn, table = self.conn, self.current_table
+        decode = self.decode_var.get()
+        # dữ liệu được đọc từ snapshot lúc mở DB, không phải file gốc (Zalo có thể đã ghi thêm)
+        original, source, plain_db = self.current_db_path, self.current_db_copy, self.plain_db
 
-        def progress_cb(exported, total):
+        # tiến trình đã gộp: UI chỉ nhận giá trị mới nhất mỗi lần poll (không after() cho từng chunk)
+        def progress(exported, total, _text):
             if total and total > 0:
                 perc = min(100, int(exported * 100 / total))
-                self.root.after(0, lambda: self.progress.configure(value=perc))
-                self.root.after(0, lambda: self.status_var.set(f"Exported {exported}/{total} rows ({perc}%)"))
+                self.progress.configure(value=perc)
+                self.status_var.set(f"Exported {exported}/{total} rows ({perc}%)")
             else:
-                self.root.after(0, lambda: self.progress.configure(value=0))
-                self.root.after(0, lambda: self.status_var.set(f"Exported {exported} rows"))
-
-        def worker():
-            try:
-                export_table_streaming(self.conn, self.current_table, out_path, fmt=fmt, chunk_size=2000, progress_callback=progress_cb)
-                self.root.after(0, lambda: messagebox.showinfo("Hoàn tất", f"Đã xuất bảng {self.current_table} ra {out_path}"))
-                self.log_status(f"Xuất toàn bộ xong: {out_path}")
-            except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Lỗi xuất", str(e)))
-                self.log_status("Lỗi khi xuất toàn bộ")
-            finally:
-                # enable buttons lại
-                self.root.after(0, lambda: self.btn_export_all_csv.configure(state=NORMAL))
-                self.root.after(0, lambda: self.btn_export_all_excel.configure(state=NORMAL))
-                self.root.after(0, lambda: self.progress.configure(value=0))
-
-        threading.Thread(target=worker, daemon=True).start()
+                self.progress.configure(value=0)
+                self.status_var.set(f"Exported {exported} rows")
+
+        def work(task):
+            source_sha256 = self.source_hash(source)
+            plain_sha256 = self.source_hash(plain_db) if plain_db is not None else None
+            result = export_table_streaming(conn, table, out_path, fmt=fmt, chunk_size=2000,
+                                            progress_callback=task.report, compression=compression,
+                                            level=level, threads=threads, decode=decode)
+            append_evidence_log(out_path.parent / EVIDENCE_LOG_NAME, {
+                "source": str(source), "source_sha256": source_sha256, "original": str(original), "table": table,
+                "output": str(out_path), "output_sha256": result["sha256"], "rows": result["rows"],
+                "bytes": result["bytes"], "compression": compression, "level": level, "threads": threads,
+                "decode": decode, "plaintext_sha256": plain_sha256,
+            })
+            return result
+
+        def done(result):
+            messagebox.showinfo("Hoàn tất", f"Đã xuất bảng {table} ra {out_path}\nSHA256: {result['sha256']}")
+            self.log_status(f"Xuất toàn bộ xong: {out_path}")
+
+        def failed(err):
+            messagebox.showerror("Lỗi xuất", err)
+            self.log_status("Lỗi khi xuất toàn bộ")
+
+        def cancelled():
+            out_path.unlink(missing_ok=True)   # file xuất dở
+            self.log_status("Đã hủy xuất toàn bộ")
+
+        def finish():
+            # enable buttons lại
+            for b in export_buttons:
+                b.configure(state=NORMAL)
+            self.progress.configure(value=0)
+
+        self.tasks.submit(f"Xuất {table} ({fmt})", work, on_done=done, on_error=failed, on_progress=progress,
+                          on_cancel=cancelled, on_finally=finish)
+
+    def ask_bundle_options(self):
+        """Hộp thoại chọn định dạng + nén zip cho bundle. Trả về (fmt, zip) hoặc None nếu hủy."""
+        dlg = tb.Toplevel(self.root)
+        dlg.title("Tùy chọn bundle")
+        dlg.geometry("320x160")
+        fmt_var = tb.StringVar(value="csv")
+        zip_var = tb.BooleanVar(value=False)
+        result = {}
+        tb.Label(dlg, text="Định dạng:").pack(anchor=W, padx=10, pady=(10, 0))
+        tb.Combobox(dlg, textvariable=fmt_var, values=list(EXPORT_FORMATS), state="readonly").pack(fill=X, padx=10)
+        tb.Checkbutton(dlg, text="Nén thành file .zip", variable=zip_var).pack(anchor=W, padx=10, pady=8)
+
+        def ok():
+            result["value"] = (fmt_var.get(), zip_var.get())
+            dlg.destroy()
+
+        tb.Button(dlg, text="Xuất", bootstyle="success", command=ok).pack(pady=5)
+        dlg.grab_set()
+        self.root.wait_window(dlg)
+        return result.get("value")
+
+    def export_bundle(self):
+        """
+        Xuất mọi bảng của DB đang mở vào 1 thư mục bundle (mỗi bảng 1 file + bundle_manifest.json).
+        Các bảng chạy song song trên nhiều process, mỗi process tự mở connection tới bản giải mã
+        (hoặc SQLCipher tới snapshot nếu không giải mã ra bản làm việc). Nguồn ghi trong manifest /
+        nhật ký luôn là snapshot mã hóa, SHA256 bản giải mã ghi riêng (plaintext_sha256).
+        """
+        if self.conn is None or self.current_db_copy is None:
+            messagebox.showwarning("Chưa mở DB", "Vui lòng mở DB bằng key trước.")
+            return
+        out = filedialog.askdirectory(title="Chọn thư mục lưu bundle")
+        if not out:
+            return
+        options = self.ask_bundle_options()
+        if not options:
+            return
+        fmt, zip_bundle = options
+        try:
+            compression, level, threads = self.compression_options(fmt)
+        except ValueError:
+            messagebox.showerror("Giá trị không hợp lệ", "Level / Threads phải là số nguyên.")
+            return
+        stem = Path(self.db_path_var.get()).stem
+        bundle_dir = Path(out) / f"bundle_{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if self.plain_db is not None:
+            # đọc từ bản giải mã cho nhanh nhưng nguồn ghi nhận vẫn là snapshot mã hóa
+            database, cipher = (stem, self.current_db_copy, self.plain_db), None
+        else:
+            params = self.cipher_params()
+            key = self.key_var.get()
+            if key and not is_raw_key(key):
+                # worker process nhận raw key -> không process nào phải chạy lại PBKDF2
+                key = KEY_CACHE.raw_key(self.current_db_copy, key, params["kdf_iter"], params["cipher_compat"])
+            database, cipher = (stem, self.current_db_copy), {"key": key, **params}
+        decode = self.decode_var.get()
+        self.btn_bundle.configure(state=DISABLED)
+        self.progress.configure(mode="determinate", value=0, maximum=100)
+        self.log_status(f"Đang xuất bundle {stem} ...")
+
+        def progress(done, total, table):
+            perc = min(100, int(done * 100 / total)) if total else 0
+            self.progress.configure(value=perc)
+            self.status_var.set(f"Bundle: {done}/{total} bảng - {table}")
+
+        def done(manifest):
+            msg = (f"Đã xuất {manifest['total_tables']} bảng, {manifest['total_rows']} dòng\n"
+                   f"Bundle: {manifest.get('archive', bundle_dir)}")
+            if manifest["failed_tables"]:
+                msg += f"\n{manifest['failed_tables']} bảng lỗi (xem bundle_manifest.json)"
+            messagebox.showinfo("Hoàn tất", msg)
+            self.log_status(f"Xuất bundle xong: {bundle_dir}")
+
+        def failed(err):
+            messagebox.showerror("Lỗi xuất", err)
+            self.log_status("Lỗi khi xuất bundle")
+
+        self.tasks.submit(f"Bundle {stem}",
+                          lambda task: export_db_bundle([database], bundle_dir, fmt=fmt, cipher=cipher,
+                                                        zip_bundle=zip_bundle, progress_callback=task.report,
+                                                        compression=compression, level=level, threads=threads,
+                                                        decode=decode),
+                          on_done=done, on_error=failed, on_progress=progress,
+                          on_cancel=lambda: self.log_status("Đã hủy xuất bundle"),
+                          on_finally=lambda: (self.btn_bundle.configure(state=NORMAL), self.progress.configure(value=0)))
 
     def cleanup(self):
-        """Xóa các file copy DB trong TEMP_DIR khi thoát ứng dụng"""
+        """Xóa các file copy DB trong TEMP_DIR và các bản giải mã (ghi đè trước khi xóa) khi thoát ứng dụng"""
+        try:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            self.plain_cache.close()
+            KEY_CACHE.clear()
+        except Exception as e:
+            print(f"Lỗi xóa bản giải mã: {e}")
         try:
             if TEMP_DIR.exists():
                 for f in TEMP_DIR.glob("*.db"):
@@ -563,6 +745,8 @@ class App:
             print(f"Lỗi cleanup: {e}")
 
     def on_close(self):
+        # dừng các tác vụ đang chạy trước khi ghi đè / xóa bản giải mã
+        self.tasks.shutdown()
         self.cleanup()
         self.root.destroy()
 
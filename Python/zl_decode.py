@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_decode.py
+-----------------------------------
+Giải mã cột theo kiểu dữ liệu cho xem (preview) và xuất file:
+    Bộ giải mã của từng cột được tự nhận dạng từ tên cột + giá trị lấy mẫu:
+     - epoch_ms / epoch_s: cột tên có time/dttm/date/ts... chứa số nguyên trong khoảng
+       năm 2000..2100 (mili giây hoặc giây) -> thêm cột <cột>_iso (ISO 8601)
+     - json_content: cột chuỗi mà một phần giá trị là object JSON (nội dung tin nhắn ảnh/file/
+       link/sticker của Zalo) -> thêm <cột>_text, <cột>_attachment, <cột>_attachment_size;
+       tin nhắn văn bản thường giữ nguyên chữ ở <cột>_text
+     - blob_hex: cột BLOB -> chuỗi hex (xem: cắt ngắn + số byte; xuất: đầy đủ)
+
+    Giải mã theo cả lô (DataFrame của preview hoặc chunk fetchmany khi xuất): timestamp tính bằng
+    numpy datetime64, JSON cả lô được pyarrow.json parse 1 lần (không có pyarrow thì json.loads),
+    không có vòng lặp Python theo từng ô.
+
+    Múi giờ: mặc định UTC (hậu tố Z, giống timeline); đặt ZL_TZ_OFFSET=+07:00 (hoặc 7) để hiển thị giờ địa phương
+-----------------------------------
+Ví dụ:
+    plan = DecodePlan.detect(columns, rows)          # rows: vài trăm dòng mẫu (tuple)
+    out_columns = plan.columns
+    rows = plan.apply_rows(rows)                      # chunk khi xuất
+    df = DecodePlan.from_frame(df).apply_frame(df)    # preview
+"""
+import io
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.json as pa_json
+    PYARROW_AVAILABLE = True
+except Exception:
+    PYARROW_AVAILABLE = False
+
+TZ_ENV = "ZL_TZ_OFFSET"
+SAMPLE_ROWS = 500
+JSON_MIN_SHARE = 0.2            # tỉ lệ tối thiểu giá trị (khác rỗng) là object JSON
+PREVIEW_BLOB_BYTES = 32         # số byte hex hiển thị cho BLOB khi xem
+
+TIME_NAME_RE = re.compile(r"(time|dttm|date|stamp|created|updated|modified|expire|^ts$|_ts$|_at$)", re.I)
+EPOCH_MS_RANGE = (946_684_800_000, 4_102_444_800_000)      # 2000-01-01 .. 2100-01-01
+EPOCH_S_RANGE = (946_684_800, 4_102_444_800)
+
+# Khóa trong nội dung JSON của Zalo (theo thứ tự ưu tiên)
+TEXT_KEYS = ("msg", "message", "title", "description", "desc", "caption")
+ATTACHMENT_KEYS = ("href", "normalUrl", "hdUrl", "oriUrl", "url", "thumb", "thumbUrl")
+FILE_SIZE_RE = r'fileSize\\?"?\s*[:=]\s*\\?"?(?P<size>\d+)'     # cả khi nằm trong chuỗi JSON lồng (params)
+
+EPOCH_MS = "epoch_ms"
+EPOCH_S = "epoch_s"
+JSON_CONTENT = "json_content"
+BLOB_HEX = "blob_hex"
+
+
+def tz_offset_seconds():
+    """Độ lệch múi giờ hiển thị (giây) từ ZL_TZ_OFFSET: "+07:00", "-5", "7"... mặc định 0 (UTC)"""
+    value = os.environ.get(TZ_ENV, "").strip()
+    m = re.fullmatch(r"([+-]?)(\d{1,2})(?::?(\d{2}))?", value)
+    if not m:
+        return 0
+    seconds = int(m.group(2)) * 3600 + int(m.group(3) or 0) * 60
+    return -seconds if m.group(1) == "-" else seconds
+
+
+def _tz_suffix(offset):
+    if not offset:
+        return "Z"
+    sign = "-" if offset < 0 else "+"
+    h, rem = divmod(abs(offset), 3600)
+    return f"{sign}{h:02d}:{rem // 60:02d}"
+
+
+# -----------------------------
+# Nhận dạng
+# -----------------------------
+def _detect_column(name, values):
+    """values: Series object (mẫu) -> kiểu giải mã hoặc None"""
+    values = values.dropna()
+    if values.empty:
+        return None
+    types = values.map(type)
+    if types.isin((bytes, bytearray, memoryview)).any():
+        return BLOB_HEX
+    if TIME_NAME_RE.search(name):
+        num = pd.to_numeric(values, errors="coerce").dropna()
+        if len(num) and len(num) >= len(values) // 2:
+            if num.between(*EPOCH_MS_RANGE).mean() >= 0.9:
+                return EPOCH_MS
+            if num.between(*EPOCH_S_RANGE).mean() >= 0.9:
+                return EPOCH_S
+    strings = values[types.eq(str)]
+    if not strings.empty:
+        candidates = strings[strings.str.lstrip().str.startswith("{")]
+        if len(candidates) and len(candidates) >= len(values) * JSON_MIN_SHARE:
+            if _parse_objects(candidates.head(50)).notna().any(axis=None):
+                return JSON_CONTENT
+    return None
+
+
+def _unique_name(base, taken):
+    name = base
+    while name in taken:
+        name += "_"
+    taken.add(name)
+    return name
+
+
+# -----------------------------
+# Bộ giải mã (theo lô)
+# -----------------------------
+def decode_epoch(series, unit=EPOCH_MS, offset=None):
+    """Series số epoch (ms hoặc s) -> Series chuỗi ISO 8601 (None nếu không hợp lệ)"""
+    offset = tz_offset_seconds() if offset is None else offset
+    num = pd.to_numeric(series, errors="coerce")
+    lo, hi = EPOCH_MS_RANGE if unit == EPOCH_MS else EPOCH_S_RANGE
+    valid = num.between(lo, hi).to_numpy()
+    scale = 1 if unit == EPOCH_MS else 1000
+    ms = num.where(valid, 0).to_numpy(dtype="int64") * scale + offset * 1000
+    text = np.datetime_as_string(ms.astype("datetime64[ms]"), unit="ms" if unit == EPOCH_MS else "s")
+    text = np.char.add(text.astype(str), _tz_suffix(offset))
+    return pd.Series(text, index=series.index, dtype=object).where(valid, None)
+
+
+def _parse_objects(strings):
+    """Series chuỗi JSON object -> DataFrame các khóa cấp 1 (chuỗi), cùng index"""
+    if PYARROW_AVAILABLE:
+        try:
+            data = "\n".join(strings.str.replace(r"[\r\n]+", " ", regex=True)).encode("utf-8", "surrogatepass")
+            table = pa_json.read_json(io.BytesIO(data))
+            if table.num_rows == len(strings):
+                columns, names = [], []
+                for name in table.column_names:
+                    col = table.column(name)
+                    if pa.types.is_nested(col.type):
+                        continue
+                    columns.append(col if pa.types.is_string(col.type) else pc.cast(col, pa.string()))
+                    names.append(name)
+                frame = pa.table(columns, names=names).to_pandas()
+                frame.index = strings.index
+                return frame
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, UnicodeEncodeError):
+            pass   # kiểu khác nhau giữa các dòng / dòng không phải JSON -> json.loads
+    records = strings.map(_loads_object)
+    frame = pd.DataFrame.from_records(records.tolist(), index=strings.index).astype(object)
+    scalar = frame.apply(lambda c: c.map(type).isin((str, int, float, bool))) & frame.notna()
+    return frame.astype(str).where(scalar, None)
+
+
+def _loads_object(text):
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _coalesce(frame, keys):
+    present = [k for k in keys if k in frame.columns]
+    if not present:
+        return pd.Series([None] * len(frame), index=frame.index, dtype=object)
+    sub = frame[present].astype(object).replace("", None)
+    return sub.bfill(axis=1).iloc[:, 0].astype(object).where(lambda s: s.notna(), None)
+
+
+def _nonempty(col):
+    if not pa.types.is_string(col.type):
+        col = pc.cast(col, pa.string())
+    return pc.if_else(pc.equal(col, ""), pa.scalar(None, pa.string()), col)
+
+
+def _decode_json_arrow(series):
+    """decode_json_content bằng pyarrow.compute: parse JSON cả lô 1 lần, ghép kết quả lại bằng mặt nạ"""
+    arr = pa.array(series.to_numpy(dtype=object), from_pandas=True)
+    if pa.types.is_null(arr.type):
+        arr = arr.cast(pa.string())
+    if not pa.types.is_string(arr.type):
+        raise pa.ArrowInvalid("cột không chỉ chứa chuỗi")
+    is_json = pc.fill_null(pc.starts_with(pc.utf8_ltrim_whitespace(arr), "{"), False)
+    text = pc.if_else(is_json, pa.scalar(None, pa.string()), arr)
+    attachment = pa.nulls(len(arr), pa.string())
+    size = pa.nulls(len(arr), pa.int64())
+    objects = pc.filter(arr, is_json)
+    if len(objects):
+        lines = pc.replace_substring_regex(objects, r"[\r\n]+", " ")
+        data = pc.binary_join(pa.ListArray.from_arrays([0, len(lines)], lines), "\n")[0].as_buffer()
+        table = pa_json.read_json(pa.BufferReader(data))
+        if table.num_rows != len(objects):
+            raise pa.ArrowInvalid("số dòng JSON không khớp")
+        fields = {name: table.column(name) for name in table.column_names
+                  if not pa.types.is_nested(table.column(name).type)}
+
+        def coalesce(keys):
+            cols = [_nonempty(fields[k]) for k in keys if k in fields]
+            if not cols:
+                return pa.nulls(len(objects), pa.string())
+            return pc.coalesce(*cols).combine_chunks() if len(cols) > 1 else cols[0].combine_chunks()
+
+        text = pc.replace_with_mask(text, is_json, coalesce(TEXT_KEYS))
+        attachment = pc.replace_with_mask(attachment, is_json, coalesce(ATTACHMENT_KEYS))
+        found = pc.struct_field(pc.extract_regex(objects, FILE_SIZE_RE), [0])
+        size = pc.replace_with_mask(size, is_json, pc.cast(found, pa.int64()))
+    index = series.index
+    return (pd.Series(text.to_numpy(zero_copy_only=False), index=index, dtype=object),
+            pd.Series(attachment.to_numpy(zero_copy_only=False), index=index, dtype=object),
+            pd.Series(size.to_pylist(), index=index, dtype=object))
+
+
+def decode_json_content(series):
+    """
+    Series nội dung tin nhắn -> (text, attachment, attachment_size):
+    object JSON lấy chữ (msg/title/description...), đường dẫn đính kèm (href/url/thumb...)
+    và fileSize (trong params); chuỗi thường giữ nguyên ở text.
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            return _decode_json_arrow(series)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, UnicodeEncodeError):
+            pass   # cột lẫn kiểu / dòng JSON lỗi -> đường pandas + json.loads bên dưới
+    empty = pd.Series([None] * len(series), index=series.index, dtype=object)
+    is_str = series.map(type).eq(str)
+    strings = series[is_str]
+    is_json = strings.str.lstrip().str.startswith("{")
+    text = empty.copy()
+    text.loc[is_str] = strings
+    attachment = empty.copy()
+    size = empty.copy()
+    objects = strings[is_json]
+    if objects.empty:
+        return text, attachment, size
+    frame = _parse_objects(objects)
+    text.loc[objects.index] = _coalesce(frame, TEXT_KEYS)
+    attachment.loc[objects.index] = _coalesce(frame, ATTACHMENT_KEYS)
+    found = objects.str.extract(FILE_SIZE_RE, expand=False)
+    found = pd.to_numeric(found, errors="coerce").astype("Int64").astype(object)
+    size.loc[objects.index] = found.where(found.notna(), None)
+    return text, attachment, size
+
+
+def decode_blob(series, max_bytes=None):
+    """Series BLOB -> chuỗi hex; max_bytes: cắt ngắn và ghi thêm tổng số byte (dùng khi xem)"""
+    is_bytes = series.map(type).isin((bytes, bytearray, memoryview))
+    if not is_bytes.any():
+        return series
+    blobs = series[is_bytes].map(bytes)
+    out = series.astype(object).copy()
+    if max_bytes:
+        lengths = blobs.str.len()
+        hexed = blobs.str[:max_bytes].map(bytes.hex)
+        long = lengths > max_bytes
+        hexed[long] = hexed[long] + "… (" + lengths[long].astype(str) + " B)"
+    else:
+        hexed = blobs.map(bytes.hex)
+    out.loc[is_bytes] = hexed
+    return out
+
+
+# -----------------------------
+# Kế hoạch giải mã của 1 kết quả truy vấn
+# -----------------------------
+class DecodePlan:
+    """
+    Danh sách bộ giải mã cho các cột của 1 kết quả truy vấn. Tập cột đầu ra cố định sau khi
+    nhận dạng (cần cho writer Arrow / xlsx khi xuất theo chunk).
+    """
+
+    def __init__(self, columns, decoders, blob_preview=None):
+        self.source_columns = list(columns)
+        self.decoders = dict(decoders)          # cột -> kiểu giải mã
+        self.blob_preview = blob_preview
+        taken = set(self.source_columns)
+        self.outputs = {}                       # cột -> tên các cột thêm vào
+        for col, kind in self.decoders.items():
+            if kind in (EPOCH_MS, EPOCH_S):
+                self.outputs[col] = [_unique_name(f"{col}_iso", taken)]
+            elif kind == JSON_CONTENT:
+                self.outputs[col] = [_unique_name(f"{col}_{s}", taken) for s in ("text", "attachment", "attachment_size")]
+        self.columns = []
+        for col in self.source_columns:
+            self.columns.append(col)
+            self.columns.extend(self.outputs.get(col, ()))
+
+    def __bool__(self):
+        return bool(self.decoders)
+
+    def __repr__(self):
+        return f"DecodePlan({self.decoders})"
+
+    @classmethod
+    def detect(cls, columns, rows, blob_preview=None):
+        """Nhận dạng từ tên cột + các dòng mẫu (list tuple, vd. chunk fetchmany đầu tiên)"""
+        sample = rows[:SAMPLE_ROWS]
+        data = list(zip(*sample)) if sample else [()] * len(columns)
+        decoders = {}
+        for col, values in zip(columns, data):
+            kind = _detect_column(col, pd.Series(values, dtype=object))
+            if kind:
+                decoders[col] = kind
+        return cls(columns, decoders, blob_preview=blob_preview)
+
+    @classmethod
+    def from_frame(cls, df, blob_preview=PREVIEW_BLOB_BYTES):
+        """Nhận dạng từ DataFrame (preview): mặc định BLOB hiển thị cắt ngắn"""
+        sample = df.head(SAMPLE_ROWS)
+        decoders = {}
+        for col in df.columns:
+            kind = _detect_column(str(col), sample[col].astype(object))
+            if kind:
+                decoders[col] = kind
+        return cls(df.columns, decoders, blob_preview=blob_preview)
+
+    def describe(self):
+        """Chuỗi ngắn cho thanh trạng thái: 'sendDttm→ISO, content→JSON, extra→hex'"""
+        label = {EPOCH_MS: "ISO", EPOCH_S: "ISO", JSON_CONTENT: "JSON", BLOB_HEX: "hex"}
+        return ", ".join(f"{c}→{label[k]}" for c, k in self.decoders.items())
+
+    def column_types(self, column_types=None):
+        """Bổ sung kiểu (như probe_column_types) cho cột thêm / cột BLOB đã thành hex"""
+        types = dict(column_types or {})
+        for col, kind in self.decoders.items():
+            if kind == BLOB_HEX:
+                kinds, maxlen = types.get(col, (set(), 0))
+                types[col] = ((kinds - {"blob"}) | {"text"}, maxlen * 2)
+            for out in self.outputs.get(col, ()):
+                types[out] = ({"integer"}, 0) if out.endswith("_attachment_size") else ({"text"}, 0)
+        return types
+
+    def _decode(self, col, series):
+        """-> (cột nguồn sau giải mã, [các cột thêm])"""
+        kind = self.decoders[col]
+        if kind == BLOB_HEX:
+            return decode_blob(series, self.blob_preview), []
+        if kind == JSON_CONTENT:
+            return series, list(decode_json_content(series))
+        return series, [decode_epoch(series, kind)]
+
+    def apply_frame(self, df):
+        """DataFrame -> DataFrame mới có thêm cột giải mã (đặt ngay sau cột nguồn)"""
+        if not self:
+            return df
+        out = {}
+        for col in df.columns:
+            series = df[col]
+            if col in self.decoders:
+                series, extra = self._decode(col, series)
+                out[col] = series
+                for name, values in zip(self.outputs.get(col, ()), extra):
+                    out[name] = values
+            else:
+                out[col] = series
+        return pd.DataFrame(out, index=df.index)
+
+    def apply_rows(self, rows):
+        """Chunk fetchmany (list tuple) -> list tuple theo self.columns; giá trị không giải mã giữ nguyên"""
+        if not self or not rows:
+            return rows
+        data = list(zip(*rows))
+        out = []
+        for col, values in zip(self.source_columns, data):
+            if col not in self.decoders:
+                out.append(values)
+                continue
+            series, extra = self._decode(col, pd.Series(values, dtype=object))
+            out.append(series.tolist())
+            out.extend(e.tolist() for e in extra)
+        return list(zip(*out))
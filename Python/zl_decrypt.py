@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_decrypt.py
+-----------------------------------
+Giải mã file SQLCipher bằng Python thuần + `cryptography` (không cần pysqlcipher3):
+    Đọc file qua mmap, kiểm tra HMAC từng trang, giải mã AES-256-CBC
+
+    Chia khoảng trang cho nhiều process giải mã song song, mỗi process ghi thẳng vào
+    vị trí của trang trong file kết quả
+
+    Kết quả là file SQLite thường (giữ page size + reserve bytes), mở được bằng sqlite3
+    của Python và đi qua viewer / engine như DB bình thường
+
+    encrypt_database(): bộ mã hóa tham chiếu cùng định dạng (tạo DB mẫu / đối chiếu với SQLCipher)
+
+    python zl_decrypt.py --self-test: đối chiếu với DB do SQLCipher thật mã hóa (cần sqlcipher3 /
+    pysqlcipher3) - v3 1K, v4 4K/8K, DB chế độ WAL (giải mã rồi mã hóa lại), trang bị sửa, sai key
+-----------------------------------
+Định dạng (SQLCipher 3/4):
+ - 16 byte đầu file là salt; khóa = PBKDF2(passphrase, salt, kdf_iter) hoặc raw key x'<hex>'
+ - Khóa HMAC = PBKDF2(khóa, salt XOR 0x3a, 2 vòng)
+ - Mỗi trang: [dữ liệu mã hóa][IV 16 byte][HMAC][đệm] - phần cuối (reserve) là 80 byte (v4, SHA512)
+   hoặc 48 byte (v3, SHA1); HMAC tính trên dữ liệu mã hóa + IV + số trang (4 byte little-endian)
+ - Trang 1 bỏ qua 16 byte salt (thay bằng "SQLite format 3\\0" khi giải mã)
+
+Yêu cầu:
+ pip install cryptography
+
+Lưu ý:
+ - Chỉ giải mã file DB chính; file -wal (nếu có) không được áp dụng -> nên checkpoint trước.
+ - Công cụ chỉ dùng khi bạn **có quyền hợp pháp** (dữ liệu của bạn hoặc giấy phép được phép truy cập).
+"""
+import argparse
+import hashlib
+import hmac
+import mmap
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    CRYPTOGRAPHY_AVAILABLE = True
+except Exception:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+from zl_sqlcipher import COMPAT_DEFAULTS, KDF_ALGORITHMS, KEY_CACHE, RAW_KEY_RE, SQLITE_HEADER
+from zl_sqlcipher import SQLCIPHER_AVAILABLE, key_pragma_value, secure_delete
+from zl_trace import traced
+
+SALT_SIZE = 16
+IV_SIZE = 16
+HMAC_SALT_MASK = 0x3A
+FAST_KDF_ITER = 2
+PAGES_PER_TASK = 2048
+# cipher_compatibility -> (thuật toán HMAC, độ dài HMAC); v1 không có HMAC
+HMAC_ALGORITHMS = {4: ("sha512", 64), 3: ("sha1", 20), 2: ("sha1", 20), 1: (None, 0)}
+
+
+def reserve_size(cipher_compat: int) -> int:
+    """Số byte cuối mỗi trang dành cho IV + HMAC, làm tròn lên bội số block AES (v4: 80, v3: 48)"""
+    hmac_len = HMAC_ALGORITHMS[cipher_compat][1]
+    return -(-(IV_SIZE + hmac_len) // 16) * 16
+
+
+def derive_keys(db_path: Path, key: str, cipher_compat: int = 4, kdf_iter: int = None):
+    """
+    Trả về (khóa AES, khóa HMAC, salt). key là passphrase (PBKDF2 qua KEY_CACHE, chỉ chạy 1 lần
+    cho mỗi salt) hoặc raw key x'<64 hex>' / x'<96 hex>' (32 byte khóa + 16 byte salt).
+    """
+    with open(db_path, "rb") as f:
+        salt = f.read(SALT_SIZE)
+    m = RAW_KEY_RE.match(str(key).strip())
+    if m:
+        raw = bytes.fromhex(m.group(1))
+        enc_key, salt = raw[:32], (raw[32:] or salt)
+    else:
+        kdf_iter = kdf_iter or COMPAT_DEFAULTS[cipher_compat][1]
+        enc_key = bytes.fromhex(KEY_CACHE.raw_key(db_path, key, kdf_iter, cipher_compat)[2:-1])
+    algorithm = HMAC_ALGORITHMS[cipher_compat][0]
+    hmac_key = None
+    if algorithm:
+        hmac_salt = bytes(b ^ HMAC_SALT_MASK for b in salt)
+        hmac_key = hashlib.pbkdf2_hmac(KDF_ALGORITHMS[cipher_compat], enc_key, hmac_salt, FAST_KDF_ITER, 32)
+    return enc_key, hmac_key, salt
+
+
+def _page_hmac(hmac_key, algorithm, data, pgno):
+    return hmac.new(hmac_key, data + pgno.to_bytes(4, "little"), algorithm).digest()
+
+
+def _decrypt_range(src: str, dst: str, first: int, last: int, page_size: int, cipher_compat: int,
+                   enc_key: bytes, hmac_key: bytes, verify: bool = True):
+    """
+    Chạy trong process con: giải mã các trang [first, last] (đánh số từ 1) từ src, ghi vào dst.
+    Trang sai HMAC được ghi toàn 0 và trả về trong danh sách bad_pages.
+    """
+    reserve = reserve_size(cipher_compat)
+    algorithm, hmac_len = HMAC_ALGORITHMS[cipher_compat]
+    aes = algorithms.AES(enc_key)
+    bad_pages = []
+    zeros = bytes(reserve)
+    with open(src, "rb") as fsrc, open(dst, "r+b") as fdst:
+        mm = mmap.mmap(fsrc.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            fdst.seek((first - 1) * page_size)
+            for pgno in range(first, last + 1):
+                base = (pgno - 1) * page_size
+                offset = SALT_SIZE if pgno == 1 else 0
+                end = base + page_size - reserve
+                data = mm[base + offset:end]
+                iv = mm[end:end + IV_SIZE]
+                if verify and algorithm:
+                    stored = mm[end + IV_SIZE:end + IV_SIZE + hmac_len]
+                    if not hmac.compare_digest(stored, _page_hmac(hmac_key, algorithm, data + iv, pgno)):
+                        bad_pages.append(pgno)
+                        fdst.write(bytes(page_size))
+                        continue
+                dec = Cipher(aes, modes.CBC(iv)).decryptor()
+                plain = dec.update(data) + dec.finalize()
+                if pgno == 1:
+                    plain = bytearray(SQLITE_HEADER + plain)
+                    plain[18] = plain[19] = 1   # bản giải mã không kèm -wal -> chế độ rollback journal
+                    plain = bytes(plain)
+                fdst.write(plain + zeros)
+        finally:
+            mm.close()
+    return last - first + 1, bad_pages
+
+
+def check_page1(db_path: Path, key: str, cipher_compat: int = 4, page_size: int = None, kdf_iter: int = None):
+    """
+    Kiểm tra key + cấu hình bằng HMAC trang 1 (page_size=None: thử mọi page size hợp lệ).
+    Trả về page size đúng, hoặc None nếu key / cấu hình sai.
+    """
+    from zl_sqlcipher import PAGE_SIZES
+    enc_key, hmac_key, _ = derive_keys(db_path, key, cipher_compat, kdf_iter)
+    algorithm = HMAC_ALGORITHMS[cipher_compat][0]
+    reserve = reserve_size(cipher_compat)
+    size = Path(db_path).stat().st_size
+    with open(db_path, "rb") as f:
+        head = f.read(max(PAGE_SIZES))
+    for p in ((page_size,) if page_size else PAGE_SIZES):
+        if p > size or size % p:
+            continue
+        end = p - reserve
+        data, iv = head[SALT_SIZE:end], head[end:end + IV_SIZE]
+        if algorithm:
+            stored = head[end + IV_SIZE:end + IV_SIZE + HMAC_ALGORITHMS[cipher_compat][1]]
+            if hmac.compare_digest(stored, _page_hmac(hmac_key, algorithm, data + iv, 1)):
+                return p
+        else:
+            # v1 không có HMAC: kiểm tra page size trong header đã giải mã
+            dec = Cipher(algorithms.AES(enc_key), modes.CBC(iv)).decryptor()
+            plain = dec.update(data[:16]) + dec.finalize()
+            if int.from_bytes(plain[0:2], "big") in (p, 1 if p == 65536 else -1):
+                return p
+    return None
+
+
+@traced("decrypt")
+def decrypt_database(src_path: Path, dst_path: Path, key: str, cipher_compat: int = None, page_size: int = None,
+                     kdf_iter: int = None, workers: int = None, strict: bool = True, progress_callback=None):
+    """
+    Giải mã toàn bộ file SQLCipher src_path ra file SQLite thường dst_path.
+    - cipher_compat=None: thử v4 rồi v3; page_size=None: dò theo HMAC trang 1
+    - Các khoảng PAGES_PER_TASK trang chạy song song trên ProcessPoolExecutor
+    - strict=True: có trang sai HMAC thì raise ValueError (dst bị ghi đè rồi xóa); strict=False: trang lỗi ghi 0
+    progress_callback(done_pages, total_pages) để cập nhật UI.
+    Trả về dict {"pages", "page_size", "cipher_compat", "bad_pages", "seconds"}.
+    """
+    if not CRYPTOGRAPHY_AVAILABLE:
+        raise RuntimeError("Thiếu thư viện cryptography (pip install cryptography)")
+    t0 = time.perf_counter()
+    src_path, dst_path = Path(src_path), Path(dst_path)
+    with open(src_path, "rb") as f:
+        if f.read(16) == SQLITE_HEADER:
+            raise ValueError(f"{src_path.name} là SQLite thường (không mã hóa), không cần giải mã.")
+
+    found = None
+    for compat in ((cipher_compat,) if cipher_compat else (4, 3)):
+        p = check_page1(src_path, key, compat, page_size, kdf_iter)
+        if p:
+            found = (compat, p)
+            break
+    if not found:
+        if not RAW_KEY_RE.match(str(key).strip()):
+            KEY_CACHE.discard(src_path, key)
+        raise ValueError("Sai key hoặc cấu hình (HMAC trang 1 không khớp)")
+    compat, page_size = found
+    enc_key, hmac_key, _ = derive_keys(src_path, key, compat, kdf_iter)
+
+    total = src_path.stat().st_size // page_size
+    with open(dst_path, "wb") as f:
+        f.truncate(total * page_size)
+    ranges = [(a, min(a + PAGES_PER_TASK - 1, total)) for a in range(1, total + 1, PAGES_PER_TASK)]
+    bad_pages, done = [], 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [pool.submit(_decrypt_range, str(src_path), str(dst_path), a, b, page_size, compat,
+                                   enc_key, hmac_key) for a, b in ranges]
+            for fut in futures:
+                n, bad = fut.result()
+                bad_pages.extend(bad)
+                done += n
+                if progress_callback:
+                    progress_callback(done, total)
+        if bad_pages and strict:
+            raise ValueError(f"{len(bad_pages)} trang sai HMAC (trang đầu: {bad_pages[:10]})")
+    except Exception:
+        # các trang đã giải mã nằm trên đĩa -> ghi đè như PlaintextCache, không chỉ unlink
+        secure_delete(dst_path)
+        raise
+    return {"pages": total, "page_size": page_size, "cipher_compat": compat, "bad_pages": sorted(bad_pages),
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+
+# -----------------------
+# Bộ mã hóa tham chiếu
+# -----------------------
+def _reserved_template(path: Path, page_size: int, reserve: int):
+    """DB SQLite rỗng 1 trang với reserve bytes ở mỗi trang (sqlite3 của Python không đặt được reserve)"""
+    header = bytearray(100)
+    header[0:16] = SQLITE_HEADER
+    header[16:18] = (1 if page_size == 65536 else page_size).to_bytes(2, "big")
+    header[18] = header[19] = 1
+    header[20] = reserve
+    header[21:24] = bytes((64, 32, 32))
+    header[24:28] = (1).to_bytes(4, "big")           # file change counter
+    header[28:32] = (1).to_bytes(4, "big")           # số trang
+    header[44:48] = (4).to_bytes(4, "big")           # schema format
+    header[56:60] = (1).to_bytes(4, "big")           # UTF-8
+    header[92:96] = (1).to_bytes(4, "big")
+    major, minor, patch = sqlite3.sqlite_version_info
+    header[96:100] = (major * 1000000 + minor * 1000 + patch).to_bytes(4, "big")
+    usable = page_size - reserve
+    btree = bytes((0x0D, 0, 0, 0, 0)) + (0 if usable == 65536 else usable).to_bytes(2, "big") + b"\x00"
+    page = bytes(header) + btree
+    path.write_bytes(page + bytes(page_size - len(page)))
+
+
+def encrypt_database(plain_path: Path, dst_path: Path, key: str, cipher_compat: int = 4, page_size: int = None,
+                     kdf_iter: int = None, salt: bytes = None):
+    """
+    Mã hóa DB SQLite thường theo định dạng SQLCipher (đối chiếu được với SQLCipher thật).
+    Nội dung được chép sang DB trung gian có reserve bytes rồi mã hóa từng trang. Trả về dst_path.
+    """
+    if not CRYPTOGRAPHY_AVAILABLE:
+        raise RuntimeError("Thiếu thư viện cryptography (pip install cryptography)")
+    page_size = page_size or COMPAT_DEFAULTS[cipher_compat][0]
+    reserve = reserve_size(cipher_compat)
+    dst_path = Path(dst_path)
+    staging = dst_path.with_name(dst_path.name + ".plain")
+    _reserved_template(staging, page_size, reserve)
+    conn = sqlite3.connect(str(staging))
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (str(plain_path),))
+        objects = conn.execute("SELECT type, name, sql FROM src.sqlite_master WHERE sql IS NOT NULL "
+                               "ORDER BY CASE type WHEN 'table' THEN 0 ELSE 1 END").fetchall()
+        for typ, name, sql in objects:
+            if name.startswith("sqlite_"):
+                continue
+            conn.execute(sql)
+            if typ == "table":
+                conn.execute(f'INSERT INTO main."{name}" SELECT * FROM src."{name}"')
+        if any(n == "sqlite_sequence" for _, n, _ in objects):
+            conn.execute("DELETE FROM main.sqlite_sequence")
+            conn.execute("INSERT INTO main.sqlite_sequence SELECT * FROM src.sqlite_sequence")
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+    finally:
+        conn.close()
+
+    salt = salt or os.urandom(SALT_SIZE)
+    data = staging.read_bytes()
+    with open(dst_path, "wb") as f:
+        f.write(salt)
+    enc_key, hmac_key, _ = derive_keys(dst_path, key, cipher_compat, kdf_iter)
+    algorithm = HMAC_ALGORITHMS[cipher_compat][0]
+    aes = algorithms.AES(enc_key)
+    with open(dst_path, "wb") as f:
+        for pgno in range(1, len(data) // page_size + 1):
+            page = data[(pgno - 1) * page_size:pgno * page_size]
+            offset = SALT_SIZE if pgno == 1 else 0
+            iv = os.urandom(IV_SIZE)
+            enc = Cipher(aes, modes.CBC(iv)).encryptor()
+            body = enc.update(page[offset:page_size - reserve]) + enc.finalize()
+            tag = _page_hmac(hmac_key, algorithm, body + iv, pgno) if algorithm else b""
+            out = (salt if pgno == 1 else b"") + body + iv + tag
+            f.write(out + os.urandom(page_size - len(out)))
+    staging.unlink()
+    return dst_path
+
+
+# -----------------------
+# Tự kiểm tra (đối chiếu với SQLCipher thật)
+# -----------------------
+SELF_TEST_KEY = "zl-self-test"
+SELF_TEST_RAW_KEY = "x'" + "5a" * 32 + "'"
+SELF_TEST_ROWS = 2000
+
+
+def _sample_rows():
+    """Dữ liệu mẫu đủ nhiều trang (kể cả trang tràn - overflow) và đủ kiểu cột"""
+    return [(i, f"tin nhắn {i} " + "ư" * (i % 700), bytes((i * 7 + j) % 256 for j in range(i % 50)), i / 3)
+            for i in range(1, SELF_TEST_ROWS + 1)]
+
+
+def _reference_db(path: Path, key: str, cipher_compat: int, page_size: int, journal_mode: str = "delete"):
+    """DB mẫu do SQLCipher thật mã hóa (cipher_compatibility + cipher_page_size, kdf_iter mặc định)"""
+    from zl_sqlcipher import sqlcipher
+    conn = sqlcipher.connect(str(path))
+    try:
+        conn.execute(f"PRAGMA key = {key_pragma_value(key)}")
+        conn.execute(f"PRAGMA cipher_compatibility = {int(cipher_compat)}")
+        conn.execute(f"PRAGMA cipher_page_size = {int(page_size)}")
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.execute("CREATE TABLE msg (id INTEGER PRIMARY KEY, content TEXT, raw BLOB, score REAL)")
+        conn.execute("CREATE INDEX msg_content ON msg(content)")
+        conn.executemany("INSERT INTO msg VALUES (?, ?, ?, ?)", _sample_rows())
+        conn.commit()
+    finally:
+        conn.close()   # đóng connection cuối -> SQLCipher checkpoint và xóa -wal
+
+
+def _plain_rows(path: Path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+            raise AssertionError("integrity_check thất bại")
+        return conn.execute("SELECT * FROM msg ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def self_test(workers: int = None):
+    """
+    Giải mã các DB mẫu do SQLCipher thật tạo và so với dữ liệu gốc.
+    Trả về danh sách (tên, ok, chi tiết).
+    """
+    if not CRYPTOGRAPHY_AVAILABLE:
+        raise RuntimeError("Thiếu thư viện cryptography (pip install cryptography)")
+    if not SQLCIPHER_AVAILABLE:
+        raise RuntimeError("Cần sqlcipher3 / pysqlcipher3 để tạo DB mẫu tham chiếu")
+    from zl_sqlcipher import open_sqlcipher_connection
+    expected = _sample_rows()
+    results = []
+
+    def check(name, fn):
+        t0 = time.perf_counter()
+        try:
+            detail = fn()
+            results.append((name, True, f"{detail} ({time.perf_counter() - t0:.2f}s)"))
+        except Exception as e:
+            results.append((name, False, f"{type(e).__name__}: {e}"))
+
+    with tempfile.TemporaryDirectory(prefix="zl_decrypt_test_") as tmp:
+        tmp = Path(tmp)
+
+        def roundtrip(name, key, compat, page_size, journal_mode="delete"):
+            src, dst = tmp / f"{name}.db", tmp / f"{name}.plain.db"
+            _reference_db(src, key, compat, page_size, journal_mode)
+            KEY_CACHE.clear()   # mỗi ca tự chạy PBKDF2, không dùng khóa của ca trước
+            info = decrypt_database(src, dst, key, workers=workers)
+            if (info["cipher_compat"], info["page_size"]) != (compat, page_size):
+                raise AssertionError(f"dò cấu hình sai: v{info['cipher_compat']} {info['page_size']}")
+            if _plain_rows(dst) != expected:
+                raise AssertionError("dữ liệu giải mã khác dữ liệu gốc")
+            return src, dst, info
+
+        check("v3 1K (passphrase)", lambda: "%(pages)d pages" % roundtrip("v3_1k", SELF_TEST_KEY, 3, 1024)[2])
+        check("v4 4K (passphrase)", lambda: "%(pages)d pages" % roundtrip("v4_4k", SELF_TEST_KEY, 4, 4096)[2])
+        check("v4 8K (raw key)", lambda: "%(pages)d pages" % roundtrip("v4_8k", SELF_TEST_RAW_KEY, 4, 8192)[2])
+
+        def wal_roundtrip():
+            _, plain, info = roundtrip("v4_wal", SELF_TEST_KEY, 4, 4096, journal_mode="wal")
+            again = tmp / "v4_wal.reencrypted.db"
+            encrypt_database(plain, again, SELF_TEST_KEY, cipher_compat=4)
+            conn = open_sqlcipher_connection(again, SELF_TEST_KEY, cipher_compat=4, key_cache=None)
+            try:
+                if conn.execute("SELECT * FROM msg ORDER BY id").fetchall() != expected:
+                    raise AssertionError("SQLCipher đọc bản mã hóa lại khác dữ liệu gốc")
+            finally:
+                conn.close()
+            return f"{info['pages']} pages, SQLCipher reopens re-encrypted copy"
+
+        check("WAL mode round-trip", wal_roundtrip)
+
+        def tamper():
+            src = tmp / "v4_4k.db"
+            data = bytearray(src.read_bytes())
+            page_size = 4096
+            data[5 * page_size + 100] ^= 0xFF          # 1 byte trong dữ liệu mã hóa của trang 6
+            bad = tmp / "tampered.db"
+            bad.write_bytes(bytes(data))
+            dst = tmp / "tampered.plain.db"
+            try:
+                decrypt_database(bad, dst, SELF_TEST_KEY, workers=workers)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("strict=True nhưng không phát hiện trang bị sửa")
+            if dst.exists():
+                raise AssertionError("bản giải mã dở không bị xóa")
+            info = decrypt_database(bad, dst, SELF_TEST_KEY, workers=workers, strict=False)
+            if info["bad_pages"] != [6]:
+                raise AssertionError(f"bad_pages = {info['bad_pages']}")
+            return "page 6 rejected (strict), zeroed (strict=False)"
+
+        check("tamper detection", tamper)
+
+        def wrong_key():
+            dst = tmp / "wrong.plain.db"
+            try:
+                decrypt_database(tmp / "v4_4k.db", dst, "not-the-key", workers=workers)
+            except ValueError:
+                if dst.exists():
+                    raise AssertionError("sai key nhưng vẫn tạo file kết quả")
+                return "rejected on page 1 HMAC"
+            raise AssertionError("sai key nhưng giải mã thành công")
+
+        check("wrong key rejected", wrong_key)
+    return results
+
+
+# -----------------------
+# CLI
+# -----------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Decrypt a SQLCipher 3/4 DB to plain SQLite in pure Python "
+                                            "(parallel, HMAC-checked per page).")
+    p.add_argument("src", nargs="?", help="Encrypted DB (checkpoint it first: the -wal file is not applied).")
+    p.add_argument("dst", nargs="?", help="Output plaintext SQLite file.")
+    p.add_argument("--key", help="Passphrase or raw key x'<hex>'.")
+    p.add_argument("--compat", type=int, choices=(3, 4), default=None, help="cipher_compatibility (default: try 4 then 3).")
+    p.add_argument("--page-size", type=int, default=None, help="Page size (default: detect from page 1 HMAC).")
+    p.add_argument("--kdf-iter", type=int, default=None, help="PBKDF2 iterations (default: per cipher_compatibility).")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    p.add_argument("--lenient", action="store_true", help="Write zeroed pages instead of failing on HMAC mismatch.")
+    p.add_argument("--self-test", action="store_true",
+                   help="Check against DBs encrypted by real SQLCipher (needs sqlcipher3 or pysqlcipher3) and exit.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.self_test:
+        failed = 0
+        for name, ok, detail in self_test(args.workers):
+            print(f"[{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+            failed += not ok
+        sys.exit(1 if failed else 0)
+    if not (args.src and args.dst and args.key):
+        print("[ERROR] src, dst and --key are required (or use --self-test).")
+        sys.exit(2)
+    info = decrypt_database(Path(args.src), Path(args.dst), args.key, cipher_compat=args.compat,
+                            page_size=args.page_size, kdf_iter=args.kdf_iter, workers=args.workers,
+                            strict=not args.lenient,
+                            progress_callback=lambda d, t: print(f"[+] {d}/{t} pages"))
+    print(f"[+] v{info['cipher_compat']}, page size {info['page_size']}, {info['pages']} pages "
+          f"in {info['seconds']}s -> {args.dst}")
+    if info["bad_pages"]:
+        print(f"[!] {len(info['bad_pages'])} pages failed HMAC and were zeroed: {info['bad_pages'][:20]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_engine.py
+-----------------------------------
+Engine trích xuất headless (không phụ thuộc Tk/Qt), dùng chung cho CLI và các GUI:
+    Tìm UID tài khoản từ database-config.json
+
+    Liệt kê Storage.db và các Message DB của tài khoản
+
+    Snapshot DB (copy kèm -wal/-shm) trước khi đọc, mở read-only
+
+    Xuất toàn bộ bảng của mọi DB song song bằng nhiều process thành bundle
+    (mỗi bảng 1 file, kèm bundle_manifest.json số dòng + SHA256, tùy chọn nén zip)
+
+    Ghi báo cáo job (job_report.json) gồm hash, số dòng, thời gian, lỗi
+-----------------------------------
+Lưu ý:
+ - Công cụ chỉ dùng khi bạn **có quyền hợp pháp** (dữ liệu của bạn hoặc giấy phép được phép truy cập).
+ - Luôn làm việc trên **bản copy** của file gốc.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from zl_acquisition import write_json_atomic, compress_and_hash
+from zl_export import list_tables_from_conn, export_table_streaming, EXPORT_FORMATS, COMPRESSIONS
+from zl_resolve import build_names_db
+from zl_trace import TRACER, span, traced, init_worker, worker_initargs
+
+PRODUCTION_DIR = Path("Database") / "_production"
+EVIDENCE_LOG_NAME = "export_evidence_log.jsonl"
+EXPORT_EXTENSIONS = {fmt: ext for fmt, (ext, _) in EXPORT_FORMATS.items()}
+
+
+# -----------------------------
+# HASH / SNAPSHOT
+# -----------------------------
+def sha256_of_file(path: Path):
+    """Tính SHA256 của file (để ghi nhận trước khi thao tác)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8192), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def append_evidence_log(log_path: Path, record: dict):
+    """
+    Ghi thêm 1 dòng JSON vào nhật ký xuất (JSONL): hash DB nguồn đặt cạnh hash file kết quả
+    để đối chiếu chuỗi bằng chứng. Chỉ append, không ghi đè các dòng cũ.
+    """
+    record = {"logged_at": datetime.utcnow().isoformat() + "Z", **record}
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def snapshot_db(db_path: Path, dest_dir: Path, name: str = None) -> Path:
+    """
+    Copy file DB và các file liên quan (-wal, -shm) sang dest_dir.
+    File -wal/-shm được đặt tên theo bản copy để SQLite vẫn replay được WAL.
+    """
+    with span("snapshot", file=db_path.name) as sp:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        dst = dest_dir / (name or db_path.name)
+        shutil.copy2(db_path, dst)
+        size = dst.stat().st_size
+        for ext in ("-wal", "-shm"):
+            f = Path(str(db_path) + ext)
+            if f.exists():
+                shutil.copy2(f, Path(str(dst) + ext))
+                size += f.stat().st_size
+        sp.set(bytes=size)
+    return dst
+
+
+def connect_ro(db_path: Path):
+    """Mở connection SQLite read-only"""
+    with span("connect", file=Path(db_path).name):
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def list_tables(db_path: Path):
+    """Liệt kê danh sách bảng trong file SQLite DB (đã snapshot)"""
+    conn = connect_ro(db_path)
+    try:
+        return list_tables_from_conn(conn)
+    finally:
+        conn.close()
+
+
+# -----------------------------
+# TÌM UID / DB CỦA TÀI KHOẢN
+# -----------------------------
+UID_RE = re.compile(r"\b\d{10,}\b")
+
+
+def _is_uid(text: str) -> bool:
+    return text.isdigit() and len(text) >= 10
+
+
+def config_uids(obj):
+    """
+    Mọi UID (chuỗi số >= 10 ký tự) trong JSON config, theo thứ tự xuất hiện, không trùng.
+    Duyệt 1 lượt bằng stack (không đệ quy); chuỗi chỉ được json.loads khi trông giống JSON.
+    """
+    found = {}
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for k in node:
+                if _is_uid(k):
+                    found.setdefault(k, None)
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, str):
+            for m in UID_RE.findall(node):
+                found.setdefault(m, None)
+            text = node.lstrip()
+            if text[:1] in ("{", "["):
+                try:
+                    stack.append(json.loads(text))
+                except ValueError:
+                    pass
+    return list(found)
+
+
+def read_config_uids(zalodata: Path):
+    """UID ghi trong database-config.json (rỗng nếu không có file). RuntimeError nếu file hỏng."""
+    cfg_file = Path(zalodata) / "database-config.json"
+    if not cfg_file.exists():
+        return []
+    try:
+        cfg = json.loads(cfg_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Không đọc được {cfg_file}: {e}") from e
+    return config_uids(cfg)
+
+
+def list_uid_dirs(zalodata: Path):
+    """Thư mục tài khoản (tên là UID) trong Database/_production"""
+    prod = Path(zalodata) / PRODUCTION_DIR
+    if not prod.exists():
+        return []
+    with os.scandir(prod) as it:
+        return sorted(e.name for e in it if e.is_dir() and _is_uid(e.name))
+
+
+def inventory_account(zalodata: Path, uid: str, in_config: bool = False):
+    """Thống kê 1 tài khoản: số DB, số Message DB, tổng dung lượng, lần sửa gần nhất"""
+    uid_dir = Path(zalodata) / PRODUCTION_DIR / uid
+    info = {"uid": uid, "in_config": in_config, "has_dir": uid_dir.exists(),
+            "db_count": 0, "message_dbs": 0, "total_bytes": 0, "last_modified": None}
+    if not info["has_dir"]:
+        return info
+    latest = 0.0
+    stack = [str(uid_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                    continue
+                st = e.stat()
+                info["total_bytes"] += st.st_size
+                latest = max(latest, st.st_mtime)
+                if e.name.endswith(".db"):
+                    info["db_count"] += 1
+                    if Path(e.path).parent.name == "Message":
+                        info["message_dbs"] += 1
+    if latest:
+        info["last_modified"] = datetime.fromtimestamp(latest).isoformat(timespec="seconds")
+    return info
+
+
+@traced("scan")
+def discover_accounts(zalodata: Path, workers: int = None):
+    """
+    Liệt kê mọi tài khoản: thư mục UID trong Database/_production đối chiếu với UID trong
+    database-config.json, thống kê từng tài khoản song song (thread pool, I/O).
+    Tài khoản có trong config đứng trước. Trả về danh sách dict (xem inventory_account).
+    """
+    zalodata = Path(zalodata)
+    cfg = read_config_uids(zalodata)
+    dirs = list_uid_dirs(zalodata)
+    cfg_set = set(cfg)
+    # UID trong config nhưng không có thư mục chỉ giữ nếu không có thư mục nào khớp
+    # (config còn chứa UID của bạn bè / nhóm)
+    uids = [u for u in cfg if u in dirs] + [u for u in dirs if u not in cfg_set]
+    if not uids:
+        uids = cfg[:1]
+    with ThreadPoolExecutor(max_workers=workers or min(8, len(uids) or 1)) as pool:
+        return list(pool.map(lambda u: inventory_account(zalodata, u, u in cfg_set), uids))
+
+
+def discover_uid(zalodata: Path):
+    """UID của tài khoản đầu tiên tìm thấy (xem discover_accounts). None nếu không có."""
+    accounts = discover_accounts(zalodata)
+    return accounts[0]["uid"] if accounts else None
+
+
+def find_storage_db(zalodata: Path):
+    """Storage.db chứa info-cache (tên, avatar)"""
+    storage_db = Path(zalodata) / PRODUCTION_DIR / "Storage.db"
+    return storage_db if storage_db.exists() else None
+
+
+def find_message_dbs(zalodata: Path, uid: str):
+    """Danh sách Message DB của tài khoản (Core/Message/*.db)"""
+    msg_dir = Path(zalodata) / PRODUCTION_DIR / uid / "Core" / "Message"
+    if not msg_dir.exists():
+        return []
+    return sorted(msg_dir.glob("*.db"))
+
+
+def find_account_dbs(zalodata: Path, uid: str):
+    """Storage.db + toàn bộ file .db trong thư mục của tài khoản"""
+    dbs = []
+    storage_db = find_storage_db(zalodata)
+    if storage_db:
+        dbs.append(storage_db)
+    uid_dir = Path(zalodata) / PRODUCTION_DIR / uid
+    if uid_dir.exists():
+        dbs.extend(sorted(uid_dir.rglob("*.db")))
+    return dbs
+
+
+# -----------------------------
+# JOB TRÍCH XUẤT SONG SONG
+# -----------------------------
+def _snapshot_name(zalodata: Path, db_path: Path) -> str:
+    """Tên snapshot duy nhất theo đường dẫn tương đối (tránh trùng tên giữa các thư mục)"""
+    rel = db_path.relative_to(Path(zalodata) / PRODUCTION_DIR)
+    return "__".join(rel.parts)
+
+
+def open_snapshot(snapshot_path: Path, cipher: dict = None):
+    """
+    Mở connection read-only tới snapshot.
+    cipher: {"key", "kdf_iter", "cipher_compat", "page_size"} nếu snapshot là DB SQLCipher.
+    """
+    if cipher:
+        from zl_sqlcipher import open_sqlcipher_connection
+        return open_sqlcipher_connection(Path(snapshot_path), cipher["key"], kdf_iter=cipher.get("kdf_iter"),
+                                         cipher_compat=cipher.get("cipher_compat"), page_size=cipher.get("page_size"))
+    return connect_ro(Path(snapshot_path))
+
+
+def _safe_filename(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|]', "_", name)
+
+
+def _export_table_job(snapshot_path: str, table: str, out_file: str, fmt: str, chunk_size: int, cipher: dict = None,
+                      compression: str = None, level: int = None, threads: int = 0, names_db: str = None,
+                      decode: bool = False):
+    """
+    Chạy trong process con: mở connection read-only riêng và xuất 1 bảng (SHA256 tính ngay khi ghi).
+    Khi bật tracing, span của process con được gửi về trong khóa "trace".
+    """
+    started = time.perf_counter()
+    with span("export.table", table=table, db=Path(snapshot_path).name):
+        conn = open_snapshot(Path(snapshot_path), cipher)
+        try:
+            result = export_table_streaming(conn, table, Path(out_file), fmt=fmt, chunk_size=chunk_size,
+                                            compression=compression, level=level, threads=threads,
+                                            names_db=names_db, plaintext_key=bool(cipher), decode=decode)
+        finally:
+            conn.close()
+    out = {
+        "rows": result["rows"],
+        "bytes": result["bytes"],
+        "sha256": result["sha256"],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if TRACER.enabled:
+        out["trace"] = TRACER.drain()
+    return out
+
+
+@traced("bundle")
+def export_db_bundle(databases, bundle_dir: Path, fmt: str = "csv", workers: int = None, cipher: dict = None,
+                     chunk_size: int = 2000, zip_bundle: bool = False, progress_callback=None,
+                     compression: str = None, level: int = None, threads: int = 0, names_db: Path = None,
+                     decode: bool = False, mp_context=None):
+    """
+    Xuất mọi bảng của một hoặc nhiều DB (đã snapshot) vào bundle_dir, mỗi bảng 1 file.
+    - databases: danh sách (label, snapshot_path); label dùng làm tiền tố tên file.
+      Phần tử thứ 3 (tùy chọn) là bản giải mã của snapshot để đọc cho nhanh (cipher=None):
+      manifest / nhật ký vẫn ghi snapshot mã hóa làm nguồn, bản giải mã ghi ở trường plaintext
+    - Các bảng được chia cho ProcessPoolExecutor, mỗi worker mở connection read-only riêng
+    - compression="gzip"/"zstd" (chỉ CSV): nén từng file khi ghi, level/threads tùy chọn
+    - names_db: DB tra tên (zl_resolve) -> các cột UID có thêm cột <cột>_name
+    - decode=True: giải mã cột (zl_decode) - timestamp -> ISO, nội dung JSON -> chữ / đính kèm, BLOB -> hex
+    - Ghi bundle_dir/bundle_manifest.json (số dòng, kích thước, SHA256 từng file)
+      và bundle_dir/export_evidence_log.jsonl (SHA256 snapshot nguồn cạnh SHA256 file kết quả)
+    - zip_bundle=True: nén bundle thành <bundle_dir>.zip và tính SHA256 của file zip
+    - mp_context: context multiprocessing cho pool (None = mặc định của nền tảng); tracing của
+      process con luôn đặt theo process cha qua zl_trace.init_worker
+    progress_callback(done_tables, total_tables, label) để cập nhật UI / CLI.
+    Trả về dict manifest.
+    """
+    bundle_dir = Path(bundle_dir)
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    if compression and fmt != "csv":
+        raise ValueError(f"Nén ngoài chỉ áp dụng cho CSV, không dùng được với {fmt}")
+    ext = EXPORT_EXTENSIONS[fmt] + (COMPRESSIONS[compression] if compression else "")
+    manifest = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "format": fmt,
+        "compression": compression,
+        "names_db": str(names_db) if names_db else None,
+        "decode": decode,
+        "workers": workers or os.cpu_count(),
+        "databases": [],
+    }
+
+    jobs = []
+    for label, snapshot_path, *plaintext in databases:
+        entry = {"label": label, "snapshot": str(snapshot_path),
+                 "snapshot_sha256": sha256_of_file(Path(snapshot_path)), "tables": []}
+        read_path = Path(plaintext[0]) if plaintext else Path(snapshot_path)
+        if plaintext:
+            entry["plaintext"] = str(read_path)
+            entry["plaintext_sha256"] = sha256_of_file(read_path)
+        try:
+            conn = open_snapshot(read_path, cipher)
+            try:
+                tables = list_tables_from_conn(conn)
+            finally:
+                conn.close()
+            for table in tables:
+                out_file = bundle_dir / _safe_filename(f"{label}__{table}{ext}")
+                t_entry = {"table": table, "file": out_file.name}
+                entry["tables"].append(t_entry)
+                jobs.append((t_entry, entry, str(read_path), table, str(out_file)))
+        except Exception as e:
+            entry["error"] = str(e)
+        manifest["databases"].append(entry)
+
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=init_worker, initargs=worker_initargs()) as pool:
+        futures = {pool.submit(_export_table_job, read_path, table, out_file, fmt, chunk_size, cipher,
+                               compression, level, threads, str(names_db) if names_db else None, decode): (t_entry, db_entry)
+                   for t_entry, db_entry, read_path, table, out_file in jobs}
+        try:
+            for fut in as_completed(futures):
+                t_entry, db_entry = futures[fut]
+                try:
+                    result = fut.result()
+                    TRACER.merge(result.pop("trace", None))
+                    t_entry.update(result)
+                    record = {
+                        "source": db_entry["snapshot"], "source_sha256": db_entry["snapshot_sha256"],
+                        "table": t_entry["table"], "output": t_entry["file"], "output_sha256": t_entry["sha256"],
+                        "rows": t_entry["rows"], "bytes": t_entry["bytes"], "compression": compression,
+                    }
+                    if "plaintext_sha256" in db_entry:
+                        record["plaintext_sha256"] = db_entry["plaintext_sha256"]
+                    append_evidence_log(bundle_dir / EVIDENCE_LOG_NAME, record)
+                except Exception as e:
+                    t_entry["error"] = str(e)
+                done += 1
+                if progress_callback:
+                    progress_callback(done, len(jobs), t_entry["table"])
+        except BaseException:
+            # progress_callback ném lỗi (vd. người dùng hủy tác vụ trong GUI): bỏ các bảng chưa chạy
+            # thay vì chờ xuất hết rồi mới dừng
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    manifest["total_tables"] = len(jobs)
+    manifest["failed_tables"] = sum(1 for t, *_ in jobs if "error" in t)
+    manifest["total_rows"] = sum(t.get("rows", 0) for t, *_ in jobs)
+    write_json_atomic(bundle_dir / "bundle_manifest.json", manifest)
+
+    if zip_bundle:
+        archive_path, archive_hash = compress_and_hash(bundle_dir, bundle_dir)
+        manifest["archive"] = str(archive_path)
+        manifest["archive_sha256"] = archive_hash
+        write_json_atomic(archive_path.with_name(archive_path.name + ".sha256.json"),
+                          {"archive": archive_path.name, "sha256": archive_hash})
+    return manifest
+
+
+@traced("run_extraction")
+def run_extraction(zalodata: Path, out_dir: Path, workers: int = None, fmt: str = "csv", uid: str = None,
+                   chunk_size: int = 2000, zip_bundle: bool = False, progress_callback=None,
+                   compression: str = None, level: int = None, threads: int = 0, resolve_names: bool = True,
+                   decode: bool = False, media: bool = False):
+    """
+    Trích xuất toàn bộ tài khoản:
+      1. Tìm UID (hoặc dùng uid truyền vào)
+      2. Snapshot Storage.db + mọi DB của tài khoản vào out_dir/snapshots (kèm SHA256 gốc)
+      3. Build bảng tra UID -> tên từ snapshot Storage.db (resolve_names=True)
+      4. Xuất mọi bảng của mọi DB song song vào bundle out_dir/tables (export_db_bundle),
+         các cột UID có thêm cột <cột>_name (decode=True: thêm cột giải mã, xem zl_decode)
+      5. media=True: kiểm kê media (SHA256, kiểu thật) + liên kết với tin nhắn -> out_dir/media_index.sqlite (zl_media)
+      6. Ghi out_dir/job_report.json
+    progress_callback(done_tables, total_tables, label) để cập nhật UI / CLI.
+    Trả về dict báo cáo job.
+    """
+    zalodata = Path(zalodata)
+    out_dir = Path(out_dir)
+    started_at = datetime.utcnow().isoformat() + "Z"
+    t0 = time.perf_counter()
+
+    uid = uid or discover_uid(zalodata)
+    if not uid:
+        raise RuntimeError(f"Không tìm thấy UID trong {zalodata / 'database-config.json'}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    snap_dir = out_dir / "snapshots"
+
+    report = {
+        "started_at": started_at,
+        "zalodata": str(zalodata),
+        "uid": uid,
+        "format": fmt,
+        "compression": compression,
+        "workers": workers or os.cpu_count(),
+        "sources": [],
+    }
+
+    # Snapshot
+    databases = []
+    for db_path in find_account_dbs(zalodata, uid):
+        name = _snapshot_name(zalodata, db_path)
+        entry = {"source": str(db_path), "source_sha256": sha256_of_file(db_path)}
+        try:
+            snap = snapshot_db(db_path, snap_dir, name)
+            entry["snapshot"] = str(snap)
+            databases.append((Path(name).stem, snap))
+        except Exception as e:
+            entry["error"] = str(e)
+        report["sources"].append(entry)
+
+    # Bảng tra tên (1 lần cho snapshot Storage.db)
+    names_db = None
+    storage_db = find_storage_db(zalodata)
+    if resolve_names and storage_db:
+        try:
+            names_db = build_names_db(snap_dir / _snapshot_name(zalodata, storage_db), source=storage_db)
+            report["names_db"] = str(names_db)
+        except Exception as e:
+            report["names_db_error"] = str(e)
+
+    # Xuất song song
+    bundle = export_db_bundle(databases, out_dir / "tables", fmt=fmt, workers=workers, chunk_size=chunk_size,
+                              zip_bundle=zip_bundle, progress_callback=progress_callback,
+                              compression=compression, level=level, threads=threads, names_db=names_db,
+                              decode=decode)
+
+    report["bundle"] = bundle
+
+    # Kiểm kê media (đọc Message DB từ snapshot đã có)
+    if media:
+        from zl_media import build_media_index, account_media_scope
+        media_index = out_dir / "media_index.sqlite"
+        try:
+            roots, skip = account_media_scope(zalodata, uid)
+            report["media"] = build_media_index(media_index, roots, find_message_dbs(zalodata, uid),
+                                                snapshot=lambda p: snap_dir / _snapshot_name(zalodata, p),
+                                                skip_dirs=skip)
+            report["media"]["index"] = str(media_index)
+        except Exception as e:
+            report["media_error"] = str(e)
+
+    report["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    report["total_tables"] = bundle["total_tables"]
+    report["failed_tables"] = bundle["failed_tables"]
+    report["total_rows"] = bundle["total_rows"]
+    write_json_atomic(out_dir / "job_report.json", report)
+    return report
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_export.py
+-----------------------------------
+Các hàm đọc bảng / xuất dữ liệu dùng chung cho GUI và engine headless:
+ - Liệt kê bảng, đếm số dòng
+ - Xuất toàn bộ bảng ra CSV/Excel dạng streaming (fetchmany, không load toàn bộ vào RAM)
+ - Writer xlsx bộ nhớ hằng: ghi nối tiếp vào 1 sheet, tự sang sheet mới khi chạm giới hạn dòng của Excel
+ - Parquet / Arrow IPC: chunk fetchmany -> record batch có kiểu, nén zstd
+ - Nén gzip/zstd khi ghi, SHA256 của file kết quả tính trong cùng lượt ghi
+ - Lọc theo chuỗi tìm kiếm được đẩy xuống SQLite (UDF), không cần DataFrame
+ - Tùy chọn giải mã cột khi xuất (timestamp -> ISO, nội dung JSON -> chữ / đính kèm, BLOB -> hex; zl_decode)
+Hoạt động với mọi connection DB-API (sqlite3 hoặc pysqlcipher3).
+-----------------------------------
+"""
+import csv
+import gzip
+import hashlib
+import io
+import re
+from pathlib import Path
+
+from zl_trace import span
+
+# Nén zstd (zstandard). Nếu không import được, chỉ còn gzip.
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except Exception:
+    ZSTD_AVAILABLE = False
+
+# Backend ghi xlsx streaming: ưu tiên xlsxwriter (constant_memory), dự phòng openpyxl (write_only)
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except Exception:
+    XLSXWRITER_AVAILABLE = False
+
+# Kiểu nén file CSV -> phần mở rộng thêm vào tên file
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+# Parquet / Arrow IPC (pyarrow). Nếu không import được, 2 định dạng này sẽ báo lỗi khi xuất.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except Exception as e:
+    PYARROW_AVAILABLE = False
+    _pyarrow_import_error = str(e)
+
+# Định dạng xuất: phần mở rộng file + nhãn cho hộp thoại lưu file
+EXPORT_FORMATS = {
+    "csv": (".csv", "CSV"),
+    "excel": (".xlsx", "Excel"),
+    "parquet": (".parquet", "Parquet"),
+    "arrow": (".arrow", "Arrow IPC"),
+}
+ARROW_FORMATS = ("parquet", "arrow")
+
+# Cột có giá trị dài hơn ngưỡng này (BLOB, JSON nội dung tin nhắn...) không dùng dictionary/statistics
+LARGE_VALUE_BYTES = 1024
+# Số dòng mỗi row group Parquet (gom nhiều chunk fetchmany lại)
+PARQUET_ROW_GROUP_ROWS = 65_536
+
+# Giới hạn của Excel
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_CELL_CHARS = 32_767
+_ILLEGAL_XLSX_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+
+def list_tables_from_conn(conn):
+    with span("schema"):
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+        return [r[0] for r in cur.fetchall()]
+
+
+def count_rows(conn, table):
+    with span("count", table=table):
+        cur = conn.cursor()
+        cur.execute(f'SELECT COUNT(*) FROM "{table}";')
+        r = cur.fetchone()
+        return r[0] if r else 0
+
+
+def _row_contains(q, *values):
+    """UDF SQLite: True nếu có cột nào chứa chuỗi q (không phân biệt hoa thường, Unicode)"""
+    for v in values:
+        if v is not None and q in str(v).lower():
+            return 1
+    return 0
+
+
+def build_search_query(conn, table, query: str = ""):
+    """
+    Tạo câu SELECT cho bảng, kèm điều kiện lọc "có cột nào chứa chuỗi tìm kiếm"
+    giống ô tìm kiếm trong preview. Trả về (sql, params).
+    """
+    q = (query or "").strip().lower()
+    sql = f'SELECT * FROM "{table}"'
+    if not q:
+        return sql, ()
+    cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+    conn.create_function("zl_row_contains", -1, _row_contains)
+    args = ", ".join(f'"{c}"' for c in cols)
+    return f"{sql} WHERE zl_row_contains(?, {args})", (q,)
+
+
+def count_query(conn, sql, params=()):
+    """Đếm số dòng kết quả của một câu SELECT"""
+    with span("count.query", sql=sql[:200]):
+        r = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()
+        return r[0] if r else 0
+
+
+def export_table_streaming(conn, table, out_path: Path, fmt="csv", chunk_size=1000, progress_callback=None, query="",
+                           compression=None, level=None, threads=0, names_db: Path = None, plaintext_key=False,
+                           decode=False):
+    """
+    Xuất toàn bộ bảng ra CSV/Excel/Parquet/Arrow dạng streaming (tránh load toàn bộ vào RAM).
+    - query: chuỗi tìm kiếm đang lọc (rỗng = toàn bộ bảng)
+    - compression: None / "gzip" / "zstd" (chỉ cho CSV), level và threads (zstd) tùy chọn
+    - names_db: DB tra tên (zl_resolve.build_names_db) -> thêm cột <cột>_name cho các cột UID
+      (plaintext_key=True nếu conn là SQLCipher)
+    - decode: giải mã cột (zl_decode) - thêm cột ISO cho timestamp, chữ / đính kèm cho nội dung JSON, BLOB -> hex
+    - progress_callback(received_rows, total_rows) để cập nhật progressbar.
+    Trả về dict {"rows", "bytes", "sha256", "compression"} - SHA256 của file kết quả được tính ngay khi ghi.
+    """
+    if names_db:
+        from zl_resolve import build_resolved_query
+        sql, params = build_resolved_query(conn, table, names_db, query, plaintext_key=plaintext_key)
+    else:
+        sql, params = build_search_query(conn, table, query)
+    total = count_query(conn, sql, params) if params else count_rows(conn, table)
+    return export_query_streaming(conn, sql, params, out_path, fmt=fmt, chunk_size=chunk_size,
+                                  progress_callback=progress_callback, total=total, sheet_name=table,
+                                  compression=compression, level=level, threads=threads, decode=decode)
+
+
+def export_query_streaming(conn, sql, params, out_path: Path, fmt="csv", chunk_size=1000, progress_callback=None, total=None,
+                           sheet_name="data", compression=None, level=None, threads=0, decode=False):
+    """
+    Chạy câu SELECT và ghi thẳng kết quả ra file theo từng lô fetchmany,
+    bộ nhớ không phụ thuộc kích thước bảng. Nén (gzip/zstd) và SHA256 được thực hiện
+    trong cùng lượt ghi - không cần đọc lại file.
+    decode=True: nhận dạng bộ giải mã cột từ lô đầu tiên (zl_decode.DecodePlan) rồi giải mã từng lô.
+    Trả về dict {"rows", "bytes", "sha256", "compression"}.
+    """
+    if compression and fmt != "csv":
+        raise ValueError(f"Nén ngoài chỉ áp dụng cho CSV ({fmt} đã tự nén bên trong)")
+    with span("export", fmt=fmt, compression=compression, file=Path(out_path).name) as sp:
+        column_types = probe_column_types(conn, sql, params) if fmt in ARROW_FORMATS else None
+        with span("query", sql=sql[:200]):
+            cur = conn.cursor()
+            cur.execute(sql, params)
+        cols = [d[0] for d in cur.description]
+        rows = cur.fetchmany(chunk_size)
+        plan = None
+        if decode:
+            from zl_decode import DecodePlan
+            plan = DecodePlan.detect(cols, rows)
+            if plan:
+                cols = plan.columns
+                column_types = plan.column_types(column_types) if column_types is not None else None
+                sp.set(decode=plan.describe())
+        sink = HashingSink(out_path)
+        exported = 0
+        try:
+            stream = open_compressed_stream(sink, compression, level=level, threads=threads,
+                                            inner_name=Path(out_path).name)
+            writer = open_export_writer(fmt, stream, cols, sheet_name=sheet_name, column_types=column_types)
+            try:
+                while rows:
+                    if plan:
+                        with span("decode", rows=len(rows)):
+                            rows = plan.apply_rows(rows)
+                    writer.write_rows(rows)
+                    exported += len(rows)
+                    if progress_callback:
+                        progress_callback(exported, total)
+                    rows = cur.fetchmany(chunk_size)
+            finally:
+                writer.close()
+        finally:
+            sink.close()
+        sp.set(rows=exported, bytes=sink.bytes)
+    return {"rows": exported, "bytes": sink.bytes, "sha256": sink.hexdigest(), "compression": compression}
+
+
+def open_export_writer(fmt, stream, columns, sheet_name="data", column_types=None):
+    """Tạo writer streaming theo định dạng (csv / excel / parquet / arrow), ghi vào stream nhị phân"""
+    if fmt == "csv":
+        return CsvStreamWriter(stream, columns)
+    if fmt == "excel":
+        return XlsxStreamWriter(stream, columns, sheet_name=sheet_name)
+    if fmt in ARROW_FORMATS:
+        return ArrowStreamWriter(stream, columns, column_types, fmt=fmt)
+    raise ValueError(f"Định dạng xuất không hỗ trợ: {fmt}")
+
+
+# -----------------------
+# File đầu ra: SHA256 khi ghi + nén gzip/zstd
+# -----------------------
+class HashingSink:
+    """
+    File nhị phân đầu ra: tính SHA256 và đếm số byte ngay khi ghi,
+    nên hash của file cuối cùng (đã nén) có sẵn mà không cần đọc lại.
+    """
+
+    def __init__(self, path: Path):
+        self._f = open(path, "wb")
+        self._h = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self._h.update(data)
+        self.bytes += len(data)
+        return self._f.write(data)
+
+    def tell(self):
+        return self.bytes
+
+    def flush(self):
+        self._f.flush()
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+    @property
+    def closed(self):
+        return self._f.closed
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def hexdigest(self):
+        return self._h.hexdigest()
+
+
+def open_compressed_stream(sink, compression=None, level=None, threads=0, inner_name=""):
+    """
+    Bọc sink bằng bộ nén streaming:
+    - None: ghi thẳng
+    - "gzip": level 1-9 (mặc định 6), mtime=0 để cùng dữ liệu cho cùng hash
+    - "zstd": level 1-22 (mặc định 3), threads > 0 để nén đa luồng (cần zstandard)
+    """
+    if not compression:
+        return sink
+    if compression == "gzip":
+        name = inner_name[:-len(".gz")] if inner_name.endswith(".gz") else inner_name
+        return gzip.GzipFile(filename=name, mode="wb", fileobj=sink,
+                             compresslevel=level if level is not None else 6, mtime=0)
+    if compression == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard không có sẵn.\nHãy cài bằng: pip install zstandard")
+        cctx = zstandard.ZstdCompressor(level=level if level is not None else 3, threads=threads or 0)
+        return cctx.stream_writer(sink, closefd=False)
+    raise ValueError(f"Kiểu nén không hỗ trợ: {compression}")
+
+
+class CsvStreamWriter:
+    """Ghi CSV (UTF-8 BOM để Excel đọc đúng tiếng Việt)"""
+
+    def __init__(self, stream, columns):
+        self._f = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._f.close()
+
+
+class XlsxStreamWriter:
+    """
+    Ghi file xlsx dạng streaming, thời gian tuyến tính và bộ nhớ hằng:
+    - xlsxwriter constant_memory (hoặc openpyxl write_only nếu không có xlsxwriter)
+    - Các dòng được nối tiếp vào cùng 1 sheet; khi đạt max_rows (kể cả header)
+      sẽ sang sheet mới "<tên>_2", "<tên>_3"... và lặp lại header.
+    """
+
+    def __init__(self, target, columns, sheet_name="data", max_rows=EXCEL_MAX_ROWS, engine=None):
+        # target: đường dẫn hoặc file nhị phân (HashingSink)
+        self.target = str(target) if isinstance(target, (str, Path)) else target
+        self.columns = list(columns)
+        self.base_name = (_INVALID_SHEET_CHARS.sub("_", str(sheet_name)) or "data")[:25]
+        self.max_rows = max_rows
+        self.engine = engine or ("xlsxwriter" if XLSXWRITER_AVAILABLE else "openpyxl")
+        self.sheet_count = 0
+        self._row = 0
+        if self.engine == "xlsxwriter":
+            self._wb = xlsxwriter.Workbook(self.target, {"constant_memory": True,
+                                                                "strings_to_numbers": False,
+                                                                "strings_to_formulas": False,
+                                                                "strings_to_urls": False})
+        else:
+            from openpyxl import Workbook
+            self._wb = Workbook(write_only=True)
+        self._new_sheet()
+
+    @staticmethod
+    def _cell(v):
+        """Chuẩn hóa giá trị ô: bytes -> hex, bỏ ký tự điều khiển, cắt theo giới hạn ô của Excel"""
+        if isinstance(v, str):
+            v = _ILLEGAL_XLSX_CHARS.sub("", v)
+            return v[:EXCEL_MAX_CELL_CHARS]
+        if isinstance(v, (bytes, bytearray, memoryview)):
+            return bytes(v).hex()[:EXCEL_MAX_CELL_CHARS]
+        return v
+
+    def _new_sheet(self):
+        self.sheet_count += 1
+        name = self.base_name if self.sheet_count == 1 else f"{self.base_name}_{self.sheet_count}"
+        if self.engine == "xlsxwriter":
+            self._ws = self._wb.add_worksheet(name)
+            self._ws.write_row(0, 0, self.columns)
+        else:
+            self._ws = self._wb.create_sheet(name)
+            self._ws.append(self.columns)
+        self._row = 1
+
+    def write_rows(self, rows):
+        cell = self._cell
+        for r in rows:
+            if self._row >= self.max_rows:
+                self._new_sheet()
+            values = [cell(v) for v in r]
+            if self.engine == "xlsxwriter":
+                self._ws.write_row(self._row, 0, values)
+            else:
+                self._ws.append(values)
+            self._row += 1
+
+    def close(self):
+        if self.engine == "xlsxwriter":
+            self._wb.close()
+        else:
+            self._wb.save(self.target)
+
+
+# -----------------------
+# Parquet / Arrow IPC
+# -----------------------
+def probe_column_types(conn, sql, params=()):
+    """
+    Xác định kiểu lưu trữ thực tế của từng cột (SQLite dùng kiểu động) bằng 1 lượt quét trong SQLite:
+    trả về {cột: (tập typeof, độ dài lớn nhất)}.
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT * FROM ({sql}) LIMIT 0", params)
+    cols = [d[0] for d in cur.description]
+    if not cols:
+        return {}
+    parts = []
+    for c in cols:
+        q = '"' + c.replace('"', '""') + '"'
+        parts.append(f"group_concat(DISTINCT typeof({q})), max(length(CAST({q} AS BLOB)))")
+    row = conn.execute(f"SELECT {', '.join(parts)} FROM ({sql})", params).fetchone()
+    types = {}
+    for i, c in enumerate(cols):
+        kinds = set((row[2 * i] or "").split(",")) - {"", "null"}
+        types[c] = (kinds, row[2 * i + 1] or 0)
+    return types
+
+
+def _arrow_type(kinds):
+    """Kiểu SQLite thực tế -> kiểu Arrow"""
+    if not kinds or kinds == {"integer"}:
+        return pa.int64()
+    if kinds <= {"integer", "real"}:
+        return pa.float64()
+    if "blob" in kinds:
+        return pa.large_binary()
+    return pa.large_string()
+
+
+def _to_arrow_column(values, typ):
+    """Chuyển 1 cột của chunk sang pyarrow.Array theo kiểu đã chọn"""
+    if pa.types.is_large_string(typ):
+        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    elif pa.types.is_large_binary(typ):
+        values = [v.encode("utf-8") if isinstance(v, str) else
+                  (str(v).encode("utf-8") if isinstance(v, (int, float)) else v) for v in values]
+    return pa.array(values, type=typ)
+
+
+class ArrowStreamWriter:
+    """
+    Ghi Parquet hoặc Arrow IPC từ các chunk fetchmany:
+    - Mỗi chunk được chuyển thành record batch có kiểu (int64/float64/string/binary)
+    - Nén zstd; Parquet gom batch thành row group ~PARQUET_ROW_GROUP_ROWS dòng
+    - Cột lớn (BLOB, JSON dài) dùng large_string/large_binary, tắt dictionary và statistics
+    """
+
+    def __init__(self, target, columns, column_types=None, fmt="parquet", compression="zstd"):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError(f"pyarrow không có sẵn: {_pyarrow_import_error}\nHãy cài bằng: pip install pyarrow")
+        column_types = column_types or {}
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.schema = pa.schema([(c, _arrow_type(column_types.get(c, (set(), 0))[0])) for c in self.columns])
+        large = [c for c in self.columns if column_types.get(c, (set(), 0))[1] > LARGE_VALUE_BYTES]
+        small = [c for c in self.columns if c not in large]
+        self._pending = []
+        self._pending_rows = 0
+        # target: đường dẫn hoặc file nhị phân (HashingSink)
+        if isinstance(target, (str, Path)):
+            self._sink = pa.OSFile(str(target), "wb")
+        else:
+            self._sink = pa.PythonFile(target, mode="w")
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression=compression,
+                                            use_dictionary=small, write_statistics=small)
+        else:
+            self._writer = pa.ipc.new_file(self._sink, self.schema,
+                                           options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    def write_rows(self, rows):
+        cols = list(zip(*rows))
+        arrays = [_to_arrow_column(col, field.type) for col, field in zip(cols, self.schema)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.fmt == "parquet":
+            self._pending.append(batch)
+            self._pending_rows += batch.num_rows
+            if self._pending_rows >= PARQUET_ROW_GROUP_ROWS:
+                self._flush()
+        else:
+            self._writer.write_batch(batch)
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write_table(pa.Table.from_batches(self._pending, schema=self.schema))
+            self._pending = []
+            self._pending_rows = 0
+
+    def close(self):
+        if self.fmt == "parquet":
+            self._flush()
+        self._writer.close()
+        self._sink.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+zl_extract.py
+
+CLI headless cho engine trích xuất (zl_engine): tìm UID, snapshot DB và xuất
+mọi bảng của mọi DB song song bằng nhiều process, kèm job_report.json.
+
+    python zl_extract.py --zalodata DIR --out DIR --workers N
+    python zl_extract.py --zalodata DIR --list-accounts
+    python zl_extract.py --zalodata DIR --out DIR --account UID [--account UID2 | --account all]
+
+Nhiều tài khoản được chọn -> mỗi tài khoản một thư mục con <out>/<uid>.
+--trace [FILE] ghi Chrome trace JSON các bước (snapshot, connect, query, export...), thêm --profile để có file .prof.
+
+WARNING: Chỉ chạy trên dữ liệu mà bạn có quyền truy cập.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from zl_engine import run_extraction, discover_accounts, EXPORT_EXTENSIONS
+from zl_export import COMPRESSIONS
+from zl_trace import TRACER
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Headless Zalo PC extraction - snapshot every DB and export every table in parallel.")
+    p.add_argument("--zalodata", required=True, type=str, help="Path to the ZaloData folder.")
+    p.add_argument("--out", type=str, help="Output directory (snapshots, tables, job_report.json).")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of export processes (default: CPU count).")
+    p.add_argument("--format", dest="fmt", choices=sorted(EXPORT_EXTENSIONS), default="csv", help="Table export format.")
+    p.add_argument("--account", "--uid", dest="accounts", action="append", metavar="UID",
+                   help="Account UID to extract (repeatable, or 'all'). Required when several accounts are found.")
+    p.add_argument("--list-accounts", action="store_true", help="List discovered accounts and exit.")
+    p.add_argument("--zip", action="store_true", help="Zip the table bundle and compute its sha256.")
+    p.add_argument("--compress", choices=sorted(COMPRESSIONS), help="(optional) Compress each CSV while writing (gzip or zstd).")
+    p.add_argument("--level", type=int, help="(optional) Compression level (gzip 1-9, zstd 1-22).")
+    p.add_argument("--threads", type=int, default=0, help="(optional) zstd compression threads per file (default: 0).")
+    p.add_argument("--no-names", action="store_true", help="Do not add <column>_name columns resolved from Storage.db info-cache.")
+    p.add_argument("--decode", action="store_true",
+                   help="Add decoded columns: timestamps as ISO 8601, JSON message content as text/attachment, BLOBs as hex.")
+    p.add_argument("--media", action="store_true",
+                   help="Inventory media files (sha256, real type from magic bytes) and link them to messages (media_index.sqlite).")
+    p.add_argument("--trace", nargs="?", const="", metavar="FILE", help="(optional) Write a Chrome trace JSON of the run (default: ~/.zl_extract/traces).")
+    p.add_argument("--profile", action="store_true", help="(optional) With --trace, also write a cProfile .prof file.")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace is not None:
+        # file trace được ghi khi thoát (kể cả khi lỗi / sys.exit)
+        TRACER.enable(profile=args.profile, dump_path=args.trace or None)
+    zalodata = Path(args.zalodata).resolve()
+    if not zalodata.exists():
+        print(f"[ERROR] ZaloData not found: {zalodata}")
+        sys.exit(2)
+    if args.compress and args.fmt != "csv":
+        print(f"[ERROR] --compress only applies to csv (got --format {args.fmt})")
+        sys.exit(2)
+
+    # chỉ cần dò tài khoản khi liệt kê hoặc chưa chỉ định UID cụ thể
+    accounts = []
+    if args.list_accounts or not args.accounts or "all" in args.accounts:
+        try:
+            accounts = discover_accounts(zalodata)
+        except RuntimeError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(2)
+    if args.list_accounts:
+        print_accounts(accounts)
+        return
+
+    if not args.out:
+        print("[ERROR] --out is required.")
+        sys.exit(2)
+    known = [a["uid"] for a in accounts]
+    if not args.accounts:
+        if len(known) > 1:
+            print("[ERROR] Several accounts found, choose with --account UID (or --account all):")
+            print_accounts(accounts)
+            sys.exit(2)
+        selected = known
+    elif "all" in args.accounts:
+        selected = known
+    else:
+        selected = args.accounts
+    if not selected:
+        print(f"[ERROR] No account found in {zalodata}")
+        sys.exit(2)
+
+    def progress(done, total, label):
+        print(f"[{done}/{total}] {label}")
+
+    failed = 0
+    for uid in selected:
+        out_dir = Path(args.out).resolve()
+        if len(selected) > 1:
+            out_dir = out_dir / uid
+        try:
+            report = run_extraction(zalodata, out_dir, workers=args.workers, fmt=args.fmt,
+                                    uid=uid, zip_bundle=args.zip, progress_callback=progress,
+                                    compression=args.compress, level=args.level, threads=args.threads,
+                                    resolve_names=not args.no_names, decode=args.decode, media=args.media)
+        except Exception as e:
+            print(f"[ERROR] Extraction failed for {uid}: {e}")
+            sys.exit(2)
+
+        print(f"[+] UID: {report['uid']}")
+        print(f"[+] {len(report['sources'])} DBs, {report['total_tables']} tables, "
+              f"{report['total_rows']} rows in {report['seconds']}s")
+        if report["bundle"].get("archive"):
+            print(f"[+] Bundle archive: {report['bundle']['archive']} (sha256 {report['bundle']['archive_sha256']})")
+        if report.get("media"):
+            m = report["media"]
+            print(f"[+] Media: {m['files']} files ({m['hashed']} hashed), {m['linked_files']} linked to messages "
+                  f"-> {m['index']}")
+        elif report.get("media_error"):
+            print(f"[!] Media inventory failed: {report['media_error']}")
+        print(f"[+] Evidence log: {out_dir / 'tables' / 'export_evidence_log.jsonl'}")
+        print(f"[+] Job report: {out_dir / 'job_report.json'}")
+        failed += report["failed_tables"]
+    if failed:
+        print(f"[!] {failed} tables failed, see job report.")
+        sys.exit(1)
+
+
+def print_accounts(accounts):
+    print(f"{'uid':>20} {'config':>7} {'dbs':>5} {'msg dbs':>8} {'MB':>10}  last modified")
+    for a in accounts:
+        print(f"{a['uid']:>20} {'yes' if a['in_config'] else 'no':>7} {a['db_count']:>5} {a['message_dbs']:>8} "
+              f"{a['total_bytes'] / 1048576:>10.1f}  {a['last_modified'] or '-'}")
+
+
+if __name__ == "__main__":
+    main()
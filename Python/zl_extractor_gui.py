@@ -6,6 +6,8 @@
 #
 # Yêu cầu thư viện:
 #   pip install pyqt6 pandas openpyxl reportlab
+#   (tùy chọn, PDF bảng lớn render song song) pip install pypdf
+#   (tùy chọn, Export Parquet) pip install pyarrow
 #
 # Lưu ý:
 # - Tên bảng trong DB Zalo có thể khác nhau giữa các phiên bản. App này cho phép
@@ -15,7 +17,8 @@
 # ---------------------------------
 
 import sys
-import sqlite3              # đọc file SQLite
+import tempfile
+from pathlib import Path
 import pandas as pd         # xử lý bảng dữ liệu và export Excel
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton,
@@ -23,8 +26,14 @@ from PyQt6.QtWidgets import (
     QLabel, QComboBox, QHBoxLayout
 )
 from PyQt6.QtCore import Qt
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+
+from zl_engine import snapshot_db, connect_ro      # snapshot DB + mở read-only (engine dùng chung)
+from zl_export import list_tables_from_conn, export_table_streaming
+from zl_pdf_report import render_table_report   # engine báo cáo PDF (reportlab)
+from zl_memory import plan_load, paged_sql, measure, format_bytes, format_report   # ngân sách bộ nhớ
+
+# Thư mục tạm chứa bản snapshot của DB đang mở
+TEMP_DIR = Path(tempfile.gettempdir()) / "zalo_extractor_tmp"
 
 # CHÚ THÍCH: toàn bộ giao diện và logic đều nằm trong class ZaloExtractor.
 # Class chịu trách nhiệm: mở DB, lấy danh sách bảng, load dữ liệu bảng, hiển thị,
@@ -40,8 +49,11 @@ class ZaloExtractor(QMainWindow):
         # Biến lưu connection SQLite và DataFrame hiện tại
         # self.conn: sqlite3.Connection (hoặc None nếu chưa mở DB)
         # self.df: pandas.DataFrame chứa dữ liệu của bảng đang chọn
+        # self.df_partial: True nếu bảng vượt ngân sách bộ nhớ và self.df chỉ là trang đầu
         self.conn = None
+        self.db_snapshot = None
         self.df = pd.DataFrame()
+        self.df_partial = False
 
         # Central widget + layout dọc chính
         central = QWidget()
@@ -75,11 +87,16 @@ class ZaloExtractor(QMainWindow):
         btn_excel.clicked.connect(self.export_excel)
         layout.addWidget(btn_excel)
 
-        # Nút: Export PDF (sử dụng reportlab để vẽ text đơn giản sang PDF)
+        # Nút: Export PDF (báo cáo dạng bảng phân trang, xem zl_pdf_report)
         btn_pdf = QPushButton("Export PDF")
         btn_pdf.clicked.connect(self.export_pdf)
         layout.addWidget(btn_pdf)
 
+        # Nút: Export Parquet (xuất streaming toàn bộ bảng từ DB, nén zstd - dùng cho phân tích)
+        btn_parquet = QPushButton("Export Parquet")
+        btn_parquet.clicked.connect(self.export_parquet)
+        layout.addWidget(btn_parquet)
+
     # Hàm gọi khi nhấn nút "Mở database"
     def open_db(self):
         # Mở file dialog để chọn file SQLite
@@ -95,13 +112,12 @@ class ZaloExtractor(QMainWindow):
             if self.conn:
                 self.conn.close()
 
-            # Mở kết nối sqlite
-            self.conn = sqlite3.connect(file_path)
+            # Snapshot DB (kèm -wal/-shm) rồi mở kết nối sqlite read-only trên bản copy
+            self.db_snapshot = snapshot_db(Path(file_path), TEMP_DIR)
+            self.conn = connect_ro(self.db_snapshot)
 
             # Lấy danh sách bảng từ sqlite_master
-            cur = self.conn.cursor()
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cur.fetchall()]
+            tables = list_tables_from_conn(self.conn)
 
             # Nếu DB không có bảng nào (hiếm), cảnh báo
             if not tables:
@@ -130,15 +146,25 @@ class ZaloExtractor(QMainWindow):
         if not table_name:
             return
         try:
-            # Chú ý: ở đây giới hạn 100 dòng để tránh load quá nặng giao diện
-            # Bạn có thể sửa limit hoặc thêm paging
+            # Ước lượng bộ nhớ trước khi đọc: bảng vượt ngân sách (ZL_MEMORY_BUDGET_MB)
+            # thì chỉ đọc trang đầu, export Excel khi đó đọc streaming từ DB
             query = f"SELECT * FROM '{table_name}'"
+            plan = plan_load(self.conn, table_name, query)
+            self.df_partial = plan["mode"] == "paged"
             # Dùng pandas.read_sql_query để load trực tiếp vào DataFrame
-            df = pd.read_sql_query(query, self.conn)
+            with measure("table.load", table=table_name, mode=plan["mode"]) as mem:
+                if self.df_partial:
+                    df = pd.read_sql_query(paged_sql(query), self.conn, params=(plan["page_rows"], 0))
+                else:
+                    df = pd.read_sql_query(query, self.conn)
             self.df = df  # lưu DataFrame hiện tại để export sau này
             self.show_table(df)
-            # Cập nhật label trạng thái: tên bảng + số dòng đang hiển thị
-            self.info_label.setText(f"Bảng: {table_name} | {len(df)} rows (hiển thị tối đa 100)")
+            # Cập nhật label trạng thái: tên bảng + số dòng đang hiển thị + bộ nhớ
+            text = f"Bảng: {table_name} | {len(df)} rows | {format_report(mem.report)}"
+            if self.df_partial:
+                text += (f" | chỉ hiển thị trang đầu (~{plan['rows']:,} dòng, ước tính "
+                         f"{format_bytes(plan['bytes'])} > ngân sách {format_bytes(plan['budget'])})")
+            self.info_label.setText(text)
         except Exception as e:
             # Thường lỗi xảy ra khi bảng có tên chứa ký tự đặc biệt (cần escape)
             # hoặc DB bị khóa / cấu trúc khác. Hiện ta show lỗi cho người dùng.
@@ -179,14 +205,44 @@ class ZaloExtractor(QMainWindow):
         )
         if not file_path:
             return
+        if self.df_partial:
+            # self.df chỉ là trang đầu: xuất cả bảng streaming từ DB thay vì đọc hết vào DataFrame
+            try:
+                with measure("export.excel", table=self.table_selector.currentText(), mode="streaming"):
+                    n = export_table_streaming(self.conn, self.table_selector.currentText(), Path(file_path),
+                                               fmt="excel", chunk_size=2000)["rows"]
+            except Exception as e:
+                QMessageBox.critical(self, "Error", str(e))
+                return
+            QMessageBox.information(self, "OK", f"Đã lưu Excel ({n} dòng, streaming): {file_path}")
+            return
         # Dùng pandas để lưu Excel (openpyxl sẽ tự động được dùng nếu cài)
         self.df.to_excel(file_path, index=False)
         QMessageBox.information(self, "OK", f"Đã lưu Excel: {file_path}")
 
-    # Xuất DataFrame hiện tại ra PDF đơn giản (text lines)
+    # Xuất toàn bộ bảng đang chọn ra Parquet (đọc streaming từ DB, không dùng self.df)
+    def export_parquet(self):
+        table_name = self.table_selector.currentText()
+        if not self.conn or not table_name:
+            QMessageBox.warning(self, "Warning", "Chưa có dữ liệu")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Lưu Parquet", f"{table_name}.parquet", "Parquet (*.parquet)"
+        )
+        if not file_path:
+            return
+        try:
+            n = export_table_streaming(self.conn, table_name, Path(file_path), fmt="parquet", chunk_size=2000)["rows"]
+            QMessageBox.information(self, "OK", f"Đã lưu Parquet ({n} dòng): {file_path}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+
+    # Xuất bảng hiện tại ra PDF dạng bảng (engine zl_pdf_report: đọc streaming từ DB,
+    # font Unicode nhúng cho tiếng Việt, wrap nội dung ô, bảng lớn render song song)
     def export_pdf(self):
+        table_name = self.table_selector.currentText()
         # Nếu chưa có dữ liệu thì cảnh báo
-        if self.df.empty:
+        if not self.db_snapshot or not table_name:
             QMessageBox.warning(self, "Warning", "Chưa có dữ liệu")
             return
         # Mở dialog chọn file để lưu PDF
@@ -196,33 +252,18 @@ class ZaloExtractor(QMainWindow):
         if not file_path:
             return
 
-        # Tạo canvas PDF (ReportLab) với khổ A4
-        c = canvas.Canvas(file_path, pagesize=A4)
-        width, height = A4
-        # Chọn font và kích thước chữ
-        c.setFont("Helvetica", 9)
-        # Bắt đầu vẽ từ mép trên
-        y = height - 40
-        # Tiêu đề báo cáo: hiển thị tên bảng hiện tại
-        c.drawString(30, y + 10, f"Zalo Data Report - Bảng {self.table_selector.currentText()}")
-
-        # Vẽ từng dòng dữ liệu (mỗi dòng 1 text tóm tắt)
-        #  - text[:120] giới hạn 120 ký tự cho 1 dòng để không tràn sang lề
-        #  - nếu cần đầy đủ nội dung, có thể wrap text hoặc tăng kích thước trang
-        for i, row in self.df.iterrows():
-            # Ghép tất cả giá trị cột của 1 hàng thành 1 chuỗi phân cách bởi " | "
-            text = " | ".join([str(x) for x in row.values])
-            c.drawString(30, y, text[:120])  # chỉ vẽ tối đa 120 ký tự/dòng
-            y -= 14  # nhảy xuống dòng tiếp theo (tùy chỉnh khoảng cách)
-            # Nếu đã gần đến đáy trang, tạo trang mới
-            if y < 40:
-                c.showPage()
-                c.setFont("Helvetica", 9)
-                y = height - 40
-
-        # Lưu file PDF
-        c.save()
-        QMessageBox.information(self, "OK", f"Đã lưu PDF: {file_path}")
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            result = render_table_report(self.db_snapshot, table_name, Path(file_path))
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        QApplication.restoreOverrideCursor()
+        QMessageBox.information(
+            self, "OK",
+            f"Đã lưu PDF: {file_path}\n{result['rows']} dòng, {result['pages']} trang ({result['seconds']}s)"
+        )
 
 
 # Entry point: tạo QApplication và hiển thị cửa sổ chính
@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_media.py
+-----------------------------------
+Kiểm kê media / file đính kèm (ảnh, video, voice, tài liệu) của ZaloData, liên kết với tin nhắn:
+    Duyệt cây thư mục song song (os.scandir, mỗi thư mục 1 tác vụ trong thread pool),
+    bỏ qua file DB (.db, -wal, -shm, -journal), config / log và file không phải media
+
+    Chỉ mục của 1 tài khoản chỉ gồm media của tài khoản đó (account_media_scope): ZaloData trừ
+    thư mục Database và thư mục UID của tài khoản khác, cộng thư mục "Zalo Received Files"
+
+    SHA256 từng file (thread pool, hashlib nhả GIL khi băm) + nhận dạng kiểu thật từ magic bytes
+    (ảnh đổi đuôi / file không đuôi vẫn nhận ra, cờ ext_mismatch)
+
+    Liên kết media với tin nhắn: tên file / tên trong URL (href, thumb...) của nội dung JSON đã giải mã
+    (zl_decode), hoặc ID tin nhắn (msgId / cliMsgId) ở đầu tên file
+
+    Kết quả ghi vào chỉ mục sidecar SQLite (cùng thư mục với chỉ mục timeline), có index theo
+    hội thoại -> "media của hội thoại này" chỉ là 1 truy vấn. View conversation_media gộp sẵn media + tin nhắn.
+    File không đổi (cùng size + mtime) không băm lại; Message DB không đổi thì không liên kết lại.
+-----------------------------------
+Ví dụ:
+    roots, skip = account_media_scope(zalodata, uid)
+    stats = build_media_index(media_index_path_for(uid), roots, find_message_dbs(zalodata, uid), skip_dirs=skip)
+    rows = conversation_media(index_path, conv_id)
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from zl_decode import decode_json_content
+from zl_engine import PRODUCTION_DIR, list_uid_dirs
+from zl_timeline_index import INDEX_DIR, db_fingerprint, detect_message_columns, epoch_seconds_sql
+from zl_trace import span
+
+HASH_CHUNK = 1024 * 1024
+HEAD_BYTES = 64
+LINK_CHUNK_ROWS = 20_000
+SKIP_SUFFIXES = (".db", ".db-wal", ".db-shm", ".db-journal", ".sqlite", ".sqlite-wal", ".sqlite-shm",
+                 ".json", ".log", ".ini", ".lock", ".tmp")
+# Kiểu không phải media (theo magic bytes): không đưa vào chỉ mục, trừ đuôi file đính kèm dạng chữ
+NON_MEDIA_KINDS = ("other", "database")
+TEXT_ATTACHMENT_EXTS = {"txt", "csv", "rtf", "xml", "html", "htm", "md"}
+
+# Cột ID tin nhắn / nội dung thường gặp (so khớp không phân biệt hoa thường)
+ID_COLUMN_CANDIDATES = ("msgId", "globalMsgId", "cliMsgId", "messageId", "id")
+CONTENT_COLUMN_CANDIDATES = ("content", "message", "msg", "attachment", "text")
+MIN_ID_DIGITS = 6     # tên file bắt đầu bằng >= 6 chữ số mới coi là ID tin nhắn
+
+# (offset, magic, mime, kind, đuôi chuẩn) - kiểm theo thứ tự
+MAGIC = (
+    (0, b"\xff\xd8\xff", "image/jpeg", "image", "jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png", "image", "png"),
+    (0, b"GIF87a", "image/gif", "image", "gif"),
+    (0, b"GIF89a", "image/gif", "image", "gif"),
+    (0, b"BM", "image/bmp", "image", "bmp"),
+    (0, b"II*\x00", "image/tiff", "image", "tif"),
+    (0, b"MM\x00*", "image/tiff", "image", "tif"),
+    (4, b"ftypheic", "image/heic", "image", "heic"),
+    (4, b"ftypheix", "image/heic", "image", "heic"),
+    (4, b"ftypmif1", "image/heif", "image", "heic"),
+    (4, b"ftypM4A", "audio/mp4", "audio", "m4a"),
+    (4, b"ftypqt", "video/quicktime", "video", "mov"),
+    (4, b"ftyp3gp", "video/3gpp", "video", "3gp"),
+    (4, b"ftyp", "video/mp4", "video", "mp4"),
+    (0, b"\x1aE\xdf\xa3", "video/webm", "video", "webm"),
+    (0, b"#!AMR", "audio/amr", "audio", "amr"),
+    (0, b"OggS", "audio/ogg", "audio", "ogg"),
+    (0, b"ID3", "audio/mpeg", "audio", "mp3"),
+    (0, b"fLaC", "audio/flac", "audio", "flac"),
+    (0, b"%PDF", "application/pdf", "document", "pdf"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage", "document", "doc"),
+    (0, b"PK\x03\x04", "application/zip", "archive", "zip"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar", "archive", "rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed", "archive", "7z"),
+    (0, b"\x1f\x8b", "application/gzip", "archive", "gz"),
+    (0, b"SQLite format 3\x00", "application/vnd.sqlite3", "database", "db"),
+)
+# RIFF: loại thật nằm ở byte 8..11
+RIFF_TYPES = {b"WEBP": ("image/webp", "image", "webp"), b"WAVE": ("audio/wav", "audio", "wav"),
+              b"AVI ": ("video/x-msvideo", "video", "avi")}
+# Đuôi hợp lệ khác cho cùng 1 kiểu (zip = docx/xlsx/apk..., ole = xls/ppt/msg)
+EXT_ALIASES = {
+    "jpg": {"jpg", "jpeg", "jfif", "jpe"}, "tif": {"tif", "tiff"}, "heic": {"heic", "heif"},
+    "mp4": {"mp4", "m4v", "mov", "3gp"}, "m4a": {"m4a", "mp4", "aac"}, "mov": {"mov", "qt", "mp4"},
+    "doc": {"doc", "xls", "ppt", "msg"}, "gz": {"gz", "tgz"}, "db": {"db", "sqlite", "sqlite3"},
+    "zip": {"zip", "docx", "xlsx", "pptx", "apk", "jar", "odt", "ods", "epub"},
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path         TEXT PRIMARY KEY,
+    root         TEXT NOT NULL,
+    rel_path     TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    mtime        REAL NOT NULL,
+    sha256       TEXT,
+    mime         TEXT,
+    kind         TEXT,
+    ext          TEXT,
+    ext_mismatch INTEGER NOT NULL DEFAULT 0,
+    indexed_at   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media_links (
+    path       TEXT NOT NULL,
+    db_path    TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    msg_id     TEXT NOT NULL,
+    conv_id    TEXT,
+    send_ts    INTEGER,
+    match      TEXT NOT NULL,
+    PRIMARY KEY (path, db_path, table_name, msg_id)
+);
+CREATE TABLE IF NOT EXISTS link_sources (
+    db_path     TEXT PRIMARY KEY,
+    db_size     INTEGER NOT NULL,
+    db_mtime    REAL NOT NULL,
+    wal_size    INTEGER NOT NULL,
+    wal_mtime   REAL NOT NULL,
+    media_state TEXT NOT NULL,
+    links       INTEGER NOT NULL,
+    linked_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_sha256 ON media(sha256);
+CREATE INDEX IF NOT EXISTS idx_media_name ON media(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_links_conv ON media_links(conv_id, send_ts);
+CREATE INDEX IF NOT EXISTS idx_links_msg ON media_links(msg_id);
+CREATE VIEW IF NOT EXISTS conversation_media AS
+    SELECT l.conv_id, l.msg_id, l.send_ts, l.match, l.db_path, l.table_name,
+           m.path, m.rel_path, m.name, m.size, m.mtime, m.sha256, m.mime, m.kind, m.ext_mismatch
+    FROM media_links l JOIN media m ON m.path = l.path;
+"""
+
+
+def media_index_path_for(uid: str) -> Path:
+    """Đường dẫn file chỉ mục media của một tài khoản"""
+    INDEX_DIR.mkdir(exist_ok=True)
+    return INDEX_DIR / f"media_{uid}.sqlite"
+
+
+def account_media_scope(zalodata: Path, uid: str):
+    """
+    Phạm vi media của 1 tài khoản -> (roots, skip_dirs):
+     - roots: ZaloData + thư mục "Zalo Received Files" (file tải về của Zalo PC, trong Documents) nếu có;
+       có thư mục con <uid> trong "Zalo Received Files" thì chỉ lấy thư mục đó
+     - skip_dirs: ZaloData/Database (DB, không có media) và mọi thư mục mang UID của tài khoản khác
+       (so theo tên ở mọi cấp, vd. Picture/<uid khác>)
+    """
+    zalodata = Path(zalodata)
+    roots = [zalodata]
+    received = Path.home() / "Documents" / "Zalo Received Files"
+    if (received / uid).is_dir():
+        roots.append(received / uid)
+    elif received.is_dir():
+        roots.append(received)
+    skip = {str(zalodata / PRODUCTION_DIR.parts[0])}
+    skip.update(u for u in list_uid_dirs(zalodata) if u != uid)
+    return roots, skip
+
+
+def open_index(index_path: Path):
+    """Mở (hoặc tạo) file chỉ mục media"""
+    conn = sqlite3.connect(str(index_path))
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(link_sources)")]
+    if cols and "wal_size" not in cols:
+        # chỉ mục cũ chưa ghi fingerprint -wal: liên kết lại mọi Message DB (không băm lại file media)
+        conn.execute("DROP TABLE link_sources")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# -----------------------------
+# Duyệt thư mục song song
+# -----------------------------
+def _scan_dir(path: str, skip_dirs=()):
+    """
+    1 thư mục -> ([(path, size, mtime)], [thư mục con]); thư mục không đọc được thì bỏ qua.
+    Thư mục con có tên hoặc đường dẫn nằm trong skip_dirs không được duyệt.
+    """
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if e.name not in skip_dirs and e.path not in skip_dirs:
+                            subdirs.append(e.path)
+                    elif e.is_file(follow_symlinks=False) and not e.name.lower().endswith(SKIP_SUFFIXES):
+                        st = e.stat(follow_symlinks=False)
+                        files.append((e.path, st.st_size, st.st_mtime))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+
+def walk_files(roots, workers: int = None, skip_dirs=()):
+    """
+    Liệt kê mọi file dưới các thư mục gốc: mỗi thư mục được scandir trong 1 tác vụ của thread pool,
+    thư mục con được đưa vào pool ngay khi tìm thấy. skip_dirs: tên / đường dẫn thư mục bỏ qua.
+    Trả về [(root, path, size, mtime)].
+    """
+    out = []
+    skip_dirs = set(skip_dirs)
+    with ThreadPoolExecutor(max_workers=workers or min(16, (os.cpu_count() or 1) * 4)) as pool:
+        pending = {pool.submit(_scan_dir, str(r), skip_dirs): str(r) for r in roots if Path(r).is_dir()}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                root = pending.pop(fut)
+                files, subdirs = fut.result()
+                out.extend((root, p, size, mtime) for p, size, mtime in files)
+                for d in subdirs:
+                    pending[pool.submit(_scan_dir, d, skip_dirs)] = root
+    return out
+
+
+# -----------------------------
+# Băm + nhận dạng kiểu
+# -----------------------------
+def sniff_type(head: bytes):
+    """Magic bytes -> (mime, kind, đuôi chuẩn); không nhận ra -> (None, "other", None)"""
+    if head[:4] == b"RIFF" and head[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[head[8:12]]
+    for offset, magic, mime, kind, ext in MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            return mime, kind, ext
+    # ADTS AAC / MP3 không có ID3: chỉ có sync word
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+        return "audio/aac", "audio", "aac"
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "audio/mpeg", "audio", "mp3"
+    return None, "other", None
+
+
+def hash_file(path: str):
+    """(sha256, HEAD_BYTES byte đầu) trong 1 lượt đọc"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        chunk = f.read(HASH_CHUNK)
+        head = chunk[:HEAD_BYTES]
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(HASH_CHUNK)
+    return h.hexdigest(), head
+
+
+def _ext_mismatch(name: str, sniffed_ext):
+    ext = Path(name).suffix.lower().lstrip(".")
+    if not sniffed_ext:
+        return ext, 0
+    return ext, int(ext not in EXT_ALIASES.get(sniffed_ext, {sniffed_ext}))
+
+
+def _is_media(kind, ext) -> bool:
+    return kind not in NON_MEDIA_KINDS or (kind == "other" and ext in TEXT_ATTACHMENT_EXTS)
+
+
+def _media_record(root, path, size, mtime):
+    """Bản ghi bảng media; None nếu không phải media (chỉ đọc HEAD_BYTES byte đầu, không băm)"""
+    name = os.path.basename(path)
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEAD_BYTES)
+    except OSError:
+        head = b""
+    mime, kind, sniffed = sniff_type(head)
+    ext, mismatch = _ext_mismatch(name, sniffed)
+    if not _is_media(kind, ext):
+        return None
+    try:
+        sha, _ = hash_file(path)
+    except OSError:
+        sha = None
+    return (path, root, os.path.relpath(path, root), name, size, mtime, sha, mime, kind, ext, mismatch,
+            datetime.now().isoformat(timespec="seconds"))
+
+
+def index_media_files(idx, roots, workers: int = None, progress_callback=None, force=False, skip_dirs=()):
+    """
+    Cập nhật bảng media: duyệt song song, băm file mới / đã đổi (size, mtime), xóa file không còn
+    (kể cả file ngoài phạm vi roots / skip_dirs hiện tại và file không phải media của chỉ mục cũ).
+    Trả về {"files", "hashed", "reused", "removed", "skipped"}; skipped = file không phải media.
+    """
+    with span("media.walk") as sp:
+        found = walk_files(roots, workers, skip_dirs)
+        sp.set(files=len(found))
+    indexed = idx.execute("SELECT path, size, mtime, kind, ext FROM media").fetchall()
+    known = {p: (s, m) for p, s, m, kind, ext in indexed if _is_media(kind, ext)}
+    todo = [f for f in found if force or known.get(f[1]) != (f[2], f[3])]
+    # file không còn / ngoài phạm vi + bản ghi không phải media của chỉ mục cũ
+    gone = ({p for p, *_ in indexed} - {f[1] for f in found}) | ({p for p, *_ in indexed} - set(known))
+    with idx:
+        idx.executemany("DELETE FROM media WHERE path=?", ((p,) for p in gone))
+        idx.executemany("DELETE FROM media_links WHERE path=?", ((p,) for p in gone))
+
+    with span("media.hash", files=len(todo)):
+        with ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 1) * 2)) as pool:
+            batch, dropped = [], []
+            for i, (f, record) in enumerate(zip(todo, pool.map(lambda f: _media_record(*f), todo)), 1):
+                if record is None:
+                    dropped.append(f[1])   # không phải media (nay đã đổi nội dung thành không phải media)
+                else:
+                    batch.append(record)
+                if len(batch) >= 500 or (i == len(todo) and batch):
+                    with idx:
+                        idx.executemany("INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                    batch = []
+                if progress_callback:
+                    progress_callback(i, len(todo), f"Băm {i}/{len(todo)} file")
+    stale = [p for p in dropped if p in known]
+    if stale:
+        with idx:
+            idx.executemany("DELETE FROM media WHERE path=?", ((p,) for p in stale))
+            idx.executemany("DELETE FROM media_links WHERE path=?", ((p,) for p in stale))
+    return {"files": len(found) - len(dropped), "hashed": len(todo) - len(dropped), "reused": len(found) - len(todo),
+            "removed": len(gone) + len(stale), "skipped": len(dropped)}
+
+
+# -----------------------------
+# Liên kết media <-> tin nhắn
+# -----------------------------
+def _media_keys(idx):
+    """DataFrame khóa so khớp: tên file (chữ thường) và ID tin nhắn ở đầu tên file"""
+    media = pd.read_sql_query("SELECT path, name FROM media", idx)
+    names = pd.DataFrame({"key": media["name"].str.lower(), "path": media["path"]})
+    stems = media["name"].str.extract(rf"^(\d{{{MIN_ID_DIGITS},}})", expand=False)
+    ids = pd.DataFrame({"key": stems, "path": media["path"]}).dropna()
+    return names, ids
+
+
+def _media_state(idx):
+    """Dấu vết tập media hiện tại: đổi thì phải liên kết lại mọi Message DB"""
+    n, total, latest = idx.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(MAX(mtime), 0) FROM media").fetchone()
+    return f"{n}:{total}:{latest}"
+
+
+def _pick_column(cols, candidates):
+    lower = {c.lower(): c for c in cols}
+    return next((lower[c.lower()] for c in candidates if c.lower() in lower), None)
+
+
+def link_message_db(idx, db_path: Path, snapshot_path: Path, names, ids):
+    """
+    Liên kết media với tin nhắn của 1 Message DB (đã snapshot):
+     - theo tên: SQLite chỉ trả về dòng có nội dung JSON, đọc theo lô, giải mã bằng zl_decode
+       rồi join (pandas merge) với tên file
+     - theo ID: SQLite lọc sẵn các dòng có msgId / cliMsgId nằm trong danh sách ID lấy từ tên file
+    Trả về số liên kết.
+    """
+    idx.execute("DELETE FROM media_links WHERE db_path=?", (str(db_path),))
+    if names.empty and ids.empty:
+        return 0
+    src = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    linked = 0
+    try:
+        tables = [r[0] for r in src.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+        for table in tables:
+            detected = detect_message_columns(src, table)
+            cols = [r[1] for r in src.execute(f'PRAGMA table_info("{table}")')]
+            id_cols = [c for c in (_pick_column(cols, (cand,)) for cand in ID_COLUMN_CANDIDATES) if c][:2]
+            content_col = _pick_column(cols, CONTENT_COLUMN_CANDIDATES)
+            if not detected or not id_cols or not content_col:
+                continue
+            conv_col, ts_col = detected
+            meta = f'CAST("{id_cols[0]}" AS TEXT), CAST("{conv_col}" AS TEXT), {epoch_seconds_sql(ts_col)}'
+            with span("media.link", db=db_path.name, table=table):
+                if not names.empty:
+                    cur = src.execute(f'SELECT {meta}, "{content_col}" FROM "{table}" '
+                                      f'WHERE substr(ltrim("{content_col}"), 1, 1) = \'{{\'')
+                    while True:
+                        rows = cur.fetchmany(LINK_CHUNK_ROWS)
+                        if not rows:
+                            break
+                        chunk = pd.DataFrame.from_records(rows, columns=["msg_id", "conv_id", "send_ts", "content"])
+                        linked += _insert_links(idx, db_path, table, _match_names(chunk, names))
+                if not ids.empty:
+                    wanted = json.dumps(sorted(set(ids["key"])))
+                    id_exprs = [f'CAST("{c}" AS TEXT)' for c in id_cols]
+                    where = " OR ".join(f"{e} IN (SELECT value FROM json_each(?))" for e in id_exprs)
+                    rows = src.execute(f'SELECT {meta}, {", ".join(id_exprs)} FROM "{table}" WHERE {where}',
+                                       [wanted] * len(id_exprs)).fetchall()
+                    if rows:
+                        chunk = pd.DataFrame.from_records(
+                            rows, columns=["msg_id", "conv_id", "send_ts"] + [f"id{i}" for i in range(len(id_cols))])
+                        linked += _insert_links(idx, db_path, table, _match_ids(chunk, ids, len(id_cols)))
+    finally:
+        src.close()
+    return linked
+
+
+def _match_names(chunk, names):
+    """Lô tin nhắn JSON -> liên kết theo tên file trong URL đính kèm hoặc tiêu đề (tên file gửi)"""
+    meta = chunk[["msg_id", "conv_id", "send_ts"]]
+    text, attachment, _ = decode_json_content(chunk["content"].astype(object))
+    url_name = attachment.str.extract(r"^(?:[^?#]*[/\\])?([^/\\?#]+)", expand=False)
+    keys = [meta.assign(key=url_name.str.lower(), match="attachment_url"),
+            meta.assign(key=text.str.lower(), match="file_name")]
+    return pd.concat(keys).dropna(subset=["key"]).merge(names, on="key")
+
+
+def _match_ids(chunk, ids, id_count):
+    meta = chunk[["msg_id", "conv_id", "send_ts"]]
+    keys = [meta.assign(key=chunk[f"id{i}"], match="msg_id") for i in range(id_count)]
+    return pd.concat(keys).dropna(subset=["key"]).merge(ids, on="key")
+
+
+def _insert_links(idx, db_path, table, found):
+    found = found.drop_duplicates(subset=["path", "msg_id"])
+    if found.empty:
+        return 0
+    found = found.astype(object).where(found.notna(), None)
+    idx.executemany(
+        "INSERT OR IGNORE INTO media_links VALUES (?, ?, ?, ?, ?, ?, ?)",
+        zip(found["path"], [str(db_path)] * len(found), [table] * len(found), found["msg_id"],
+            found["conv_id"], found["send_ts"], found["match"]),
+    )
+    return len(found)
+
+
+def build_media_index(index_path: Path, roots, message_dbs, snapshot=None, progress_callback=None,
+                      workers: int = None, force=False, skip_dirs=()):
+    """
+    Build / cập nhật chỉ mục media:
+      1. Kiểm kê file dưới các thư mục gốc (roots, trừ skip_dirs - xem account_media_scope), băm file mới / đã đổi
+      2. Liên kết media với tin nhắn của từng Message DB (bỏ qua DB và tập media không đổi)
+    - snapshot(db_path) -> Path: hàm copy DB sang bản tạm (mặc định đọc trực tiếp, read-only)
+    - progress_callback(done, total, text) để cập nhật UI
+    Trả về dict thống kê.
+    """
+    t0 = time.perf_counter()
+    message_dbs = [Path(p) for p in message_dbs]
+    idx = open_index(index_path)
+    try:
+        stats = index_media_files(idx, roots, workers=workers, progress_callback=progress_callback, force=force,
+                                  skip_dirs=skip_dirs)
+        state = _media_state(idx)
+        wanted = {str(p) for p in message_dbs}
+        for (old,) in idx.execute("SELECT db_path FROM link_sources").fetchall():
+            if old not in wanted:
+                with idx:
+                    idx.execute("DELETE FROM media_links WHERE db_path=?", (old,))
+                    idx.execute("DELETE FROM link_sources WHERE db_path=?", (old,))
+        names, ids = _media_keys(idx)
+        stats.update(linked_dbs=0, skipped_dbs=0)
+        for i, db_path in enumerate(message_dbs, 1):
+            # tin nhắn mới nằm ở -wal trước khi checkpoint -> so cả size/mtime của -wal
+            fingerprint = db_fingerprint(db_path)
+            row = idx.execute("SELECT db_size, db_mtime, wal_size, wal_mtime, media_state FROM link_sources "
+                              "WHERE db_path=?", (str(db_path),)).fetchone()
+            if not force and row == (*fingerprint, state):
+                stats["skipped_dbs"] += 1
+            else:
+                snap = snapshot(db_path) if snapshot else db_path
+                with idx:
+                    n = link_message_db(idx, db_path, snap, names, ids)
+                    idx.execute("INSERT OR REPLACE INTO link_sources VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (str(db_path), *fingerprint, state, n,
+                                 datetime.now().isoformat(timespec="seconds")))
+                stats["linked_dbs"] += 1
+            if progress_callback:
+                progress_callback(i, len(message_dbs), f"Liên kết {db_path.name}")
+        stats["links"] = idx.execute("SELECT COUNT(*) FROM media_links").fetchone()[0]
+        stats["linked_files"] = idx.execute("SELECT COUNT(DISTINCT path) FROM media_links").fetchone()[0]
+        idx.commit()
+    finally:
+        idx.close()
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+
+# -----------------------------
+# ĐỌC TỪ CHỈ MỤC
+# -----------------------------
+def media_conversations(index_path: Path):
+    """
+    Hội thoại có media, nhiều file nhất trước.
+    Mỗi phần tử: (conv_id, file_count, total_bytes, first_ts, last_ts)
+    """
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        return conn.execute(
+            "SELECT conv_id, COUNT(DISTINCT path), SUM(size), MIN(send_ts), MAX(send_ts) "
+            "FROM conversation_media GROUP BY conv_id ORDER BY 2 DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+MEDIA_COLUMNS = ("send_ts", "msg_id", "name", "kind", "mime", "size", "sha256", "match", "ext_mismatch", "path")
+
+
+def conversation_media(index_path: Path, conv_id: str = None):
+    """
+    Media của 1 hội thoại theo thời gian tin nhắn (cột như MEDIA_COLUMNS);
+    conv_id=None: media không liên kết được với tin nhắn nào.
+    """
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        if conv_id is None:
+            return conn.execute(
+                "SELECT NULL, NULL, name, kind, mime, size, sha256, NULL, ext_mismatch, path FROM media "
+                "WHERE path NOT IN (SELECT path FROM media_links) ORDER BY rel_path"
+            ).fetchall()
+        return conn.execute(
+            f"SELECT {', '.join(MEDIA_COLUMNS)} FROM conversation_media WHERE conv_id=? ORDER BY send_ts",
+            (conv_id,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def export_media_csv(index_path: Path, out_path: Path):
+    """Xuất toàn bộ kiểm kê media (kèm hội thoại / tin nhắn liên kết nếu có) ra CSV. Trả về số dòng."""
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    written = 0
+    try:
+        cur = conn.execute(
+            "SELECT m.rel_path, m.name, m.kind, m.mime, m.ext_mismatch, m.size, m.mtime, m.sha256, "
+            "       l.conv_id, l.msg_id, l.send_ts, l.match, m.path "
+            "FROM media m LEFT JOIN media_links l ON l.path = m.path ORDER BY m.rel_path, l.send_ts"
+        )
+        with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow([d[0] for d in cur.description])
+            while True:
+                rows = cur.fetchmany(5000)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                written += len(rows)
+    finally:
+        conn.close()
+    return written
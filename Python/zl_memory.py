@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_memory.py
+-----------------------------------
+Giới hạn bộ nhớ khi đọc bảng vào pandas (preview / xuất từ DataFrame):
+    Ước lượng kích thước kết quả TRƯỚC khi đọc: số byte bảng chiếm trên đĩa (dbstat,
+    hoặc page_count * page_size nếu SQLite không có dbstat) chia cho kích thước dòng trung
+    bình trên đĩa (lấy mẫu vài trăm dòng) -> số dòng; nhân với kích thước 1 dòng khi nằm
+    trong bộ nhớ (object Python của mẫu)
+
+    Vượt ngân sách thì chuyển sang đọc theo trang (LIMIT/OFFSET) hoặc xuất streaming
+    (zl_export) thay vì đọc cả bảng
+
+    Ngân sách (MB): biến môi trường ZL_MEMORY_BUDGET_MB > "memory_budget_mb" trong
+    ~/.zl_extract/settings.json > mặc định 1/4 RAM máy (tối đa 4 GB)
+
+    measure("tên thao tác"): đo RSS trước/sau (+ đỉnh tracemalloc nếu đang bật, ZL_TRACEMALLOC=1),
+    ghi vào span của zl_trace và danh sách REPORTS
+-----------------------------------
+Yêu cầu: không bắt buộc - pip install psutil (đo RSS chính xác trên Windows / macOS)
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+from zl_trace import span
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except Exception:
+    PSUTIL_AVAILABLE = False
+
+BUDGET_ENV = "ZL_MEMORY_BUDGET_MB"
+TRACEMALLOC_ENV = "ZL_TRACEMALLOC"
+SETTINGS_PATH = Path.home() / ".zl_extract" / "settings.json"
+DEFAULT_BUDGET_MB = 1024          # khi không biết dung lượng RAM
+MAX_DEFAULT_BUDGET_MB = 4096
+SAMPLE_ROWS = 500
+MIN_PAGE_ROWS = 1000
+MAX_PAGE_ROWS = 50_000
+READ_PEAK_FACTOR = 2.5           # read_sql_query giữ cùng lúc list tuple (fetchall) + DataFrame
+MB = 1024 * 1024
+
+REPORTS = deque(maxlen=200)       # kết quả measure() gần nhất
+_lock = threading.Lock()
+
+
+# -----------------------------
+# RAM / RSS
+# -----------------------------
+def total_memory():
+    """Tổng RAM của máy (byte), None nếu không xác định được"""
+    if PSUTIL_AVAILABLE:
+        return psutil.virtual_memory().total
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        pass
+    if sys.platform == "win32":
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+        stat = MEMORYSTATUSEX()
+        stat.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat)):
+            return stat.ullTotalPhys
+    return None
+
+
+def current_rss():
+    """RSS hiện tại của process (byte), None nếu không đo được (Windows / macOS không có psutil)"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# -----------------------------
+# Ngân sách
+# -----------------------------
+def _load_settings():
+    try:
+        return json.loads(SETTINGS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def default_budget_mb():
+    total = total_memory()
+    if not total:
+        return DEFAULT_BUDGET_MB
+    return max(256, min(MAX_DEFAULT_BUDGET_MB, total // 4 // MB))
+
+
+def memory_budget_mb():
+    """Ngân sách bộ nhớ (MB) cho 1 lần đọc bảng vào DataFrame"""
+    env = os.environ.get(BUDGET_ENV, "").strip()
+    if env:
+        try:
+            return max(1, int(float(env)))
+        except ValueError:
+            pass
+    value = _load_settings().get("memory_budget_mb")
+    if isinstance(value, (int, float)) and value > 0:
+        return int(value)
+    return default_budget_mb()
+
+
+def memory_budget():
+    """Ngân sách bộ nhớ tính bằng byte"""
+    return memory_budget_mb() * MB
+
+
+def set_memory_budget_mb(mb):
+    """Lưu ngân sách vào ~/.zl_extract/settings.json (None = về mặc định). Biến môi trường vẫn được ưu tiên."""
+    settings = _load_settings()
+    if mb:
+        settings["memory_budget_mb"] = int(mb)
+    else:
+        settings.pop("memory_budget_mb", None)
+    SETTINGS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    SETTINGS_PATH.write_text(json.dumps(settings, indent=2), encoding="utf-8")
+
+
+# -----------------------------
+# Ước lượng kích thước kết quả
+# -----------------------------
+def table_disk_bytes(conn, table):
+    """Số byte bảng chiếm trên đĩa: (bytes, "dbstat") hoặc cả file (page_count * page_size, "pages")"""
+    try:
+        r = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ? AND aggregate = 1", (table,)).fetchone()
+        if r and r[0]:
+            return int(r[0]), "dbstat"
+    except Exception:
+        pass   # SQLite biên dịch không có dbstat (vd. một số bản SQLCipher)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count, "pages"
+
+
+def _disk_size(v):
+    if v is None:
+        return 1
+    if isinstance(v, str):
+        return len(v.encode("utf-8", "surrogatepass")) + 2
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return len(v) + 2
+    return 9
+
+
+def _memory_size(v):
+    # object trong cột pandas + con trỏ 8 byte; số nguyên / thực nằm trong mảng numpy 8 byte
+    if v is None or isinstance(v, (int, float)):
+        return 8
+    return sys.getsizeof(v) + 8
+
+
+def estimate_result(conn, table, sql=None, params=()):
+    """
+    Ước lượng kết quả của sql (mặc định SELECT * FROM table) trước khi đọc vào DataFrame.
+    Trả về dict: rows (ước lượng, chặn trên vì bỏ qua điều kiện lọc), row_bytes (bộ nhớ / dòng),
+    bytes (đỉnh bộ nhớ dự kiến khi đọc bằng read_sql_query), disk_bytes,
+    method ("sample" nếu bảng nhỏ hơn mẫu => chính xác).
+    """
+    sql = sql or f'SELECT * FROM "{table}"'
+    with span("memory.estimate", table=table) as sp:
+        sample = conn.execute(f"SELECT * FROM ({sql}) LIMIT {SAMPLE_ROWS}", params).fetchall()
+        if not sample:
+            return {"rows": 0, "row_bytes": 0, "bytes": 0, "disk_bytes": 0, "method": "sample"}
+        disk_row = sum(_disk_size(v) for row in sample for v in row) / len(sample) + 4
+        mem_row = sum(_memory_size(v) for row in sample for v in row) / len(sample)
+        if len(sample) < SAMPLE_ROWS:
+            rows, disk_bytes, method = len(sample), int(disk_row * len(sample)), "sample"
+        else:
+            disk_bytes, method = table_disk_bytes(conn, table)
+            rows = max(len(sample), int(disk_bytes / disk_row))
+        est = {"rows": rows, "row_bytes": int(mem_row), "bytes": int(rows * mem_row * READ_PEAK_FACTOR),
+               "disk_bytes": disk_bytes, "method": method}
+        sp.set(**est)
+        return est
+
+
+def plan_load(conn, table, sql=None, params=(), budget=None):
+    """
+    Quyết định đọc cả bảng ("full") hay đọc theo trang ("paged").
+    Trả về estimate_result() + mode, budget, page_rows (số dòng mỗi trang khi "paged",
+    chiếm khoảng 1/4 ngân sách, trong khoảng MIN_PAGE_ROWS..MAX_PAGE_ROWS).
+    """
+    budget = budget or memory_budget()
+    est = estimate_result(conn, table, sql, params)
+    mode = "full" if est["bytes"] <= budget else "paged"
+    page_rows = int(budget / 4 / READ_PEAK_FACTOR / max(est["row_bytes"], 1))
+    return {**est, "mode": mode, "budget": budget,
+            "page_rows": max(MIN_PAGE_ROWS, min(MAX_PAGE_ROWS, page_rows))}
+
+
+def paged_sql(sql):
+    """Bọc câu SELECT để lấy 1 trang: params thêm (limit, offset)"""
+    return f"SELECT * FROM ({sql}) LIMIT ? OFFSET ?"
+
+
+# -----------------------------
+# Đo bộ nhớ theo thao tác
+# -----------------------------
+class measure:
+    """
+    Đo bộ nhớ của 1 thao tác (context manager):
+        with measure("preview.load", table=t) as m:
+            df = ...
+        m.report -> {"op", "seconds", "rss_before", "rss_after", "rss_delta", "tracemalloc_peak", ...}
+    Đỉnh tracemalloc chỉ có khi tracemalloc đang chạy (ZL_TRACEMALLOC=1) vì nó làm chậm mọi cấp phát.
+    """
+
+    def __init__(self, op, **info):
+        self.op = op
+        self.info = info
+        self.report = None
+        self._span = None
+
+    def __enter__(self):
+        self._span = span(f"memory.{self.op}", **self.info)
+        self._span.__enter__()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._rss = current_rss()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        rss = current_rss()
+        report = {"op": self.op, **self.info, "seconds": round(time.perf_counter() - self._t0, 4),
+                  "rss_before": self._rss, "rss_after": rss,
+                  "rss_delta": rss - self._rss if rss is not None and self._rss is not None else None,
+                  "tracemalloc_peak": tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None}
+        self.report = report
+        with _lock:
+            REPORTS.append(report)
+        self._span.set(**{k: v for k, v in report.items() if k.startswith(("rss", "tracemalloc"))})
+        self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def format_bytes(n):
+    if n is None:
+        return "?"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def format_report(report):
+    """Chuỗi ngắn cho thanh trạng thái: 'RSS 412.3 MB (+120.5 MB), đỉnh tracemalloc 98.1 MB'"""
+    if not report:
+        return ""
+    text = f"RSS {format_bytes(report['rss_after'])}"
+    if report.get("rss_delta") is not None:
+        sign = "+" if report["rss_delta"] >= 0 else "-"
+        text += f" ({sign}{format_bytes(abs(report['rss_delta']))})"
+    if report.get("tracemalloc_peak") is not None:
+        text += f", đỉnh tracemalloc {format_bytes(report['tracemalloc_peak'])}"
+    return text
+
+
+if os.environ.get(TRACEMALLOC_ENV) and not tracemalloc.is_tracing():
+    tracemalloc.start()
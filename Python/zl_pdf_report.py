@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_pdf_report.py
+-----------------------------------
+Engine xuất báo cáo PDF dạng bảng cho dữ liệu Zalo:
+    Đọc streaming từ cursor (fetchmany), bộ nhớ không phụ thuộc số dòng
+
+    Font Unicode được nhúng (hiển thị đúng tiếng Việt), lặp lại header mỗi trang
+
+    Tự chia độ rộng cột theo nội dung mẫu, xuống dòng (wrap) trong từng ô
+
+    Bảng lớn: chia khoảng dòng cho nhiều process render song song rồi ghép PDF (pypdf)
+-----------------------------------
+Yêu cầu:
+ pip install reportlab
+ (tùy chọn, render song song) pip install pypdf
+
+Font: tự tìm font TTF có đủ chữ tiếng Việt (Arial, Tahoma, DejaVu, Noto, Liberation...) trong các thư mục
+font của hệ thống; không có thì báo lỗi - đặt biến môi trường ZL_PDF_FONT=<đường dẫn .ttf>.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+try:
+    from pypdf import PdfWriter
+    PYPDF_AVAILABLE = True
+except Exception:
+    PYPDF_AVAILABLE = False
+
+FONT_NAME = "ZLUnicode"
+FONT_CANDIDATES = (
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/tahoma.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+)
+
+# Tên file font Unicode phổ biến, tìm trong các thư mục font (không phân biệt hoa thường)
+FONT_FILE_NAMES = ("arial.ttf", "tahoma.ttf", "segoeui.ttf", "dejavusans.ttf", "notosans-regular.ttf",
+                   "liberationsans-regular.ttf", "freesans.ttf", "arial unicode.ttf", "verdana.ttf")
+FONT_DIRS = (
+    Path(os.environ.get("WINDIR", "C:/Windows")) / "Fonts",
+    Path("/usr/share/fonts"), Path("/usr/local/share/fonts"),
+    Path.home() / ".fonts", Path.home() / ".local" / "share" / "fonts",
+    Path("/Library/Fonts"), Path("/System/Library/Fonts"), Path.home() / "Library" / "Fonts",
+)
+VIETNAMESE_SAMPLE = "ăâđêôơưạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹĐƠƯ"
+
+PAGE_SIZE = landscape(A4)
+MARGIN = 28
+FONT_SIZE = 7
+LEADING = 8.5
+CELL_PAD = 2
+MAX_CELL_CHARS = 2000          # cắt giá trị quá dài (BLOB/JSON lớn) trước khi wrap
+MAX_CELL_LINES = 40            # tối đa số dòng của 1 ô
+SAMPLE_ROWS = 200              # số dòng mẫu để tính độ rộng cột
+PARALLEL_THRESHOLD = 20_000    # từ số dòng này trở lên thì render song song
+CHUNK_SIZE = 1000
+
+
+def has_vietnamese_glyphs(font_path) -> bool:
+    """Font TTF có glyph cho mọi ký tự trong VIETNAMESE_SAMPLE không"""
+    try:
+        cmap = TTFont("_zl_probe", str(font_path)).face.charToGlyph
+    except Exception:
+        return False
+    return all(ord(ch) in cmap for ch in VIETNAMESE_SAMPLE)
+
+
+def _system_fonts():
+    """File font có tên trong FONT_FILE_NAMES dưới các thư mục FONT_DIRS (theo thứ tự FONT_FILE_NAMES)"""
+    found = {}
+    for d in FONT_DIRS:
+        if not d.is_dir():
+            continue
+        for root, _dirs, files in os.walk(d):
+            for f in files:
+                found.setdefault(f.lower(), os.path.join(root, f))
+    return [found[n] for n in FONT_FILE_NAMES if n in found]
+
+
+def find_unicode_font(font_path=None):
+    """
+    Tìm file TTF hỗ trợ tiếng Việt: font_path, ZL_PDF_FONT, các đường dẫn quen thuộc (FONT_CANDIDATES),
+    rồi tới font phổ biến trong thư mục font hệ thống. Font chỉ định mà thiếu glyph tiếng Việt -> ValueError;
+    không tìm được font nào -> RuntimeError (không âm thầm dùng Helvetica, vốn mất dấu tiếng Việt).
+    """
+    for p in (font_path, os.environ.get("ZL_PDF_FONT")):
+        if not p:
+            continue
+        if not Path(p).is_file():
+            raise ValueError(f"Không tìm thấy font: {p}")
+        if not has_vietnamese_glyphs(p):
+            raise ValueError(f"Font {p} không có đủ chữ tiếng Việt (cần font TTF Unicode, vd. Arial, DejaVu Sans)")
+        return str(p)
+    for p in (*(c for c in FONT_CANDIDATES if Path(c).is_file()), *_system_fonts()):
+        if has_vietnamese_glyphs(p):
+            return str(p)
+    raise RuntimeError("Không tìm thấy font TTF có chữ tiếng Việt để nhúng vào PDF. "
+                       "Đặt biến môi trường ZL_PDF_FONT=<đường dẫn .ttf> (vd. DejaVuSans.ttf, NotoSans-Regular.ttf).")
+
+
+def register_font(font_path):
+    """Đăng ký font TTF để nhúng vào PDF; trả về tên font dùng cho canvas"""
+    if not font_path:
+        raise ValueError("Thiếu font Unicode (xem find_unicode_font / ZL_PDF_FONT)")
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    return FONT_NAME
+
+
+def _cell_text(v):
+    if v is None:
+        return ""
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        v = bytes(v)
+        return f"<{len(v)} bytes> " + v[:64].hex()
+    s = str(v)
+    return s if len(s) <= MAX_CELL_CHARS else s[:MAX_CELL_CHARS] + "…"
+
+
+def compute_layout(columns, sample_rows, title, font_path=None):
+    """Độ rộng cột theo nội dung mẫu (tỉ lệ với độ rộng trung bình, có min/max)"""
+    font = register_font(font_path)
+    usable = PAGE_SIZE[0] - 2 * MARGIN
+    weights = []
+    for i, c in enumerate(columns):
+        texts = [_cell_text(r[i])[:60] for r in sample_rows] + [str(c)]
+        avg = sum(pdfmetrics.stringWidth(t, font, FONT_SIZE) for t in texts) / len(texts)
+        weights.append(min(max(avg, 30.0), 240.0))
+    total = sum(weights) or 1.0
+    widths = [usable * w / total for w in weights]
+    return {"columns": list(columns), "widths": widths, "title": title, "font_path": font_path}
+
+
+class _PageWriter:
+    """Vẽ các dòng lên canvas, tự sang trang và lặp lại header"""
+
+    def __init__(self, out_path, layout, first_row_no=1):
+        self.layout = layout
+        self.font = register_font(layout["font_path"])
+        self.c = canvas.Canvas(str(out_path), pagesize=PAGE_SIZE)
+        self.c.setTitle(layout["title"])
+        self.row_no = first_row_no
+        self.page_first_row = first_row_no
+        self.pages = 0
+        self.y = None
+        face = getattr(pdfmetrics.getFont(self.font), "face", None)
+        self._char_widths = getattr(face, "charWidths", None)
+        self._default_width = getattr(face, "defaultWidth", 1000)
+        self._max_ascii_width = max(pdfmetrics.stringWidth(chr(c), self.font, FONT_SIZE) for c in range(32, 127))
+
+    def _text_width(self, text):
+        """Độ rộng chuỗi theo bảng độ rộng ký tự của font (nhanh hơn stringWidth cho từng ô)"""
+        if self._char_widths is None:
+            return pdfmetrics.stringWidth(text, self.font, FONT_SIZE)
+        cw, dw = self._char_widths, self._default_width
+        return sum([cw.get(ord(ch), dw) for ch in text]) * FONT_SIZE / 1000.0
+
+    def _wrap(self, text, width):
+        width -= 2 * CELL_PAD
+        # đường tắt: chuỗi ASCII ngắn chắc chắn vừa 1 dòng
+        if text.isascii() and len(text) * self._max_ascii_width <= width and "\n" not in text:
+            return [text]
+        lines = []
+        for part in text.splitlines() or [""]:
+            if self._text_width(part) <= width:
+                lines.append(part)
+            else:
+                lines.extend(simpleSplit(part, self.font, FONT_SIZE, width) or [""])
+            if len(lines) >= MAX_CELL_LINES:
+                return lines[:MAX_CELL_LINES - 1] + ["…"]
+        return lines
+
+    def _wrap_cells(self, cells):
+        return [self._wrap(t, w) for t, w in zip(cells, self.layout["widths"])]
+
+    @staticmethod
+    def _row_height(wrapped):
+        return max(len(w) for w in wrapped) * LEADING + 2 * CELL_PAD
+
+    def _draw_row(self, wrapped, bold=False):
+        widths = self.layout["widths"]
+        height = self._row_height(wrapped)
+        top = self.y
+        if bold:
+            self.c.setFillGray(0.9)
+            self.c.rect(MARGIN, top - height, sum(widths), height, stroke=0, fill=1)
+            self.c.setFillGray(0)
+        x = MARGIN
+        for lines, w in zip(wrapped, widths):
+            ty = top - CELL_PAD - FONT_SIZE
+            for line in lines:
+                self.c.drawString(x + CELL_PAD, ty, line)
+                ty -= LEADING
+            x += w
+        self.c.setStrokeGray(0.75)
+        self.c.line(MARGIN, top - height, MARGIN + sum(widths), top - height)
+        self.y = top - height
+        return height
+
+    def _start_page(self):
+        self.pages += 1
+        self.page_first_row = self.row_no
+        self.c.setFont(self.font, FONT_SIZE + 3)
+        self.c.drawString(MARGIN, PAGE_SIZE[1] - MARGIN + 8, self.layout["title"])
+        self.c.setFont(self.font, FONT_SIZE)
+        self.y = PAGE_SIZE[1] - MARGIN
+        self._draw_row(self._wrap_cells([str(c) for c in self.layout["columns"]]), bold=True)
+
+    def _end_page(self):
+        self.c.setFont(self.font, FONT_SIZE)
+        self.c.drawRightString(PAGE_SIZE[0] - MARGIN, MARGIN - 14,
+                               f"Dòng {self.page_first_row}–{self.row_no - 1}")
+        self.c.showPage()
+
+    def write_rows(self, rows):
+        for r in rows:
+            wrapped = self._wrap_cells([_cell_text(v) for v in r])
+            if self.y is None:
+                self._start_page()
+            # không đủ chỗ cho dòng này -> sang trang mới
+            if self.y - self._row_height(wrapped) < MARGIN and self.page_first_row != self.row_no:
+                self._end_page()
+                self._start_page()
+            self._draw_row(wrapped)
+            self.row_no += 1
+
+    def close(self):
+        if self.y is None:
+            self._start_page()
+        self._end_page()
+        self.c.save()
+
+
+def _render_range(db_path, sql, params, offset, limit, out_path, layout):
+    """Chạy trong process con: render các dòng [offset, offset+limit) ra 1 file PDF"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(f"SELECT * FROM ({sql}) LIMIT ? OFFSET ?", (*params, limit, offset))
+        writer = _PageWriter(out_path, layout, first_row_no=offset + 1)
+        while True:
+            rows = cur.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            writer.write_rows(rows)
+        writer.close()
+        return writer.pages
+    finally:
+        conn.close()
+
+
+def render_report(db_path: Path, sql: str, out_path: Path, title: str = "", params=(), workers: int = None,
+                  font_path: str = None, parallel_threshold: int = PARALLEL_THRESHOLD, progress_callback=None):
+    """
+    Render kết quả câu SELECT (trên snapshot SQLite db_path) ra PDF dạng bảng phân trang.
+    - Bảng nhỏ: 1 process, đọc streaming fetchmany
+    - Bảng >= parallel_threshold dòng (và có pypdf): chia khoảng dòng cho nhiều process rồi ghép
+    progress_callback(done_parts, total_parts) để cập nhật UI.
+    Không có font tiếng Việt -> RuntimeError trước khi ghi file (xem find_unicode_font).
+    Trả về dict {"rows", "pages", "parts", "seconds", "font"}.
+    """
+    t0 = time.perf_counter()
+    font_path = find_unicode_font(font_path)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        sample = cur.fetchmany(SAMPLE_ROWS)
+        total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    finally:
+        conn.close()
+    layout = compute_layout(columns, sample, title, font_path)
+
+    workers = workers or os.cpu_count() or 1
+    parts = 1
+    if total >= parallel_threshold and workers > 1 and PYPDF_AVAILABLE:
+        parts = min(workers * 2, max(1, total // (parallel_threshold // 4)))
+
+    if parts == 1:
+        pages = _render_range(str(db_path), sql, tuple(params), 0, max(total, 1), str(out_path), layout)
+        if progress_callback:
+            progress_callback(1, 1)
+    else:
+        per_part = -(-total // parts)
+        with tempfile.TemporaryDirectory(prefix="zl_pdf_") as tmp:
+            part_files = [Path(tmp) / f"part_{i:04d}.pdf" for i in range(parts)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_render_range, str(db_path), sql, tuple(params), i * per_part, per_part,
+                                       str(part_files[i]), layout) for i in range(parts)]
+                pages = 0
+                for done, fut in enumerate(futures, 1):
+                    pages += fut.result()
+                    if progress_callback:
+                        progress_callback(done, parts)
+            merger = PdfWriter()
+            for f in part_files:
+                merger.append(str(f))
+            with open(out_path, "wb") as fh:
+                merger.write(fh)
+            merger.close()
+
+    return {"rows": total, "pages": pages, "parts": parts, "seconds": round(time.perf_counter() - t0, 3),
+            "font": font_path}
+
+
+def render_table_report(db_path: Path, table: str, out_path: Path, **kwargs):
+    """Render toàn bộ 1 bảng ra PDF (xem render_report)"""
+    kwargs.setdefault("title", f"Zalo Data Report - Bảng {table}")
+    return render_report(db_path, f'SELECT * FROM "{table}"', out_path, **kwargs)
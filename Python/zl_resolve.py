@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_resolve.py
+-----------------------------------
+Gắn tên người dùng vào các cột UID (người gửi, hội thoại...) của bảng tin nhắn:
+    Bảng tra UID -> tên/avatar được build 1 lần cho mỗi snapshot Storage.db (DB sidecar
+    <snapshot>.names.sqlite, khóa chính uid). Sidecar lưu fingerprint của DB nguồn
+    (đường dẫn + size/mtime của DB và -wal) và được build lại khi fingerprint đổi
+
+    Khi preview/xuất: ATTACH DB sidecar vào connection và LEFT JOIN ngay trong SQLite,
+    mỗi cột UID có thêm cột <cột>_name - không cần load bảng vào pandas để merge
+-----------------------------------
+Lưu ý:
+ - Luôn làm việc trên **bản copy** (snapshot) của Storage.db.
+"""
+import json
+import sqlite3
+from pathlib import Path
+
+from zl_contacts import INFO_CACHE_TABLE
+from zl_export import build_search_query, _row_contains
+from zl_timeline_index import db_fingerprint
+from zl_trace import traced
+
+NAMES_ALIAS = "zl_names"
+# Cột có thể chứa UID người dùng / hội thoại (không phân biệt hoa thường)
+UID_COLUMN_CANDIDATES = (
+    "fromUid", "toUid", "uidFrom", "uidTo", "idTo", "idFrom", "senderId", "ownerId", "userId",
+    "threadId", "convId", "conversationId", "groupId",
+)
+
+_NAMES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (
+    uid    TEXT PRIMARY KEY,
+    name   TEXT,
+    avatar TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+def names_db_path_for(storage_snapshot: Path) -> Path:
+    storage_snapshot = Path(storage_snapshot)
+    return storage_snapshot.with_name(storage_snapshot.name + ".names.sqlite")
+
+
+def names_fingerprint(storage_db: Path) -> str:
+    """Fingerprint của Storage.db nguồn: đường dẫn + size/mtime của DB và -wal (chuỗi JSON)"""
+    storage_db = Path(storage_db)
+    return json.dumps([str(storage_db.resolve()), *db_fingerprint(storage_db)])
+
+
+def _stored_fingerprint(names_path: Path):
+    try:
+        with sqlite3.connect(f"file:{names_path}?mode=ro", uri=True) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key='fingerprint'").fetchone()
+    except sqlite3.Error:
+        return None   # sidecar cũ (chưa có bảng meta) hoặc hỏng -> build lại
+    return row[0] if row else None
+
+
+@traced("names_db")
+def build_names_db(storage_snapshot: Path, names_path: Path = None, force: bool = False,
+                   source: Path = None) -> Path:
+    """
+    Build bảng tra UID -> tên/avatar từ info-cache của snapshot Storage.db.
+    Key info-cache dạng "0_<uid>" được tách lấy <uid>.
+    source: Storage.db gốc mà snapshot được copy từ (mặc định chính snapshot). Bỏ qua nếu sidecar
+    đã build từ đúng nguồn đó (cùng đường dẫn, size/mtime của DB và -wal) - snapshot dùng chung
+    trong TEMP_DIR nên không thể so mtime của snapshot.
+    Trả về đường dẫn DB sidecar.
+    """
+    storage_snapshot = Path(storage_snapshot)
+    names_path = Path(names_path) if names_path else names_db_path_for(storage_snapshot)
+    # tính trước khi build: mở snapshot có thể checkpoint -wal của nó
+    fingerprint = names_fingerprint(source or storage_snapshot)
+    if not force and names_path.exists() and _stored_fingerprint(names_path) == fingerprint:
+        return names_path
+
+    tmp = names_path.with_name(names_path.name + ".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(str(tmp))
+    try:
+        conn.executescript(_NAMES_SCHEMA)
+        conn.execute("ATTACH DATABASE ? AS src", (str(storage_snapshot),))
+        conn.execute(f"""
+            INSERT OR REPLACE INTO names (uid, name, avatar)
+            SELECT CASE WHEN instr(key, '_') > 0 THEN substr(key, instr(key, '_') + 1) ELSE key END,
+                   json_extract(val, '$.zName'), json_extract(val, '$.avatar')
+            FROM src."{INFO_CACHE_TABLE}"
+            WHERE json_valid(val)
+        """)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+    finally:
+        conn.close()
+    tmp.replace(names_path)
+    return names_path
+
+
+def uid_columns(conn, table):
+    """Các cột UID có trong bảng (theo UID_COLUMN_CANDIDATES)"""
+    wanted = {c.lower() for c in UID_COLUMN_CANDIDATES}
+    return [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")') if r[1].lower() in wanted]
+
+
+def attach_names(conn, names_path: Path, plaintext_key: bool = False):
+    """
+    ATTACH DB sidecar vào connection nếu chưa gắn.
+    plaintext_key=True khi conn là SQLCipher: DB sidecar không mã hóa nên phải ATTACH ... KEY ''.
+    """
+    attached = {r[1] for r in conn.execute("PRAGMA database_list")}
+    if NAMES_ALIAS not in attached:
+        key = " KEY ''" if plaintext_key else ""
+        conn.execute(f"ATTACH DATABASE ? AS {NAMES_ALIAS}{key}", (str(names_path),))
+
+
+def build_resolved_query(conn, table, names_path: Path = None, query: str = "", plaintext_key: bool = False):
+    """
+    Giống build_search_query nhưng thêm cột <cột>_name cho mỗi cột UID (LEFT JOIN bảng tra tên).
+    Chuỗi tìm kiếm được áp dụng cả trên các cột tên. Không có names_path / cột UID thì
+    trả về đúng build_search_query. Trả về (sql, params).
+    """
+    cols = uid_columns(conn, table) if names_path else []
+    if not cols:
+        return build_search_query(conn, table, query)
+    attach_names(conn, names_path, plaintext_key)
+    all_cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+    taken = {c.lower() for c in all_cols}
+    selects, joins, out_cols = [], [], list(all_cols)
+    for i, c in enumerate(cols):
+        alias = f"{c}_name"
+        while alias.lower() in taken:
+            alias += "_"
+        taken.add(alias.lower())
+        out_cols.append(alias)
+        selects.append(f'n{i}.name AS "{alias}"')
+        joins.append(f'LEFT JOIN {NAMES_ALIAS}.names AS n{i} ON n{i}.uid = CAST(t."{c}" AS TEXT)')
+    sql = f'SELECT t.*, {", ".join(selects)} FROM "{table}" AS t {" ".join(joins)}'
+
+    q = (query or "").strip().lower()
+    if not q:
+        return sql, ()
+    conn.create_function("zl_row_contains", -1, _row_contains)
+    args = ", ".join(f'"{c}"' for c in out_cols)
+    return f"SELECT * FROM ({sql}) WHERE zl_row_contains(?, {args})", (q,)
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_sqlcipher.py
+-----------------------------------
+Mở DB mã hóa SQLCipher (dùng chung cho GUI keypass và engine headless / worker process).
+    Tự dò cấu hình (auto-configure): thử key với ma trận cipher_compatibility / page size / kdf_iter
+    trên bản copy chỉ gồm vài trang đầu, song song nhiều process, dừng ở lần thành công đầu tiên
+
+    Cấu hình đúng được nhớ theo fingerprint của DB (SHA256 của 16 byte salt đầu file)
+    trong ~/.zl_extract/sqlcipher_profiles.json (không lưu key)
+
+    Materialize: sqlcipher_export 1 lần ra DB SQLite thường trong thư mục tạm riêng (quyền 0700),
+    các truy vấn sau chạy trên bản này (không giải mã + HMAC lại từng trang); cache theo
+    fingerprint + cấu hình + hash key, giới hạn dung lượng (LRU), xóa an toàn khi đóng
+
+    Raw key: nhận key hex dạng x'<64 hex>' (hoặc x'<96 hex>' kèm salt), bỏ qua PBKDF2.
+    Passphrase được PBKDF2 1 lần cho mỗi (salt, cấu hình), khóa dẫn xuất giữ trong bộ nhớ
+    (bytearray, xóa về 0 khi đóng) -> các lần mở lại / thread khác dùng raw key luôn
+-----------------------------------
+Yêu cầu:
+ pip install pysqlcipher3   (hoặc sqlcipher3-binary)
+
+Lưu ý:
+ - Công cụ chỉ dùng khi bạn **có quyền hợp pháp** (dữ liệu của bạn hoặc giấy phép được phép truy cập).
+"""
+import atexit
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from zl_trace import traced
+
+# SQLCipher library (pysqlcipher3, hoặc sqlcipher3 có cùng API dbapi2).
+try:
+    from pysqlcipher3 import dbapi2 as sqlcipher
+    SQLCIPHER_AVAILABLE = True
+    _sqlcipher_import_error = ""
+except Exception as e:
+    try:
+        from sqlcipher3 import dbapi2 as sqlcipher
+        SQLCIPHER_AVAILABLE = True
+        _sqlcipher_import_error = ""
+    except Exception:
+        SQLCIPHER_AVAILABLE = False
+        _sqlcipher_import_error = str(e)
+
+
+def sql_literal(value: str) -> str:
+    """Chuỗi -> literal SQL trong dấu nháy đơn"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# -----------------------
+# Raw key + cache khóa dẫn xuất
+# -----------------------
+RAW_KEY_RE = re.compile(r"^x'([0-9a-fA-F]{64}|[0-9a-fA-F]{96})'$")
+# Thuật toán PBKDF2 theo cipher_compatibility (v4: SHA512, v1-3: SHA1)
+KDF_ALGORITHMS = {4: "sha512", 3: "sha1", 2: "sha1", 1: "sha1"}
+_library_compat = None
+
+
+def is_raw_key(key) -> bool:
+    """key dạng x'<hex>' (khóa 256-bit, có thể kèm 128-bit salt) -> SQLCipher không chạy PBKDF2"""
+    return bool(RAW_KEY_RE.match(str(key or "").strip()))
+
+
+def key_pragma_value(key: str) -> str:
+    """Giá trị cho PRAGMA key: raw key phải nằm trong nháy kép ("x'...'"), passphrase là literal thường"""
+    key = str(key)
+    if is_raw_key(key):
+        return f'"{key.strip()}"'
+    return sql_literal(key)
+
+
+def library_compat() -> int:
+    """cipher_compatibility mặc định của thư viện SQLCipher đang dùng (= major version)"""
+    global _library_compat
+    if _library_compat is None:
+        conn = sqlcipher.connect(":memory:")
+        try:
+            version = conn.execute("PRAGMA cipher_version").fetchone()[0]
+            _library_compat = int(str(version).split(".")[0])
+        except Exception:
+            _library_compat = 4
+        finally:
+            conn.close()
+    return _library_compat
+
+
+class DerivedKeyCache:
+    """
+    Cache khóa dẫn xuất PBKDF2 trong process, theo (salt, SHA256(passphrase), thuật toán, kdf_iter).
+    Khóa giữ trong bytearray để xóa về 0 được khi clear(); raw_key() trả về chuỗi x'<hex>'
+    dùng thẳng cho PRAGMA key. Không bao giờ ghi ra đĩa.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(salt: bytes, passphrase: str, algorithm: str, kdf_iter: int):
+        return salt, hashlib.sha256(passphrase.encode("utf-8")).digest(), algorithm, kdf_iter
+
+    def raw_key(self, db_path: Path, passphrase: str, kdf_iter: int = None, cipher_compat: int = None) -> str:
+        compat = cipher_compat or library_compat()
+        algorithm = KDF_ALGORITHMS.get(compat, "sha512")
+        kdf_iter = kdf_iter or COMPAT_DEFAULTS.get(compat, COMPAT_DEFAULTS[4])[1]
+        with open(db_path, "rb") as f:
+            salt = f.read(16)
+        ck = self._cache_key(salt, passphrase, algorithm, kdf_iter)
+        with self._lock:
+            derived = self._keys.get(ck)
+        if derived is None:
+            # PBKDF2 chạy ngoài lock: các DB khác nhau dẫn xuất song song được
+            derived = bytearray(hashlib.pbkdf2_hmac(algorithm, passphrase.encode("utf-8"), salt, kdf_iter, 32))
+            with self._lock:
+                derived = self._keys.setdefault(ck, derived)
+        return f"x'{derived.hex()}'"
+
+    def discard(self, db_path: Path, passphrase: str):
+        """Bỏ (và xóa về 0) mọi khóa của passphrase cho salt của db_path"""
+        with open(db_path, "rb") as f:
+            salt = f.read(16)
+        digest = hashlib.sha256(passphrase.encode("utf-8")).digest()
+        with self._lock:
+            for ck in [k for k in self._keys if k[0] == salt and k[1] == digest]:
+                _zeroize(self._keys.pop(ck))
+
+    def clear(self):
+        with self._lock:
+            for derived in self._keys.values():
+                _zeroize(derived)
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def _zeroize(buf: bytearray):
+    for i in range(len(buf)):
+        buf[i] = 0
+
+
+KEY_CACHE = DerivedKeyCache()
+atexit.register(KEY_CACHE.clear)
+
+
+@traced("connect.sqlcipher")
+def open_sqlcipher_connection(db_path: Path, key: str, kdf_iter: int = None, cipher_compat: int = None, page_size: int=None,
+                              key_cache: DerivedKeyCache = KEY_CACHE):
+    """
+    Mở connection SQLCipher với key và optional pragmas.
+    key là passphrase hoặc raw key x'<hex>'. Với passphrase, khóa dẫn xuất được lấy từ key_cache
+    (PBKDF2 chỉ chạy lần mở đầu tiên); key_cache=None để SQLCipher tự chạy KDF như cũ.
+    Trả về connection nếu thành công, hoặc raise Exception nếu lỗi.
+    """
+    if not SQLCIPHER_AVAILABLE:
+        raise RuntimeError(f"pysqlcipher3 không có sẵn: {_sqlcipher_import_error}")
+    if key_cache is not None and key and not is_raw_key(key):
+        raw = key_cache.raw_key(Path(db_path), key, kdf_iter, cipher_compat)
+        try:
+            return open_sqlcipher_connection(db_path, raw, None, cipher_compat, page_size, key_cache=None)
+        except Exception:
+            # sai key / cấu hình -> không giữ khóa dẫn xuất vô ích trong bộ nhớ
+            key_cache.discard(Path(db_path), key)
+            raise
+    conn = sqlcipher.connect(str(db_path))
+    cur = conn.cursor()
+
+    # set key (PRAGMA không nhận tham số bind -> escape thành literal SQL)
+    cur.execute(f"PRAGMA key = {key_pragma_value(key)};")
+
+    # optional pragmas (nếu DB dùng cấu hình khác) - phải đặt SAU key, trước lần đọc đầu tiên
+    if cipher_compat is not None:
+        cur.execute(f"PRAGMA cipher_compatibility = {int(cipher_compat)};")
+    if page_size is not None:
+        cur.execute(f"PRAGMA cipher_page_size = {int(page_size)};")
+    if kdf_iter is not None:
+        cur.execute(f"PRAGMA kdf_iter = {int(kdf_iter)};")
+    # test query
+    try:
+        cur.execute("SELECT count(*) FROM sqlite_master;")
+        _ = cur.fetchone()
+        return conn
+    except Exception as e:
+        conn.close()
+        raise e
+
+
+# -----------------------
+# Tự dò cấu hình SQLCipher
+# -----------------------
+PROFILE_STORE = Path.home() / ".zl_extract" / "sqlcipher_profiles.json"
+SQLITE_HEADER = b"SQLite format 3\x00"
+PROBE_BYTES = 65536          # = page size lớn nhất -> đủ chứa trang 1 với mọi cấu hình
+# Mặc định theo cipher_compatibility: (page size, kdf_iter)
+COMPAT_DEFAULTS = {4: (4096, 256000), 3: (1024, 64000), 2: (1024, 4000), 1: (1024, 4000)}
+PAGE_SIZES = (1024, 4096, 8192, 16384, 32768, 65536)
+KDF_ITERS = (256000, 64000, 4000, 10000, 100000, 1)
+
+
+def db_fingerprint(db_path: Path) -> str:
+    """SHA256 của 16 byte đầu file (salt SQLCipher) - không đổi khi nội dung DB thay đổi"""
+    with open(db_path, "rb") as f:
+        return hashlib.sha256(f.read(16)).hexdigest()
+
+
+def profile_matrix():
+    """
+    Danh sách cấu hình cần thử, khả năng cao trước: mặc định của từng compat (4, 3, 2, 1),
+    rồi đổi page size, rồi đổi kdf_iter, cuối cùng đổi cả hai. Cấu hình trùng nhau bị loại.
+    """
+    seen, out = set(), []
+
+    def add(compat, page, kdf):
+        if (compat, page, kdf) not in seen:
+            seen.add((compat, page, kdf))
+            out.append({"cipher_compat": compat, "page_size": page, "kdf_iter": kdf})
+
+    for compat, (page, kdf) in COMPAT_DEFAULTS.items():
+        add(compat, page, kdf)
+    for compat, (page, kdf) in COMPAT_DEFAULTS.items():
+        for p in PAGE_SIZES:
+            add(compat, p, kdf)
+    for compat, (page, kdf) in COMPAT_DEFAULTS.items():
+        for k in KDF_ITERS:
+            add(compat, page, k)
+    for compat, p, k in itertools.product(COMPAT_DEFAULTS, PAGE_SIZES, KDF_ITERS):
+        add(compat, p, k)
+    return out
+
+
+def _probe_profile(probe_path: str, key: str, profile: dict):
+    """
+    Chạy trong process con: thử key + cấu hình trên bản copy trang đầu.
+    "file is not a database" = sai (HMAC trang 1 không khớp); lỗi khác (vd. thiếu trang
+    do bản copy bị cắt) nghĩa là trang 1 đã giải mã được -> đúng. Trả về profile hoặc None.
+    """
+    conn = sqlcipher.connect(probe_path)
+    try:
+        try:
+            conn.execute("PRAGMA cipher_log_level = NONE")
+        except Exception:
+            pass
+        conn.execute(f"PRAGMA key = {key_pragma_value(key)};")
+        conn.execute(f"PRAGMA cipher_compatibility = {int(profile['cipher_compat'])};")
+        conn.execute(f"PRAGMA cipher_page_size = {int(profile['page_size'])};")
+        conn.execute(f"PRAGMA kdf_iter = {int(profile['kdf_iter'])};")
+        conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        return profile
+    except Exception as e:
+        return None if "file is not a database" in str(e) else profile
+    finally:
+        conn.close()
+
+
+def load_profiles(store: Path = PROFILE_STORE):
+    try:
+        return json.loads(Path(store).read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def save_profile(fingerprint: str, profile: dict, store: Path = PROFILE_STORE):
+    """Ghi nhớ cấu hình đúng cho fingerprint (ghi nguyên tử)"""
+    store = Path(store)
+    store.parent.mkdir(parents=True, exist_ok=True)
+    profiles = load_profiles(store)
+    profiles[fingerprint] = profile
+    tmp = store.with_suffix(store.suffix + ".tmp")
+    tmp.write_text(json.dumps(profiles, indent=2), encoding="utf-8")
+    tmp.replace(store)
+
+
+@traced("auto_configure")
+def auto_configure(db_path: Path, key: str, workers: int = None, store: Path = PROFILE_STORE, progress_callback=None):
+    """
+    Tìm cấu hình SQLCipher (cipher_compat, page_size, kdf_iter) đúng cho key.
+    - Cấu hình đã nhớ cho fingerprint được thử trước (1 lần PBKDF2)
+    - Sau đó thử profile_matrix() song song trên ProcessPoolExecutor, dừng ở lần đúng đầu tiên
+    progress_callback(done, total) để cập nhật UI.
+    Trả về dict profile (kèm "fingerprint", "cached"); raise RuntimeError nếu không cấu hình nào đúng.
+    """
+    if not SQLCIPHER_AVAILABLE:
+        raise RuntimeError(f"pysqlcipher3 không có sẵn: {_sqlcipher_import_error}")
+    db_path = Path(db_path)
+    with open(db_path, "rb") as f:
+        if f.read(16) == SQLITE_HEADER:
+            raise ValueError(f"{db_path.name} là SQLite thường (không mã hóa), không cần key.")
+    fingerprint = db_fingerprint(db_path)
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="zl_probe_"))
+    try:
+        # bản copy chỉ gồm các trang đầu: mỗi lần thử chỉ đọc/giải mã trang 1
+        probe = tmp_dir / "probe.db"
+        with open(db_path, "rb") as src, open(probe, "wb") as dst:
+            dst.write(src.read(PROBE_BYTES))
+
+        cached = load_profiles(store).get(fingerprint)
+        if cached and _probe_profile(str(probe), key, cached):
+            return {**cached, "fingerprint": fingerprint, "cached": True}
+
+        candidates = profile_matrix()
+        found = None
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        try:
+            futures = [pool.submit(_probe_profile, str(probe), key, p) for p in candidates]
+            for done, fut in enumerate(as_completed(futures), 1):
+                if progress_callback:
+                    progress_callback(done, len(futures))
+                result = fut.result()
+                if result:
+                    found = result
+                    break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if not found:
+        raise RuntimeError(f"Không cấu hình nào trong {len(candidates)} tổ hợp mở được DB với key này.")
+    save_profile(fingerprint, found, store)
+    return {**found, "fingerprint": fingerprint, "cached": False}
+
+
+# -----------------------
+# Bản làm việc đã giải mã (materialize)
+# -----------------------
+PLAINTEXT_CACHE_MAX_BYTES = 4 * 1024 ** 3   # 4 GB
+_WIPE_CHUNK = 1024 * 1024
+
+
+def secure_delete(path: Path):
+    """Ghi đè nội dung bằng byte 0 (fsync) rồi xóa file - tránh để lại dữ liệu đã giải mã trên đĩa"""
+    path = Path(path)
+    if not path.exists():
+        return
+    try:
+        size = path.stat().st_size
+        zeros = bytes(_WIPE_CHUNK)
+        with open(path, "r+b") as f:
+            remaining = size
+            while remaining > 0:
+                n = min(remaining, _WIPE_CHUNK)
+                f.write(zeros[:n])
+                remaining -= n
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        path.unlink()
+
+
+class PlaintextCache:
+    """
+    Cache các bản giải mã của DB SQLCipher trong 1 thư mục tạm riêng (mkdtemp, chmod 0700).
+    - Khóa cache: fingerprint (salt) + kích thước/mtime file + cấu hình cipher + SHA256(key)
+    - Vượt max_bytes: xóa an toàn bản ít dùng nhất (không xóa bản vừa tạo)
+    - close(): xóa an toàn toàn bộ và xóa thư mục
+    """
+
+    def __init__(self, max_bytes: int = PLAINTEXT_CACHE_MAX_BYTES):
+        self.root = Path(tempfile.mkdtemp(prefix="zl_plain_"))
+        os.chmod(self.root, 0o700)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # cache key -> Path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(db_path: Path, key: str, profile: dict = None) -> str:
+        st = Path(db_path).stat()
+        profile = profile or {}
+        parts = [db_fingerprint(db_path), str(st.st_size), str(st.st_mtime_ns),
+                 str(profile.get("cipher_compat")), str(profile.get("page_size")), str(profile.get("kdf_iter")),
+                 hashlib.sha256(str(key).encode("utf-8")).hexdigest()]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    @traced("materialize")
+    def materialize(self, db_path: Path, key: str, profile: dict = None) -> Path:
+        """
+        Trả về đường dẫn bản SQLite thường của db_path (giải mã bằng sqlcipher_export nếu chưa có,
+        hoặc bằng zl_decrypt khi không có pysqlcipher3).
+        profile: {"cipher_compat", "page_size", "kdf_iter"} (None = mặc định).
+        """
+        ck = self.cache_key(db_path, key, profile)
+        with self._lock:
+            if ck in self._entries and self._entries[ck].exists():
+                self._entries.move_to_end(ck)
+                return self._entries[ck]
+
+        out = self.root / f"{ck[:32]}.db"
+        tmp = out.with_suffix(".tmp")
+        profile = profile or {}
+        if not SQLCIPHER_AVAILABLE:
+            # không có pysqlcipher3 -> giải mã bằng Python thuần (zl_decrypt)
+            from zl_decrypt import decrypt_database
+            decrypt_database(Path(db_path), tmp, key, cipher_compat=profile.get("cipher_compat"),
+                             page_size=profile.get("page_size"), kdf_iter=profile.get("kdf_iter"))
+            return self._store(ck, tmp, out)
+        conn = open_sqlcipher_connection(Path(db_path), key, kdf_iter=profile.get("kdf_iter"),
+                                         cipher_compat=profile.get("cipher_compat"), page_size=profile.get("page_size"))
+        try:
+            conn.execute(f"ATTACH DATABASE {sql_literal(str(tmp))} AS plaintext KEY ''")
+            conn.execute("SELECT sqlcipher_export('plaintext')")
+            conn.execute("DETACH DATABASE plaintext")
+        except Exception:
+            conn.close()
+            if tmp.exists():
+                secure_delete(tmp)
+            raise
+        conn.close()
+        return self._store(ck, tmp, out)
+
+    def _store(self, ck, tmp: Path, out: Path) -> Path:
+        tmp.replace(out)
+        os.chmod(out, 0o600)
+
+        with self._lock:
+            self._entries[ck] = out
+            self._evict(keep=ck)
+        return out
+
+    def _evict(self, keep):
+        total = sum(p.stat().st_size for p in self._entries.values() if p.exists())
+        for ck in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if ck == keep:
+                continue
+            path = self._entries.pop(ck)
+            if path.exists():
+                total -= path.stat().st_size
+                secure_delete(path)
+
+    def close(self):
+        with self._lock:
+            for path in self._entries.values():
+                for p in (path, Path(f"{path}-journal"), Path(f"{path}-wal")):
+                    try:
+                        secure_delete(p)
+                    except OSError:
+                        pass
+            self._entries.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def connect_plaintext(path: Path):
+    """Connection read-only tới bản đã giải mã (dùng chung giữa các thread của GUI)"""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_synth.py
+-----------------------------------
+Sinh cây thư mục ZaloData giả lập (dữ liệu tổng hợp, không chứa dữ liệu thật) để test / benchmark:
+    database-config.json + Database/_production/Storage.db (bảng info-cache, val là JSON)
+
+    N Message DB cho mỗi tài khoản (bảng message: người gửi, hội thoại, thời gian ms,
+    loại tin nhắn, nội dung text / JSON đính kèm), tổng số tin nhắn tùy chỉnh (tới hàng chục triệu)
+
+    Tùy chọn để lại file -wal chưa checkpoint (giống bản copy máy đang chạy Zalo)
+
+    Tùy chọn mã hóa SQLCipher bằng bộ mã hóa tham chiếu của zl_decrypt (không cần pysqlcipher3)
+
+    python zl_synth.py --out /tmp/synth --messages 1000000 --message-dbs 4 --wal
+-----------------------------------
+Lưu ý:
+ - Cùng seed -> cùng dữ liệu (trừ salt / IV khi mã hóa).
+"""
+import argparse
+import json
+import random
+import sqlite3
+import time
+from pathlib import Path
+
+from zl_engine import PRODUCTION_DIR
+from zl_contacts import INFO_CACHE_TABLE
+
+INSERT_BATCH = 50_000
+BASE_TIME_MS = 1_600_000_000_000          # 2020-09-13
+TIME_SPAN_MS = 4 * 365 * 24 * 3600 * 1000  # 4 năm
+WAL_TAIL_RATIO = 0.01                      # tỉ lệ tin nhắn nằm trong -wal khi wal=True
+
+MESSAGE_SCHEMA = """
+CREATE TABLE message (
+    msgId    INTEGER PRIMARY KEY,
+    cliMsgId TEXT,
+    fromUid  TEXT,
+    toUid    TEXT,
+    sendDttm INTEGER,
+    msgType  INTEGER,
+    status   INTEGER,
+    content  TEXT,
+    extra    BLOB
+);
+CREATE INDEX idx_message_to_time ON message(toUid, sendDttm);
+"""
+
+# msgType: 1 text, 2 ảnh, 3 sticker, 4 file, 5 link
+MSG_TYPES = (1, 1, 1, 1, 1, 1, 2, 2, 3, 4, 5)
+_FAMILY = ("Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô")
+_MIDDLE = ("Văn", "Thị", "Hữu", "Minh", "Ngọc", "Đức", "Thu", "Quang", "Thanh", "Gia", "")
+_GIVEN = ("An", "Bình", "Chi", "Dũng", "Giang", "Hà", "Hải", "Hương", "Khánh", "Lan", "Linh", "Long", "Mai",
+          "Nam", "Nga", "Phúc", "Quân", "Sơn", "Tâm", "Thảo", "Trang", "Tuấn", "Việt", "Yến", "Đạt")
+_WORDS = ("xin chào", "ok", "cảm ơn", "mai gặp nhé", "đang ở đâu", "gửi file giúp mình", "họp lúc 9h",
+          "đã nhận", "chuyển khoản rồi", "haha", "anh ơi", "chị ơi", "tối nay", "được", "không sao",
+          "nhớ mang tài liệu", "hợp đồng", "báo giá", "đơn hàng", "giao hàng", "thanh toán", "👍", "❤️")
+
+
+def make_uid(rng: random.Random) -> str:
+    return str(rng.randrange(10 ** 17, 10 ** 18))
+
+
+def make_name(rng: random.Random) -> str:
+    return " ".join(p for p in (rng.choice(_FAMILY), rng.choice(_MIDDLE), rng.choice(_GIVEN)) if p)
+
+
+def _contact_json(uid, name, rng):
+    return json.dumps({
+        "userId": uid, "zName": name, "displayName": name,
+        "avatar": f"https://s120-ava-talk.zadn.vn/{uid[-4:]}/{uid}.jpg",
+        "phoneNumber": f"0{rng.randrange(300000000, 999999999)}" if rng.random() < 0.6 else "",
+        "gender": rng.randrange(2), "isFr": int(rng.random() < 0.8),
+        "lastUpdateTime": BASE_TIME_MS + rng.randrange(TIME_SPAN_MS),
+    }, ensure_ascii=False)
+
+
+def build_storage_db(path: Path, accounts, contacts: int, groups: int, rng: random.Random):
+    """Storage.db với bảng info-cache: key "0_<uid>" (người) / "0_g<id>" (nhóm), val JSON. Trả về (uid bạn bè, id nhóm)."""
+    friend_uids = [make_uid(rng) for _ in range(contacts)]
+    group_ids = [f"g{rng.randrange(10 ** 17, 10 ** 18)}" for _ in range(groups)]
+    conn = sqlite3.connect(str(path))
+    try:
+        conn.execute(f'CREATE TABLE "{INFO_CACHE_TABLE}" (key TEXT PRIMARY KEY, val TEXT)')
+        rows = [(f"0_{uid}", _contact_json(uid, make_name(rng), rng)) for uid in [*accounts, *friend_uids]]
+        rows += [(f"0_{gid}", json.dumps({"groupId": gid, "zName": f"Nhóm {rng.choice(_WORDS)} {i}",
+                                          "avatar": "", "totalMember": rng.randrange(3, 500)}, ensure_ascii=False))
+                 for i, gid in enumerate(group_ids)]
+        conn.executemany(f'INSERT OR REPLACE INTO "{INFO_CACHE_TABLE}" VALUES (?, ?)', rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return friend_uids, group_ids
+
+
+def _content(msg_type, msg_id, rng):
+    if msg_type == 1:
+        return " ".join(rng.choice(_WORDS) for _ in range(rng.randrange(1, 8))), None
+    if msg_type == 2:
+        return json.dumps({"title": "", "href": f"https://photo-talk.zadn.vn/{msg_id}.jpg",
+                           "thumb": f"https://photo-talk.zadn.vn/thumb/{msg_id}.jpg",
+                           "width": 1280, "height": 960}), None
+    if msg_type == 3:
+        return json.dumps({"id": rng.randrange(1, 5000), "catId": rng.randrange(1, 200), "type": 7}), None
+    if msg_type == 4:
+        name = f"tai_lieu_{msg_id}.pdf"
+        return json.dumps({"title": name, "href": f"https://f.zadn.vn/{msg_id}/{name}",
+                           "params": json.dumps({"fileSize": rng.randrange(10_000, 20_000_000)})}), \
+            rng.randbytes(16)
+    return json.dumps({"title": "Bài viết", "href": f"https://example.com/a/{msg_id}",
+                       "description": rng.choice(_WORDS)}, ensure_ascii=False), None
+
+
+def _message_rows(owner, peers, first_id, count, rng):
+    t_step = TIME_SPAN_MS // max(count, 1)
+    t = BASE_TIME_MS
+    for i in range(count):
+        msg_id = first_id + i
+        conv = rng.choice(peers)
+        sender = owner if rng.random() < 0.45 else (conv if not conv.startswith("g") else rng.choice(peers))
+        msg_type = rng.choice(MSG_TYPES)
+        content, extra = _content(msg_type, msg_id, rng)
+        t += rng.randrange(1, 2 * t_step + 2)
+        yield (msg_id, f"{msg_id}{rng.randrange(1000):03d}", sender, conv, t, msg_type, rng.randrange(0, 3),
+               content, extra)
+
+
+def build_message_db(path: Path, owner, peers, first_id: int, count: int, rng: random.Random, wal: bool = False):
+    """1 Message DB với `count` tin nhắn; wal=True: phần cuối nằm trong file -wal chưa checkpoint"""
+    tail = int(count * WAL_TAIL_RATIO) if wal else 0
+    rows = _message_rows(owner, peers, first_id, count, rng)
+    conn = sqlite3.connect(str(path))
+    try:
+        conn.executescript(MESSAGE_SCHEMA)
+        conn.execute("PRAGMA synchronous = OFF")
+        remaining = count - tail
+        while remaining > 0:
+            n = min(remaining, INSERT_BATCH)
+            conn.executemany("INSERT INTO message VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (next(rows) for _ in range(n)))
+            remaining -= n
+        conn.commit()
+    finally:
+        conn.close()
+    if tail:
+        _append_uncheckpointed(path, rows, tail)
+
+
+def _append_uncheckpointed(path: Path, rows, count: int):
+    """
+    Ghi `count` dòng ở chế độ WAL và giữ lại -wal chưa checkpoint: chép DB + -wal trong lúc
+    connection còn mở, đóng connection (SQLite checkpoint và xóa -wal), rồi đặt lại 2 bản chép.
+    """
+    wal_path = Path(f"{path}-wal")
+    conn = sqlite3.connect(str(path))
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+        for n in (count // 2, count - count // 2):   # 2 transaction -> nhiều commit frame trong -wal
+            conn.executemany("INSERT INTO message VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (next(rows) for _ in range(n)))
+            conn.commit()
+        db_bytes, wal_bytes = path.read_bytes(), wal_path.read_bytes()
+    finally:
+        conn.close()
+    path.write_bytes(db_bytes)
+    wal_path.write_bytes(wal_bytes)
+    Path(f"{path}-shm").unlink(missing_ok=True)
+
+
+def generate_zalodata(out_dir: Path, accounts: int = 1, messages: int = 10_000, message_dbs: int = 2,
+                      contacts: int = 2_000, groups: int = 50, wal: bool = False, key: str = None,
+                      seed: int = 0, progress_callback=None):
+    """
+    Sinh out_dir/ZaloData. messages là tổng số tin nhắn của mỗi tài khoản, chia đều cho message_dbs DB.
+    key: mã hóa mọi DB bằng SQLCipher v4 (passphrase key; bỏ qua wal vì -wal mã hóa khác định dạng).
+    progress_callback(done_dbs, total_dbs, name). Trả về dict mô tả (đường dẫn, UID, số dòng, thời gian).
+    """
+    t0 = time.perf_counter()
+    rng = random.Random(seed)
+    zalodata = Path(out_dir) / "ZaloData"
+    prod = zalodata / PRODUCTION_DIR
+    prod.mkdir(parents=True, exist_ok=True)
+
+    uids = [make_uid(rng) for _ in range(accounts)]
+    (zalodata / "database-config.json").write_text(json.dumps({
+        "version": 2, "currentUser": uids[0],
+        "db": {uid: {"path": str(PRODUCTION_DIR / uid), "lastLogin": BASE_TIME_MS + TIME_SPAN_MS} for uid in uids},
+    }, indent=2), encoding="utf-8")
+
+    storage = prod / "Storage.db"
+    friends, group_ids = build_storage_db(storage, uids, contacts, groups, rng)
+    peers = friends + group_ids
+    total_dbs = 1 + accounts * message_dbs
+    if progress_callback:
+        progress_callback(1, total_dbs, storage.name)
+
+    info = {"zalodata": str(zalodata), "uids": uids, "storage_db": str(storage), "contacts": contacts + accounts,
+            "groups": groups, "message_dbs": [], "messages_per_account": messages, "wal": wal and not key,
+            "encrypted": bool(key), "seed": seed}
+    done = 1
+    for uid in uids:
+        msg_dir = prod / uid / "Core" / "Message"
+        msg_dir.mkdir(parents=True, exist_ok=True)
+        per_db = [messages // message_dbs + (1 if i < messages % message_dbs else 0) for i in range(message_dbs)]
+        first_id = 1
+        for i, count in enumerate(per_db):
+            db = msg_dir / f"Message{i}.db"
+            build_message_db(db, uid, peers, first_id, count, rng, wal=wal and not key)
+            info["message_dbs"].append({"uid": uid, "path": str(db), "rows": count})
+            first_id += count
+            done += 1
+            if progress_callback:
+                progress_callback(done, total_dbs, db.name)
+
+    if key:
+        from zl_decrypt import encrypt_database
+        for path in [storage] + [Path(m["path"]) for m in info["message_dbs"]]:
+            enc = path.with_name(path.name + ".enc")
+            encrypt_database(path, enc, key)
+            enc.replace(path)
+    info["seconds"] = round(time.perf_counter() - t0, 3)
+    return info
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Generate a synthetic ZaloData tree for tests and benchmarks.")
+    p.add_argument("--out", required=True, help="Output directory (ZaloData/ is created inside).")
+    p.add_argument("--accounts", type=int, default=1, help="Number of accounts.")
+    p.add_argument("--messages", type=int, default=10_000, help="Messages per account.")
+    p.add_argument("--message-dbs", type=int, default=2, help="Message DBs per account.")
+    p.add_argument("--contacts", type=int, default=2_000, help="info-cache contacts.")
+    p.add_argument("--groups", type=int, default=50, help="Group conversations.")
+    p.add_argument("--wal", action="store_true", help="Leave un-checkpointed -wal files next to the Message DBs.")
+    p.add_argument("--key", default=None, help="Encrypt every DB with SQLCipher v4 using this passphrase.")
+    p.add_argument("--seed", type=int, default=0, help="Random seed.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    info = generate_zalodata(Path(args.out), accounts=args.accounts, messages=args.messages,
+                             message_dbs=args.message_dbs, contacts=args.contacts, groups=args.groups,
+                             wal=args.wal, key=args.key, seed=args.seed,
+                             progress_callback=lambda d, t, n: print(f"[+] {d}/{t} {n}"))
+    print(json.dumps(info, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_tasks.py
+-----------------------------------
+Bộ lập lịch tác vụ nền dùng chung cho các GUI (thay cho mỗi thao tác 1 threading.Thread riêng):
+    Pool thread giới hạn số tác vụ chạy đồng thời; tác vụ thừa xếp hàng (trạng thái "queued")
+
+    Mỗi tác vụ có CancelToken: task.report(...) / task.check() ném TaskCancelled khi người dùng
+    bấm Hủy, nên các hàm nhận progress_callback (xuất streaming, bundle, index...) dừng được giữa chừng
+
+    Mọi callback về UI (kết quả, lỗi, tiến trình) đi qua 1 hàng đợi duy nhất, UI thread lấy ra
+    theo chu kỳ cố định (poll_ms) thay vì root.after(0, ...) cho từng lần cập nhật
+
+    Tiến trình được gộp: giữa 2 lần poll chỉ giá trị mới nhất của mỗi tác vụ được đưa lên UI
+
+    Tác vụ cùng key đang chạy / chờ thì không tạo thêm (vd. double-click 1 bảng nhiều lần)
+
+    TaskPanel: cửa sổ Tk liệt kê tác vụ (trạng thái, tiến trình, thời gian) + nút Hủy
+-----------------------------------
+Ví dụ:
+    tasks = TaskScheduler(max_workers=3)
+    tasks.attach(root)
+    tasks.submit("Xuất bảng", lambda task: export(..., progress_callback=task.report),
+                 on_done=lambda result: ..., on_progress=lambda done, total, text: ...)
+"""
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+from zl_trace import span
+
+DEFAULT_POLL_MS = 100
+KEEP_FINISHED = 50
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+STATE_LABELS = {QUEUED: "Đang chờ", RUNNING: "Đang chạy", DONE: "Xong", FAILED: "Lỗi", CANCELLED: "Đã hủy"}
+
+
+def default_workers():
+    return max(2, min(4, os.cpu_count() or 1))
+
+
+class TaskCancelled(Exception):
+    """Tác vụ bị người dùng hủy"""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise TaskCancelled()
+
+
+class Task:
+    """
+    1 tác vụ nền. Hàm chạy nhận chính task làm tham số đầu để báo tiến trình / kiểm tra hủy:
+        task.report(done, total, text="")   (dùng trực tiếp làm progress_callback)
+        task.check()
+    """
+
+    def __init__(self, scheduler, task_id, name, key, callbacks):
+        self.scheduler = scheduler
+        self.id = task_id
+        self.name = name
+        self.key = key
+        self.token = CancelToken()
+        self.state = QUEUED
+        self.progress = (0, 0, "")
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.callbacks = callbacks
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def check(self):
+        self.token.check()
+
+    def report(self, done=0, total=0, text=""):
+        """Cập nhật tiến trình (gọi được từ thread bất kỳ, rẻ: UI chỉ nhận giá trị mới nhất mỗi lần poll)"""
+        self.token.check()
+        self.progress = (done, total, str(text) if text else "")
+        self.scheduler._mark_dirty(self)
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+
+class TaskScheduler:
+    """
+    Pool thread giới hạn + hàng đợi UI. attach(widget) để UI thread tự poll mỗi poll_ms;
+    GUI không phải Tk thì gọi poll() định kỳ (vd. QTimer).
+    """
+
+    def __init__(self, max_workers: int = None, poll_ms: int = DEFAULT_POLL_MS):
+        self.max_workers = max_workers or default_workers()
+        self.poll_ms = poll_ms
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._idle = 0
+        self._ui_queue = queue.SimpleQueue()
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._widget = None
+        self._listeners = []
+        self.tasks = OrderedDict()
+
+    # -----------------------------
+    def submit(self, name, fn, *args, key=None, on_done=None, on_error=None, on_progress=None, on_cancel=None,
+               on_finally=None, **kwargs):
+        """
+        Chạy fn(task, *args, **kwargs) trên pool. Các callback on_* luôn được gọi trên UI thread:
+        on_done(result), on_error(message), on_progress(done, total, text), on_cancel(), on_finally().
+        key: nếu đã có tác vụ cùng key đang chờ / chạy thì trả về tác vụ đó, không chạy thêm.
+        """
+        with self._lock:
+            if key is not None:
+                for t in self.tasks.values():
+                    if t.key == key and t.active:
+                        return t
+            self._next_id += 1
+            task = Task(self, self._next_id, name, key, {"done": on_done, "error": on_error, "progress": on_progress,
+                                                         "cancel": on_cancel, "finally": on_finally})
+            self.tasks[task.id] = task
+            self._trim()
+        self._jobs.put((task, fn, args, kwargs))
+        self._spawn_worker()
+        self._mark_dirty(task)
+        return task
+
+    def _spawn_worker(self):
+        # thread daemon (như các threading.Thread trước đây): đóng app không phải chờ tác vụ đang chạy
+        with self._lock:
+            if len(self._workers) >= self.max_workers or self._jobs.qsize() <= self._idle:
+                return
+            t = threading.Thread(target=self._worker_loop, name=f"zl_task_{len(self._workers) + 1}", daemon=True)
+            self._workers.append(t)
+        t.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            job = self._jobs.get()
+            with self._lock:
+                self._idle -= 1
+            if job is None:
+                return
+            self._run(*job)
+
+    def _run(self, task, fn, args, kwargs):
+        with self._lock:
+            if task.state != QUEUED:   # đã bị hủy khi còn trong hàng chờ
+                return
+            task.state = RUNNING
+        task.started = time.time()
+        self._mark_dirty(task)
+        try:
+            with span(f"task.{task.name}", task_id=task.id):
+                result = fn(task, *args, **kwargs)
+            if task.cancelled:
+                raise TaskCancelled()
+        except TaskCancelled:
+            self._finish(task, CANCELLED, "cancel")
+        except Exception as e:
+            task.error = str(e) or e.__class__.__name__
+            self._finish(task, FAILED, "error", task.error)
+        else:
+            self._finish(task, DONE, "done", result)
+
+    def _finish(self, task, state, callback, *args):
+        task.state = state
+        task.finished = time.time()
+        cb = task.callbacks.get(callback)
+        if cb is not None:
+            self.call_ui(cb, *args)
+        if task.callbacks.get("finally") is not None:
+            self.call_ui(task.callbacks["finally"])
+        self._mark_dirty(task)
+
+    def _trim(self):
+        finished = [t.id for t in self.tasks.values() if not t.active]
+        for task_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self.tasks[task_id]
+
+    # -----------------------------
+    def cancel(self, task):
+        """Hủy 1 tác vụ: đang chờ thì bỏ luôn, đang chạy thì dừng ở lần report()/check() kế tiếp"""
+        task.token.cancel()
+        with self._lock:
+            queued = task.state == QUEUED
+            if queued:
+                task.state = CANCELLED
+        if queued:
+            self._finish(task, CANCELLED, "cancel")
+
+    def cancel_all(self):
+        for task in list(self.tasks.values()):
+            if task.active:
+                self.cancel(task)
+
+    def active(self):
+        return [t for t in list(self.tasks.values()) if t.active]
+
+    def find(self, key):
+        """Tác vụ đang chờ / chạy có key này (None nếu không có)"""
+        for t in list(self.tasks.values()):
+            if t.key == key and t.active:
+                return t
+        return None
+
+    def shutdown(self):
+        self.cancel_all()
+        for _ in self._workers:
+            self._jobs.put(None)
+
+    # -----------------------------
+    # Hàng đợi UI
+    # -----------------------------
+    def call_ui(self, fn, *args):
+        """Đưa fn(*args) sang UI thread (chạy ở lần poll kế tiếp)"""
+        self._ui_queue.put((fn, args))
+
+    def add_listener(self, fn):
+        """fn(task) được gọi trên UI thread mỗi khi trạng thái / tiến trình tác vụ thay đổi"""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _mark_dirty(self, task):
+        with self._lock:
+            self._dirty[task.id] = task
+
+    def poll(self):
+        """Chạy trên UI thread: thực thi callback đang chờ, rồi đưa tiến trình đã gộp lên UI"""
+        while True:
+            try:
+                fn, args = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        for task in dirty.values():
+            on_progress = task.callbacks.get("progress")
+            if on_progress is not None and task.state == RUNNING:
+                try:
+                    on_progress(*task.progress)
+                except Exception:
+                    traceback.print_exc()
+            for listener in list(self._listeners):
+                try:
+                    listener(task)
+                except Exception:
+                    traceback.print_exc()
+
+    def attach(self, widget):
+        """Tk: poll() mỗi poll_ms trên UI thread của widget cho tới khi widget bị hủy"""
+        self._widget = widget
+
+        def tick():
+            self.poll()
+            try:
+                widget.after(self.poll_ms, tick)
+            except Exception:
+                pass   # cửa sổ đã đóng
+        widget.after(self.poll_ms, tick)
+
+
+# -----------------------------
+# Bảng tác vụ (Tk)
+# -----------------------------
+class TaskPanel:
+    """Cửa sổ liệt kê tác vụ của scheduler (mở lại thì chỉ đưa lên trước)"""
+
+    def __init__(self, master, scheduler: TaskScheduler):
+        import ttkbootstrap as tb
+        from ttkbootstrap.constants import BOTH, BOTTOM, X, LEFT, RIGHT, Y
+
+        self.scheduler = scheduler
+        self.win = tb.Toplevel(master)
+        self.win.title("🧵 Tác vụ nền")
+        self.win.geometry("720x320")
+        bar = tb.Frame(self.win)
+        bar.pack(fill=X, side=BOTTOM, pady=5)
+        tb.Label(bar, text=f"Tối đa {scheduler.max_workers} tác vụ chạy cùng lúc").pack(side=LEFT, padx=5)
+        tb.Button(bar, text="Hủy tất cả", bootstyle="danger-outline",
+                  command=scheduler.cancel_all).pack(side=RIGHT, padx=5)
+        tb.Button(bar, text="Hủy", bootstyle="danger", command=self.cancel_selected).pack(side=RIGHT, padx=5)
+
+        cols = ("name", "state", "progress", "elapsed")
+        self.tree = tb.Treeview(self.win, columns=cols, show="headings", bootstyle="info")
+        for c, text, w in zip(cols, ("Tác vụ", "Trạng thái", "Tiến trình", "Thời gian"), (280, 90, 240, 80)):
+            self.tree.heading(c, text=text)
+            self.tree.column(c, width=w, anchor="w")
+        self.tree.pack(fill=BOTH, expand=True, side=LEFT, padx=(5, 0), pady=5)
+        sb = tb.Scrollbar(self.win, orient="vertical", command=self.tree.yview, bootstyle="round")
+        self.tree.configure(yscroll=sb.set)
+        sb.pack(side=RIGHT, fill=Y)
+
+        for task in list(scheduler.tasks.values()):
+            self.update(task)
+        scheduler.add_listener(self.update)
+        self._refresh_job = self.win.after(1000, self.refresh_elapsed)
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+
+    @staticmethod
+    def _values(task):
+        done, total, text = task.progress
+        if total:
+            progress = f"{done}/{total} ({min(100, int(done * 100 / total))}%)"
+        else:
+            progress = str(done) if done else ""
+        if text:
+            progress = f"{progress} {text}".strip()
+        if task.error:
+            progress = task.error
+        return task.name, STATE_LABELS[task.state], progress, f"{task.elapsed:.1f}s"
+
+    def update(self, task):
+        iid = str(task.id)
+        if not self.tree.exists(iid):
+            if task.id not in self.scheduler.tasks:
+                return
+            self.tree.insert("", 0, iid=iid, values=self._values(task))
+        else:
+            self.tree.item(iid, values=self._values(task))
+
+    def refresh_elapsed(self):
+        for task in self.scheduler.active():
+            self.update(task)
+        self._refresh_job = self.win.after(1000, self.refresh_elapsed)
+
+    def cancel_selected(self):
+        for iid in self.tree.selection():
+            task = self.scheduler.tasks.get(int(iid))
+            if task is not None:
+                task.cancel()
+
+    def exists(self):
+        try:
+            return bool(self.win.winfo_exists())
+        except Exception:
+            return False
+
+    def lift(self):
+        self.win.lift()
+        self.win.focus_force()
+
+    def close(self):
+        self.scheduler.remove_listener(self.update)
+        try:
+            self.win.after_cancel(self._refresh_job)
+        except Exception:
+            pass
+        self.win.destroy()
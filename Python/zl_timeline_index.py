@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_timeline_index.py
+-----------------------------------
+Chỉ mục timeline hội thoại (sidecar SQLite) cho các Message DB:
+    Đếm số tin nhắn theo từng hội thoại
+
+    Thời điểm tin nhắn đầu tiên / cuối cùng của hội thoại
+
+    Histogram số tin nhắn theo ngày (UTC)
+
+Toàn bộ phép tổng hợp được đẩy xuống SQLite bằng GROUP BY, không load bảng
+tin nhắn vào pandas. Timeline view và xuất CSV chỉ đọc từ file chỉ mục.
+Message DB không đổi (cùng size + mtime của file DB và file -wal) sẽ được bỏ qua khi build lại.
+-----------------------------------
+"""
+import csv
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Thư mục chứa các file chỉ mục sidecar
+INDEX_DIR = Path("zl_index")
+
+# Tên cột hội thoại / thời gian thường gặp trong bảng tin nhắn (so khớp không phân biệt hoa thường)
+CONV_COLUMN_CANDIDATES = ("threadId", "convId", "conversationId", "toUid", "idTo", "groupId")
+TIME_COLUMN_CANDIDATES = ("sendDttm", "serverTime", "timestamp", "createdTime", "msgTime", "time", "ts")
+
+# Giá trị epoch lớn hơn ngưỡng này được coi là mili-giây
+EPOCH_MS_THRESHOLD = 100_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    db_path     TEXT NOT NULL,
+    db_name     TEXT NOT NULL,
+    table_name  TEXT NOT NULL,
+    conv_column TEXT NOT NULL,
+    time_column TEXT NOT NULL,
+    msg_count   INTEGER NOT NULL,
+    db_size     INTEGER NOT NULL,
+    db_mtime    REAL NOT NULL,
+    wal_size    INTEGER NOT NULL,
+    wal_mtime   REAL NOT NULL,
+    indexed_at  TEXT NOT NULL,
+    PRIMARY KEY (db_path, table_name)
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    db_path    TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    conv_id    TEXT NOT NULL,
+    msg_count  INTEGER NOT NULL,
+    first_ts   INTEGER,
+    last_ts    INTEGER,
+    PRIMARY KEY (db_path, table_name, conv_id)
+);
+CREATE TABLE IF NOT EXISTS daily (
+    db_path    TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    conv_id    TEXT NOT NULL,
+    day        TEXT NOT NULL,
+    msg_count  INTEGER NOT NULL,
+    PRIMARY KEY (db_path, table_name, conv_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_conv ON conversations(conv_id);
+CREATE INDEX IF NOT EXISTS idx_daily_conv_day ON daily(conv_id, day);
+"""
+
+
+def index_path_for(uid: str) -> Path:
+    """Đường dẫn file chỉ mục timeline của một tài khoản"""
+    INDEX_DIR.mkdir(exist_ok=True)
+    return INDEX_DIR / f"timeline_{uid}.sqlite"
+
+
+def detect_message_columns(conn, table: str):
+    """
+    Tìm cột hội thoại và cột thời gian của bảng tin nhắn.
+    Trả về (conv_column, time_column) hoặc None nếu bảng không giống bảng tin nhắn.
+    """
+    cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+    lower = {c.lower(): c for c in cols}
+    conv = next((lower[c.lower()] for c in CONV_COLUMN_CANDIDATES if c.lower() in lower), None)
+    ts = next((lower[c.lower()] for c in TIME_COLUMN_CANDIDATES if c.lower() in lower), None)
+    if conv and ts:
+        return conv, ts
+    return None
+
+
+def epoch_seconds_sql(col: str) -> str:
+    """Biểu thức SQL chuẩn hóa epoch (giây hoặc mili-giây) về giây"""
+    return (f'(CASE WHEN CAST("{col}" AS INTEGER) > {EPOCH_MS_THRESHOLD} '
+            f'THEN CAST("{col}" AS INTEGER) / 1000 ELSE CAST("{col}" AS INTEGER) END)')
+
+
+def open_index(index_path: Path):
+    """Mở (hoặc tạo) file chỉ mục timeline"""
+    conn = sqlite3.connect(str(index_path))
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(sources)")]
+    if cols and "wal_size" not in cols:
+        # chỉ mục cũ chưa ghi fingerprint -wal: bỏ đi để build lại
+        conn.executescript("DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS conversations; DROP TABLE IF EXISTS daily;")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def db_fingerprint(db_path: Path):
+    """
+    (size, mtime) của file DB và file -wal ((0, 0) nếu không có -wal).
+    Zalo ghi tin nhắn mới vào -wal trước, file DB chính có thể chưa đổi.
+    """
+    stat = Path(db_path).stat()
+    wal = Path(f"{db_path}-wal")
+    wal_stat = wal.stat() if wal.exists() else None
+    return (stat.st_size, stat.st_mtime,
+            wal_stat.st_size if wal_stat else 0, wal_stat.st_mtime if wal_stat else 0.0)
+
+
+def _is_fresh(idx, db_path: Path, fingerprint) -> bool:
+    row = idx.execute("SELECT db_size, db_mtime, wal_size, wal_mtime FROM sources WHERE db_path=? LIMIT 1",
+                      (str(db_path),)).fetchone()
+    return bool(row) and tuple(row) == tuple(fingerprint)
+
+
+def _drop_source(idx, db_path: Path):
+    for t in ("sources", "conversations", "daily"):
+        idx.execute(f"DELETE FROM {t} WHERE db_path=?", (str(db_path),))
+
+
+def index_message_db(idx, db_path: Path, snapshot_path: Path):
+    """
+    Tính tổng hợp cho 1 Message DB (đã snapshot) và ghi vào chỉ mục.
+    Trả về số bảng tin nhắn đã index.
+    """
+    fingerprint = db_fingerprint(db_path)
+    _drop_source(idx, db_path)
+    src = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    indexed = 0
+    try:
+        tables = [r[0] for r in src.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+        for table in tables:
+            cols = detect_message_columns(src, table)
+            if not cols:
+                continue
+            conv_col, ts_col = cols
+            sec = epoch_seconds_sql(ts_col)
+            where = f'WHERE "{conv_col}" IS NOT NULL AND "{ts_col}" IS NOT NULL'
+
+            conv_rows = src.execute(
+                f'SELECT CAST("{conv_col}" AS TEXT), COUNT(*), MIN({sec}), MAX({sec}) '
+                f'FROM "{table}" {where} GROUP BY 1'
+            ).fetchall()
+            idx.executemany(
+                "INSERT INTO conversations VALUES (?, ?, ?, ?, ?, ?)",
+                ((str(db_path), table, c, n, first, last) for c, n, first, last in conv_rows),
+            )
+
+            day_cur = src.execute(
+                f"SELECT CAST(\"{conv_col}\" AS TEXT), date({sec}, 'unixepoch'), COUNT(*) "
+                f'FROM "{table}" {where} GROUP BY 1, 2'
+            )
+            while True:
+                rows = day_cur.fetchmany(5000)
+                if not rows:
+                    break
+                idx.executemany(
+                    "INSERT INTO daily VALUES (?, ?, ?, ?, ?)",
+                    ((str(db_path), table, c, d, n) for c, d, n in rows),
+                )
+
+            idx.execute(
+                "INSERT INTO sources VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(db_path), db_path.name, table, conv_col, ts_col,
+                 sum(r[1] for r in conv_rows), *fingerprint,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+            indexed += 1
+    finally:
+        src.close()
+    if not indexed:
+        # vẫn ghi nhận DB để lần sau không quét lại file không có bảng tin nhắn
+        idx.execute(
+            "INSERT INTO sources VALUES (?, ?, '', '', '', 0, ?, ?, ?, ?, ?)",
+            (str(db_path), db_path.name, *fingerprint,
+             datetime.now().isoformat(timespec="seconds")),
+        )
+    return indexed
+
+
+def build_timeline_index(index_path: Path, message_dbs, snapshot=None, progress_callback=None, force=False):
+    """
+    Build chỉ mục timeline cho danh sách Message DB.
+    - snapshot(db_path) -> Path: hàm copy DB sang bản tạm (mặc định đọc trực tiếp, read-only)
+    - progress_callback(done, total, db_name) để cập nhật UI
+    - force=True: index lại kể cả DB không thay đổi
+    Trả về dict thống kê {"indexed": n, "skipped": m}.
+    """
+    message_dbs = [Path(p) for p in message_dbs]
+    idx = open_index(index_path)
+    stats = {"indexed": 0, "skipped": 0}
+    try:
+        # xóa dữ liệu của các DB không còn trong danh sách
+        wanted = {str(p) for p in message_dbs}
+        for (old,) in idx.execute("SELECT DISTINCT db_path FROM sources").fetchall():
+            if old not in wanted:
+                _drop_source(idx, Path(old))
+
+        for i, db_path in enumerate(message_dbs, 1):
+            if not force and _is_fresh(idx, db_path, db_fingerprint(db_path)):
+                stats["skipped"] += 1
+            else:
+                snap = snapshot(db_path) if snapshot else db_path
+                with idx:
+                    index_message_db(idx, db_path, snap)
+                stats["indexed"] += 1
+            if progress_callback:
+                progress_callback(i, len(message_dbs), db_path.name)
+        idx.commit()
+    finally:
+        idx.close()
+    return stats
+
+
+# -----------------------------
+# ĐỌC TỪ CHỈ MỤC
+# -----------------------------
+def format_ts(sec):
+    """Epoch giây -> chuỗi ISO (UTC)"""
+    if sec is None:
+        return ""
+    return datetime.fromtimestamp(int(sec), tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def timeline_summary(index_path: Path):
+    """
+    Danh sách hội thoại (gộp qua mọi Message DB), sắp xếp theo số tin nhắn giảm dần.
+    Mỗi phần tử: (conv_id, msg_count, first_ts, last_ts, active_days)
+    """
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        return conn.execute(
+            "SELECT c.conv_id, SUM(c.msg_count), MIN(c.first_ts), MAX(c.last_ts), "
+            "  (SELECT COUNT(DISTINCT d.day) FROM daily d WHERE d.conv_id = c.conv_id) "
+            "FROM conversations c GROUP BY c.conv_id ORDER BY 2 DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def timeline_daily(index_path: Path, conv_id: str = None):
+    """
+    Histogram theo ngày [(day, msg_count)] của một hội thoại,
+    hoặc của toàn bộ tài khoản nếu conv_id=None.
+    """
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        if conv_id is None:
+            return conn.execute("SELECT day, SUM(msg_count) FROM daily GROUP BY day ORDER BY day").fetchall()
+        return conn.execute(
+            "SELECT day, SUM(msg_count) FROM daily WHERE conv_id=? GROUP BY day ORDER BY day", (conv_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def export_timeline_csv(index_path: Path, out_path: Path, daily=False):
+    """
+    Xuất chỉ mục ra CSV (chỉ đọc file chỉ mục).
+    - daily=False: tổng hợp theo hội thoại
+    - daily=True: histogram theo (hội thoại, ngày)
+    Trả về số dòng đã ghi.
+    """
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    written = 0
+    try:
+        with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            if daily:
+                writer.writerow(["conv_id", "day", "msg_count"])
+                cur = conn.execute(
+                    "SELECT conv_id, day, SUM(msg_count) FROM daily GROUP BY conv_id, day ORDER BY conv_id, day")
+                while True:
+                    rows = cur.fetchmany(5000)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    written += len(rows)
+            else:
+                writer.writerow(["conv_id", "msg_count", "first_message", "last_message", "active_days"])
+                for conv_id, n, first, last, days in timeline_summary(index_path):
+                    writer.writerow([conv_id, n, format_ts(first), format_ts(last), days])
+                    written += 1
+    finally:
+        conn.close()
+    return written
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_trace.py
+-----------------------------------
+Đo thời gian theo span cho các thao tác của công cụ (copy/snapshot, connect, đọc schema,
+đếm dòng, truy vấn, render Treeview, xuất file...):
+    Bật bằng biến môi trường ZL_TRACE=1 (hoặc ZL_TRACE=<file.json>), nút bật/tắt trên GUI,
+    hoặc --trace của CLI; tắt thì span gần như không tốn gì (dùng chung 1 object rỗng)
+
+    Ghi ra Chrome trace JSON (mở bằng chrome://tracing hoặc https://ui.perfetto.dev),
+    mỗi thread / process 1 hàng
+
+    ZL_TRACE_PROFILE=1: chạy thêm cProfile trong span ngoài cùng của mỗi thread, gộp
+    thành 1 file .prof (xem bằng snakeviz / python -m pstats)
+
+    Span chạy trong process con (xuất bundle) được gửi về process cha qua drain() / merge();
+    pool tạo bằng initializer=init_worker để process con bật tracing giống process cha
+    (kể cả khi start method là spawn: Windows, macOS)
+
+    python zl_trace.py --self-test: xuất bundle mẫu với mọi start method (fork / spawn /
+    forkserver) và kiểm tra span + cProfile của process con có về process cha
+-----------------------------------
+Ví dụ:
+    from zl_trace import span
+    with span("count", table=t) as sp:
+        n = count_rows(conn, t)
+        sp.set(rows=n)
+"""
+import argparse
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+TRACE_ENV = "ZL_TRACE"
+PROFILE_ENV = "ZL_TRACE_PROFILE"
+TRACE_DIR = Path.home() / ".zl_extract" / "traces"
+
+
+class _NullSpan:
+    """Span khi tracing tắt: không ghi gì"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start", "profiler")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.profiler = None
+
+    def set(self, **args):
+        """Thêm thông tin cho span (vd. số dòng) sau khi đã biết"""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.profiler = self.tracer._push()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._pop(self.profiler)
+        self.tracer._record({"name": self.name, "cat": self.cat, "ph": "X", "ts": self.start // 1000,
+                             "dur": (end - self.start) // 1000, "pid": os.getpid(),
+                             "tid": threading.get_ident(), "args": self.args})
+        return False
+
+
+class _ProfileStats:
+    """Kết quả cProfile gửi về từ process con - pstats.Stats đọc được như 1 cProfile.Profile"""
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def create_stats(self):
+        # pstats.Stats lấy .stats rồi gán lại {} -> trả bản gốc mỗi lần để dump() gọi được nhiều lần
+        self.stats = self._stats
+
+
+class Tracer:
+    """
+    Bộ ghi span dùng chung trong process (TRACER). enable()/disable() bật tắt lúc chạy;
+    dump() ghi Chrome trace JSON (+ file .prof nếu bật profile). Còn span chưa ghi khi thoát
+    chương trình thì tự dump ra dump_path.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profile = False
+        self.dump_path = None
+        self.events = []
+        self._threads = {}
+        self._profilers = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self, profile: bool = False, dump_path: Path = None):
+        self.profile = profile
+        self.dump_path = dump_path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name: str, cat: str = "zl", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def instant(self, name: str, cat: str = "zl", **args):
+        """Sự kiện tức thời (vd. người dùng bấm nút)"""
+        if self.enabled:
+            self._record({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": time.perf_counter_ns() // 1000,
+                          "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+    def _push(self):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        if depth or not self.profile:
+            return None
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:   # thread đã có profiler khác đang chạy
+            return None
+        return prof
+
+    def _pop(self, prof):
+        self._local.depth -= 1
+        if prof is not None:
+            prof.disable()
+            with self._lock:
+                self._profilers.append(prof)
+
+    def _record(self, event):
+        with self._lock:
+            self.events.append(event)
+            key = (event["pid"], event["tid"])
+            if key not in self._threads:
+                self._threads[key] = threading.current_thread().name
+
+    def drain(self):
+        """
+        Lấy (và xóa) các span ghi trong process hiện tại - process con gửi kèm kết quả về process cha.
+        Bật profile thì gửi kèm kết quả cProfile (dict của pstats, pickle được).
+        """
+        pid = os.getpid()
+        with self._lock:
+            mine = [e for e in self.events if e["pid"] == pid]
+            self.events = [e for e in self.events if e["pid"] != pid]
+            threads = {k: v for k, v in self._threads.items() if k[0] == pid}
+            profilers, self._profilers = self._profilers, []
+        profile = []
+        for prof in profilers:
+            prof.create_stats()
+            profile.append(prof.stats)
+        return {"events": mine, "threads": [[p, t, n] for (p, t), n in threads.items()], "profile": profile}
+
+    def merge(self, drained):
+        """Gộp span (và cProfile) từ process con (kết quả của drain())"""
+        if not drained:
+            return
+        with self._lock:
+            self.events.extend(drained["events"])
+            for p, t, n in drained["threads"]:
+                self._threads.setdefault((p, t), n)
+            self._profilers.extend(_ProfileStats(st) for st in drained.get("profile", ()))
+
+    def dump(self, path: Path = None, profile_path: Path = None):
+        """
+        Ghi Chrome trace JSON ra path (mặc định ~/.zl_extract/traces/zl_trace_<thời gian>_<pid>.json).
+        Có cProfile thì ghi thêm <path>.prof. Trả về (trace_path, profile_path | None).
+        """
+        path = path or self.dump_path
+        if path is None:
+            env = os.environ.get(TRACE_ENV, "")
+            if env.lower().endswith(".json"):
+                path = Path(env)
+            else:
+                path = TRACE_DIR / f"zl_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.json"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+            profilers = list(self._profilers)
+        meta = [{"name": "thread_name", "ph": "M", "pid": p, "tid": t, "args": {"name": n}}
+                for (p, t), n in threads.items()]
+        meta += [{"name": "process_name", "ph": "M", "pid": p, "args": {"name": "main" if p == os.getpid() else f"worker {p}"}}
+                 for p in {p for p, _ in threads}]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+        if profilers:
+            profile_path = Path(profile_path) if profile_path else path.with_suffix(".prof")
+            stats = pstats.Stats(profilers[0])
+            for prof in profilers[1:]:
+                stats.add(prof)
+            stats.dump_stats(str(profile_path))
+        else:
+            profile_path = None
+        return path, profile_path
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self._threads.clear()
+            self._profilers.clear()
+
+
+TRACER = Tracer()
+span = TRACER.span
+
+
+def traced(name: str = None, cat: str = "zl"):
+    """Decorator: bao cả hàm trong 1 span"""
+    def wrap(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            if not TRACER.enabled:
+                return fn(*a, **kw)
+            with TRACER.span(label, cat):
+                return fn(*a, **kw)
+        return inner
+    return wrap
+
+
+def init_worker(enabled: bool, profile: bool = False):
+    """
+    initializer cho ProcessPoolExecutor (initargs=worker_initargs()): đặt tracing của process con
+    giống process cha. Với spawn process con import lại module nên TRACER luôn tắt (trừ khi có ZL_TRACE);
+    với fork process con mang theo span / profiler / độ sâu span của process cha -> bỏ hết,
+    drain() chỉ gửi phần của process con.
+    """
+    TRACER.clear()
+    TRACER._local = threading.local()
+    if enabled:
+        TRACER.enable(profile=profile)
+    else:
+        TRACER.disable()
+
+
+def worker_initargs():
+    """initargs cho init_worker theo trạng thái TRACER của process hiện tại"""
+    return TRACER.enabled, TRACER.profile
+
+
+def _dump_at_exit():
+    if TRACER.enabled and TRACER.events:
+        path, prof = TRACER.dump()
+        print(f"[trace] {path}" + (f" (+ {prof})" if prof else ""))
+
+
+atexit.register(_dump_at_exit)
+if os.environ.get(TRACE_ENV):
+    TRACER.enable(profile=bool(os.environ.get(PROFILE_ENV)))
+
+
+# -----------------------------
+# Tự kiểm tra span của process con
+# -----------------------------
+def self_test(workers: int = 2, tables: int = 6):
+    """
+    Xuất bundle 1 DB mẫu (tables bảng) với từng start method có trên máy, tracing + profile bật.
+    Đạt khi mọi span "export.table" đến từ process con và có cProfile của process con.
+    Trả về danh sách (start method, ok, chi tiết).
+    """
+    import multiprocessing
+    import sqlite3
+    import tempfile
+    from zl_engine import export_db_bundle
+
+    results = []
+    was_enabled, was_profile = TRACER.enabled, TRACER.profile
+    with tempfile.TemporaryDirectory(prefix="zl_trace_test_") as tmp:
+        db = Path(tmp) / "sample.db"
+        conn = sqlite3.connect(str(db))
+        for i in range(tables):
+            conn.execute(f"CREATE TABLE t{i} (id INTEGER PRIMARY KEY, v TEXT)")
+            conn.executemany(f"INSERT INTO t{i} (v) VALUES (?)", [(f"row {j}",) for j in range(500)])
+        conn.commit()
+        conn.close()
+        for method in multiprocessing.get_all_start_methods():
+            TRACER.clear()
+            TRACER.enable(profile=True)
+            try:
+                manifest = export_db_bundle([("sample", db)], Path(tmp) / method, workers=workers,
+                                            mp_context=multiprocessing.get_context(method))
+                with TRACER._lock:
+                    spans = [e for e in TRACER.events if e["name"] == "export.table"]
+                    child_profiles = sum(isinstance(p, _ProfileStats) for p in TRACER._profilers)
+                pids = {e["pid"] for e in spans}
+                ok = (manifest["failed_tables"] == 0 and len(spans) == tables
+                      and os.getpid() not in pids and child_profiles > 0)
+                results.append((method, ok, f"{len(spans)}/{tables} worker spans from {len(pids)} processes, "
+                                            f"{child_profiles} worker profiles"))
+            except Exception as e:
+                results.append((method, False, f"{type(e).__name__}: {e}"))
+    TRACER.clear()
+    if was_enabled:
+        TRACER.enable(profile=was_profile)
+    else:
+        TRACER.disable()
+    return results
+
+
+def main():
+    p = argparse.ArgumentParser(description="Tracing helpers for the Zalo extraction tools.")
+    p.add_argument("--self-test", action="store_true",
+                   help="Check that worker-process spans reach the parent under every multiprocessing start method.")
+    p.add_argument("--workers", type=int, default=2, help="Worker processes for --self-test (default: 2).")
+    args = p.parse_args()
+    if not args.self_test:
+        p.print_help()
+        return 0
+    failed = 0
+    for method, ok, detail in self_test(args.workers):
+        print(f"[{'PASS' if ok else 'FAIL'}] {method}: {detail}")
+        failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # chạy qua module zl_trace (không phải __main__) để dùng chung TRACER với zl_engine
+    import zl_trace
+    sys.exit(zl_trace.main())
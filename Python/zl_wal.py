@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+zl_wal.py
+-----------------------------------
+Đọc trực tiếp file -wal của SQLite (không để SQLite replay), giữ lại mọi phiên bản trang:
+    mmap file -wal, kiểm header (magic, page size, salt, checksum header)
+
+    Chỉ mục frame xây trong 1 lần quét: header frame đọc bằng numpy theo từng khối CHUNK_FRAMES frame;
+    checksum lũy tiến của SQLite (s0 += x0 + s1; s1 += x1 + s0 trên từng cặp word 32-bit) là ánh xạ
+    tuyến tính mod 2^32 -> phần đóng góp của mỗi frame tính bằng 1 phép nhân ma trận cho cả khối,
+    chỉ còn nối chuỗi checksum giữa các frame trong Python
+
+    Trạng thái frame:
+        committed   - checksum đúng, thuộc 1 transaction đã commit (SQLite sẽ replay)
+        uncommitted - checksum đúng nhưng sau commit frame cuối cùng (transaction dở dang)
+        invalid     - cùng salt nhưng chuỗi checksum đã đứt
+        stale       - salt khác: frame của thế hệ WAL trước (sau checkpoint + reset) chưa bị ghi đè
+
+    Theo chỉ mục: danh sách commit (frame, trang đổi, số trang DB), các phiên bản của từng trang,
+    dựng lại DB tại 1 commit bất kỳ (DB chính + frame đã commit tới commit đó), so sánh 2 phiên bản
+    1 trang (khoảng byte khác nhau + dòng thêm / xóa / sửa nếu là trang lá bảng)
+-----------------------------------
+Lưu ý:
+    Commit 0 = DB chính (chưa replay frame nào). Trang không có trong -wal lấy từ DB chính.
+    -wal của DB SQLCipher được mã hóa từng trang -> giải mã DB trước, reader này chỉ đọc -wal thường.
+-----------------------------------
+Ví dụ:
+    with WalReader(db_path) as wal:
+        wal.summary(); wal.page_versions(5)
+        wal.materialize(out_path, commit=3)
+        wal.diff_page(5, None, wal.page_versions(5)[-1]["frame"])
+    python zl_wal.py Message0.db --materialize 3 --out Message0@3.db
+"""
+import argparse
+import json
+import mmap
+import shutil
+import struct
+import sys
+import time
+from bisect import bisect_right
+from pathlib import Path
+
+import numpy as np
+
+from zl_carve import read_leaf_cells
+from zl_trace import span
+
+WAL_MAGIC = (0x377F0682, 0x377F0683)      # bit thấp = 1: checksum đọc word big-endian
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+CHUNK_FRAMES = 2048
+MASK32 = 0xFFFFFFFF
+PAGE_TYPES = {0x02: "index interior", 0x05: "table interior", 0x0A: "index leaf", 0x0D: "table leaf"}
+STATUSES = ("committed", "uncommitted", "invalid", "stale")
+
+
+def wal_path_for(db_path: Path) -> Path:
+    return Path(f"{db_path}-wal")
+
+
+# -----------------------------
+# Checksum WAL
+# -----------------------------
+def _matrix_powers(n):
+    """M^j (j = 0..n), M = [[1, 1], [1, 2]] mod 2^32, mỗi dòng (a, b, c, d) = [[a, b], [c, d]]"""
+    powers = np.empty((n + 1, 4), dtype=np.uint64)
+    a, b, c, d = 1, 0, 0, 1
+    for j in range(n + 1):
+        powers[j] = (a, b, c, d)
+        a, b, c, d = (a + b) & MASK32, (a + 2 * b) & MASK32, (c + d) & MASK32, (c + 2 * d) & MASK32
+    return powers
+
+
+def _contributions(words, powers):
+    """
+    words (F x 2n, uint64): các word được checksum của F frame. Mỗi cặp (x0, x1):
+    [s0, s1] <- M [s0, s1] + [x0, x0 + x1]  =>  checksum cuối = M^n s_vào + c, trả về c (F x 2).
+    Nhân uint64 tràn theo mod 2^64 nên kết quả vẫn đúng mod 2^32.
+    """
+    n = words.shape[1] // 2
+    x0, x1 = words[:, 0::2], words[:, 1::2]
+    b1 = x0 + x1
+    w = powers[n - 1::-1]                 # M^(n-k) cho cặp thứ k = 1..n
+    c0 = (x0 @ w[:, 0] + b1 @ w[:, 1]) & MASK32
+    c1 = (x0 @ w[:, 2] + b1 @ w[:, 3]) & MASK32
+    return np.stack([c0, c1], axis=1)
+
+
+def _chain(s, power, contribution):
+    """Checksum sau 1 frame: M^n s + c (số nguyên Python)"""
+    a, b, c, d = (int(v) for v in power)
+    return ((a * s[0] + b * s[1] + int(contribution[0])) & MASK32,
+            (c * s[0] + d * s[1] + int(contribution[1])) & MASK32)
+
+
+def wal_checksum(data: bytes, big_endian: bool, s=(0, 0)):
+    """Checksum WAL của data (độ dài bội của 8) nối tiếp từ s - cài đặt tham chiếu, chạy chậm"""
+    s0, s1 = s
+    for x0, x1 in struct.iter_unpack(">II" if big_endian else "<II", data):
+        s0 = (s0 + x0 + s1) & MASK32
+        s1 = (s1 + x1 + s0) & MASK32
+    return s0, s1
+
+
+# -----------------------------
+# Reader
+# -----------------------------
+class WalReader:
+    """
+    Chỉ mục frame của file -wal + DB chính (db_path; -wal mặc định là db_path-wal).
+    Thuộc tính: header, frames (list dict index, offset, pgno, db_pages, status, commit),
+    commits (list dict commit, frame, first_frame, frames, pages, db_pages), versions {pgno: [frame]}.
+    """
+
+    def __init__(self, db_path: Path, wal_path: Path = None):
+        self.db_path = Path(db_path)
+        self.wal_path = Path(wal_path) if wal_path else wal_path_for(self.db_path)
+        self._wal_file = open(self.wal_path, "rb")
+        self._mm = None
+        self._db_file = self._db_mm = None
+        try:
+            if self.wal_path.stat().st_size >= WAL_HEADER_SIZE:
+                self._mm = mmap.mmap(self._wal_file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.db_path.exists() and self.db_path.stat().st_size:
+                self._db_file = open(self.db_path, "rb")
+                self._db_mm = mmap.mmap(self._db_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._build()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        for m in (self._mm, self._db_mm):
+            if m is not None:
+                m.close()
+        for f in (self._wal_file, self._db_file):
+            if f is not None:
+                f.close()
+        self._mm = self._db_mm = self._wal_file = self._db_file = None
+
+    # -----------------------------
+    # Chỉ mục (1 lần quét)
+    # -----------------------------
+    def _build(self):
+        t0 = time.perf_counter()
+        self.frames, self.commits, self.versions = [], [], {}
+        self._committed = {}          # pgno -> [frame] chỉ frame đã commit (tăng dần)
+        if self._mm is None:
+            raise ValueError(f"{self.wal_path.name}: file -wal rỗng / quá ngắn")
+        magic, version, page_size, ckpt_seq, salt1, salt2, ck1, ck2 = struct.unpack_from(">8I", self._mm, 0)
+        if magic not in WAL_MAGIC:
+            raise ValueError(f"{self.wal_path.name} không phải file WAL (magic {magic:#x}; -wal SQLCipher bị mã hóa)")
+        big_endian = bool(magic & 1)
+        self.page_size = page_size
+        self.frame_size = FRAME_HEADER_SIZE + page_size
+        header_ok = wal_checksum(self._mm[:24], big_endian) == (ck1, ck2)
+        total = (len(self._mm) - WAL_HEADER_SIZE) // self.frame_size
+        self.header = {"magic": hex(magic), "version": version, "page_size": page_size,
+                       "checkpoint_seq": ckpt_seq, "salt1": salt1, "salt2": salt2,
+                       "big_endian_checksum": big_endian, "header_checksum_ok": header_ok, "frames": total}
+
+        n = self.frame_size // 8 - 2            # cặp word: 1 cặp header frame + page_size / 8 cặp trang
+        powers = _matrix_powers(n)
+        power_n = powers[n]
+        dtype = ">u4" if big_endian else "<u4"
+        s, chain_ok = (ck1, ck2), header_ok
+        pending = []                            # frame hợp lệ chưa gặp commit frame
+        with span("wal.index", file=self.wal_path.name, frames=total):
+            for start in range(0, total, CHUNK_FRAMES):
+                count = min(CHUNK_FRAMES, total - start)
+                base = WAL_HEADER_SIZE + start * self.frame_size
+                raw = self._mm[base:base + count * self.frame_size]
+                fields = np.frombuffer(raw, dtype=">u4").reshape(count, -1)[:, :6]
+                salt_ok = (fields[:, 2] == salt1) & (fields[:, 3] == salt2)
+                contrib = None
+                if chain_ok and salt_ok.any():
+                    words = np.frombuffer(raw, dtype=dtype).reshape(count, -1)
+                    words = np.concatenate([words[:, :2], words[:, 6:]], axis=1).astype(np.uint64)
+                    contrib = _contributions(words, powers)
+                for i in range(count):
+                    idx = start + i
+                    pgno, db_pages, _, _, f1, f2 = (int(v) for v in fields[i])
+                    if not salt_ok[i]:
+                        status = "stale"
+                        chain_ok = False
+                    elif chain_ok:
+                        s = _chain(s, power_n, contrib[i])
+                        chain_ok = s == (f1, f2)
+                        status = "uncommitted" if chain_ok else "invalid"
+                    else:
+                        status = "invalid"
+                    frame = {"index": idx, "offset": base + i * self.frame_size, "pgno": pgno,
+                             "db_pages": db_pages, "status": status, "commit": None}
+                    self.frames.append(frame)
+                    self.versions.setdefault(pgno, []).append(idx)
+                    if status != "uncommitted":
+                        continue
+                    pending.append(frame)
+                    if db_pages:                # commit frame: đóng transaction
+                        commit_no = len(self.commits) + 1
+                        for f in pending:
+                            f["status"], f["commit"] = "committed", commit_no
+                            self._committed.setdefault(f["pgno"], []).append(f["index"])
+                        self.commits.append({"commit": commit_no, "frame": idx, "first_frame": pending[0]["index"],
+                                             "frames": len(pending), "pages": sorted({f["pgno"] for f in pending}),
+                                             "db_pages": db_pages})
+                        pending = []
+        self.seconds = round(time.perf_counter() - t0, 4)
+
+    # -----------------------------
+    # Truy vấn
+    # -----------------------------
+    @property
+    def last_commit(self):
+        return len(self.commits)
+
+    def summary(self):
+        counts = {k: 0 for k in STATUSES}
+        for f in self.frames:
+            counts[f["status"]] += 1
+        return {"wal": str(self.wal_path), **self.header, "commits": len(self.commits),
+                "pages": len(self.versions), **counts, "seconds": self.seconds}
+
+    def db_pages(self, commit=None):
+        """Số trang DB tại commit (0 = DB chính)"""
+        commit = self.last_commit if commit is None else commit
+        if commit:
+            return self.commits[commit - 1]["db_pages"]
+        return len(self._db_mm) // self.page_size if self._db_mm is not None else 0
+
+    def frame_data(self, frame):
+        """Nội dung trang của frame (chỉ số)"""
+        off = self.frames[frame]["offset"] + FRAME_HEADER_SIZE
+        return self._mm[off:off + self.page_size]
+
+    def db_page(self, pgno):
+        """Trang pgno của DB chính (None nếu vượt quá file)"""
+        if self._db_mm is None or pgno < 1 or pgno * self.page_size > len(self._db_mm):
+            return None
+        return self._db_mm[(pgno - 1) * self.page_size:pgno * self.page_size]
+
+    def frame_at(self, pgno, commit=None):
+        """Frame chứa phiên bản của pgno tại commit (None = lấy từ DB chính)"""
+        commit = self.last_commit if commit is None else commit
+        frames = self._committed.get(pgno)
+        if not commit or not frames:
+            return None
+        pos = bisect_right(frames, self.commits[commit - 1]["frame"])
+        return frames[pos - 1] if pos else None
+
+    def page_at(self, pgno, commit=None):
+        """Nội dung trang pgno tại commit"""
+        if pgno < 1 or pgno > self.db_pages(commit):
+            return None
+        frame = self.frame_at(pgno, commit)
+        return self.frame_data(frame) if frame is not None else self.db_page(pgno)
+
+    def page_versions(self, pgno):
+        """Mọi phiên bản của trang: DB chính (frame None, commit 0) rồi từng frame trong -wal theo thứ tự ghi"""
+        out = []
+        if self.db_page(pgno) is not None:
+            out.append({"frame": None, "commit": 0, "status": "db", "offset": (pgno - 1) * self.page_size})
+        for idx in self.versions.get(pgno, []):
+            f = self.frames[idx]
+            out.append({"frame": idx, "commit": f["commit"], "status": f["status"], "offset": f["offset"]})
+        return out
+
+    def page_type(self, data, pgno):
+        if data is None:
+            return "?"
+        return PAGE_TYPES.get(data[100 if pgno == 1 else 0], "other")
+
+    def _page1(self, commit=None):
+        return self.page_at(1, commit) or b""
+
+    # -----------------------------
+    # Dựng DB tại 1 commit
+    # -----------------------------
+    def materialize(self, out_path: Path, commit=None):
+        """
+        Ghi file SQLite thường = DB tại commit (None = commit cuối, 0 = DB chính), không kèm -wal.
+        ValueError (không tạo file) nếu DB tại commit không có trang nào hoặc thiếu trang 1
+        (vd. DB chính không có / rỗng và -wal không chứa trang 1).
+        Trả về dict commit, pages, wal_pages (số trang lấy từ -wal), seconds.
+        """
+        t0 = time.perf_counter()
+        commit = self.last_commit if commit is None else commit
+        if commit < 0 or commit > self.last_commit:
+            raise ValueError(f"Commit {commit} không tồn tại (0..{self.last_commit})")
+        pages = self.db_pages(commit)
+        latest = {}
+        if commit:
+            last = self.commits[commit - 1]["frame"]
+            for f in self.frames[:last + 1]:
+                if f["status"] == "committed":
+                    latest[f["pgno"]] = f["index"]
+        if pages == 0:
+            raise ValueError(f"DB tại commit {commit} không có trang nào (DB chính không có / rỗng)")
+        if 1 not in latest and self.db_page(1) is None:
+            raise ValueError(f"Thiếu trang 1 (header SQLite) tại commit {commit}: không có trong DB chính lẫn -wal")
+        out_path = Path(out_path)
+        with span("wal.materialize", commit=commit, pages=pages):
+            with open(out_path, "wb") as out:
+                if self._db_file is not None:
+                    self._db_file.seek(0)
+                    shutil.copyfileobj(self._db_file, out, 1024 * 1024)
+                out.truncate(pages * self.page_size)
+                for pgno, frame in latest.items():
+                    if pgno <= pages:
+                        out.seek((pgno - 1) * self.page_size)
+                        out.write(self.frame_data(frame))
+                out.seek(18)                      # trang 1 chắc chắn đã ghi (kiểm ở trên)
+                out.write(b"\x01\x01")            # không kèm -wal -> chế độ rollback journal
+        return {"commit": commit, "pages": pages, "wal_pages": len(latest),
+                "seconds": round(time.perf_counter() - t0, 3)}
+
+    # -----------------------------
+    # So sánh phiên bản trang
+    # -----------------------------
+    def _version_data(self, pgno, frame):
+        return self.db_page(pgno) if frame is None else self.frame_data(frame)
+
+    def _version_commit(self, frame):
+        """Commit dùng để đọc trang overflow của 1 phiên bản (frame chưa commit: commit cuối)"""
+        if frame is None:
+            return 0
+        return self.frames[frame]["commit"] or self.last_commit
+
+    def diff_page(self, pgno, frame_a, frame_b):
+        """
+        So sánh 2 phiên bản trang pgno (frame None = DB chính).
+        Trả về dict type_a, type_b, bytes_changed, ranges [(start, end)] và nếu cả 2 là trang lá bảng:
+        added {rowid: values}, removed {rowid: values}, changed {rowid: (cũ, mới)}.
+        """
+        a, b = self._version_data(pgno, frame_a), self._version_data(pgno, frame_b)
+        a, b = a or bytes(self.page_size), b or bytes(self.page_size)
+        diff = np.flatnonzero(np.frombuffer(a, dtype=np.uint8) != np.frombuffer(b, dtype=np.uint8))
+        ranges = []
+        if diff.size:
+            breaks = np.flatnonzero(np.diff(diff) > 1)
+            starts = np.concatenate([[diff[0]], diff[breaks + 1]])
+            ends = np.concatenate([diff[breaks], [diff[-1]]]) + 1
+            ranges = [(int(x), int(y)) for x, y in zip(starts, ends)]
+        result = {"pgno": pgno, "type_a": self.page_type(a, pgno), "type_b": self.page_type(b, pgno),
+                  "bytes_changed": int(diff.size), "ranges": ranges}
+        if result["type_a"] == result["type_b"] == "table leaf":
+            page1 = self._page1()
+            usable = self.page_size - (page1[20] if len(page1) > 20 else 0)
+            encoding = {2: "utf-16-le", 3: "utf-16-be"}.get(
+                struct.unpack_from(">I", page1, 56)[0] if len(page1) >= 60 else 1, "utf-8")
+            hdr = 100 if pgno == 1 else 0
+            rows_a = read_leaf_cells(a, hdr, usable, encoding,
+                                     lambda p, c=self._version_commit(frame_a): self.page_at(p, c))
+            rows_b = read_leaf_cells(b, hdr, usable, encoding,
+                                     lambda p, c=self._version_commit(frame_b): self.page_at(p, c))
+            result["added"] = {r: rows_b[r] for r in rows_b.keys() - rows_a.keys()}
+            result["removed"] = {r: rows_a[r] for r in rows_a.keys() - rows_b.keys()}
+            result["changed"] = {r: (rows_a[r], rows_b[r]) for r in rows_a.keys() & rows_b.keys()
+                                 if rows_a[r] != rows_b[r]}
+        return result
+
+
+def _json_default(v):
+    return v.hex() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+def _short(values, width=160):
+    text = json.dumps(values, ensure_ascii=False, default=_json_default)
+    return text if len(text) <= width else text[:width] + "…"
+
+
+def format_page_diff(diff, max_rows=200):
+    """Kết quả diff_page() -> văn bản nhiều dòng (cho cửa sổ xem / log)"""
+    lines = [f"Trang {diff['pgno']}: {diff['type_a']} -> {diff['type_b']}, {diff['bytes_changed']} byte khác "
+             f"trong {len(diff['ranges'])} đoạn"]
+    lines += [f"  [{a:#06x}, {b:#06x})" for a, b in diff["ranges"][:20]]
+    if len(diff["ranges"]) > 20:
+        lines.append(f"  ... {len(diff['ranges']) - 20} đoạn nữa")
+    if "added" in diff:
+        rows = ([f"+ {r}: {_short(v)}" for r, v in sorted(diff["added"].items())]
+                + [f"- {r}: {_short(v)}" for r, v in sorted(diff["removed"].items())]
+                + [f"~ {r}: {_short(a)}\n     -> {_short(b)}" for r, (a, b) in sorted(diff["changed"].items())])
+        lines.append(f"Dòng: +{len(diff['added'])} thêm, -{len(diff['removed'])} xóa, ~{len(diff['changed'])} sửa")
+        lines += rows[:max_rows]
+        if len(rows) > max_rows:
+            lines.append(f"... {len(rows) - max_rows} dòng nữa")
+    return "\n".join(lines)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def parse_args():
+    p = argparse.ArgumentParser(description="Read a SQLite -wal file directly: list commits and frame status, "
+                                            "rebuild the DB as of any commit, diff page versions.")
+    p.add_argument("db", help="Main DB file (the -wal file next to it is read).")
+    p.add_argument("--wal", default=None, help="WAL file (default: <db>-wal).")
+    p.add_argument("--commits", action="store_true", help="List commits.")
+    p.add_argument("--page", type=int, default=None, help="List versions of this page and diff consecutive ones.")
+    p.add_argument("--materialize", type=int, default=None, help="Rebuild the DB as of this commit (0 = main DB).")
+    p.add_argument("--out", default=None, help="Output file for --materialize.")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    with WalReader(Path(args.db), Path(args.wal) if args.wal else None) as wal:
+        result = {"summary": wal.summary()}
+        if args.commits:
+            result["commits"] = wal.commits
+        if args.page is not None:
+            versions = wal.page_versions(args.page)
+            result["versions"] = versions
+            result["diffs"] = [wal.diff_page(args.page, a["frame"], b["frame"]) for a, b in zip(versions, versions[1:])]
+        if args.materialize is not None:
+            out = Path(args.out or f"{Path(args.db).stem}@{args.materialize}.db")
+            try:
+                result["materialized"] = {**wal.materialize(out, args.materialize), "out": str(out)}
+            except ValueError as e:
+                print(f"[ERROR] {e}")
+                sys.exit(2)
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=_json_default))
+
+
+if __name__ == "__main__":
+    main()